@@ -1,9 +1,11 @@
 # Standard library imports
 import json
+import logging
 import os
 from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Callable, Optional, List, Tuple, Dict, Sequence, TYPE_CHECKING
+from typing import Callable, Iterable, Optional, List, Tuple, Dict, Sequence, TYPE_CHECKING
 
 # Third-party imports
 import ctk
@@ -16,6 +18,7 @@ import slicer
 from slicer import (
     vtkMRMLMarkupsFiducialNode,
     vtkMRMLScriptedModuleNode,
+    vtkMRMLTransformNode,
 )
 from slicer.ScriptedLoadableModule import *
 from slicer.i18n import tr as _
@@ -36,8 +39,25 @@ from OpenLIFULib import (
     get_cur_db,
     get_target_candidates,
 )
+from OpenLIFULib.database_index import get_database_summary_index
+from OpenLIFULib.database_metadata_cache import get_database_metadata_cache
+from OpenLIFULib.database_table_model import SummaryTableColumn, SummaryTableModel
 from OpenLIFULib.events import SlicerOpenLIFUEvents
+from OpenLIFULib.foreground_mask_store import FOREGROUND_MASK_ATTRIBUTE, get_session_foreground_mask_store_dir
 from OpenLIFULib.guided_mode_util import GuidedWorkflowMixin
+from OpenLIFULib.notifications import notify
+from OpenLIFULib.profiling import profile_span, profiled
+from OpenLIFULib.session_saving import (
+    AUTOSAVE_QUIET_PERIOD_MS,
+    SessionChangeTracker,
+    SessionComponent,
+    get_autosave_enabled,
+    set_autosave_enabled,
+    prepare_photoscan_metadata_file_write,
+    prepare_session_file_write,
+    write_pending_file,
+)
+from OpenLIFULib.transducer import TransducerModelData, read_transducer_model_data
 from OpenLIFULib.transducer_tracking_results import (
     add_transducer_tracking_results_from_openlifu_session_format,
     clear_transducer_tracking_results,
@@ -52,7 +72,11 @@ from OpenLIFULib.util import (
     ensure_list,
     replace_widget,
 )
-from OpenLIFULib.volume_thresholding import load_volume_and_threshold_background
+from OpenLIFULib.volume_thresholding import (
+    get_streaming_volume_loading_enabled,
+    load_volume_and_threshold_background,
+    read_volume_and_compute_foreground_mask,
+)
 from OpenLIFULib.virtual_fit_results import (
     add_virtual_fit_results_from_openlifu_session_format,
     clear_virtual_fit_results,
@@ -64,6 +88,7 @@ if TYPE_CHECKING:
     import openlifu.plan
     import openlifu.xdc
     from OpenLIFUHome.OpenLIFUHome import OpenLIFUHomeLogic
+    from OpenLIFULib.profiling import ProfileSpan
     from OpenLIFUPrePlanning.OpenLIFUPrePlanning import OpenLIFUPrePlanningWidget
 
 #
@@ -351,30 +376,49 @@ class LoadSubjectDialog(qt.QDialog):
     def setup(self) -> None:
         self.boxLayout = qt.QVBoxLayout()
         self.setLayout(self.boxLayout)
+
+        # ---- Search ----
+        self.searchLineEdit = qt.QLineEdit()
+        self.searchLineEdit.setPlaceholderText("Search subjects")
+        self.searchLineEdit.setClearButtonEnabled(True)
+        self.boxLayout.addWidget(self.searchLineEdit)
+
         # ---- Subjects Table ----
+        self.databaseSummaryIndex = get_database_summary_index(self.db)
         cols = [
-            "Subject Name",
-            "Subject ID",
-            "# Volumes",
-            "# Sessions",
+            SummaryTableColumn("Subject Name", lambda summary: summary.name),
+            SummaryTableColumn("Subject ID", lambda summary: summary.id),
+            SummaryTableColumn("# Volumes", lambda summary: str(summary.num_volumes), lambda summary: summary.num_volumes),
+            SummaryTableColumn("# Sessions", lambda summary: str(summary.num_sessions), lambda summary: summary.num_sessions),
         ]
-        self.tableWidget = qt.QTableWidget(self)
-        self.tableWidget.setColumnCount(len(cols))
-        self.tableWidget.setHorizontalHeaderLabels(cols)
-        self.tableWidget.horizontalHeader().setDefaultAlignment(qt.Qt.AlignLeft | qt.Qt.AlignVCenter)
-        self.tableWidget.setSelectionBehavior(qt.QAbstractItemView.SelectRows)
-        self.tableWidget.setEditTriggers(qt.QAbstractItemView.NoEditTriggers)
-        self.tableWidget.setSizePolicy(qt.QSizePolicy.Expanding, qt.QSizePolicy.Expanding)
-        self.tableWidget.horizontalHeader().setHighlightSections(False)
-        self.tableWidget.horizontalHeader().setStretchLastSection(True)
-        self.tableWidget.verticalHeader().setVisible(False)
-        self.tableWidget.setShowGrid(False)
-        self.tableWidget.setFocusPolicy(qt.Qt.NoFocus)
-        self.tableWidget.setSortingEnabled(True)
-
-        self.boxLayout.addWidget(self.tableWidget)
-
-        header = self.tableWidget.horizontalHeader()
+        self.tableModel = SummaryTableModel(
+            cols,
+            get_summary = self.databaseSummaryIndex.get_subject_summary,
+            peek_summary = self.databaseSummaryIndex.peek_subject_summary,
+            parent = self,
+        )
+        self.tableView = qt.QTableView(self)
+        self.tableView.setModel(self.tableModel)
+        self.tableView.horizontalHeader().setDefaultAlignment(qt.Qt.AlignLeft | qt.Qt.AlignVCenter)
+        self.tableView.setSelectionBehavior(qt.QAbstractItemView.SelectRows)
+        self.tableView.setSelectionMode(qt.QAbstractItemView.SingleSelection)
+        self.tableView.setEditTriggers(qt.QAbstractItemView.NoEditTriggers)
+        self.tableView.setSizePolicy(qt.QSizePolicy.Expanding, qt.QSizePolicy.Expanding)
+        self.tableView.horizontalHeader().setHighlightSections(False)
+        self.tableView.horizontalHeader().setStretchLastSection(True)
+        self.tableView.verticalHeader().setVisible(False)
+        self.tableView.setShowGrid(False)
+        self.tableView.setFocusPolicy(qt.Qt.NoFocus)
+        # Start out in database order; sorting by a column requires the summaries of all rows
+        self.tableView.horizontalHeader().setSortIndicator(-1, qt.Qt.AscendingOrder)
+        self.tableView.setSortingEnabled(True)
+
+        self.boxLayout.addWidget(self.tableView)
+
+        self.searchLineEdit.textChanged.connect(self.tableModel.set_filter_text)
+        self.finished.connect(lambda *args: self.databaseSummaryIndex.save())
+
+        header = self.tableView.horizontalHeader()
         header.setSectionResizeMode(0, qt.QHeaderView.Interactive)
         header.setSectionResizeMode(0, qt.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(1, qt.QHeaderView.ResizeToContents)
@@ -392,8 +436,8 @@ class LoadSubjectDialog(qt.QDialog):
         self.loadSubjectButton = qt.QPushButton("Load Subject")
         self.loadSubjectButton.setToolTip("Load the selected subject")
         self.loadSubjectButton.clicked.connect(self.onLoadSubjectClicked)
-        self.tableWidget.clicked.connect(lambda: self.loadSubjectButton.setFocus())
-        self.tableWidget.doubleClicked.connect(self.onLoadSubjectClicked)
+        self.tableView.clicked.connect(lambda: self.loadSubjectButton.setFocus())
+        self.tableView.doubleClicked.connect(self.onLoadSubjectClicked)
         buttonRowLayout.addWidget(self.loadSubjectButton)
 
         self.boxLayout.addLayout(buttonRowLayout)
@@ -417,42 +461,11 @@ class LoadSubjectDialog(qt.QDialog):
         self.resize(int(screen.width() * 0.25), int(screen.height() * 0.25))
 
     def updateSubjectsList(self) -> None:
-        self.tableWidget.setSortingEnabled(False) # turn off sorting during edit
-
-        subject_ids = self.db.get_subject_ids()
-
-        self.tableWidget.clearContents()
-        self.tableWidget.setRowCount(len(subject_ids))
-
-        for row, subject_id in enumerate(subject_ids):
-            subject = self.db.load_subject(subject_id)
-            num_volumes = len(self.db.get_volume_ids(subject_id))
-            num_sessions = len(self.db.get_session_ids(subject_id))
-
-            self.tableWidget.setItem(row, 0, qt.QTableWidgetItem(subject.name))
-            self.tableWidget.setItem(row, 1, qt.QTableWidgetItem(subject.id))
-            self.tableWidget.setItem(row, 2, qt.QTableWidgetItem(str(num_volumes)))
-            self.tableWidget.setItem(row, 3, qt.QTableWidgetItem(str(num_sessions)))
-        self.tableWidget.resizeRowsToContents()
-
-        self.tableWidget.setSortingEnabled(True) # turn on sorting after edit
+        # Only the subject IDs are listed here; the table model looks up the summaries of the rows as they are shown
+        self.tableModel.set_ids(self.databaseSummaryIndex.get_subject_ids())
 
     def appendSubjectToList(self, subject: "openlifu.db.subject.Subject") -> None:
-        self.tableWidget.setSortingEnabled(False) # turn off sorting during edit
-
-        row = self.tableWidget.rowCount
-        self.tableWidget.insertRow(row)
-
-        num_volumes = len(self.db.get_volume_ids(subject.id))
-        num_sessions = len(self.db.get_session_ids(subject.id))
-
-        self.tableWidget.setItem(row, 0, qt.QTableWidgetItem(subject.name))
-        self.tableWidget.setItem(row, 1, qt.QTableWidgetItem(subject.id))
-        self.tableWidget.setItem(row, 2, qt.QTableWidgetItem(str(num_volumes)))
-        self.tableWidget.setItem(row, 3, qt.QTableWidgetItem(str(num_sessions)))
-        self.tableWidget.resizeRowsToContents()
-
-        self.tableWidget.setSortingEnabled(True) # turn on sorting after edit
+        self.tableModel.add_id(subject.id)
 
     def on_add_subject_clicked(self, checked:bool) -> None:
         subjectdlg = AddNewSubjectDialog()
@@ -475,14 +488,13 @@ class LoadSubjectDialog(qt.QDialog):
             self.accept()
 
     def onLoadSubjectClicked(self) -> None:
-        selected_items = self.tableWidget.selectedItems()
-        if not selected_items:
+        selected_rows = self.tableView.selectionModel().selectedRows()
+        if not selected_rows:
             slicer.util.errorDisplay("Please select a subject to load.")
             return
 
-        row = selected_items[0].row()
-        subject_id_item = self.tableWidget.item(row, 1)
-        self.selected_subject = self.db.load_subject(subject_id_item.text())
+        subject_id = self.tableModel.id_at(selected_rows[0].row())
+        self.selected_subject = self.db.load_subject(subject_id)
         self.accept()
 
     def exec_and_get_subject(self) -> Optional[str]:
@@ -547,36 +559,54 @@ class LoadSessionDialog(qt.QDialog):
         self.box_layout = qt.QVBoxLayout()
         self.setLayout(self.box_layout)
 
+        # ---- Search ----
+        self.search_line_edit = qt.QLineEdit()
+        self.search_line_edit.setPlaceholderText("Search sessions")
+        self.search_line_edit.setClearButtonEnabled(True)
+        self.box_layout.addWidget(self.search_line_edit)
+
         # ---- Sessions Table ----
+        self.database_summary_index = get_database_summary_index(self.db)
         cols = [
-            "Session Name",
-            "Session ID",
-            "Protocol",
-            "Volume",
-            "Transducer",
-            "Created Date",
-            "Modified Date",
+            SummaryTableColumn("Session Name", lambda summary: summary.name),
+            SummaryTableColumn("Session ID", lambda summary: summary.id),
+            SummaryTableColumn("Protocol", lambda summary: f"{summary.protocol_name} ({summary.protocol_id})"),
+            SummaryTableColumn("Volume", lambda summary: f"{summary.volume_name} ({summary.volume_id})"),
+            SummaryTableColumn("Transducer", lambda summary: f"{summary.transducer_name} ({summary.transducer_id})"),
+            SummaryTableColumn("Created Date", lambda summary: summary.date_created.strftime('%Y-%m-%d %H:%M'), lambda summary: summary.date_created),
+            SummaryTableColumn("Modified Date", lambda summary: summary.date_modified.strftime('%Y-%m-%d %H:%M'), lambda summary: summary.date_modified),
         ]
-        self.table_widget = qt.QTableWidget(self)
-        self.table_widget.setColumnCount(len(cols))
-        self.table_widget.setHorizontalHeaderLabels(cols)
-        self.table_widget.horizontalHeader().setDefaultAlignment(qt.Qt.AlignLeft | qt.Qt.AlignVCenter)
-        self.table_widget.setSelectionBehavior(qt.QAbstractItemView.SelectRows)
-        self.table_widget.setEditTriggers(qt.QAbstractItemView.NoEditTriggers)
-        self.table_widget.setSizePolicy(qt.QSizePolicy.Expanding, qt.QSizePolicy.Expanding)
-        self.table_widget.horizontalHeader().setHighlightSections(False)
-        self.table_widget.horizontalHeader().setStretchLastSection(True)
-        self.table_widget.verticalHeader().setVisible(False)
-        self.table_widget.setShowGrid(False)
-        self.table_widget.setFocusPolicy(qt.Qt.NoFocus)
-        self.table_widget.setSortingEnabled(True)
-
-        header = self.table_widget.horizontalHeader()
+        self.table_model = SummaryTableModel(
+            cols,
+            get_summary = lambda session_id: self.database_summary_index.get_session_summary(self.subject, session_id),
+            peek_summary = lambda session_id: self.database_summary_index.peek_session_summary(self.subject_id, session_id),
+            parent = self,
+        )
+        self.table_view = qt.QTableView(self)
+        self.table_view.setModel(self.table_model)
+        self.table_view.horizontalHeader().setDefaultAlignment(qt.Qt.AlignLeft | qt.Qt.AlignVCenter)
+        self.table_view.setSelectionBehavior(qt.QAbstractItemView.SelectRows)
+        self.table_view.setSelectionMode(qt.QAbstractItemView.SingleSelection)
+        self.table_view.setEditTriggers(qt.QAbstractItemView.NoEditTriggers)
+        self.table_view.setSizePolicy(qt.QSizePolicy.Expanding, qt.QSizePolicy.Expanding)
+        self.table_view.horizontalHeader().setHighlightSections(False)
+        self.table_view.horizontalHeader().setStretchLastSection(True)
+        self.table_view.verticalHeader().setVisible(False)
+        self.table_view.setShowGrid(False)
+        self.table_view.setFocusPolicy(qt.Qt.NoFocus)
+        # Start out in database order; sorting by a column requires the summaries of all rows
+        self.table_view.horizontalHeader().setSortIndicator(-1, qt.Qt.AscendingOrder)
+        self.table_view.setSortingEnabled(True)
+
+        self.search_line_edit.textChanged.connect(self.table_model.set_filter_text)
+        self.finished.connect(lambda *args: self.database_summary_index.save())
+
+        header = self.table_view.horizontalHeader()
         for i in range(0, 6):
             header.setSectionResizeMode(i, qt.QHeaderView.ResizeToContents)
         header.setSectionResizeMode(6, qt.QHeaderView.Stretch)
 
-        self.box_layout.addWidget(self.table_widget)
+        self.box_layout.addWidget(self.table_view)
         
         # ---- Subject Level Buttons ----
         subject_buttons_layout = qt.QHBoxLayout()
@@ -596,8 +626,8 @@ class LoadSessionDialog(qt.QDialog):
 
         self.new_session_button.clicked.connect(self.on_new_session_clicked)
         self.load_session_button.clicked.connect(self.on_load_session_clicked)
-        self.table_widget.doubleClicked.connect(self.on_load_session_clicked)
-        self.table_widget.clicked.connect(lambda: self.load_session_button.setFocus())
+        self.table_view.doubleClicked.connect(self.on_load_session_clicked)
+        self.table_view.clicked.connect(lambda: self.load_session_button.setFocus())
         self.delete_session_button.clicked.connect(self.on_delete_session_clicked)
 
         # ---- Cancel Button ----
@@ -615,78 +645,12 @@ class LoadSessionDialog(qt.QDialog):
         self.resize(int(screen.width() * 0.50), int(screen.height() * 0.25))
 
     def update_sessions_list(self):
-        self.table_widget.setSortingEnabled(False) # turn off sorting during edit
-
-        session_ids = self.db.get_session_ids(self.subject_id)
-
-        self.table_widget.clearContents()
-        self.table_widget.setRowCount(0)
-        self.table_widget.setRowCount(len(session_ids))
-
-        for row, session_id in enumerate(session_ids):
-            # Session info
-            session = self.db.load_session(self.subject, session_id)
-            self.table_widget.setItem(row, 0, qt.QTableWidgetItem(session.name))
-            self.table_widget.setItem(row, 1, qt.QTableWidgetItem(session.id))
-
-            # Protocol, volume, transducer text
-            def safe_call(func, fallback="NA"):
-                try:
-                    return func()
-                except Exception:
-                    return fallback
-
-            protocol_name = safe_call(lambda: self.db.load_protocol(session.protocol_id).name)
-            volume_name = safe_call(lambda: self.db.get_volume_info(self.subject_id, session.volume_id)["name"])
-            transducer_name = safe_call(lambda: self.db.load_transducer(session.transducer_id).name)
-
-            protocol_text = f"{protocol_name} ({session.protocol_id})"
-            volume_text = f"{volume_name} ({session.volume_id})"
-            transducer_text = f"{transducer_name} ({session.transducer_id})"
-
-            self.table_widget.setItem(row, 2, qt.QTableWidgetItem(protocol_text))
-            self.table_widget.setItem(row, 3, qt.QTableWidgetItem(volume_text))
-            self.table_widget.setItem(row, 4, qt.QTableWidgetItem(transducer_text))
-
-            # Date created, modified
-
-            self.table_widget.setItem(row, 5, qt.QTableWidgetItem(session.date_created.strftime('%Y-%m-%d %H:%M')))
-            self.table_widget.setItem(row, 6, qt.QTableWidgetItem(session.date_modified.strftime('%Y-%m-%d %H:%M')))
-
-        self.table_widget.resizeRowsToContents()
-        self.table_widget.setSortingEnabled(True) # turn on sorting after edit
+        # Only the session IDs are listed here; the table model looks up the summaries of the rows as they are shown
+        self.table_model.set_ids(self.database_summary_index.get_session_ids(self.subject_id))
 
     @display_errors
     def append_session_to_list(self, session: "openlifu.db.session.Session") -> None:
-        self.table_widget.setSortingEnabled(False) # turn off sorting during edit
-
-        row = self.table_widget.rowCount
-        self.table_widget.insertRow(row)
-
-        def safe_call(func, fallback="NA"):
-            try:
-                return func()
-            except Exception:
-                return fallback
-
-        protocol_name = safe_call(lambda: self.db.load_protocol(session.protocol_id).name)
-        volume_name = safe_call(lambda: self.db.get_volume_info(self.subject_id, session.volume_id)["name"])
-        transducer_name = safe_call(lambda: self.db.load_transducer(session.transducer_id).name)
-
-        protocol_text = f"{protocol_name} ({session.protocol_id})"
-        volume_text = f"{volume_name} ({session.volume_id})"
-        transducer_text = f"{transducer_name} ({session.transducer_id})"
-
-        self.table_widget.setItem(row, 0, qt.QTableWidgetItem(session.name))
-        self.table_widget.setItem(row, 1, qt.QTableWidgetItem(session.id))
-        self.table_widget.setItem(row, 2, qt.QTableWidgetItem(protocol_text))
-        self.table_widget.setItem(row, 3, qt.QTableWidgetItem(volume_text))
-        self.table_widget.setItem(row, 4, qt.QTableWidgetItem(transducer_text))
-        self.table_widget.setItem(row, 5, qt.QTableWidgetItem(session.date_created.strftime('%Y-%m-%d %H:%M')))
-        self.table_widget.setItem(row, 6, qt.QTableWidgetItem(session.date_modified.strftime('%Y-%m-%d %H:%M')))
-
-        self.table_widget.resizeRowsToContents()
-        self.table_widget.setSortingEnabled(True) # turn on sorting after edit
+        self.table_model.add_id(session.id)
 
     @display_errors
     def on_new_session_clicked(self, checked: bool) -> None:
@@ -698,7 +662,7 @@ class LoadSessionDialog(qt.QDialog):
 
         # ---- Don't show unallowed protocols; requires loading protocols ----
         db_protocol_ids = self.db.get_protocol_ids()
-        protocols: List["openlifu.plan.Protocol"] = self.db.load_all_protocols()
+        protocols: List["openlifu.plan.Protocol"] = get_database_metadata_cache(self.db).get_all_protocols()
 
         if not get_user_account_mode_state() or 'admin' in get_current_user().roles:
             pass  # No filtering needed
@@ -733,18 +697,16 @@ class LoadSessionDialog(qt.QDialog):
         """
         Load the selected session into the OpenLIFUData module if the user has permission.
         """
-        selected_items = self.table_widget.selectedItems()
-        if not selected_items:
+        selected_rows = self.table_view.selectionModel().selectedRows()
+        if not selected_rows:
             slicer.util.errorDisplay("Please select a session to load.")
             return
 
-        row = selected_items[0].row()
-        session_id_item = self.table_widget.item(row, 1)  # Column 1 is Session ID
-        session_id = session_id_item.text()
+        session_id = self.table_model.id_at(selected_rows[0].row())
 
         # ---- Prevent loading sessions with unallowed protocols ----
         session = self.db.load_session(self.subject, session_id)
-        protocol = self.db.load_protocol(session.protocol_id)
+        protocol = get_database_metadata_cache(self.db).get_protocol(session.protocol_id)
 
         if not get_user_account_mode_state() or 'admin' in get_current_user().roles:
             pass  # No enforcement needed
@@ -765,16 +727,13 @@ class LoadSessionDialog(qt.QDialog):
         """
         Delete the selected session into the OpenLIFUData module if the user has permission.
         """
-        selected_items = self.table_widget.selectedItems()
-        if not selected_items:
+        selected_rows = self.table_view.selectionModel().selectedRows()
+        if not selected_rows:
             slicer.util.errorDisplay("Please select a session to delete.")
             return
 
-        row = selected_items[0].row()
-        session_name_item = self.table_widget.item(row, 0)  # Column 0 is Session name
-        session_name = session_name_item.text()
-        session_id_item = self.table_widget.item(row, 1)  # Column 1 is Session ID
-        session_id = session_id_item.text()
+        session_id = self.table_model.id_at(selected_rows[0].row())
+        session_name = self.database_summary_index.get_session_summary(self.subject, session_id).name
 
         # ---- Prevent deleting sessions if it is the currently loaded session ----
         if session_id == self.loaded_session_id:
@@ -789,7 +748,7 @@ class LoadSessionDialog(qt.QDialog):
             pass  # No enforcement needed
         else:
             session = self.db.load_session(self.subject, session_id)
-            protocol = self.db.load_protocol(session.protocol_id)
+            protocol = get_database_metadata_cache(self.db).get_protocol(session.protocol_id)
 
             if not any(role in protocol.allowed_roles for role in get_current_user().roles):
                 slicer.util.errorDisplay(
@@ -805,10 +764,11 @@ class LoadSessionDialog(qt.QDialog):
             windowTitle="Delete session?",
         ):
             self.db.delete_session(self.subject.id, session_id)
+            self.database_summary_index.invalidate_session(self.subject.id, session_id)
+            self.database_summary_index.invalidate_subject(self.subject.id)
 
             # Update session dialog
-            self.table_widget.removeRow(row)
-            self.table_widget.resizeRowsToContents()
+            self.table_model.remove_id(session_id)
 
     def exec_and_get_session(self) -> Optional["openlifu.db.session.Session"]:
         """
@@ -1094,6 +1054,8 @@ class OpenLIFUDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin, Guid
 
         # Session collapsible section
         self.ui.chooseSessionButton.clicked.connect(self.on_load_session_clicked)
+        self.ui.autosaveCheckBox.setChecked(get_autosave_enabled())
+        self.ui.autosaveCheckBox.toggled.connect(self.onAutosaveToggled)
 
         # ---- Issue updates that may not have been triggered yet ---
         
@@ -1107,6 +1069,11 @@ class OpenLIFUDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin, Guid
         self.update_sessionCollapsibleButton_checked_and_enabled()
         self.updateWorkflowControls()
 
+    def onAutosaveToggled(self, checked:bool) -> None:
+        set_autosave_enabled(checked)
+        if checked and self.logic.getParameterNode().loaded_session is not None:
+            self.logic.schedule_autosave() # save anything that changed while autosave was off
+
     def onDatabaseChanged(self, db: Optional["openlifu.db.Database"] = None):
         self.logic.subject = None
         self.logic.clear_session()
@@ -1293,7 +1260,11 @@ class OpenLIFUDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin, Guid
             ))
             self.loadedObjectsItemModel.appendRow(row)
         for volume_node in slicer.util.getNodesByClass('vtkMRMLScalarVolumeNode'):
-            if volume_node.GetAttribute('isOpenLIFUSolution') is not None or volume_node.GetAttribute('isOpenLIFUPhotoscan') is not None:
+            if (
+                volume_node.GetAttribute('isOpenLIFUSolution') is not None
+                or volume_node.GetAttribute('isOpenLIFUPhotoscan') is not None
+                or volume_node.GetAttribute(FOREGROUND_MASK_ATTRIBUTE) is not None
+            ):
                 continue
             if volume_node.GetAttribute('OpenLIFUData.volume_id'):
                 row = list(map(
@@ -1390,7 +1361,7 @@ class OpenLIFUDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin, Guid
 
         for row, volume_id in enumerate(volume_ids):
             # volume info
-            volume_info = db.get_volume_info(subject.id, volume_id)
+            volume_info = get_database_metadata_cache(db).get_volume_info(subject.id, volume_id)
             self.ui.volumesTableWidget.setItem(row, 0, qt.QTableWidgetItem(volume_info["name"]))
             self.ui.volumesTableWidget.setItem(row, 1, qt.QTableWidgetItem(volume_info["id"]))
             self.ui.volumesTableWidget.setItem(row, 2, qt.QTableWidgetItem(infer_format(str(volume_info["data_abspath"]))))
@@ -1625,6 +1596,33 @@ class OpenLIFUDataWidget(ScriptedLoadableModuleWidget, VTKObservationMixin, Guid
 # OpenLIFUDataLogic
 #
 
+def _run_session_load_stage(stage_name:str, parent_span:"ProfileSpan", stage_function:Callable, *args):
+    """Run a stage of `OpenLIFUDataLogic.load_session` in a worker thread, timing it as a stage of `parent_span`"""
+    with profile_span(stage_name, parent=parent_span):
+        return stage_function(*args)
+
+def _read_session_transducer(
+        db:"openlifu.db.Database",
+        transducer_id:str,
+    ) -> "Tuple[openlifu.xdc.Transducer, dict, TransducerModelData]":
+    """Read a transducer, the absolute paths of its affiliated files, and its geometry from the database, without
+    touching the scene. Used by `OpenLIFUDataLogic.load_session` from a worker thread."""
+    transducer = db.load_transducer(transducer_id)
+    transducer_abspaths_info = db.get_transducer_absolute_filepaths(transducer_id)
+    return transducer, transducer_abspaths_info, read_transducer_model_data(transducer, transducer_abspaths_info)
+
+def _read_session_photo_data(
+        db:"openlifu.db.Database",
+        subject_id:str,
+        session_id:str,
+        photoscan_ids:List[str],
+    ) -> "Tuple[Dict[str,openlifu.nav.photoscan.Photoscan], List[str]]":
+    """Read the photoscans and the photocollection reference numbers affiliated with a session, without touching the
+    scene. Used by `OpenLIFUDataLogic.load_session` from a worker thread."""
+    affiliated_photoscans = {photoscan_id:db.load_photoscan(subject_id, session_id, photoscan_id) for photoscan_id in photoscan_ids}
+    affiliated_photocollections = db.get_photocollection_reference_numbers(subject_id, session_id)
+    return affiliated_photoscans, affiliated_photocollections
+
 class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
     """This class should implement all the actual
     computation done by your module.  The interface
@@ -1651,6 +1649,36 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
         self._on_subject_changed_callbacks : List[Callable[[Optional["openlifu.db.Subject"]],None]] = []
         """List of functions to call when `subject` property is changed."""
 
+        self._session_change_tracker : Optional[SessionChangeTracker] = None
+        """Tracks what changed in the loaded session since it was loaded or last saved, so that `save_session` only
+        writes that. None if no session was loaded, or if the loaded session was restored from a saved scene rather
+        than loaded with `load_session`, in which case the next save writes everything."""
+
+        self._session_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="OpenLIFUSessionWriter")
+        """Writes session files in the background. There is a single thread so that writes land in the order that
+        they were made."""
+
+        self._autosave_timer = qt.QTimer()
+        self._autosave_timer.setSingleShot(True)
+        self._autosave_timer.setInterval(AUTOSAVE_QUIET_PERIOD_MS)
+        self._autosave_timer.timeout.connect(self._on_autosave_timeout)
+
+        self._autosave_future : Optional[Future] = None
+        """The background write of the most recent autosave"""
+
+        self._autosave_mark_not_saved : Optional[Callable[[],None]] = None
+        """Marks the changes written by the most recent autosave as not saved again, for when the write fails"""
+
+        self._autosave_failed = False
+        """Whether the most recent autosave failed, so that the user is told about a failure only once until an
+        autosave succeeds again"""
+
+        self._autosave_write_watch_timer = qt.QTimer()
+        self._autosave_write_watch_timer.setInterval(100)
+        self._autosave_write_watch_timer.timeout.connect(self._on_autosave_write_watch_timeout)
+        """Checks on the background write of the most recent autosave, so that its outcome is handled on the main
+        thread rather than the writer thread"""
+
     def getParameterNode(self):
         return OpenLIFUDataParameterNode(super().getParameterNode())
 
@@ -1694,6 +1722,8 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
         if loaded_session is None:
             return # There is no active session to clear
         self.getParameterNode().loaded_session = None
+        self._stop_tracking_session_changes()
+        self._autosave_timer.stop()
         if clean_up_scene:
             loaded_session.clear_volume_and_target_nodes()
             if loaded_session.get_transducer_id() in self.getParameterNode().loaded_transducers:
@@ -1718,10 +1748,33 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
 
             self.session_loading_unloading_in_progress = False
 
-    def save_session(self) -> None:
-        """Save the current session to the openlifu database.
-        This first writes the transducer and target information into the in-memory openlifu Session object,
-        and then it writes that Session object and any affiliated Photoscan objects to the database.
+    @profiled("save session")
+    def save_session(self, write_everything:bool = False) -> None:
+        """Save the current session to the openlifu database, waiting until it is written.
+
+        Only what changed since the session was loaded or last saved is written: the changed transducer, target and
+        result information is written into the in-memory openlifu Session object, the session file is rewritten if any
+        of it changed, and affiliated Photoscan objects are rewritten if they changed. Files are replaced atomically.
+        If nothing changed then nothing is written, so this is cheap enough to call often.
+
+        Args:
+            write_everything: Write the whole session and all affiliated photoscans, whether or not they changed.
+        """
+        self._autosave_timer.stop()
+        write_future, mark_not_saved = self._save_session_changes(write_everything)
+        try:
+            write_future.result()
+        except Exception:
+            mark_not_saved()
+            raise
+
+    def _save_session_changes(self, write_everything:bool = False) -> Tuple[Future, Callable[[],None]]:
+        """Start saving the changes to the current session (see `save_session`). The session is read and serialized
+        right away, on the calling (main) thread, so later changes do not affect what gets written; only the file
+        writes happen in the background.
+
+        Returns the future of the background write, and a function that marks the changes as not saved again. Call
+        that function, on the main thread, if the write fails, so that the changes are written by the next save.
         """
 
         if get_cur_db() is None:
@@ -1733,20 +1786,57 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
         if not self.validate_session():
             raise RuntimeError("Cannot save session because there is no active session, or the active session was invalid.")
 
-        session_openlifu = self.update_underlying_openlifu_session()
+        loaded_session : SlicerOpenLIFUSession = self.getParameterNode().loaded_session
+        if (
+            self._session_change_tracker is None
+            or not self._session_change_tracker.active
+            or self._session_change_tracker.session_id != loaded_session.get_session_id()
+        ):
+            # It is not known what changed, e.g. because the session was restored from a saved scene, so write everything
+            self._start_tracking_session_changes(loaded_session)
+            write_everything = True
+        if write_everything:
+            self._session_change_tracker.mark_all_modified(loaded_session.get_affiliated_photoscan_ids())
+
+        tracker = self._session_change_tracker
+        modified_components = set(tracker.modified_components)
+        modified_photoscan_ids = set(tracker.modified_photoscan_ids)
+        pending_writes = []
+
+        if modified_components:
+            session_openlifu = self.update_underlying_openlifu_session(modified_components)
+            pending_writes.append(prepare_session_file_write(get_cur_db(), self.subject, session_openlifu))
+            get_database_summary_index(get_cur_db()).invalidate_session(session_openlifu.subject_id, session_openlifu.id)
+
+        # Write any affiliated photoscan objects that changed
+        for photoscan in loaded_session.get_affiliated_photoscans():
+            if photoscan.id in modified_photoscan_ids:
+                pending_writes.append(prepare_photoscan_metadata_file_write(
+                    get_cur_db(), loaded_session.get_subject_id(), loaded_session.get_session_id(), photoscan
+                ))
+
+        # Changes made from here on are saved by the next save
+        tracker.mark_saved(modified_components, modified_photoscan_ids)
 
-        import openlifu.db.database
+        def write_files():
+            # This runs in the writer thread, so it must not touch the tracker or the scene
+            for pending_write in pending_writes:
+                if pending_write is not None: # None means it was already written
+                    write_pending_file(pending_write)
 
-        OnConflictOpts : "openlifu.db.database.OnConflictOpts" = openlifu.db.database.OnConflictOpts
-        get_cur_db().write_session(self.subject,session_openlifu,on_conflict=OnConflictOpts.OVERWRITE)
+        def mark_not_saved():
+            tracker.mark_not_saved(modified_components, modified_photoscan_ids)
 
-        # Write any affiliated photoscan objects
-        for photoscan in self.getParameterNode().loaded_session.get_affiliated_photoscans():
-            get_cur_db().write_photoscan(session_openlifu.subject_id, session_openlifu.id, photoscan, on_conflict=OnConflictOpts.OVERWRITE)
+        return self._session_writer.submit(write_files), mark_not_saved
 
-    def update_underlying_openlifu_session(self) -> "openlifu.db.Session":
+    def update_underlying_openlifu_session(self, components:Optional[Iterable[SessionComponent]] = None) -> "openlifu.db.Session":
         """Update the underlying openlifu session of the currently loaded session, if there is one.
-        Returns the newly updated openlifu Session object."""
+        Returns the newly updated openlifu Session object.
+
+        Args:
+            components: the parts of the session to update, by default all of them. See
+                `SlicerOpenLIFUSession.update_underlying_openlifu_session`.
+        """
         parameter_node = self.getParameterNode()
 
         if parameter_node.loaded_session is None:
@@ -1757,10 +1847,86 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
             targets = get_target_candidates()
             # TODO: I think instead of getting all 1-point fiducial nodes as targets, we should attribute-tag targets with
             # the session ID, and have a tool that adds and retrieves targets by session ID similar to what we do for virtual fit results
-            session_openlifu = session.update_underlying_openlifu_session(targets)
+            session_openlifu = session.update_underlying_openlifu_session(targets, components)
             parameter_node.loaded_session = session # remember to write the updated session into the parameter node
             return session_openlifu
 
+    def _start_tracking_session_changes(self, session:SlicerOpenLIFUSession) -> None:
+        """Start tracking the changes to the given session, treating it as unmodified until something changes."""
+        self._stop_tracking_session_changes()
+        self._session_change_tracker = SessionChangeTracker(
+            slicer.mrmlScene,
+            session_id = session.get_session_id(),
+            transducer_transform_node = session.get_transducer().transform_node,
+            on_modified = self.schedule_autosave,
+        )
+
+    def _stop_tracking_session_changes(self) -> None:
+        if self._session_change_tracker is not None:
+            self._session_change_tracker.stop()
+            self._session_change_tracker = None
+
+    def schedule_autosave(self) -> None:
+        """Save the changes to the loaded session once it has gone without changes for a while, if autosave is
+        enabled (see `OpenLIFULib.session_saving.get_autosave_enabled`). Calling this again before then restarts the
+        wait, so that a burst of changes is saved with a single write. The files are written in a background thread,
+        so an autosave does not hold up the GUI."""
+        if not get_autosave_enabled():
+            return
+        self._autosave_timer.start() # restarts the timer if it is already running
+
+    def _on_autosave_timeout(self) -> None:
+        parameter_node = self.getParameterNode()
+        if (
+            not get_autosave_enabled()
+            or parameter_node.loaded_session is None
+            or get_cur_db() is None
+            or self.subject is None
+            or self.session_loading_unloading_in_progress
+        ):
+            return
+        if self._autosave_future is not None:
+            # The previous autosave is still being written, or its outcome was not handled yet; try again after it had some more time
+            self._autosave_timer.start()
+            return
+        try:
+            with profile_span("autosave session"): # only the part on the main thread; the files are written afterwards
+                self._autosave_future, self._autosave_mark_not_saved = self._save_session_changes()
+        except Exception as e:
+            self._on_autosave_failed(e)
+            return
+        self._autosave_write_watch_timer.start()
+
+    def _on_autosave_write_watch_timeout(self) -> None:
+        if self._autosave_future is None:
+            self._autosave_write_watch_timer.stop()
+            return
+        if not self._autosave_future.done():
+            return
+        self._autosave_write_watch_timer.stop()
+        exception = self._autosave_future.exception()
+        if exception is not None:
+            self._autosave_mark_not_saved()
+            self._on_autosave_failed(exception)
+        else:
+            self._autosave_failed = False
+        self._autosave_future = None
+        self._autosave_mark_not_saved = None
+
+    def _on_autosave_failed(self, exception:Exception) -> None:
+        """Tell the user about a failed autosave, the first time in a row that it fails, and try again later"""
+        logging.warning(f"Could not autosave the session: {exception}")
+        if not self._autosave_failed:
+            notify(f"Could not autosave the session; it will be tried again.\n{exception}")
+        self._autosave_failed = True
+        self.schedule_autosave()
+
+    def mark_affiliated_photoscan_modified(self, photoscan_id:str) -> None:
+        """Note that a photoscan affiliated with the loaded session changed, so that the next `save_session` writes it.
+        Changes that are made in the scene, such as to targets, the transducer transform, or virtual fit and transducer
+        tracking results, are noticed automatically; photoscans are not part of the scene so they need this."""
+        if self._session_change_tracker is not None:
+            self._session_change_tracker.mark_photoscan_modified(photoscan_id)
 
     def validate_session(self) -> bool:
         """Check to ensure that the currently active session is in a valid state, clearing out the session
@@ -1885,14 +2051,24 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
         if affiliated_photocollections:
             loaded_session.set_affiliated_photocollections(affiliated_photocollections)
 
-    def update_photoscans_affiliated_with_loaded_session(self) -> None:
+    def update_photoscans_affiliated_with_loaded_session(
+            self,
+            affiliated_photoscans:"Optional[Dict[str,openlifu.nav.photoscan.Photoscan]]" = None,
+        ) -> None:
+        """Record the photoscans affiliated with the loaded session in the session.
+
+        Args:
+            affiliated_photoscans: Mapping from photoscan ID to photoscan for the photoscans affiliated with the loaded
+                session, if they were already read from the database. If None then they are read here.
+        """
 
         loaded_session = self.getParameterNode().loaded_session
         subject_id = loaded_session.get_subject_id()
         session_id = loaded_session.get_session_id()
         
         # Keep track of any photoscans associated with the session
-        affiliated_photoscans = {id:get_cur_db().load_photoscan(subject_id, session_id, id) for id in get_cur_db().get_photoscan_ids(subject_id, session_id)}
+        if affiliated_photoscans is None:
+            affiliated_photoscans = {id:get_cur_db().load_photoscan(subject_id, session_id, id) for id in get_cur_db().get_photoscan_ids(subject_id, session_id)}
         if affiliated_photoscans:
             loaded_session.set_affiliated_photoscans(affiliated_photoscans)
 
@@ -1977,37 +2153,92 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
         
         # === Proceed with loading session ===
 
-        self.clear_session()
+        # Loading happens in stages. Reading and parsing the session data from disk does not touch the scene, so it is
+        # started right away in worker threads, all at once. Meanwhile the main thread clears the old session, and then
+        # creates the scene nodes for each piece of data as it becomes available. Each stage is timed; see OpenLIFULib.profiling.
 
-        self.session_loading_unloading_in_progress = True  
+        with profile_span("load session") as load_session_span, ThreadPoolExecutor(max_workers=4) as executor:
+            db = get_cur_db()
+            metadata_cache = get_database_metadata_cache(db)
+            volume_info = metadata_cache.get_volume_info(session_openlifu.subject_id, session_openlifu.volume_id)
 
-        volume_info = get_cur_db().get_volume_info(session_openlifu.subject_id, session_openlifu.volume_id)
+            read_volume_future = executor.submit(
+                _run_session_load_stage, "read volume and compute foreground mask", load_session_span,
+                read_volume_and_compute_foreground_mask, volume_info['data_abspath'], get_streaming_volume_loading_enabled(),
+                get_session_foreground_mask_store_dir(db.path, subject_id, session_id),
+            )
+            read_transducer_future = executor.submit(
+                _run_session_load_stage, "read transducer", load_session_span,
+                _read_session_transducer, db, session_openlifu.transducer_id,
+            )
+            read_protocol_future = executor.submit(
+                _run_session_load_stage, "read protocol", load_session_span,
+                metadata_cache.get_protocol, session_openlifu.protocol_id,
+            )
+            read_photo_data_future = executor.submit(
+                _run_session_load_stage, "read photoscans and photocollections", load_session_span,
+                _read_session_photo_data, db, subject_id, session_id, session_affiliated_photoscans,
+            )
 
-       # Create the SlicerOpenLIFU session object; this handles loading volume and targets
-        new_session = SlicerOpenLIFUSession.initialize_from_openlifu_session(
-            session_openlifu,
-            volume_info
-        )
+            with profile_span("clear previous session"):
+                self.clear_session()
 
-        # === Load transducer ===
+            self.session_loading_unloading_in_progress = True  
 
-        transducer_openlifu = get_cur_db().load_transducer(session_openlifu.transducer_id)
-        transducer_abspaths_info = get_cur_db().get_transducer_absolute_filepaths(session_openlifu.transducer_id)
-        newly_loaded_transducer = self.load_transducer_from_openlifu(
-            transducer = transducer_openlifu,
-            transducer_abspaths_info = transducer_abspaths_info,
-            transducer_matrix = session_openlifu.array_transform.matrix,
-            transducer_matrix_units = session_openlifu.array_transform.units,
-            replace_confirmed = True,
-        )
-        newly_loaded_transducer.set_visibility(False)
+            # Create the SlicerOpenLIFU session object; this handles adding the volume and targets to the scene
+            read_volume = read_volume_future.result()
+            with profile_span("create volume and target nodes"):
+                new_session = SlicerOpenLIFUSession.initialize_from_openlifu_session(
+                    session_openlifu,
+                    volume_info,
+                    read_volume = read_volume,
+                )
+
+            # === Load transducer ===
+
+            transducer_openlifu, transducer_abspaths_info, transducer_model_data = read_transducer_future.result()
+            with profile_span("create transducer nodes"):
+                newly_loaded_transducer = self.load_transducer_from_openlifu(
+                    transducer = transducer_openlifu,
+                    transducer_abspaths_info = transducer_abspaths_info,
+                    transducer_matrix = session_openlifu.array_transform.matrix,
+                    transducer_matrix_units = session_openlifu.array_transform.units,
+                    replace_confirmed = True,
+                    model_data = transducer_model_data,
+                )
+                newly_loaded_transducer.set_visibility(False)
 
-        # === Load protocol ===
+            # === Load protocol ===
 
-        self.load_protocol_from_openlifu(
-            get_cur_db().load_protocol(session_openlifu.protocol_id),
-            replace_confirmed = True,
-        )
+            protocol_openlifu = read_protocol_future.result()
+            with profile_span("load protocol"):
+                self.load_protocol_from_openlifu(
+                    protocol_openlifu,
+                    replace_confirmed = True,
+                )
+
+            session_affiliated_photoscans_openlifu, session_affiliated_photocollections = read_photo_data_future.result()
+
+            with profile_span("create result nodes and set up views"):
+                newly_added_tt_result_nodes = self._create_session_result_nodes_and_views(
+                    session_openlifu, new_session, newly_loaded_transducer,
+                )
+
+            self._finish_loading_session(
+                new_session, newly_loaded_transducer, newly_added_tt_result_nodes,
+                session_affiliated_photoscans_openlifu, session_affiliated_photocollections,
+            )
+
+        self.session_loading_unloading_in_progress = False  
+
+    def _create_session_result_nodes_and_views(
+            self,
+            session_openlifu:"openlifu.db.Session",
+            new_session:SlicerOpenLIFUSession,
+            newly_loaded_transducer:SlicerOpenLIFUTransducer,
+        ) -> List[Tuple[vtkMRMLTransformNode, vtkMRMLTransformNode]]:
+        """The stage of `load_session` that recreates the virtual fit and transducer localization result nodes of a
+        session and sets up the views. Returns the newly added transducer localization result nodes."""
 
         # === Load virtual fit results ===
 
@@ -2048,34 +2279,52 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
             newly_loaded_transducer.move_node_into_transducer_sh_folder(transducer_to_volume_node)
             newly_loaded_transducer.move_node_into_transducer_sh_folder(photoscan_to_volume_node)
 
-        # === Toggle slice visibility and center slices on first target ===
+        # There are no views to set up when Slicer runs without a main window, e.g. in headless benchmarks
+        if slicer.app.layoutManager() is not None:
+
+            # === Toggle slice visibility and center slices on first target ===
 
-        slices_center_point = new_session.get_initial_center_point()
-        for slice_node_name in ["Red", "Green", "Yellow"]:
-            sliceNode = slicer.util.getFirstNodeByClassByName("vtkMRMLSliceNode", slice_node_name)
-            sliceNode.JumpSliceByCentering(*slices_center_point)
+            slices_center_point = new_session.get_initial_center_point()
+            for slice_node_name in ["Red", "Green", "Yellow"]:
+                sliceNode = slicer.util.getFirstNodeByClassByName("vtkMRMLSliceNode", slice_node_name)
+                sliceNode.JumpSliceByCentering(*slices_center_point)
+                sliceNode.SetSliceVisible(True)
+            sliceNode = slicer.util.getFirstNodeByClassByName("vtkMRMLSliceNode", "Green")
             sliceNode.SetSliceVisible(True)
-        sliceNode = slicer.util.getFirstNodeByClassByName("vtkMRMLSliceNode", "Green")
-        sliceNode.SetSliceVisible(True)
-        sliceNode = slicer.util.getFirstNodeByClassByName("vtkMRMLSliceNode", "Yellow")
-        sliceNode.SetSliceVisible(True)
+            sliceNode = slicer.util.getFirstNodeByClassByName("vtkMRMLSliceNode", "Yellow")
+            sliceNode.SetSliceVisible(True)
+
+            # === Set camera ===
 
-        # === Set camera ===
+            threeDView = slicer.app.layoutManager().threeDWidget(0).threeDView()
+            threeDView.resetCamera()
+            threeDView.resetFocalPoint()
 
-        threeDView = slicer.app.layoutManager().threeDWidget(0).threeDView()
-        threeDView.resetCamera()
-        threeDView.resetFocalPoint()
+        return newly_added_tt_result_nodes
+
+    def _finish_loading_session(
+            self,
+            new_session:SlicerOpenLIFUSession,
+            newly_loaded_transducer:SlicerOpenLIFUTransducer,
+            newly_added_tt_result_nodes:List[Tuple[vtkMRMLTransformNode, vtkMRMLTransformNode]],
+            affiliated_photoscans:Dict[str,"openlifu.nav.photoscan.Photoscan"],
+            affiliated_photocollections:List[str],
+        ) -> None:
+        """The last stage of `load_session`, which makes the new session the active one."""
 
         # === Set the newly created session as the currently active session ===
 
         self.getParameterNode().loaded_session = new_session
 
+        # What was just loaded matches the database, so from here on only the changes need to be saved. This includes
+        # any approvals that get revoked below.
+        self._start_tracking_session_changes(new_session)
+
         # === Keep track of affiliated photoscans and unload any conflicting photoscans that have been previously loaded ===
-        self.update_photoscans_affiliated_with_loaded_session()
+        self.update_photoscans_affiliated_with_loaded_session(affiliated_photoscans)
 
         # === Load photocollections as all scan_ids ===
-        session_affiliated_photocollections = get_cur_db().get_photocollection_reference_numbers(subject_id, session_id)
-        self.getParameterNode().session_photocollections = session_affiliated_photocollections
+        self.getParameterNode().session_photocollections = affiliated_photocollections
 
         # If there are any *approved* transducer localization results that we have just loaded in newly_added_tt_result_nodes,
         # then we check to see if any of them match the current transducer transform in terms of matrix values.
@@ -2100,8 +2349,6 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
                             reason="The transducer transform does not match the approved localization result."
                         )
 
-        self.session_loading_unloading_in_progress = False  
-
     # TODO: This should be a widget level function
     def _on_transducer_transform_modified(self, transducer: SlicerOpenLIFUTransducer) -> None:
 
@@ -2200,6 +2447,7 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
             transducer_matrix: Optional[np.ndarray]=None,
             transducer_matrix_units: Optional[str]=None,
             replace_confirmed: bool = False,
+            model_data: "Optional[TransducerModelData]" = None,
         ) -> SlicerOpenLIFUTransducer:
         """Load an openlifu transducer object into the scene as a SlicerOpenLIFUTransducer,
         adding it to the list of loaded openlifu objects.
@@ -2216,6 +2464,7 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
                 these units. If left as None then the transducer's native units (Transducer.units) will be assumed.
             replace_confirmed: Whether we can bypass the prompt to re-load an already loaded Transducer.
                 This could be used for example if we already know the user is okay with re-loading the transducer.
+            model_data: The transducer geometry, if it was already read with `read_transducer_model_data`.
 
         Returns: The newly loaded SlicerOpenLIFUTransducer.
         """
@@ -2239,6 +2488,7 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
             transducer_abspaths_info,
             transducer_matrix=transducer_matrix,
             transducer_matrix_units=transducer_matrix_units,
+            model_data=model_data,
         )
         self.getParameterNode().loaded_transducers[transducer.id] = newly_loaded_transducer
 
@@ -2362,6 +2612,7 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
             solution_openlifu = solution.solution.solution
             self.getParameterNode().loaded_session.last_generated_solution_id = solution_openlifu.id
             get_cur_db().write_solution(session_openlifu, solution_openlifu)
+            self.schedule_autosave() # a new solution is a good moment to also save the session that it was planned on
 
 
     def clear_solution(self,  clean_up_scene:bool = True) -> None:
@@ -2395,6 +2646,7 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
             
             # Session and protocol snapshots are optional arguments
             get_cur_db().write_run(run_openlifu, session_openlifu, protocol_openlifu)
+            self.schedule_autosave()
             
     def add_subject_to_database(self, subject_name, subject_id):
         """ Adds new subject to loaded openlifu database.
@@ -2422,6 +2674,7 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
                 return
 
         get_cur_db().write_subject(newOpenLIFUSubject, on_conflict = openlifu.db.database.OnConflictOpts.OVERWRITE)
+        get_database_summary_index(get_cur_db()).invalidate_subject(subject_id)
 
     def get_virtual_fit_approvals_in_session(self) -> List[str]:
         """Get the virtual fit approval state in the current session object, a list of target IDs for which virtual fit
@@ -2654,6 +2907,8 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
         import openlifu.db.database
 
         get_cur_db().write_volume(subject_id, volume_id, volume_name, volume_filepath, on_conflict = openlifu.db.database.OnConflictOpts.OVERWRITE)
+        get_database_metadata_cache(get_cur_db()).invalidate_volume(subject_id, volume_id)
+        get_database_summary_index(get_cur_db()).invalidate_subject(subject_id)
 
     def add_session_to_database(self, subject_id: str, session_parameters: Dict) -> bool:
         """ Add new session to selected subject in the loaded openlifu database
@@ -2687,6 +2942,9 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
             transducer_id = session_parameters['transducer_id']
         )
         get_cur_db().write_session(self.get_subject(subject_id), newOpenLIFUSession, on_conflict = openlifu.db.database.OnConflictOpts.OVERWRITE)
+        database_summary_index = get_database_summary_index(get_cur_db())
+        database_summary_index.invalidate_session(subject_id, session_parameters['id'])
+        database_summary_index.invalidate_subject(subject_id)
         return True
 
     def add_photocollection_to_database(self, subject_id: str, session_id: str, photocollection_parameters: Dict) -> bool:
@@ -2778,6 +3036,7 @@ class OpenLIFUDataLogic(ScriptedLoadableModuleLogic):
 
                 OnConflictOpts : "openlifu.db.database.OnConflictOpts" = openlifu.db.database.OnConflictOpts
                 get_cur_db().write_solution(session.session.session, solution.solution.solution, on_conflict=OnConflictOpts.OVERWRITE)
+                self.schedule_autosave()
             else:
                 # This can happen if, for example, a solution is generated from a session and then a new session is loaded and the user
                 # tries to toggle approval on the old solution. The user would have to have kept the old solution around by
@@ -2815,7 +3074,7 @@ class OpenLIFUDataTest(ScriptedLoadableModuleTest):
         load_subject_dlg = LoadSubjectDialog(cur_db)
 
         def simulate_user():
-            load_subject_dlg.tableWidget.selectRow(0) # Manually choose first subject
+            load_subject_dlg.tableView.selectRow(0) # Manually choose first subject
             load_subject_dlg.onLoadSubjectClicked() 
 
         qt.QTimer.singleShot(0, simulate_user) # Needed since the dialog is modal
@@ -2829,7 +3088,7 @@ class OpenLIFUDataTest(ScriptedLoadableModuleTest):
         # Simulate session selection
         load_session_dlg = LoadSessionDialog(cur_db, dw.logic.subject.id)
         def simulate_user_session():
-            load_session_dlg.table_widget.selectRow(0) # Manually choose first session
+            load_session_dlg.table_view.selectRow(0) # Manually choose first session
             load_session_dlg.on_load_session_clicked()
 
         qt.QTimer.singleShot(0, simulate_user_session) # Needed since the dialog is modal   
@@ -2839,3 +3098,325 @@ class OpenLIFUDataTest(ScriptedLoadableModuleTest):
 
         assert result is True
         assert dw.logic.getParameterNode().loaded_session.get_session_id() == "test_session"
+
+    def _workflow_session_file_writes_match_database(self):
+        """Test that the session and photoscan files written by session saving are byte-identical to the ones that
+        openlifu's Database.write_session and Database.write_photoscan write."""
+        from unittest import mock
+        import openlifu.db.database
+
+        data_logic : OpenLIFUDataLogic = slicer.modules.OpenLIFUDataWidget.logic
+        cur_db = get_cur_db()
+        subject = data_logic.subject
+        loaded_session : SlicerOpenLIFUSession = data_logic.getParameterNode().loaded_session
+        session_openlifu = data_logic.update_underlying_openlifu_session()
+
+        session_filepath = Path(cur_db.get_session_filename(subject.id, session_openlifu.id))
+        photoscans = loaded_session.get_affiliated_photoscans()
+        photoscan_filepaths = [
+            Path(cur_db.get_photoscan_metadata_filepath(subject.id, session_openlifu.id, photoscan.id))
+            for photoscan in photoscans
+        ]
+        original_file_contents = {path : path.read_bytes() for path in [session_filepath, *photoscan_filepaths]}
+
+        try:
+            # Freeze the modification time, which both ways of writing update
+            with mock.patch.object(type(session_openlifu), "update_modified_time", lambda self: None):
+                pending_session_write = prepare_session_file_write(cur_db, subject, session_openlifu)
+                assert pending_session_write is not None
+                assert pending_session_write.path == session_filepath
+                cur_db.write_session(subject, session_openlifu, on_conflict=openlifu.db.database.OnConflictOpts.OVERWRITE)
+            database_session_bytes = session_filepath.read_bytes()
+            write_pending_file(pending_session_write)
+            assert session_filepath.read_bytes() == database_session_bytes
+
+            for photoscan, photoscan_filepath in zip(photoscans, photoscan_filepaths):
+                pending_photoscan_write = prepare_photoscan_metadata_file_write(
+                    cur_db, subject.id, session_openlifu.id, photoscan
+                )
+                assert pending_photoscan_write is not None
+                assert pending_photoscan_write.path == photoscan_filepath
+                cur_db.write_photoscan(
+                    subject.id, session_openlifu.id, photoscan, on_conflict=openlifu.db.database.OnConflictOpts.OVERWRITE
+                )
+                database_photoscan_bytes = photoscan_filepath.read_bytes()
+                write_pending_file(pending_photoscan_write)
+                assert photoscan_filepath.read_bytes() == database_photoscan_bytes
+        finally:
+            for path, contents in original_file_contents.items():
+                path.write_bytes(contents)
+
+    def _make_summary_table_model(self, summaries:Dict[str,Tuple[str,int]], indexed_ids:Iterable[str] = ()):
+        """Make a SummaryTableModel over (name, age) summaries. Returns the model and the list of IDs whose summaries it
+        looked up through get_summary, in order. The summaries of `indexed_ids` are also available to peek_summary."""
+        indexed_ids = set(indexed_ids)
+        looked_up_ids = []
+        def get_summary(object_id):
+            looked_up_ids.append(object_id)
+            return summaries[object_id]
+        model = SummaryTableModel(
+            columns = [
+                SummaryTableColumn("Name", lambda summary : summary[0]),
+                SummaryTableColumn("Age", lambda summary : str(summary[1]), sort_key = lambda summary : summary[1]),
+            ],
+            get_summary = get_summary,
+            peek_summary = lambda object_id : summaries[object_id] if object_id in indexed_ids else None,
+        )
+        return model, looked_up_ids
+
+    def _summary_table_model_ids(self, model:SummaryTableModel) -> List[str]:
+        return [model.id_at(row) for row in range(model.rowCount())]
+
+    def test_summary_table_model_fetches_rows_in_batches(self):
+        batch_size = SummaryTableModel.FETCH_BATCH_SIZE
+        summaries = {f"id{i:04d}" : (f"name{i}", i) for i in range(2*batch_size + batch_size//2)}
+        model, looked_up_ids = self._make_summary_table_model(summaries)
+        model.set_ids(list(summaries.keys()))
+
+        # Only the first batch is handed to the view, and nothing is looked up until a row is displayed
+        self.assertEqual(model.rowCount(), batch_size)
+        self.assertEqual(model.columnCount(), 2)
+        self.assertTrue(model.canFetchMore(qt.QModelIndex()))
+        self.assertEqual(looked_up_ids, [])
+
+        model.fetchMore(qt.QModelIndex())
+        self.assertEqual(model.rowCount(), 2*batch_size)
+        model.fetchMore(qt.QModelIndex())
+        self.assertEqual(model.rowCount(), len(summaries))
+        self.assertFalse(model.canFetchMore(qt.QModelIndex()))
+        model.fetchMore(qt.QModelIndex())
+        self.assertEqual(model.rowCount(), len(summaries))
+        self.assertEqual(self._summary_table_model_ids(model), list(summaries.keys()))
+
+        # Displayed summaries are looked up once
+        row = batch_size + 3
+        self.assertEqual(model.data(model.index(row, 0)), f"name{row}")
+        self.assertEqual(model.data(model.index(row, 1)), str(row))
+        self.assertEqual(looked_up_ids, [f"id{row:04d}"])
+
+    def test_summary_table_model_add_and_remove_ids(self):
+        batch_size = SummaryTableModel.FETCH_BATCH_SIZE
+        summaries = {f"id{i:04d}" : (f"name{i}", i) for i in range(batch_size + 2)}
+        model, looked_up_ids = self._make_summary_table_model(summaries)
+        model.set_ids([f"id{i:04d}" for i in range(3)])
+
+        # A new ID is appended as a row right away when all rows have been fetched
+        model.add_id("id0003")
+        self.assertEqual(self._summary_table_model_ids(model), ["id0000", "id0001", "id0002", "id0003"])
+
+        # Adding a listed ID refreshes its summary instead of listing it twice
+        self.assertEqual(model.data(model.index(1, 0)), "name1")
+        summaries["id0001"] = ("renamed", 1)
+        model.add_id("id0001")
+        self.assertEqual(model.rowCount(), 4)
+        self.assertEqual(model.data(model.index(1, 0)), "renamed")
+        self.assertEqual(looked_up_ids, ["id0001", "id0001"])
+
+        model.remove_id("id0001")
+        self.assertEqual(self._summary_table_model_ids(model), ["id0000", "id0002", "id0003"])
+        model.remove_id("not_listed")
+        self.assertEqual(model.rowCount(), 3)
+
+        # While rows remain to be fetched, added IDs wait to be fetched along with them
+        model.set_ids([f"id{i:04d}" for i in range(batch_size + 1)])
+        model.add_id(f"id{batch_size + 1:04d}")
+        self.assertEqual(model.rowCount(), batch_size)
+        model.remove_id(f"id{batch_size:04d}")
+        self.assertEqual(model.rowCount(), batch_size)
+        model.fetchMore(qt.QModelIndex())
+        self.assertEqual(model.rowCount(), batch_size + 1)
+        self.assertEqual(model.id_at(batch_size), f"id{batch_size + 1:04d}")
+        self.assertFalse(model.canFetchMore(qt.QModelIndex()))
+
+    def test_summary_table_model_filters_and_sorts(self):
+        summaries = {
+            "a" : ("Alice", 40),
+            "b" : ("Bob", 7),
+            "c" : ("alfred", 100),
+            "d" : ("Dana", 23),
+        }
+        model, looked_up_ids = self._make_summary_table_model(summaries, indexed_ids=["a", "b", "c"])
+        model.set_ids(list(summaries.keys()))
+
+        # Sorting uses the sort key of the column rather than its text, and prefers already indexed summaries
+        model.sort(1, qt.Qt.AscendingOrder)
+        self.assertEqual(self._summary_table_model_ids(model), ["b", "d", "a", "c"])
+        self.assertEqual(looked_up_ids, ["d"])
+        model.sort(1, qt.Qt.DescendingOrder)
+        self.assertEqual(self._summary_table_model_ids(model), ["c", "a", "d", "b"])
+        model.sort(0, qt.Qt.AscendingOrder)
+        self.assertEqual(self._summary_table_model_ids(model), ["a", "b", "d", "c"])
+
+        # Filtering matches any column, ignoring case, and keeps the sort order
+        model.set_filter_text(" AL ")
+        self.assertEqual(self._summary_table_model_ids(model), ["a", "c"])
+        model.set_filter_text("7")
+        self.assertEqual(self._summary_table_model_ids(model), ["b"])
+
+        # Added IDs that do not pass the filter are not shown, but are kept for when the filter changes
+        summaries["e"] = ("Eve", 70)
+        model.add_id("e")
+        self.assertEqual(self._summary_table_model_ids(model), ["b", "e"])
+        summaries["f"] = ("Frank", 1)
+        model.add_id("f")
+        self.assertEqual(self._summary_table_model_ids(model), ["b", "e"])
+        model.set_filter_text("")
+        self.assertEqual(self._summary_table_model_ids(model), ["a", "b", "d", "e", "f", "c"])
+
+    def test_session_change_tracker_marks_modified_components(self):
+        session_id = "session_change_tracker_test"
+        transducer_transform_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTransformNode")
+        added_nodes = [transducer_transform_node]
+        on_modified_calls = []
+        tracker = SessionChangeTracker(
+            slicer.mrmlScene,
+            session_id = session_id,
+            transducer_transform_node = transducer_transform_node,
+            on_modified = lambda : on_modified_calls.append(True),
+        )
+
+        def add_node(class_name:str):
+            node = slicer.mrmlScene.AddNewNodeByClass(class_name)
+            added_nodes.append(node)
+            return node
+
+        def assert_modified_and_reset(expected_components):
+            self.assertEqual(tracker.modified_components, expected_components)
+            self.assertEqual(tracker.is_modified(), bool(expected_components))
+            tracker.mark_saved(SessionComponent, [])
+
+        try:
+            # Moving the transducer changes the session, while attributes of its transform node do not
+            transducer_transform_node.SetAttribute("matching_transform_id", "some_id")
+            assert_modified_and_reset(set())
+            transducer_matrix = vtk.vtkMatrix4x4()
+            transducer_matrix.SetElement(0, 3, 10.)
+            transducer_transform_node.SetMatrixTransformToParent(transducer_matrix)
+            assert_modified_and_reset({SessionComponent.TRANSDUCER_TRANSFORM})
+
+            # Fiducial nodes are targets while they have a single point
+            fiducial_node = add_node("vtkMRMLMarkupsFiducialNode")
+            assert_modified_and_reset(set())
+            fiducial_node.AddControlPoint(0., 0., 0.)
+            assert_modified_and_reset({SessionComponent.TARGETS})
+            fiducial_node.SetNthControlPointPosition(0, 1., 2., 3.)
+            assert_modified_and_reset({SessionComponent.TARGETS})
+            fiducial_node.InvokeEvent(SlicerOpenLIFUEvents.TARGET_NAME_MODIFIED_EVENT)
+            assert_modified_and_reset({SessionComponent.TARGETS})
+            fiducial_node.AddControlPoint(4., 5., 6.) # no longer a target, which still changes the session targets
+            assert_modified_and_reset({SessionComponent.TARGETS})
+            fiducial_node.AddControlPoint(7., 8., 9.)
+            assert_modified_and_reset(set())
+
+            # Result nodes count only if they belong to the session
+            unrelated_transform_node = add_node("vtkMRMLTransformNode")
+            unrelated_transform_node.SetMatrixTransformToParent(transducer_matrix)
+            unrelated_transform_node.SetAttribute("isVirtualFitResult", "1")
+            unrelated_transform_node.SetAttribute("VF:sessionID", "another_session")
+            assert_modified_and_reset(set())
+            virtual_fit_result_node = add_node("vtkMRMLTransformNode")
+            virtual_fit_result_node.SetAttribute("VF:sessionID", session_id)
+            virtual_fit_result_node.SetAttribute("isVirtualFitResult", "1")
+            assert_modified_and_reset({SessionComponent.VIRTUAL_FIT_RESULTS})
+            virtual_fit_result_node.SetAttribute("VF:approvalStatus", "1")
+            assert_modified_and_reset({SessionComponent.VIRTUAL_FIT_RESULTS})
+            tracking_result_node = add_node("vtkMRMLTransformNode")
+            tracking_result_node.SetAttribute("TT:sessionID", session_id)
+            tracking_result_node.SetAttribute("isTT-TRANSDUCER_TO_VOLUME", "1")
+            assert_modified_and_reset({SessionComponent.TRANSDUCER_TRACKING_RESULTS})
+
+            # Removing a result changes the session, as does a result that stops belonging to the session
+            slicer.mrmlScene.RemoveNode(tracking_result_node)
+            assert_modified_and_reset({SessionComponent.TRANSDUCER_TRACKING_RESULTS})
+            virtual_fit_result_node.RemoveAttribute("isVirtualFitResult")
+            assert_modified_and_reset({SessionComponent.VIRTUAL_FIT_RESULTS})
+            virtual_fit_result_node.SetAttribute("VF:rank", "2")
+            assert_modified_and_reset(set())
+
+            # Nothing is tracked after stopping
+            self.assertTrue(on_modified_calls)
+            num_on_modified_calls = len(on_modified_calls)
+            tracker.stop()
+            self.assertFalse(tracker.active)
+            transducer_transform_node.SetMatrixTransformToParent(vtk.vtkMatrix4x4())
+            fiducial_node.SetNthControlPointPosition(0, 0., 0., 0.)
+            assert_modified_and_reset(set())
+            self.assertEqual(len(on_modified_calls), num_on_modified_calls)
+        finally:
+            tracker.stop()
+            for node in added_nodes:
+                if node.GetScene() is not None:
+                    slicer.mrmlScene.RemoveNode(node)
+
+    def test_session_change_tracker_save_bookkeeping(self):
+        transducer_transform_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLTransformNode")
+        on_modified_calls = []
+        tracker = SessionChangeTracker(
+            slicer.mrmlScene,
+            session_id = "session_change_tracker_test",
+            transducer_transform_node = transducer_transform_node,
+            on_modified = lambda : on_modified_calls.append(True),
+        )
+        try:
+            self.assertFalse(tracker.is_modified())
+
+            tracker.mark_photoscan_modified("photoscan1")
+            self.assertTrue(tracker.is_modified())
+            self.assertEqual(len(on_modified_calls), 1)
+
+            # Marking everything modified, or undoing a save that failed, does not ask for another save
+            tracker.mark_all_modified(["photoscan2"])
+            self.assertEqual(tracker.modified_components, set(SessionComponent))
+            self.assertEqual(tracker.modified_photoscan_ids, {"photoscan1", "photoscan2"})
+            self.assertEqual(len(on_modified_calls), 1)
+
+            saved_components = [SessionComponent.TARGETS, SessionComponent.TRANSDUCER_TRANSFORM]
+            tracker.mark_saved(saved_components, ["photoscan1"])
+            self.assertEqual(
+                tracker.modified_components,
+                {SessionComponent.VIRTUAL_FIT_RESULTS, SessionComponent.TRANSDUCER_TRACKING_RESULTS},
+            )
+            self.assertEqual(tracker.modified_photoscan_ids, {"photoscan2"})
+            tracker.mark_not_saved(saved_components, ["photoscan1"])
+            self.assertEqual(tracker.modified_components, set(SessionComponent))
+            self.assertEqual(tracker.modified_photoscan_ids, {"photoscan1", "photoscan2"})
+            self.assertEqual(len(on_modified_calls), 1)
+
+            tracker.mark_saved(SessionComponent, ["photoscan1", "photoscan2"])
+            self.assertFalse(tracker.is_modified())
+        finally:
+            tracker.stop()
+            slicer.mrmlScene.RemoveNode(transducer_transform_node)
+
+    def test_streaming_foreground_mask_matches_openlifu(self):
+        """Test that the foreground mask computed a slab at a time, as when volumes are loaded in streaming mode, is the
+        one that openlifu computes, for integer and float volumes."""
+        from unittest import mock
+        from openlifu.seg.skinseg import compute_foreground_mask
+        from OpenLIFULib import volume_streaming
+        from OpenLIFULib.volume_streaming import compute_foreground_mask_streaming
+
+        rng = np.random.default_rng(0)
+        z, y, x = np.mgrid[:30, :30, :30]
+        ball = ((z - 15)**2 + (y - 15)**2 + (x - 15)**2 < 100).astype(float)
+        volumes = {}
+        for dtype in [np.uint8, np.int16, np.uint16, np.int32]:
+            volumes[np.dtype(dtype).name] = (ball*180 + rng.integers(0, 70, ball.shape)).astype(dtype)
+        for dtype in [np.float32, np.float64]:
+            noisy_ball = (ball*500 + rng.normal(0, 150, ball.shape)).astype(dtype)
+            volumes[np.dtype(dtype).name] = noisy_ball
+            with_outlier = noisy_ball.copy()
+            with_outlier[0, 0, 0] = 1e7 # most values end up in one histogram bin
+            volumes[f"{np.dtype(dtype).name} with outlier"] = with_outlier
+            with_repeated_values = noisy_ball.copy()
+            with_repeated_values[rng.random(ball.shape) < 0.5] = 0
+            volumes[f"{np.dtype(dtype).name} with repeated values"] = with_repeated_values
+
+        # Small slabs, and few values gathered at a time, so that the narrowing down of float quantiles goes a few levels deep
+        with mock.patch.object(volume_streaming, "MAX_GATHERED_VALUES", 50):
+            for name, vol_array in volumes.items():
+                with self.subTest(volume=name):
+                    np.testing.assert_array_equal(
+                        compute_foreground_mask_streaming(vol_array, chunk_voxels=1000),
+                        compute_foreground_mask(vol_array),
+                    )
@@ -798,3 +798,201 @@ class OpenLIFUDatabaseTest(ScriptedLoadableModuleTest):
             logic.load_database(destination)
             self.assertIsNotNone(logic.db)
             self.assertEqual([], logic.db.get_transducer_ids())
+
+    def _write_json_file(self, path: Path, contents: dict) -> None:
+        """Write a JSON file, moving its modification time forward if it already existed so that the change is
+        detected even on file systems with coarse modification times."""
+        previous_mtime_ns = path.stat().st_mtime_ns if path.exists() else None
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(contents), encoding="utf-8")
+        if previous_mtime_ns is not None:
+            os.utime(path, ns=(previous_mtime_ns + 10**9, previous_mtime_ns + 10**9))
+
+    def _make_json_file_database_for_test(self, database_root: Path):
+        """Write a database with one subject, volume, session, protocol and transducer, in the openlifu database folder
+        layout. Returns a stand-in for openlifu.db.Database that reads it, and that counts its loads by method name."""
+        from collections import Counter
+        from datetime import datetime
+        from types import SimpleNamespace
+
+        def read_json(path: Path) -> dict:
+            return json.loads(path.read_text(encoding="utf-8"))
+
+        subjects_dir = database_root / "subjects"
+        self._write_json_file(subjects_dir / "subjects.json", {"subject_ids": ["subject1"]})
+        self._write_json_file(subjects_dir / "subject1" / "subject1.json", {"id": "subject1", "name": "Subject One"})
+        self._write_json_file(subjects_dir / "subject1" / "volumes" / "volumes.json", {"volume_ids": ["volume1"]})
+        self._write_json_file(
+            subjects_dir / "subject1" / "volumes" / "volume1" / "volume1.json", {"id": "volume1", "name": "Volume One"}
+        )
+        self._write_json_file(subjects_dir / "subject1" / "sessions" / "sessions.json", {"session_ids": ["session1"]})
+        self._write_json_file(
+            subjects_dir / "subject1" / "sessions" / "session1" / "session1.json",
+            {
+                "id": "session1",
+                "name": "Session One",
+                "protocol_id": "protocol1",
+                "volume_id": "volume1",
+                "transducer_id": "transducer1",
+                "date_created": "2024-01-01T10:00:00",
+                "date_modified": "2024-01-02T10:00:00",
+            },
+        )
+        self._write_json_file(database_root / "protocols" / "protocols.json", {"protocol_ids": ["protocol1"]})
+        self._write_json_file(database_root / "protocols" / "protocol1" / "protocol1.json", {"name": "Protocol One"})
+        self._write_json_file(database_root / "transducers" / "transducer1" / "transducer1.json", {"name": "Transducer One"})
+
+        class JsonFileDatabase:
+            def __init__(self):
+                self.path = str(database_root)
+                self.loads = Counter()
+
+            def _read(self, method_name: str, *relative_path: str) -> dict:
+                self.loads[method_name] += 1
+                return read_json(database_root.joinpath(*relative_path))
+
+            def get_subject_ids(self):
+                return read_json(subjects_dir / "subjects.json")["subject_ids"]
+
+            def get_volume_ids(self, subject_id):
+                return read_json(subjects_dir / subject_id / "volumes" / "volumes.json")["volume_ids"]
+
+            def get_session_ids(self, subject_id):
+                return read_json(subjects_dir / subject_id / "sessions" / "sessions.json")["session_ids"]
+
+            def get_protocol_ids(self):
+                return read_json(database_root / "protocols" / "protocols.json")["protocol_ids"]
+
+            def load_subject(self, subject_id):
+                return SimpleNamespace(**self._read("load_subject", "subjects", subject_id, f"{subject_id}.json"))
+
+            def load_session(self, subject, session_id):
+                session_dict = self._read("load_session", "subjects", subject.id, "sessions", session_id, f"{session_id}.json")
+                session_dict["date_created"] = datetime.fromisoformat(session_dict["date_created"])
+                session_dict["date_modified"] = datetime.fromisoformat(session_dict["date_modified"])
+                return SimpleNamespace(**session_dict)
+
+            def load_protocol(self, protocol_id):
+                return SimpleNamespace(**self._read("load_protocol", "protocols", protocol_id, f"{protocol_id}.json"))
+
+            def load_transducer(self, transducer_id):
+                self.loads["load_transducer"] += 1
+                return SimpleNamespace(name=f"Loaded {transducer_id}")
+
+            def get_volume_info(self, subject_id, volume_id):
+                return self._read("get_volume_info", "subjects", subject_id, "volumes", volume_id, f"{volume_id}.json")
+
+        return JsonFileDatabase()
+
+    def test_database_metadata_cache_revalidates_changed_files(self):
+        from OpenLIFULib.database_metadata_cache import DatabaseMetadataCache
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_root = Path(temp_dir)
+            db = self._make_json_file_database_for_test(database_root)
+            cache = DatabaseMetadataCache(db)
+
+            # Protocols are loaded once, and loaded again when their file changes or they are invalidated
+            protocol = cache.get_protocol("protocol1")
+            self.assertIs(cache.get_protocol("protocol1"), protocol)
+            self.assertEqual(cache.get_protocol_name("protocol1"), "Protocol One")
+            self.assertEqual([p.name for p in cache.get_all_protocols()], ["Protocol One"])
+            self.assertEqual(db.loads["load_protocol"], 1)
+            self._write_json_file(database_root / "protocols" / "protocol1" / "protocol1.json", {"name": "Renamed Protocol"})
+            self.assertEqual(cache.get_protocol_name("protocol1"), "Renamed Protocol")
+            self.assertEqual(db.loads["load_protocol"], 2)
+            cache.invalidate_protocol("protocol1")
+            cache.get_protocol("protocol1")
+            self.assertEqual(db.loads["load_protocol"], 3)
+
+            # Transducer names are read from the transducer file, without loading the transducer
+            transducer_filepath = database_root / "transducers" / "transducer1" / "transducer1.json"
+            self.assertEqual(cache.get_transducer_name("transducer1"), "Transducer One")
+            self._write_json_file(transducer_filepath, {"name": "Renamed Transducer"})
+            self.assertEqual(cache.get_transducer_name("transducer1"), "Renamed Transducer")
+            self.assertEqual(db.loads["load_transducer"], 0)
+            self._write_json_file(transducer_filepath, {})
+            self.assertEqual(cache.get_transducer_name("transducer1"), "Loaded transducer1")
+            self.assertEqual(cache.get_transducer_name("transducer1"), "Loaded transducer1")
+            self.assertEqual(db.loads["load_transducer"], 1)
+
+            # Volume information is handed out as copies
+            volume_info = cache.get_volume_info("subject1", "volume1")
+            volume_info["name"] = "Modified by caller"
+            self.assertEqual(cache.get_volume_info("subject1", "volume1")["name"], "Volume One")
+            self.assertEqual(db.loads["get_volume_info"], 1)
+            cache.invalidate_volume("subject1", "volume1")
+            cache.get_volume_info("subject1", "volume1")
+            self.assertEqual(db.loads["get_volume_info"], 2)
+
+            cache.clear()
+            cache.get_protocol("protocol1")
+            cache.get_volume_info("subject1", "volume1")
+            self.assertEqual(db.loads["load_protocol"], 4)
+            self.assertEqual(db.loads["get_volume_info"], 3)
+
+    def test_database_summary_index_revalidates_changed_files(self):
+        from OpenLIFULib import database_metadata_cache
+        from OpenLIFULib.database_index import DatabaseSummaryIndex
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            database_root = Path(temp_dir)
+            subject_dir = database_root / "subjects" / "subject1"
+            db = self._make_json_file_database_for_test(database_root)
+            index = DatabaseSummaryIndex(db)
+            try:
+                # Summaries are read once, and read again when one of the files they come from changes
+                self.assertIsNone(index.peek_subject_summary("subject1"))
+                subject_summary, = index.get_subject_summaries()
+                self.assertEqual(subject_summary, ("subject1", "Subject One", 1, 1))
+                self.assertEqual(index.peek_subject_summary("subject1"), subject_summary)
+                index.get_subject_summaries()
+                self.assertEqual(db.loads["load_subject"], 1)
+                self._write_json_file(subject_dir / "subject1.json", {"id": "subject1", "name": "Renamed Subject"})
+                self._write_json_file(subject_dir / "volumes" / "volumes.json", {"volume_ids": ["volume1", "volume2"]})
+                self.assertEqual(index.get_subject_summary("subject1"), ("subject1", "Renamed Subject", 2, 1))
+                self.assertEqual(db.loads["load_subject"], 2)
+
+                subject = db.load_subject("subject1")
+                session_summary, = index.get_session_summaries(subject)
+                self.assertEqual(session_summary.name, "Session One")
+                self.assertEqual(session_summary.protocol_name, "Protocol One")
+                self.assertEqual(session_summary.volume_name, "Volume One")
+                self.assertEqual(session_summary.transducer_name, "Transducer One")
+                self.assertEqual(session_summary.date_modified.isoformat(), "2024-01-02T10:00:00")
+                index.get_session_summaries(subject)
+                self.assertEqual(db.loads["load_session"], 1)
+
+                # A session summary also depends on the protocol, volume and transducer that the session refers to
+                self._write_json_file(database_root / "protocols" / "protocol1" / "protocol1.json", {"name": "Renamed Protocol"})
+                self.assertEqual(index.get_session_summary(subject, "session1").protocol_name, "Renamed Protocol")
+                self.assertEqual(db.loads["load_session"], 2)
+
+                # Invalidation forces a read even when no file changed
+                index.invalidate_session("subject1", "session1")
+                self.assertIsNone(index.peek_session_summary("subject1", "session1"))
+                index.get_session_summary(subject, "session1")
+                self.assertEqual(db.loads["load_session"], 3)
+                index.invalidate_subject("subject1")
+                self.assertIsNone(index.peek_subject_summary("subject1"))
+                index.get_subject_summary("subject1")
+                self.assertEqual(db.loads["load_subject"], 4)
+
+                # Saved summaries are picked up by a new index without reading the database
+                index.save()
+                reloaded_index = DatabaseSummaryIndex(db)
+                self.assertEqual(reloaded_index.get_subject_summary("subject1"), ("subject1", "Renamed Subject", 2, 1))
+                self.assertEqual(reloaded_index.get_session_summary(subject, "session1").protocol_name, "Renamed Protocol")
+                self.assertEqual(db.loads["load_subject"], 4)
+                self.assertEqual(db.loads["load_session"], 3)
+
+                # Summaries of removed sessions and subjects are dropped when the IDs are listed
+                self._write_json_file(subject_dir / "sessions" / "sessions.json", {"session_ids": []})
+                self.assertEqual(reloaded_index.get_session_ids("subject1"), [])
+                self.assertIsNone(reloaded_index.peek_session_summary("subject1", "session1"))
+                self._write_json_file(database_root / "subjects" / "subjects.json", {"subject_ids": []})
+                self.assertEqual(reloaded_index.get_subject_ids(), [])
+                self.assertIsNone(reloaded_index.peek_subject_summary("subject1"))
+            finally:
+                index.index_filepath.unlink(missing_ok=True)
+                database_metadata_cache._database_metadata_caches.pop(database_root.resolve(), None)
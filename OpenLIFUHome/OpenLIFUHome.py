@@ -1,4 +1,5 @@
 # Standard library imports
+from pathlib import Path
 from typing import Optional, TYPE_CHECKING
 import os
 
@@ -24,6 +25,14 @@ from OpenLIFULib.util import (
 )
 
 from OpenLIFULib.guided_mode_util import set_guided_mode_state, Workflow
+from OpenLIFULib.profiling import (
+    ProfileSpan,
+    clear_recent_operations,
+    get_num_recorded_operations,
+    get_profiling_export_path,
+    get_recent_operations,
+    set_profiling_export_path,
+)
 
 from OpenLIFUCloudSync import getCloudSyncLogic
 #
@@ -124,6 +133,8 @@ class OpenLIFUHomeWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         self.ui.transducerTrackingPushButton.clicked.connect(lambda : self.switchModule(self.ui.transducerTrackingPushButton.text))
         self.ui.protocolConfigPushButton.clicked.connect(lambda : self.switchModule(self.ui.protocolConfigPushButton.text))
 
+        self.setupPerformancePanel()
+
     def switchModule(self, moduleButtonText: str) -> None:
         moduleButtonText = moduleButtonText.replace(" ", "")
         moduleButtonText = moduleButtonText.replace("-", "")
@@ -138,6 +149,69 @@ class OpenLIFUHomeWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
 
         slicer.util.selectModule(moduleButtonText)
 
+    def setupPerformancePanel(self) -> None:
+        """Set up the developer panel that lists the timings of recent operations; see OpenLIFULib.profiling.
+        The panel is only shown in developer mode."""
+        self.ui.performanceCollapsibleButton.setVisible(
+            slicer.util.settingsValue('Developer/DeveloperMode', False, converter=slicer.util.toBool)
+        )
+        self.ui.performanceTreeWidget.header().setSectionResizeMode(0, qt.QHeaderView.Stretch)
+
+        export_path = get_profiling_export_path()
+        self.ui.performanceExportPathLineEdit.currentPath = (
+            export_path if export_path else str(Path(slicer.app.defaultScenePath) / "OpenLIFU-timings.jsonl")
+        )
+        self.ui.performanceExportCheckBox.checked = bool(export_path)
+        self.ui.performanceExportCheckBox.toggled.connect(self.onPerformanceExportSettingsChanged)
+        self.ui.performanceExportPathLineEdit.currentPathChanged.connect(self.onPerformanceExportSettingsChanged)
+        self.ui.performanceClearPushButton.clicked.connect(self.onPerformanceClearClicked)
+
+        # Operations can finish in worker threads, so rather than being notified the panel checks for new ones periodically
+        self._num_operations_shown = None
+        self.performanceUpdateTimer = qt.QTimer()
+        self.performanceUpdateTimer.setInterval(1000)
+        self.performanceUpdateTimer.timeout.connect(self.updatePerformanceTree)
+        self.ui.performanceCollapsibleButton.contentsCollapsed.connect(self.updatePerformanceUpdateTimer)
+
+    def updatePerformanceUpdateTimer(self, *args) -> None:
+        """Refresh the operation timings periodically only while they can be seen"""
+        if self.ui.performanceCollapsibleButton.visible and not self.ui.performanceCollapsibleButton.collapsed:
+            self.updatePerformanceTree()
+            self.performanceUpdateTimer.start()
+        else:
+            self.performanceUpdateTimer.stop()
+
+    def updatePerformanceTree(self) -> None:
+        num_operations = get_num_recorded_operations()
+        if num_operations == self._num_operations_shown:
+            return
+        self._num_operations_shown = num_operations
+
+        def add_span_item(span:ProfileSpan) -> qt.QTreeWidgetItem:
+            item = qt.QTreeWidgetItem()
+            item.setText(0, f"{span.name} (failed: {span.error})" if span.error else span.name)
+            item.setText(1, f"{span.duration:.3f}" if span.is_finished else "unfinished")
+            item.setText(2, span.start_time.strftime("%H:%M:%S"))
+            item.setToolTip(0, f"Thread: {span.thread_name}")
+            for child in span.children:
+                item.addChild(add_span_item(child))
+            return item
+
+        tree = self.ui.performanceTreeWidget
+        tree.clear()
+        for operation in reversed(get_recent_operations()):
+            tree.addTopLevelItem(add_span_item(operation))
+
+    def onPerformanceExportSettingsChanged(self, *args) -> None:
+        if self.ui.performanceExportCheckBox.checked and self.ui.performanceExportPathLineEdit.currentPath:
+            set_profiling_export_path(self.ui.performanceExportPathLineEdit.currentPath)
+        else:
+            set_profiling_export_path(None)
+
+    def onPerformanceClearClicked(self) -> None:
+        clear_recent_operations()
+        self.updatePerformanceTree()
+
     def setupCloudSyncToolBar(self):
         mw = slicer.util.mainWindow()
         try:
@@ -184,6 +258,7 @@ class OpenLIFUHomeWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
     def cleanup(self) -> None:
         """Called when the application closes and the module widget is destroyed."""
         self.removeObservers()
+        self.performanceUpdateTimer.stop()
 
         mw = slicer.util.mainWindow()
         # Find and remove the entire toolbar
@@ -197,9 +272,11 @@ class OpenLIFUHomeWidget(ScriptedLoadableModuleWidget, VTKObservationMixin):
         ensure_python_requirements_for_module_enter()
         # Make sure parameter node exists and observed
         self.initializeParameterNode()
+        self.updatePerformanceUpdateTimer()
 
     def exit(self) -> None:
         """Called each time the user opens a different module."""
+        self.performanceUpdateTimer.stop()
         # Do not react to parameter node changes (GUI will be updated when the user enters into the module)
         if self._parameterNode:
             self._parameterNode.disconnectGui(self._parameterNodeGuiTag)
@@ -404,6 +481,7 @@ class OpenLIFUHomeTest(ScriptedLoadableModuleTest):
         from OpenLIFUData import OpenLIFUDataTest
         dt = OpenLIFUDataTest()
         dt.load_subject_session()
+        dt._workflow_session_file_writes_match_database()
 
         from OpenLIFUPrePlanning import OpenLIFUPrePlanningTest
         pt = OpenLIFUPrePlanningTest()
@@ -415,8 +493,11 @@ class OpenLIFUHomeTest(ScriptedLoadableModuleTest):
 
         from OpenLIFUSonicationPlanner import OpenLIFUSonicationPlannerTest
         spt = OpenLIFUSonicationPlannerTest()
+        spt._workflow_cancel_solution_computation()
         spt._workflow_planning()
 
         from OpenLIFUSonicationControl import OpenLIFUSonicationControlTest
         sct = OpenLIFUSonicationControlTest()
         sct._workflow_sonication_control()
+
+        pt._workflow_virtual_fit_many()
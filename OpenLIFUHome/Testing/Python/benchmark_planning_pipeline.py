@@ -0,0 +1,282 @@
+"""Benchmark of the SlicerOpenLIFU planning pipeline.
+
+Times loading a session, skin segmentation, virtual fitting, solution computation, ICP registration and saving the
+session, repeating each run to get statistics, and writes the results to a JSON file so that releases can be compared.
+
+Run it headless with Slicer, passing the benchmark arguments after the script:
+
+    Slicer --no-main-window --python-script OpenLIFUHome/Testing/Python/benchmark_planning_pipeline.py --output results.json
+
+By default the test database is downloaded with DVC, which needs the same environment as the OpenLIFUHome integration
+test (DVC_REPO_DIR and GDRIVE_CREDENTIALS_DATA). Use --database to benchmark on a database folder instead. Since the
+session gets saved, point it at a copy of any database that you care about.
+
+Pass --compare with an earlier results file to print how each benchmark changed relative to it.
+"""
+
+import argparse
+import json
+import logging
+import platform
+import statistics
+import sys
+import traceback
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import qt
+import slicer
+
+BENCHMARK_RESULTS_VERSION = 1
+"""Version of the results file format"""
+
+def parse_args(argv:List[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Benchmark the SlicerOpenLIFU planning pipeline.")
+    parser.add_argument("--output", required=True, help="JSON file to write the results to")
+    parser.add_argument("--database", help="Database folder to use instead of downloading the test database")
+    parser.add_argument("--subject", default="example_subject", help="ID of the subject to benchmark on")
+    parser.add_argument("--session", default="test_session", help="ID of the session to benchmark on")
+    parser.add_argument("--repeats", type=int, default=5, help="Number of timed runs of each benchmark")
+    parser.add_argument("--warmup", type=int, default=1, help="Number of untimed runs of each benchmark before the timed ones")
+    parser.add_argument("--skip", nargs="*", default=[], help="Names of benchmarks to skip, e.g. compute_solution")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    return parser.parse_args(argv)
+
+class PlanningPipelineBenchmark:
+    """Runs the benchmarks on one session of an openlifu database. Each benchmark is a method whose name starts with
+    `bench_`; it is timed as a span (see OpenLIFULib.profiling), so the results also break down where the time went."""
+
+    def __init__(self, subject_id:str, session_id:str):
+        self.subject_id = subject_id
+        self.session_id = session_id
+        self.data_logic = slicer.util.getModuleLogic("OpenLIFUData")
+
+    # ---- Scene access ----
+
+    def loaded_session(self):
+        loaded_session = self.data_logic.getParameterNode().loaded_session
+        if loaded_session is None:
+            raise RuntimeError("There is no loaded session; the load_session benchmark must run first.")
+        return loaded_session
+
+    def target(self):
+        from OpenLIFULib import get_target_candidates
+        targets = get_target_candidates()
+        if not targets:
+            raise RuntimeError(f"Session {self.session_id} has no targets.")
+        return targets[0]
+
+    def skin_mesh_node(self):
+        from OpenLIFULib.skinseg import generate_skin_segmentation, get_skin_segmentation
+        volume_node = self.loaded_session().volume_node
+        skin_mesh_node = get_skin_segmentation(volume_node)
+        if skin_mesh_node is None:
+            skin_mesh_node = generate_skin_segmentation(volume_node)
+        return skin_mesh_node
+
+    # ---- Benchmarks, in the order that they are run ----
+
+    def bench_load_session(self) -> None:
+        if self.data_logic.subject is None or self.data_logic.subject.id != self.subject_id:
+            from OpenLIFULib import get_cur_db
+            self.data_logic.subject = get_cur_db().load_subject(self.subject_id)
+        self.data_logic.load_session(self.subject_id, self.session_id)
+        slicer.app.processEvents()
+
+    def bench_skin_segmentation(self) -> None:
+        from OpenLIFULib.skinseg import generate_skin_segmentation, get_skin_segmentation
+        volume_node = self.loaded_session().volume_node
+        existing_skin_mesh_node = get_skin_segmentation(volume_node)
+        if existing_skin_mesh_node is not None:
+            slicer.mrmlScene.RemoveNode(existing_skin_mesh_node)
+        generate_skin_segmentation(volume_node, use_cache=False)
+
+    def bench_virtual_fit(self) -> None:
+        self.skin_mesh_node() # not part of the timing if it already exists, which it does after bench_skin_segmentation
+        loaded_session = self.loaded_session()
+        slicer.util.getModuleLogic("OpenLIFUPrePlanning").virtual_fit(
+            protocol = loaded_session.get_protocol(),
+            transducer = loaded_session.get_transducer(),
+            volume = loaded_session.volume_node,
+            target = self.target(),
+            progress_callback = lambda value, message : None,
+            include_debug_info = False,
+        )
+
+    def bench_compute_solution(self) -> None:
+        loaded_session = self.loaded_session()
+        slicer.util.getModuleLogic("OpenLIFUSonicationPlanner").computeSolution(
+            loaded_session.volume_node,
+            self.target(),
+            loaded_session.get_transducer(),
+            loaded_session.get_protocol(),
+        )
+
+    def bench_icp_registration(self) -> None:
+        # The registration surface of the transducer is registered to the skin mesh. This is not a meaningful
+        # registration, but it exercises the same code on realistic meshes, the way photoscan registration does.
+        surface_model_node = self.loaded_session().get_transducer().surface_model_node
+        if surface_model_node is None:
+            raise RuntimeError("The session transducer has no registration surface model.")
+        from OpenLIFULib.skinseg import SkinMeshLOD, get_skin_mesh
+        icp_result_node, _, _ = slicer.util.getModuleLogic("OpenLIFUTransducerLocalization").run_icp_model_registration(
+            input_fixed_model = self.skin_mesh_node(),
+            input_moving_model = surface_model_node,
+            fixed_mesh = get_skin_mesh(self.skin_mesh_node(), SkinMeshLOD.COARSE),
+        )
+        slicer.mrmlScene.RemoveNode(icp_result_node)
+
+    def bench_save_session(self) -> None:
+        # An unchanged session is not written at all, so write everything to time a full save on every run
+        self.data_logic.save_session(write_everything=True)
+
+    def benchmarks(self) -> Dict[str, Callable[[], None]]:
+        return {
+            name[len("bench_"):] : getattr(self, name)
+            for name in [
+                "bench_load_session",
+                "bench_skin_segmentation",
+                "bench_virtual_fit",
+                "bench_compute_solution",
+                "bench_icp_registration",
+                "bench_save_session",
+            ]
+        }
+
+def time_benchmark(name:str, benchmark:Callable[[], None], repeats:int, warmup:int) -> Dict[str, Any]:
+    """Run a benchmark repeatedly and summarize the durations of the timed runs."""
+    from OpenLIFULib.profiling import profile_span
+
+    for _ in range(warmup):
+        benchmark()
+
+    durations = []
+    last_span = None
+    for _ in range(repeats):
+        with profile_span(f"benchmark {name}", parent=None) as span:
+            benchmark()
+        durations.append(span.duration)
+        last_span = span
+
+    return {
+        "durations" : durations,
+        "mean" : statistics.mean(durations),
+        "median" : statistics.median(durations),
+        "stdev" : statistics.stdev(durations) if len(durations) > 1 else 0.0,
+        "min" : min(durations),
+        "max" : max(durations),
+        "last_run_breakdown" : last_span.to_dict(),
+    }
+
+def get_environment_info() -> Dict[str, Any]:
+    import openlifu
+    return {
+        "slicer_version" : slicer.app.applicationVersion,
+        "slicer_revision" : slicer.app.revision,
+        "openlifu_version" : getattr(openlifu, "__version__", "unknown"),
+        "python_version" : platform.python_version(),
+        "platform" : platform.platform(),
+        "processor" : platform.processor(),
+    }
+
+def print_comparison(results:Dict[str, Any], baseline:Dict[str, Any]) -> None:
+    """Print the relative change of each benchmark's median duration with respect to a baseline results file."""
+    print(f"Comparison of median durations against the baseline from {baseline.get('timestamp', 'unknown time')}:")
+    for name, result in results["benchmarks"].items():
+        baseline_result = baseline.get("benchmarks", {}).get(name)
+        if "median" not in result or baseline_result is None or "median" not in baseline_result:
+            print(f"  {name}: no comparison available")
+            continue
+        change = (result["median"] - baseline_result["median"]) / baseline_result["median"]
+        print(f"  {name}: {baseline_result['median']:.3f} s -> {result['median']:.3f} s ({change:+.1%})")
+
+def set_up(args:argparse.Namespace) -> None:
+    from OpenLIFULib import ensure_python_requirements_for_module_enter
+    ensure_python_requirements_for_module_enter()
+
+    database_dir = args.database
+    if database_dir is None:
+        from OpenLIFUHome import OpenLIFUHomeTest
+        database_dir = OpenLIFUHomeTest().get_test_database()
+
+    from OpenLIFUDatabase import OpenLIFUDatabaseTest
+    OpenLIFUDatabaseTest().connect_database(database_dir = database_dir)
+
+def run(args:argparse.Namespace) -> Dict[str, Any]:
+    from OpenLIFULib.session_saving import AUTOSAVE_SETTINGS_KEY
+    from OpenLIFULib.solution_cache import SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY
+
+    set_up(args)
+
+    # Computed solutions would otherwise be served from the solution cache after the first run, and an autosave could
+    # fire in the middle of a timed run
+    settings = qt.QSettings()
+    overridden_settings = {
+        SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY : 0,
+        AUTOSAVE_SETTINGS_KEY : False,
+    }
+    original_settings = {key : settings.value(key) for key in overridden_settings}
+    for key, value in overridden_settings.items():
+        settings.setValue(key, value)
+
+    benchmark = PlanningPipelineBenchmark(args.subject, args.session)
+    results = {
+        "version" : BENCHMARK_RESULTS_VERSION,
+        "timestamp" : datetime.now().isoformat(),
+        "environment" : get_environment_info(),
+        "subject_id" : args.subject,
+        "session_id" : args.session,
+        "repeats" : args.repeats,
+        "warmup" : args.warmup,
+        "benchmarks" : {},
+    }
+    try:
+        for name, benchmark_function in benchmark.benchmarks().items():
+            if name in args.skip:
+                continue
+            logging.info(f"Running benchmark {name}")
+            try:
+                results["benchmarks"][name] = time_benchmark(name, benchmark_function, args.repeats, args.warmup)
+            except Exception as e:
+                logging.error(f"Benchmark {name} failed: {e}")
+                results["benchmarks"][name] = {"error" : traceback.format_exc()}
+    finally:
+        for key, original_value in original_settings.items():
+            if original_value is None:
+                settings.remove(key)
+            else:
+                settings.setValue(key, original_value)
+
+    return results
+
+def main(argv:List[str]) -> int:
+    if argv and argv[0] == "--":
+        argv = argv[1:]
+    args = parse_args(argv)
+    results = run(args)
+
+    output_path = Path(args.output)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(results, indent=2), encoding='utf-8')
+    print(f"Wrote benchmark results to {output_path}")
+
+    for name, result in results["benchmarks"].items():
+        if "error" in result:
+            print(f"  {name}: failed")
+        else:
+            print(f"  {name}: median {result['median']:.3f} s, stdev {result['stdev']:.3f} s over {len(result['durations'])} runs")
+
+    if args.compare:
+        print_comparison(results, json.loads(Path(args.compare).read_text(encoding='utf-8')))
+
+    return 1 if any("error" in result for result in results["benchmarks"].values()) else 0
+
+if __name__ == "__main__":
+    exit_code = 1
+    try:
+        exit_code = main(sys.argv[1:])
+    except Exception:
+        traceback.print_exc()
+    finally:
+        slicer.util.exit(exit_code)
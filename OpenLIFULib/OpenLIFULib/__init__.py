@@ -9,7 +9,6 @@ from OpenLIFULib.dependency_utils import (
 )
 from OpenLIFULib.parameter_node_utils import (
     SlicerOpenLIFUPoint,
-    SlicerOpenLIFUXADataset,
     SlicerOpenLIFUProtocol,
     SlicerOpenLIFURun,
     SlicerOpenLIFUSolutionAnalysis,
@@ -42,7 +41,6 @@ __all__ = [
     "SlicerOpenLIFUProtocol",
     "SlicerOpenLIFUTransducer",
     "SlicerOpenLIFUPoint",
-    "SlicerOpenLIFUXADataset",
     "SlicerOpenLIFURun",
     "SlicerOpenLIFUSolutionAnalysis",
     "SlicerOpenLIFUPhotoscan",
@@ -12,6 +12,7 @@ from OpenLIFULib.util import get_openlifu_data_parameter_node
 from OpenLIFULib import SlicerOpenLIFUTransducer
 
 from OpenLIFULib.targets import get_target_candidates
+from OpenLIFULib.foreground_mask_store import FOREGROUND_MASK_ATTRIBUTE
 
 if TYPE_CHECKING:
     import openlifu
@@ -151,8 +152,12 @@ class OpenLIFUAlgorithmInputWidget(qt.QWidget):
         if "Volume" in self.inputs_dict:
             self.inputs_dict["Volume"].combo_box.setEnabled(True)
             for volume_node in slicer.util.getNodesByClass('vtkMRMLScalarVolumeNode'):
-                # Check that the volume is not an OpenLIFUSolution output volume
-                if volume_node.GetAttribute('isOpenLIFUSolution') is None and volume_node.GetAttribute('isOpenLIFUPhotoscan') is None :
+                # Check that the volume is not an OpenLIFUSolution output volume, photoscan texture or foreground mask
+                if (
+                    volume_node.GetAttribute('isOpenLIFUSolution') is None
+                    and volume_node.GetAttribute('isOpenLIFUPhotoscan') is None
+                    and volume_node.GetAttribute(FOREGROUND_MASK_ATTRIBUTE) is None
+                ):
                     self.add_volume_to_combobox(volume_node)
                     valid_input_volumes += 1
             if valid_input_volumes == 0:
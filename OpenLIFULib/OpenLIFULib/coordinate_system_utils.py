@@ -1,7 +1,8 @@
-from typing import Any, Sequence
+from typing import Any, Optional, Sequence
 import numpy as np
 from numpy.typing import NDArray
 import vtk
+from vtk.util import numpy_support
 import slicer
 from slicer import vtkMRMLScalarVolumeNode
 
@@ -9,11 +10,54 @@ def numpy_to_vtk_4x4(numpy_array_4x4 : NDArray[Any]) -> vtk.vtkMatrix4x4:
             if numpy_array_4x4.shape != (4, 4):
                 raise ValueError("The input numpy array must be of shape (4, 4).")
             vtk_matrix = vtk.vtkMatrix4x4()
-            for i in range(4):
-                for j in range(4):
-                    vtk_matrix.SetElement(i, j, numpy_array_4x4[i, j])
+            vtk_matrix.DeepCopy(np.asarray(numpy_array_4x4, dtype=float).ravel()) # row-major, which is what vtkMatrix4x4 expects
             return vtk_matrix
 
+def numpy_to_vtk_polydata(
+    points : NDArray[Any],
+    scalars : Optional[NDArray[Any]] = None,
+    scalars_name : str = "scalars",
+    vectors : Optional[NDArray[Any]] = None,
+    vectors_name : str = "vectors",
+) -> vtk.vtkPolyData:
+    """Create a vtkPolyData of points, without cells, from numpy arrays. The arrays are converted in bulk rather than
+    point by point, which matters for large point sets.
+
+    Args:
+        points: Array of shape (N,3) of point coordinates
+        scalars: Optional array of shape (N,) of point scalars, which become the active scalars of the point data
+        scalars_name: The name of the scalars array
+        vectors: Optional array of shape (N,3) of point vectors, which become the active vectors of the point data
+        vectors_name: The name of the vectors array
+    """
+    points = np.ascontiguousarray(points, dtype=float).reshape(-1, 3)
+    num_points = points.shape[0]
+
+    points_vtk = vtk.vtkPoints()
+    points_vtk.SetData(numpy_support.numpy_to_vtk(points, deep=True))
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(points_vtk)
+
+    if scalars is not None:
+        scalars = np.ascontiguousarray(scalars, dtype=float).reshape(-1)
+        if scalars.shape[0] != num_points:
+            raise ValueError("There must be one scalar per point.")
+        scalar_array = numpy_support.numpy_to_vtk(scalars, deep=True)
+        scalar_array.SetName(scalars_name)
+        polydata.GetPointData().AddArray(scalar_array)
+        polydata.GetPointData().SetActiveScalars(scalars_name)
+
+    if vectors is not None:
+        vectors = np.ascontiguousarray(vectors, dtype=float).reshape(-1, 3)
+        if vectors.shape[0] != num_points:
+            raise ValueError("There must be one vector per point.")
+        vector_array = numpy_support.numpy_to_vtk(vectors, deep=True)
+        vector_array.SetName(vectors_name)
+        polydata.GetPointData().AddArray(vector_array)
+        polydata.GetPointData().SetActiveVectors(vectors_name)
+
+    return polydata
+
 directions_in_RAS_coords_dict = {
     'R' : np.array([1,0,0]),
     'A' : np.array([0,1,0]),
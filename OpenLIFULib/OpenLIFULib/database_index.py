@@ -0,0 +1,284 @@
+"""Summary index of the subjects and sessions of an openlifu database, for listing them without loading them"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, TYPE_CHECKING
+import slicer
+from OpenLIFULib.database_metadata_cache import FileSignature, file_signature, get_database_metadata_cache
+
+if TYPE_CHECKING:
+    import openlifu.db
+
+DATABASE_INDEX_VERSION = 1
+"""Version of the on-disk index format. Index files of any other version are discarded and rebuilt."""
+
+class SubjectSummary(NamedTuple):
+    """What the subject list shows about a subject"""
+    id : str
+    name : str
+    num_volumes : int
+    num_sessions : int
+
+class SessionSummary(NamedTuple):
+    """What the session list shows about a session"""
+    id : str
+    name : str
+    protocol_id : str
+    protocol_name : str
+    volume_id : str
+    volume_name : str
+    transducer_id : str
+    transducer_name : str
+    date_created : datetime
+    date_modified : datetime
+
+def _safe_call(func, fallback="NA"):
+    try:
+        return func()
+    except Exception:
+        return fallback
+
+class DatabaseSummaryIndex:
+    """Summaries of the subjects and sessions in an openlifu database, persisted in the Slicer cache folder.
+
+    Filling the subject and session lists from the database directly would require loading every subject and session,
+    along with the protocol, transducer and volume information that each session refers to. The index keeps the few
+    fields that are displayed, together with a signature (modification time and size) of each database file that a
+    summary was read from. A summary is only read again from the database when one of those files changed, which costs
+    a file stat rather than a JSON parse. Summaries are validated only when they are asked for, so a caller that only
+    needs some of the rows (e.g. the visible rows of a table) only pays for those; the `peek_` methods skip validation
+    altogether. Writes made through SlicerOpenLIFU additionally invalidate the summaries they
+    affect with `invalidate_subject` and `invalidate_session`, so that they show up even on file systems with coarse
+    modification times.
+
+    The index is written to disk by `save`, which callers should do when they are done with a batch of lookups.
+
+    The signatures rely on the openlifu database folder layout (subjects/<subject_id>/<subject_id>.json and so on); if a
+    file is not found where it is expected then the summary is still cached, just without that part of the validation.
+    """
+
+    def __init__(self, db:"openlifu.db.Database"):
+        self.db = db
+        self.db_path = Path(db.path).resolve()
+        path_hash = hashlib.blake2b(str(self.db_path).encode('utf-8'), digest_size=16).hexdigest()
+        self.index_filepath = Path(slicer.app.cachePath) / "OpenLIFU" / "database_index" / f"{path_hash}.json"
+
+        self._subject_entries : Dict[str,Dict[str,Any]] = {}
+        """Mapping from subject ID to the serialized subject summary and its signature"""
+
+        self._session_entries : Dict[str,Dict[str,Dict[str,Any]]] = {}
+        """Mapping from subject ID to session ID to the serialized session summary and its signature"""
+
+        self._dirty = False
+        self._load()
+
+    # ---- Database file layout ----
+
+    def _subject_signature(self, subject_id:str) -> List[FileSignature]:
+        subject_dir = self.db_path / "subjects" / subject_id
+        return [
+            file_signature(subject_dir / f"{subject_id}.json"),
+            file_signature(subject_dir / "volumes" / "volumes.json"),
+            file_signature(subject_dir / "sessions" / "sessions.json"),
+        ]
+
+    def _session_signature(self, subject_id:str, session_id:str, protocol_id:str, volume_id:str, transducer_id:str) -> List[FileSignature]:
+        metadata_cache = get_database_metadata_cache(self.db)
+        return [
+            file_signature(self.db_path / "subjects" / subject_id / "sessions" / session_id / f"{session_id}.json"),
+            file_signature(metadata_cache.protocol_filepath(protocol_id)),
+            file_signature(metadata_cache.volume_info_filepath(subject_id, volume_id)),
+            file_signature(metadata_cache.transducer_filepath(transducer_id)),
+        ]
+
+    # ---- Persistence ----
+
+    def _load(self) -> None:
+        if not self.index_filepath.is_file():
+            return
+        try:
+            index = json.loads(self.index_filepath.read_text(encoding='utf-8'))
+        except Exception as e:
+            logging.warning(f"Discarding unreadable database index {self.index_filepath}: {e}")
+            return
+        if index.get("version") != DATABASE_INDEX_VERSION or index.get("db_path") != str(self.db_path):
+            return
+        self._subject_entries = index.get("subjects", {})
+        self._session_entries = index.get("sessions", {})
+
+    def save(self) -> None:
+        """Write the index to the cache folder, if it changed since it was last loaded or saved."""
+        if not self._dirty:
+            return
+        index = {
+            "version" : DATABASE_INDEX_VERSION,
+            "db_path" : str(self.db_path),
+            "subjects" : self._subject_entries,
+            "sessions" : self._session_entries,
+        }
+        self.index_filepath.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            # Write to a temporary file and move it into place, so that a partially written index is never read
+            fd, temp_path = tempfile.mkstemp(prefix=f".{self.index_filepath.name}-", dir=self.index_filepath.parent)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f)
+            os.replace(temp_path, self.index_filepath)
+        except OSError as e:
+            logging.warning(f"Could not save the database index {self.index_filepath}: {e}")
+            return
+        self._dirty = False
+
+    # ---- Subjects ----
+
+    def _read_subject_entry(self, subject_id:str, signature:List[FileSignature]) -> Dict[str,Any]:
+        subject = self.db.load_subject(subject_id)
+        entry = {
+            "signature" : signature,
+            "name" : subject.name,
+            "num_volumes" : len(self.db.get_volume_ids(subject_id)),
+            "num_sessions" : len(self.db.get_session_ids(subject_id)),
+        }
+        self._subject_entries[subject_id] = entry
+        self._dirty = True
+        return entry
+
+    def _get_subject_entry(self, subject_id:str) -> Dict[str,Any]:
+        # Signatures are compared as lists since that is what they become after a JSON round trip
+        signature = [list(s) if s is not None else None for s in self._subject_signature(subject_id)]
+        entry = self._subject_entries.get(subject_id)
+        if entry is None or entry["signature"] != signature:
+            entry = self._read_subject_entry(subject_id, signature)
+        return entry
+
+    @staticmethod
+    def _subject_summary_from_entry(subject_id:str, entry:Dict[str,Any]) -> SubjectSummary:
+        return SubjectSummary(subject_id, entry["name"], entry["num_volumes"], entry["num_sessions"])
+
+    def get_subject_ids(self) -> List[str]:
+        """Get the IDs of all subjects in the database, dropping the summaries of subjects that no longer exist."""
+        subject_ids = self.db.get_subject_ids()
+        for removed_subject_id in set(self._subject_entries.keys()) - set(subject_ids):
+            self._subject_entries.pop(removed_subject_id)
+            self._session_entries.pop(removed_subject_id, None)
+            self._dirty = True
+        return subject_ids
+
+    def get_subject_summary(self, subject_id:str) -> SubjectSummary:
+        """Get the summary of a subject."""
+        return self._subject_summary_from_entry(subject_id, self._get_subject_entry(subject_id))
+
+    def peek_subject_summary(self, subject_id:str) -> Optional[SubjectSummary]:
+        """Get the indexed summary of a subject without checking whether it is up to date, or None if the subject
+        is not indexed."""
+        entry = self._subject_entries.get(subject_id)
+        return self._subject_summary_from_entry(subject_id, entry) if entry is not None else None
+
+    def get_subject_summaries(self) -> List[SubjectSummary]:
+        """Get the summaries of all subjects in the database, in the order of `Database.get_subject_ids`."""
+        summaries = [self.get_subject_summary(subject_id) for subject_id in self.get_subject_ids()]
+        self.save()
+        return summaries
+
+    def invalidate_subject(self, subject_id:str) -> None:
+        """Drop the summary of a subject, so that it is read from the database again the next time it is needed."""
+        if self._subject_entries.pop(subject_id, None) is not None:
+            self._dirty = True
+            self.save()
+
+    # ---- Sessions ----
+
+    def _read_session_entry(self, subject:"openlifu.db.Subject", session_id:str) -> Dict[str,Any]:
+        session = self.db.load_session(subject, session_id)
+        metadata_cache = get_database_metadata_cache(self.db)
+        entry = {
+            "signature" : [
+                list(s) if s is not None else None
+                for s in self._session_signature(subject.id, session_id, session.protocol_id, session.volume_id, session.transducer_id)
+            ],
+            "name" : session.name,
+            "protocol_id" : session.protocol_id,
+            "protocol_name" : _safe_call(lambda: metadata_cache.get_protocol_name(session.protocol_id)),
+            "volume_id" : session.volume_id,
+            "volume_name" : _safe_call(lambda: metadata_cache.get_volume_info(subject.id, session.volume_id)["name"]),
+            "transducer_id" : session.transducer_id,
+            "transducer_name" : _safe_call(lambda: metadata_cache.get_transducer_name(session.transducer_id)),
+            "date_created" : session.date_created.isoformat(),
+            "date_modified" : session.date_modified.isoformat(),
+        }
+        self._session_entries.setdefault(subject.id, {})[session_id] = entry
+        self._dirty = True
+        return entry
+
+    def _get_session_entry(self, subject:"openlifu.db.Subject", session_id:str) -> Dict[str,Any]:
+        entry = self._session_entries.get(subject.id, {}).get(session_id)
+        if entry is not None:
+            signature = [
+                list(s) if s is not None else None
+                for s in self._session_signature(subject.id, session_id, entry["protocol_id"], entry["volume_id"], entry["transducer_id"])
+            ]
+            if entry["signature"] == signature:
+                return entry
+        return self._read_session_entry(subject, session_id)
+
+    @staticmethod
+    def _session_summary_from_entry(session_id:str, entry:Dict[str,Any]) -> SessionSummary:
+        return SessionSummary(
+            id = session_id,
+            name = entry["name"],
+            protocol_id = entry["protocol_id"],
+            protocol_name = entry["protocol_name"],
+            volume_id = entry["volume_id"],
+            volume_name = entry["volume_name"],
+            transducer_id = entry["transducer_id"],
+            transducer_name = entry["transducer_name"],
+            date_created = datetime.fromisoformat(entry["date_created"]),
+            date_modified = datetime.fromisoformat(entry["date_modified"]),
+        )
+
+    def get_session_ids(self, subject_id:str) -> List[str]:
+        """Get the IDs of all sessions of a subject, dropping the summaries of sessions that no longer exist."""
+        session_ids = self.db.get_session_ids(subject_id)
+        subject_session_entries = self._session_entries.get(subject_id, {})
+        for removed_session_id in set(subject_session_entries.keys()) - set(session_ids):
+            subject_session_entries.pop(removed_session_id)
+            self._dirty = True
+        return session_ids
+
+    def get_session_summary(self, subject:"openlifu.db.Subject", session_id:str) -> SessionSummary:
+        """Get the summary of a session of the given subject."""
+        return self._session_summary_from_entry(session_id, self._get_session_entry(subject, session_id))
+
+    def peek_session_summary(self, subject_id:str, session_id:str) -> Optional[SessionSummary]:
+        """Get the indexed summary of a session without checking whether it is up to date, or None if the session
+        is not indexed."""
+        entry = self._session_entries.get(subject_id, {}).get(session_id)
+        return self._session_summary_from_entry(session_id, entry) if entry is not None else None
+
+    def get_session_summaries(self, subject:"openlifu.db.Subject") -> List[SessionSummary]:
+        """Get the summaries of all sessions of the given subject, in the order of `Database.get_session_ids`."""
+        summaries = [self.get_session_summary(subject, session_id) for session_id in self.get_session_ids(subject.id)]
+        self.save()
+        return summaries
+
+    def invalidate_session(self, subject_id:str, session_id:str) -> None:
+        """Drop the summary of a session, so that it is read from the database again the next time it is needed."""
+        if self._session_entries.get(subject_id, {}).pop(session_id, None) is not None:
+            self._dirty = True
+            self.save()
+
+_database_summary_indices : Dict[Path, DatabaseSummaryIndex] = {}
+
+def get_database_summary_index(db:"openlifu.db.Database") -> DatabaseSummaryIndex:
+    """Get the summary index of an openlifu database. There is one index per database folder."""
+    db_path = Path(db.path).resolve()
+    index = _database_summary_indices.get(db_path)
+    if index is None:
+        index = DatabaseSummaryIndex(db)
+        _database_summary_indices[db_path] = index
+    index.db = db # the database may have been reconnected
+    return index
@@ -0,0 +1,133 @@
+"""Cache of the protocols, transducer names and volume information of an openlifu database"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import openlifu.db
+    import openlifu.plan
+
+FileSignature = Optional[Tuple[int,int]]
+"""Modification time in nanoseconds and size of a file, or None if the file does not exist"""
+
+def file_signature(path:Path) -> FileSignature:
+    """Get the modification time and size of a file, or None if it does not exist."""
+    try:
+        stat_result = os.stat(path)
+    except OSError:
+        return None
+    return (stat_result.st_mtime_ns, stat_result.st_size)
+
+class DatabaseMetadataCache:
+    """Memoized lookups of database objects that many sessions share, so that listing sessions or checking protocol
+    permissions does not load the same protocol or transducer over and over.
+
+    Each cached value is keyed by object ID and stored together with the signature (modification time and size) of the
+    database file it came from, and it is looked up again when that file changes. Writes made through SlicerOpenLIFU
+    additionally call the `invalidate_` methods, so that they are picked up even on file systems with coarse modification
+    times. The file locations follow the openlifu database folder layout; for an object whose file is not found where it
+    is expected, the database is asked directly and nothing is cached.
+
+    Protocols returned by `get_protocol` and `get_all_protocols` are shared between callers and must not be modified.
+    Transducers are not cached as a whole: they can be large, and what is needed repeatedly is only their name, which
+    `get_transducer_name` reads without constructing the transducer.
+    """
+
+    def __init__(self, db:"openlifu.db.Database"):
+        self.db = db
+        self.db_path = Path(db.path).resolve()
+        self._entries : Dict[Hashable,Tuple[FileSignature,Any]] = {}
+        """Mapping from cache key to (signature of the file the value was read from, value)"""
+
+    # ---- Database file layout ----
+
+    def protocol_filepath(self, protocol_id:str) -> Path:
+        return self.db_path / "protocols" / protocol_id / f"{protocol_id}.json"
+
+    def transducer_filepath(self, transducer_id:str) -> Path:
+        return self.db_path / "transducers" / transducer_id / f"{transducer_id}.json"
+
+    def volume_info_filepath(self, subject_id:str, volume_id:str) -> Path:
+        return self.db_path / "subjects" / subject_id / "volumes" / volume_id / f"{volume_id}.json"
+
+    # ---- Lookups ----
+
+    def _lookup(self, key:Hashable, filepath:Path, read:Callable[[], Any]) -> Any:
+        signature = file_signature(filepath)
+        if signature is None:
+            self._entries.pop(key, None)
+            return read()
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+        value = read()
+        self._entries[key] = (signature, value)
+        return value
+
+    def get_protocol(self, protocol_id:str) -> "openlifu.plan.Protocol":
+        """Load a protocol. The returned protocol is shared, so do not modify it."""
+        return self._lookup(
+            ("protocol", protocol_id),
+            self.protocol_filepath(protocol_id),
+            lambda: self.db.load_protocol(protocol_id),
+        )
+
+    def get_all_protocols(self) -> "List[openlifu.plan.Protocol]":
+        """Load all protocols in the database. The returned protocols are shared, so do not modify them."""
+        return [self.get_protocol(protocol_id) for protocol_id in self.db.get_protocol_ids()]
+
+    def get_protocol_name(self, protocol_id:str) -> str:
+        """Get the name of a protocol."""
+        return self.get_protocol(protocol_id).name
+
+    def get_transducer_name(self, transducer_id:str) -> str:
+        """Get the name of a transducer, reading it from the transducer JSON file without constructing the transducer."""
+        filepath = self.transducer_filepath(transducer_id)
+        def read_name() -> str:
+            if filepath.is_file():
+                transducer_dict = json.loads(filepath.read_text(encoding='utf-8'))
+                if "name" in transducer_dict:
+                    return transducer_dict["name"]
+            return self.db.load_transducer(transducer_id).name
+        return self._lookup(("transducer_name", transducer_id), filepath, read_name)
+
+    def get_volume_info(self, subject_id:str, volume_id:str) -> Dict[str,Any]:
+        """Get the volume information of a volume, as returned by `Database.get_volume_info`."""
+        volume_info = self._lookup(
+            ("volume_info", subject_id, volume_id),
+            self.volume_info_filepath(subject_id, volume_id),
+            lambda: self.db.get_volume_info(subject_id, volume_id),
+        )
+        return dict(volume_info) # shallow copy, so that callers can freely modify the dict
+
+    # ---- Invalidation ----
+
+    def invalidate_protocol(self, protocol_id:str) -> None:
+        """Drop the cached protocol with the given ID."""
+        self._entries.pop(("protocol", protocol_id), None)
+
+    def invalidate_transducer(self, transducer_id:str) -> None:
+        """Drop the cached information about the transducer with the given ID."""
+        self._entries.pop(("transducer_name", transducer_id), None)
+
+    def invalidate_volume(self, subject_id:str, volume_id:str) -> None:
+        """Drop the cached volume information of the given volume."""
+        self._entries.pop(("volume_info", subject_id, volume_id), None)
+
+    def clear(self) -> None:
+        """Drop everything."""
+        self._entries.clear()
+
+_database_metadata_caches : Dict[Path, DatabaseMetadataCache] = {}
+
+def get_database_metadata_cache(db:"openlifu.db.Database") -> DatabaseMetadataCache:
+    """Get the metadata cache of an openlifu database. There is one cache per database folder."""
+    db_path = Path(db.path).resolve()
+    cache = _database_metadata_caches.get(db_path)
+    if cache is None:
+        cache = DatabaseMetadataCache(db)
+        _database_metadata_caches[db_path] = cache
+    cache.db = db # the database may have been reconnected
+    return cache
@@ -0,0 +1,183 @@
+"""Table model that lists database objects from their summaries, fetching rows on demand"""
+
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+import qt
+
+class SummaryTableColumn(NamedTuple):
+    """A column of a `SummaryTableModel`"""
+    header : str
+    text : Callable[[Any], str]
+    """Function that maps a row summary to the text to display"""
+    sort_key : Optional[Callable[[Any], Any]] = None
+    """Function that maps a row summary to the value to sort by. If None then the displayed text is sorted."""
+
+class SummaryTableModel(qt.QAbstractTableModel):
+    """Table model over a list of object IDs (e.g. the subjects of a database), with one summary per row.
+
+    Summaries are looked up only when a row is displayed, and rows are handed to the view in batches as it scrolls
+    (canFetchMore/fetchMore), so a model over any number of objects is shown right away and only the summaries of the
+    rows that were actually displayed are read. Sorting and filtering are done by the model on the whole list of IDs;
+    they use the already indexed summaries where possible and look up the rest.
+
+    Args:
+        columns: The columns of the table.
+        get_summary: Function that looks up the summary of the object with a given ID, validating it against the
+            database. See `DatabaseSummaryIndex`.
+        peek_summary: Function that returns the summary of the object with a given ID if it is already indexed,
+            without checking whether it is up to date, or None.
+    """
+
+    FETCH_BATCH_SIZE = 100
+
+    def __init__(
+            self,
+            columns:List[SummaryTableColumn],
+            get_summary:Callable[[str], Any],
+            peek_summary:Callable[[str], Any],
+            parent:Optional[qt.QObject] = None,
+        ):
+        super().__init__(parent)
+        self.columns = columns
+        self.get_summary = get_summary
+        self.peek_summary = peek_summary
+
+        self._ids : List[str] = []
+        """All object IDs, in the order that they were given"""
+
+        self._row_ids : List[str] = []
+        """The object IDs that pass the filter, in display order"""
+
+        self._num_fetched_rows = 0
+        """Number of leading entries of `_row_ids` that have been handed to the view"""
+
+        self._summaries : Dict[str,Any] = {}
+        """Summaries that were validated while this model has been showing them"""
+
+        self._filter_text = ""
+        self._sort_column = -1
+        self._sort_order = qt.Qt.AscendingOrder
+
+    # ---- Summaries ----
+
+    def _summary(self, object_id:str) -> Any:
+        """Get the validated summary of an object."""
+        if object_id not in self._summaries:
+            self._summaries[object_id] = self.get_summary(object_id)
+        return self._summaries[object_id]
+
+    def _summary_for_ordering(self, object_id:str) -> Any:
+        """Get a summary of an object for sorting and filtering, preferring an already indexed one."""
+        if object_id in self._summaries:
+            return self._summaries[object_id]
+        summary = self.peek_summary(object_id)
+        return summary if summary is not None else self._summary(object_id)
+
+    # ---- Content ----
+
+    def set_ids(self, ids:List[str]) -> None:
+        """Replace the listed objects."""
+        self._ids = list(ids)
+        self._summaries.clear()
+        self._update_rows()
+
+    def add_id(self, object_id:str) -> None:
+        """Add an object to the end of the list, or refresh its row if it is already listed."""
+        self._summaries.pop(object_id, None)
+        if object_id in self._ids:
+            if object_id in self._row_ids[:self._num_fetched_rows]:
+                row = self._row_ids.index(object_id)
+                self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+            return
+        self._ids.append(object_id)
+        if not self._passes_filter(object_id):
+            return
+        # The new row goes at the end regardless of the sort order; it is sorted in on the next sort
+        row = len(self._row_ids)
+        self._row_ids.append(object_id)
+        if self._num_fetched_rows == row:
+            self.beginInsertRows(qt.QModelIndex(), row, row)
+            self._num_fetched_rows += 1
+            self.endInsertRows()
+
+    def remove_id(self, object_id:str) -> None:
+        """Remove an object from the list."""
+        if object_id not in self._ids:
+            return
+        self._ids.remove(object_id)
+        self._summaries.pop(object_id, None)
+        if object_id not in self._row_ids:
+            return
+        row = self._row_ids.index(object_id)
+        if row < self._num_fetched_rows:
+            self.beginRemoveRows(qt.QModelIndex(), row, row)
+            del self._row_ids[row]
+            self._num_fetched_rows -= 1
+            self.endRemoveRows()
+        else:
+            del self._row_ids[row]
+
+    def id_at(self, row:int) -> str:
+        """Get the ID of the object shown in a row."""
+        return self._row_ids[row]
+
+    def set_filter_text(self, text:str) -> None:
+        """Only show the rows in which some column contains the given text, ignoring case."""
+        self._filter_text = text.strip().casefold()
+        self._update_rows()
+
+    def _passes_filter(self, object_id:str) -> bool:
+        if not self._filter_text:
+            return True
+        summary = self._summary_for_ordering(object_id)
+        return any(self._filter_text in column.text(summary).casefold() for column in self.columns)
+
+    def _update_rows(self) -> None:
+        """Apply the filter and the sort order to the whole list of IDs, and start over fetching rows."""
+        self.beginResetModel()
+        self._row_ids = [object_id for object_id in self._ids if self._passes_filter(object_id)]
+        if 0 <= self._sort_column < len(self.columns):
+            column = self.columns[self._sort_column]
+            sort_key = column.sort_key if column.sort_key is not None else column.text
+            self._row_ids.sort(
+                key = lambda object_id : sort_key(self._summary_for_ordering(object_id)),
+                reverse = self._sort_order == qt.Qt.DescendingOrder,
+            )
+        self._num_fetched_rows = min(self.FETCH_BATCH_SIZE, len(self._row_ids))
+        self.endResetModel()
+
+    # ---- QAbstractTableModel interface ----
+
+    def rowCount(self, parent=qt.QModelIndex()) -> int:
+        return 0 if parent.isValid() else self._num_fetched_rows
+
+    def columnCount(self, parent=qt.QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=qt.Qt.DisplayRole):
+        if not index.isValid() or role not in (qt.Qt.DisplayRole, qt.Qt.ToolTipRole):
+            return None
+        summary = self._summary(self._row_ids[index.row()])
+        return self.columns[index.column()].text(summary)
+
+    def headerData(self, section, orientation, role=qt.Qt.DisplayRole):
+        if role == qt.Qt.DisplayRole and orientation == qt.Qt.Horizontal and 0 <= section < len(self.columns):
+            return self.columns[section].header
+        return None
+
+    def canFetchMore(self, parent) -> bool:
+        return not parent.isValid() and self._num_fetched_rows < len(self._row_ids)
+
+    def fetchMore(self, parent) -> None:
+        if parent.isValid():
+            return
+        num_rows_to_fetch = min(self.FETCH_BATCH_SIZE, len(self._row_ids) - self._num_fetched_rows)
+        if num_rows_to_fetch <= 0:
+            return
+        self.beginInsertRows(qt.QModelIndex(), self._num_fetched_rows, self._num_fetched_rows + num_rows_to_fetch - 1)
+        self._num_fetched_rows += num_rows_to_fetch
+        self.endInsertRows()
+
+    def sort(self, column, order=qt.Qt.AscendingOrder) -> None:
+        self._sort_column = column
+        self._sort_order = order
+        self._update_rows()
@@ -0,0 +1,211 @@
+"""Binary sidecar files holding xarray datasets that parameter nodes refer to, so that the datasets do not need to be
+encoded as text into the parameter nodes (and hence into the scene MRML file)"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Set, TYPE_CHECKING
+import slicer
+
+if TYPE_CHECKING:
+    import xarray
+
+SIDECAR_REFERENCE_PREFIX = "openlifu-sidecar:"
+"""Prefix of the parameter values that refer to a sidecar file rather than containing the serialized value itself"""
+
+SCENE_SIDECAR_SUBDIR = "OpenLIFUData"
+"""Folder, inside the scene root directory, into which the sidecar files referred to by the scene are saved"""
+
+DATASET_READ_CACHE_SIZE = 8
+"""Maximum number of read datasets that are kept in memory for repeated reads"""
+
+SIDECAR_STORE_MAX_AGE_DAYS = 7
+"""Sidecar files in the store folder (see `get_sidecar_store_dir`) that were neither written nor read for this many days
+are deleted when the application starts and when the scene is closed. Sidecar files that a saved scene refers to are
+not affected, since they are copied next to the scene file."""
+
+_dataset_read_cache : "OrderedDict[str, xarray.Dataset]" = OrderedDict()
+"""Mapping from sidecar file name to the dataset read from it, in least to most recently used order"""
+
+_known_sidecar_paths : Dict[str, Path] = {}
+"""Mapping from sidecar file name to a location where the file is known to exist, which may be outside of the current
+scene root directory (for example the folder of a scene that was loaded and is now being saved somewhere else)"""
+
+def get_sidecar_store_dir() -> Path:
+    """Get the folder into which newly written sidecar files go, until the scene is saved."""
+    return Path(slicer.app.temporaryPath) / "OpenLIFU" / "sidecars"
+
+def is_sidecar_reference(value: str) -> bool:
+    """Whether a parameter value is a reference to a sidecar file."""
+    return value.startswith(SIDECAR_REFERENCE_PREFIX)
+
+def _sidecar_name_from_reference(reference: str) -> str:
+    name = reference[len(SIDECAR_REFERENCE_PREFIX):]
+    if not name or Path(name).name != name:
+        raise ValueError(f"Invalid sidecar reference: {reference}")
+    return name
+
+def _resolve_sidecar_path(name: str, scene: Optional[slicer.vtkMRMLScene] = None) -> Optional[Path]:
+    """Find an existing sidecar file with the given name, looking in the scene root directory first.
+    Returns None if the file cannot be found."""
+    if scene is None:
+        scene = slicer.mrmlScene
+    candidates = []
+    root_directory = scene.GetRootDirectory()
+    if root_directory:
+        candidates.append(Path(root_directory) / SCENE_SIDECAR_SUBDIR / name)
+    if name in _known_sidecar_paths:
+        candidates.append(_known_sidecar_paths[name])
+    candidates.append(get_sidecar_store_dir() / name)
+    for path in candidates:
+        if path.is_file():
+            _known_sidecar_paths[name] = path
+            return path
+    return None
+
+def _touch(path: Path) -> None:
+    """Update the modification time of a sidecar file, which is how its use is recorded for `prune_sidecar_store`"""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+def write_dataset_sidecar(dataset: "xarray.Dataset") -> str:
+    """Write a dataset into a NetCDF sidecar file and return the reference to store in a parameter node.
+
+    Sidecar files are named by a hash of their content, so writing the same dataset again reuses the existing file.
+    """
+    data = dataset.to_netcdf()
+    name = hashlib.blake2b(data, digest_size=16).hexdigest() + ".nc"
+    existing_path = _resolve_sidecar_path(name)
+    if existing_path is not None:
+        _touch(existing_path)
+    else:
+        store_dir = get_sidecar_store_dir()
+        store_dir.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and move it into place, so that a partially written sidecar is never read
+        fd, temp_path = tempfile.mkstemp(prefix=f".{name}-", dir=store_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, store_dir / name)
+        except Exception:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        _known_sidecar_paths[name] = store_dir / name
+    return SIDECAR_REFERENCE_PREFIX + name
+
+def read_dataset_sidecar(reference: str) -> "xarray.Dataset":
+    """Read the dataset that a sidecar reference refers to.
+
+    The dataset is read into memory and the file is closed right away, so no file handles are held and the returned
+    dataset stays usable however long the caller keeps it. The dataset is kept in a small cache so that repeated reads of
+    the same reference return the same object without any file access. Since sidecar files are named by content, a
+    cached dataset can never be out of date. Callers should not modify the returned dataset in place.
+    """
+    import xarray
+
+    name = _sidecar_name_from_reference(reference)
+    if name in _dataset_read_cache:
+        _dataset_read_cache.move_to_end(name)
+        return _dataset_read_cache[name]
+
+    path = _resolve_sidecar_path(name)
+    if path is None:
+        raise FileNotFoundError(
+            f"Could not find the data file {name} in {SCENE_SIDECAR_SUBDIR} next to the scene file or in {get_sidecar_store_dir()}."
+        )
+    with xarray.open_dataset(path) as opened_dataset:
+        dataset = opened_dataset.load()
+    _touch(path)
+    _dataset_read_cache[name] = dataset
+    while len(_dataset_read_cache) > DATASET_READ_CACHE_SIZE:
+        _, evicted_dataset = _dataset_read_cache.popitem(last=False)
+        evicted_dataset.close()
+    return dataset
+
+def clear_dataset_read_cache() -> None:
+    """Drop all cached datasets."""
+    while _dataset_read_cache:
+        _, dataset = _dataset_read_cache.popitem()
+        dataset.close()
+
+def prune_sidecar_store(max_age_days: float = SIDECAR_STORE_MAX_AGE_DAYS) -> None:
+    """Delete the sidecar files in the store folder (see `get_sidecar_store_dir`) that were neither written nor read for
+    `max_age_days` days. Several application instances share the store folder, so files are pruned by age rather than by
+    whether the current scene refers to them."""
+    store_dir = get_sidecar_store_dir()
+    if not store_dir.is_dir():
+        return
+    cutoff = time.time() - max_age_days * 24 * 60 * 60
+    for path in store_dir.iterdir():
+        try:
+            if path.is_file() and path.stat().st_mtime < cutoff:
+                path.unlink()
+        except OSError as e:
+            logging.warning(f"Could not remove stale data file {path}: {e}")
+            continue
+        if _known_sidecar_paths.get(path.name) == path:
+            del _known_sidecar_paths[path.name]
+
+def _get_scene_sidecar_names(scene: slicer.vtkMRMLScene) -> Set[str]:
+    """Get the names of the sidecar files that are referred to by the parameter nodes in a scene."""
+    names = set()
+    for node in slicer.util.getNodesByClass('vtkMRMLScriptedModuleNode', scene):
+        for parameter_name in node.GetParameterNames():
+            value = node.GetParameter(parameter_name)
+            if is_sidecar_reference(value):
+                try:
+                    names.add(_sidecar_name_from_reference(value))
+                except ValueError as e:
+                    logging.warning(f"Ignoring parameter {parameter_name} of {node.GetName()}: {e}")
+    return names
+
+def _on_scene_end_import(scene: slicer.vtkMRMLScene, event) -> None:
+    """Remember where the sidecar files of a loaded scene are, so that they can still be found after the scene root
+    directory changes, which happens when the scene is saved somewhere else."""
+    for name in _get_scene_sidecar_names(scene):
+        if _resolve_sidecar_path(name, scene) is None:
+            logging.warning(f"The loaded scene refers to a data file {name} that could not be found.")
+
+def _on_scene_start_save(scene: slicer.vtkMRMLScene, event) -> None:
+    """Copy the sidecar files referred to by the scene into the folder that the scene is being saved to."""
+    root_directory = scene.GetRootDirectory()
+    if not root_directory:
+        return
+    scene_sidecar_dir = Path(root_directory) / SCENE_SIDECAR_SUBDIR
+    for name in _get_scene_sidecar_names(scene):
+        destination = scene_sidecar_dir / name
+        if destination.is_file():
+            continue
+        source = _resolve_sidecar_path(name, scene)
+        if source is None:
+            logging.error(f"Could not save the data file {name}, which is referred to by the scene, because it could not be found.")
+            continue
+        scene_sidecar_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(source, destination)
+
+def _on_scene_end_close(scene: slicer.vtkMRMLScene, event) -> None:
+    """Release the datasets of the closed scene and prune the sidecar store."""
+    clear_dataset_read_cache()
+    prune_sidecar_store()
+
+_scene_observer_tags = []
+
+def install_scene_observers() -> None:
+    """Observe the application scene so that sidecar files are saved along with the scene and found again when the scene
+    is loaded, and so that the sidecar store is pruned when the scene is closed. The sidecar store is also pruned right
+    away. Calling this more than once has no further effect."""
+    if _scene_observer_tags:
+        return
+    _scene_observer_tags.extend([
+        slicer.mrmlScene.AddObserver(slicer.vtkMRMLScene.StartSaveEvent, _on_scene_start_save),
+        slicer.mrmlScene.AddObserver(slicer.vtkMRMLScene.EndImportEvent, _on_scene_end_import),
+        slicer.mrmlScene.AddObserver(slicer.vtkMRMLScene.EndCloseEvent, _on_scene_end_close),
+    ])
+    prune_sidecar_store()
@@ -0,0 +1,127 @@
+"""Per-volume store of foreground masks, shared by background thresholding, skin segmentation and virtual fit"""
+
+import hashlib
+import logging
+from pathlib import Path
+from typing import Optional, Union
+import numpy as np
+import slicer
+from slicer import vtkMRMLScalarVolumeNode, vtkMRMLLabelMapVolumeNode
+from OpenLIFULib.database_metadata_cache import file_signature
+
+FOREGROUND_MASK_ATTRIBUTE = "isOpenLIFUForegroundMask"
+"""Attribute set on foreground mask labelmap nodes. Its value is the node ID of the volume that the mask belongs to."""
+
+FOREGROUND_MASK_STORE_DIR_ATTRIBUTE = "OpenLIFUData.foreground_mask_store_dir"
+"""Attribute set on a volume node whose foreground mask is persisted, holding the folder that the mask is persisted in"""
+
+FOREGROUND_MASK_STORE_DIRNAME = "foreground_masks"
+"""Name of the folder, placed in a session folder of the openlifu database, that holds the persisted foreground mask of
+the session volume"""
+
+def get_session_foreground_mask_store_dir(db_path:Union[str,Path], subject_id:str, session_id:str) -> Path:
+    """Get the folder in which the foreground mask of a session volume is persisted"""
+    return Path(db_path) / "subjects" / subject_id / "sessions" / session_id / FOREGROUND_MASK_STORE_DIRNAME
+
+def _stored_foreground_mask_filepath(store_dir:Path, volume_filepath:Union[str,Path]) -> Optional[Path]:
+    """Get the file in which the foreground mask of the given volume file is persisted, or None if the volume file does
+    not exist. The filename is derived from the path, modification time and size of the volume file, so that a changed
+    volume file never picks up the mask of its previous content."""
+    signature = file_signature(Path(volume_filepath))
+    if signature is None:
+        return None
+    key = hashlib.blake2b(f"{Path(volume_filepath).resolve()}|{signature}".encode('utf-8'), digest_size=16).hexdigest()
+    return Path(store_dir) / f"{key}.npz"
+
+def load_stored_foreground_mask(store_dir:Union[str,Path], volume_filepath:Union[str,Path]) -> Optional[np.ndarray]:
+    """Load the persisted foreground mask of a volume file, or None if there is none for the current content of the file.
+    This does not touch the scene, so it can be run in a worker thread.
+
+    The mask array is in correspondence with what you'd get from slicer.util.arrayFromVolume on the loaded volume node.
+    """
+    mask_filepath = _stored_foreground_mask_filepath(Path(store_dir), volume_filepath)
+    if mask_filepath is None or not mask_filepath.exists():
+        return None
+    try:
+        with np.load(mask_filepath) as foreground_mask_npz:
+            return np.unpackbits(
+                foreground_mask_npz['packed_mask'],
+                count=int(np.prod(foreground_mask_npz['shape'])),
+            ).reshape(foreground_mask_npz['shape']).astype(bool)
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Ignoring unreadable stored foreground mask {mask_filepath}: {e}")
+        return None
+
+def save_foreground_mask_to_store(store_dir:Union[str,Path], volume_filepath:Union[str,Path], foreground_mask:np.ndarray) -> None:
+    """Persist the foreground mask of a volume file, replacing any masks persisted for other volume content. The mask is
+    written bit-packed. This does not touch the scene, so it can be run in a worker thread. Failures to write are logged
+    rather than raised, since the mask can always be computed again."""
+    store_dir = Path(store_dir)
+    mask_filepath = _stored_foreground_mask_filepath(store_dir, volume_filepath)
+    if mask_filepath is None:
+        return
+    try:
+        store_dir.mkdir(parents=True, exist_ok=True)
+        for stale_filepath in store_dir.glob("*.npz"):
+            if stale_filepath != mask_filepath:
+                stale_filepath.unlink()
+        np.savez_compressed(
+            mask_filepath,
+            packed_mask = np.packbits(foreground_mask.astype(bool, copy=False), axis=None),
+            shape = np.array(foreground_mask.shape),
+        )
+    except OSError as e:
+        logging.warning(f"Could not persist foreground mask for {volume_filepath}: {e}")
+
+def get_foreground_mask_node(volume_node:vtkMRMLScalarVolumeNode) -> Optional[vtkMRMLLabelMapVolumeNode]:
+    """Get the foreground mask labelmap attached to a volume by `attach_foreground_mask`, or None if there is none."""
+    for mask_node in slicer.util.getNodesByClass('vtkMRMLLabelMapVolumeNode'):
+        if mask_node.GetAttribute(FOREGROUND_MASK_ATTRIBUTE) == volume_node.GetID():
+            return mask_node
+    return None
+
+def get_attached_foreground_mask(volume_node:vtkMRMLScalarVolumeNode) -> Optional[np.ndarray]:
+    """Get the foreground mask attached to a volume, or None if it has none.
+
+    The returned boolean array is a view of the labelmap voxels, and it is in correspondence with what you'd get from
+    slicer.util.arrayFromVolume on the volume node.
+    """
+    mask_node = get_foreground_mask_node(volume_node)
+    if mask_node is None:
+        return None
+    return slicer.util.arrayFromVolume(mask_node).view(bool)
+
+def attach_foreground_mask(volume_node:vtkMRMLScalarVolumeNode, foreground_mask:np.ndarray) -> vtkMRMLLabelMapVolumeNode:
+    """Attach a foreground mask to a volume, replacing any mask that was attached before. The mask is kept in a hidden
+    uint8 labelmap node that shares the geometry of the volume, so that it goes along with the volume in the scene.
+
+    Returns the labelmap node.
+    """
+    remove_foreground_mask_nodes(volume_node)
+
+    mask_node : vtkMRMLLabelMapVolumeNode = slicer.mrmlScene.AddNewNodeByClass(
+        "vtkMRMLLabelMapVolumeNode",
+        slicer.mrmlScene.GenerateUniqueName(f"{volume_node.GetName()}-foreground"),
+    )
+    mask_node.SetAttribute(FOREGROUND_MASK_ATTRIBUTE, volume_node.GetID())
+    mask_node.SetHideFromEditors(True)
+    mask_node.CopyOrientation(volume_node)
+    foreground_mask_uint8 = foreground_mask.view(np.uint8) if foreground_mask.dtype == bool else (foreground_mask != 0).view(np.uint8)
+    slicer.util.updateVolumeFromArray(mask_node, foreground_mask_uint8)
+    return mask_node
+
+def remove_foreground_mask_nodes(volume_node:vtkMRMLScalarVolumeNode) -> None:
+    """Remove any foreground mask labelmaps of the given volume from the scene. This also works on a volume node that was
+    already removed from the scene."""
+    for mask_node in slicer.util.getNodesByClass('vtkMRMLLabelMapVolumeNode'):
+        if mask_node.GetAttribute(FOREGROUND_MASK_ATTRIBUTE) == volume_node.GetID():
+            slicer.mrmlScene.RemoveNode(mask_node)
+
+def set_foreground_mask_store_dir(volume_node:vtkMRMLScalarVolumeNode, store_dir:Union[str,Path]) -> None:
+    """Set the folder in which the foreground mask of a volume is persisted when it gets computed"""
+    volume_node.SetAttribute(FOREGROUND_MASK_STORE_DIR_ATTRIBUTE, str(store_dir))
+
+def get_foreground_mask_store_dir(volume_node:vtkMRMLScalarVolumeNode) -> Optional[Path]:
+    """Get the folder in which the foreground mask of a volume is persisted, or None if it is not persisted"""
+    store_dir = volume_node.GetAttribute(FOREGROUND_MASK_STORE_DIR_ATTRIBUTE)
+    return Path(store_dir) if store_dir else None
@@ -1,5 +1,6 @@
 """Some of the underlying parameter node infrastructure"""
 
+import abc
 from typing import TYPE_CHECKING, Optional, Any
 import numpy as np
 import slicer
@@ -13,6 +14,12 @@ from slicer.parameterNodeWrapper.serializers import createSerializerFromAnnotate
 import zlib
 import io
 import base64
+from OpenLIFULib.dataset_sidecar import (
+    install_scene_observers,
+    is_sidecar_reference,
+    read_dataset_sidecar,
+    write_dataset_sidecar,
+)
 
 if TYPE_CHECKING:
     import openlifu
@@ -21,8 +28,9 @@ if TYPE_CHECKING:
     import openlifu.plan
     import openlifu.nav.photoscan
     import openlifu.xdc
-    import xarray
 
+# Solution parameters refer to sidecar files that need to be carried along when the scene is saved and loaded
+install_scene_observers()
 
 # This very thin wrapper around openlifu.plan.Protocol is needed so parameter node
 # wrappers can keep type annotations without importing openlifu at module load time.
@@ -66,13 +74,6 @@ class SlicerOpenLIFUSolutionWrapper:
     def __init__(self, solution: "Optional[openlifu.plan.Solution]" = None):
         self.solution = solution
 
-# For the same reason we have a thin wrapper around xarray.Dataset
-class SlicerOpenLIFUXADataset:
-    """Ultrathin wrapper of xarray.Dataset, so that it can have parameter node
-    support while we still do lazy-loading of xarray (a dependency that is installed alongside openlifu)."""
-    def __init__(self, dataset: "Optional[xarray.Dataset]" = None):
-        self.dataset = dataset
-
 # For the same reason we have a thin wrapper around openlifu.plan.Run.
 class SlicerOpenLIFURun:
     """Ultrathin wrapper of openlifu.plan.Run. This exists so that runs can have parameter node
@@ -103,6 +104,20 @@ def SlicerOpenLIFUSerializerBaseMaker(
     """Factory for parameter node serializer base class to handle boilerplate aspects of
     the implementation of a serializer.
 
+    The base class stores each value as a single string parameter, and it caches the values that it reads: a
+    repeated read of a parameter returns the previously read object as long as the parameter node has not been
+    modified since, instead of deserializing the string again. The cache entry of a parameter is versioned by the
+    modification time of the parameter node, so any change to the parameter node (including writes that bypass
+    the serializer) invalidates it, and writing through the serializer drops it. The serializer also reports that it
+    supports caching, so parameterNodeWrapper keeps the value it read and hands it out until the parameter node is
+    modified.
+
+    Values read from a parameter node are therefore shared by every reader, and must be treated as read-only: the only
+    allowed modification of a value read from a parameter node is one that is immediately followed by writing the
+    value back, which replaces the shared value for all readers. A caller that needs a private copy to modify must make
+    it itself. Copies are not made on read since copying an object such as a transducer costs about twice as much as
+    deserializing it.
+
     Args:
         serialized_type: The type that is being serialized. To check whether an object can be
             serialized with this serializer, the object's type is compared with this type.
@@ -112,14 +127,18 @@ def SlicerOpenLIFUSerializerBaseMaker(
             a default object. If None then no kwargs are passed.
 
     Returns: An abstract base class deriving from Serializer which has implementations of boilerplate
-        methods in place. Only read and write methods need to be implemented from here.
+        methods in place. Only serialize and deserialize methods need to be implemented from here.
 
     """
     if default_args is None:
         default_args = []
     if default_kwargs is None:
         default_kwargs = {}
-    class SlicerOpenLIFUSerializerBase(Serializer):
+    class SlicerOpenLIFUSerializerBase(Serializer, abc.ABC):
+        def __init__(self):
+            self._read_cache : dict[tuple[str,str],tuple[int,Any]] = {}
+            """Mapping from (parameter node ID, parameter name) to (parameter node modification time, value read)"""
+
         @staticmethod
         def canSerialize(type_) -> bool:
             """
@@ -144,6 +163,14 @@ def SlicerOpenLIFUSerializerBaseMaker(
             """
             return serialized_type(*default_args, **default_kwargs)
 
+        @abc.abstractmethod
+        def serialize(self, value) -> str:
+            """Convert a value into the string that is stored in the parameter node."""
+
+        @abc.abstractmethod
+        def deserialize(self, serialized:str):
+            """Convert a string stored in the parameter node back into a value."""
+
         def isIn(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> bool:
             """
             Whether the parameterNode contains a parameter of the given name.
@@ -151,171 +178,134 @@ def SlicerOpenLIFUSerializerBaseMaker(
             """
             return parameterNode.HasParameter(name)
 
+        def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value) -> None:
+            """
+            Writes the value to the parameterNode under the given name.
+            """
+            self._read_cache.pop((parameterNode.GetID(), name), None)
+            parameterNode.SetParameter(name, self.serialize(value))
+
+        def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str):
+            """
+            Reads and returns the value with the given name from the parameterNode.
+            """
+            # While modified events are disabled the parameter node modification time is not updated on changes,
+            # so the cache cannot be trusted
+            cacheable = parameterNode.GetID() is not None and not parameterNode.GetDisableModifiedEvent()
+            key = (parameterNode.GetID(), name)
+            if cacheable and key in self._read_cache:
+                mtime, value = self._read_cache[key]
+                if mtime == parameterNode.GetMTime():
+                    return value
+            value = self.deserialize(parameterNode.GetParameter(name))
+            if cacheable:
+                self._read_cache[key] = (parameterNode.GetMTime(), value)
+            else:
+                self._read_cache.pop(key, None)
+            return value
+
         def remove(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> None:
             """
             Removes the value of the given name from the parameterNode.
             """
+            self._read_cache.pop((parameterNode.GetID(), name), None)
             parameterNode.UnsetParameter(name)
+
+        def supportsCaching(self) -> bool:
+            # Values are shared read-only objects, see the docstring of SlicerOpenLIFUSerializerBaseMaker
+            return True
     return SlicerOpenLIFUSerializerBase
 
 @parameterNodeSerializer
 class OpenLIFUProtocolSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFUProtocol)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFUProtocol) -> None:
-        """
-        Writes the value to the parameterNode under the given name.
-        """
-        parameterNode.SetParameter(
-            name,
-            value.protocol.to_json(compact=True)
-        )
+    def serialize(self, value: SlicerOpenLIFUProtocol) -> str:
+        return value.protocol.to_json(compact=True)
 
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFUProtocol:
-        """
-        Reads and returns the value with the given name from the parameterNode.
-        """
+    def deserialize(self, serialized: str) -> SlicerOpenLIFUProtocol:
         import openlifu.plan
 
-        json_string = parameterNode.GetParameter(name)
-        return SlicerOpenLIFUProtocol(openlifu.plan.Protocol.from_json(json_string))
+        return SlicerOpenLIFUProtocol(openlifu.plan.Protocol.from_json(serialized))
 
 @parameterNodeSerializer
 class OpenLIFUTransducerSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFUTransducerWrapper)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFUTransducerWrapper) -> None:
-        """
-        Writes the value to the parameterNode under the given name.
-        """
-        parameterNode.SetParameter(
-            name,
-            value.transducer.to_json(compact=True)
-        )
+    def serialize(self, value: SlicerOpenLIFUTransducerWrapper) -> str:
+        return value.transducer.to_json(compact=True)
 
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFUTransducerWrapper:
-        """
-        Reads and returns the value with the given name from the parameterNode.
-        """
+    def deserialize(self, serialized: str) -> SlicerOpenLIFUTransducerWrapper:
         import openlifu.xdc
 
-        json_string = parameterNode.GetParameter(name)
-        return SlicerOpenLIFUTransducerWrapper(openlifu.xdc.Transducer.from_json(json_string))
+        return SlicerOpenLIFUTransducerWrapper(openlifu.xdc.Transducer.from_json(serialized))
 
 @parameterNodeSerializer
 class OpenLIFUSessionSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFUSessionWrapper)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFUSessionWrapper) -> None:
-        parameterNode.SetParameter(
-            name,
-            value.session.to_json(compact=True)
-        )
+    def serialize(self, value: SlicerOpenLIFUSessionWrapper) -> str:
+        return value.session.to_json(compact=True)
 
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFUSessionWrapper:
+    def deserialize(self, serialized: str) -> SlicerOpenLIFUSessionWrapper:
         import openlifu.db
 
-        json_string = parameterNode.GetParameter(name)
-        return SlicerOpenLIFUSessionWrapper(openlifu.db.Session.from_json(json_string))
+        return SlicerOpenLIFUSessionWrapper(openlifu.db.Session.from_json(serialized))
 
 @parameterNodeSerializer
 class OpenLIFUSolutionSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFUSolutionWrapper)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFUSolutionWrapper) -> None:
-        parameterNode.SetParameter(
-            name,
-            value.solution.to_json(include_simulation_data=True, compact=True)
-        )
-
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFUSolutionWrapper:
+    """Serializer that stores the simulation result of a solution as a binary NetCDF sidecar file, keeping only a
+    reference to the file in the parameter node along with the JSON of the rest of the solution. See
+    `OpenLIFULib.dataset_sidecar`. Parameter values holding the whole solution as JSON, with the simulation result base64
+    encoded inside it, which is how solutions were stored by earlier versions, can still be read."""
+    def serialize(self, value: SlicerOpenLIFUSolutionWrapper) -> str:
+        reference = write_dataset_sidecar(value.solution.simulation_result)
+        return reference + "\n" + value.solution.to_json(include_simulation_data=False, compact=True)
+
+    def deserialize(self, serialized: str) -> SlicerOpenLIFUSolutionWrapper:
         import openlifu.plan
 
-        json_string = parameterNode.GetParameter(name)
-        return SlicerOpenLIFUSolutionWrapper(openlifu.plan.Solution.from_json(json_string))
+        if is_sidecar_reference(serialized):
+            reference, solution_json = serialized.split("\n", 1)
+            solution = openlifu.plan.Solution.from_json(solution_json)
+            solution.simulation_result = read_dataset_sidecar(reference)
+            return SlicerOpenLIFUSolutionWrapper(solution)
+
+        return SlicerOpenLIFUSolutionWrapper(openlifu.plan.Solution.from_json(serialized))
 
 @parameterNodeSerializer
 class OpenLIFUPointSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFUPoint)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFUPoint) -> None:
-        """
-        Writes the value to the parameterNode under the given name.
-        """
-        parameterNode.SetParameter(
-            name,
-            value.point.to_json(compact=True)
-        )
+    def serialize(self, value: SlicerOpenLIFUPoint) -> str:
+        return value.point.to_json(compact=True)
 
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFUPoint:
-        """
-        Reads and returns the value with the given name from the parameterNode.
-        """
+    def deserialize(self, serialized: str) -> SlicerOpenLIFUPoint:
         import openlifu.geo
 
-        json_string = parameterNode.GetParameter(name)
-        return SlicerOpenLIFUPoint(openlifu.geo.Point.from_json(json_string))
+        return SlicerOpenLIFUPoint(openlifu.geo.Point.from_json(serialized))
 
 @parameterNodeSerializer
 class OpenLIFURunSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFURun)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFURun) -> None:
-        parameterNode.SetParameter(
-            name,
-            value.run.to_json(compact=True)
-        )
+    def serialize(self, value: SlicerOpenLIFURun) -> str:
+        return value.run.to_json(compact=True)
 
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFURun:
+    def deserialize(self, serialized: str) -> SlicerOpenLIFURun:
         import openlifu.plan
 
-        json_string = parameterNode.GetParameter(name)
-        return SlicerOpenLIFURun(openlifu.plan.Run.from_json(json_string))
+        return SlicerOpenLIFURun(openlifu.plan.Run.from_json(serialized))
 
 @parameterNodeSerializer
 class OpenLIFUSolutionAnalysisSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFUSolutionAnalysis)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFUSolutionAnalysis) -> None:
-        parameterNode.SetParameter(
-            name,
-            value.analysis.to_json(compact=True)
-        )
+    def serialize(self, value: SlicerOpenLIFUSolutionAnalysis) -> str:
+        return value.analysis.to_json(compact=True)
 
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFUSolutionAnalysis:
+    def deserialize(self, serialized: str) -> SlicerOpenLIFUSolutionAnalysis:
         import openlifu.plan
 
-        json_string = parameterNode.GetParameter(name)
-        return SlicerOpenLIFUSolutionAnalysis(openlifu.plan.SolutionAnalysis.from_json(json_string))
+        return SlicerOpenLIFUSolutionAnalysis(openlifu.plan.SolutionAnalysis.from_json(serialized))
 
 @parameterNodeSerializer
 class OpenLIFUPhotoscanSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFUPhotoscanWrapper)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFUPhotoscanWrapper) -> None:
-        """
-        Writes the value to the parameterNode under the given name.
-        """
-        parameterNode.SetParameter(
-            name,
-            value.photoscan.to_json(compact=True)
-        )
+    def serialize(self, value: SlicerOpenLIFUPhotoscanWrapper) -> str:
+        return value.photoscan.to_json(compact=True)
 
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFUPhotoscanWrapper:
-        """
-        Reads and returns the value with the given name from the parameterNode.
-        """
+    def deserialize(self, serialized: str) -> SlicerOpenLIFUPhotoscanWrapper:
         import openlifu.nav.photoscan
 
-        json_string = parameterNode.GetParameter(name)    
-        return SlicerOpenLIFUPhotoscanWrapper(openlifu.nav.photoscan.Photoscan.from_json(json_string))
-
-@parameterNodeSerializer
-class XarraydatasetSerializer(SlicerOpenLIFUSerializerBaseMaker(SlicerOpenLIFUXADataset)):
-    def write(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str, value: SlicerOpenLIFUXADataset) -> None:
-        """
-        Writes the value to the parameterNode under the given name.
-        """
-        ds = value.dataset
-        ds_serialized = base64.b64encode(ds.to_netcdf()).decode('utf-8')
-        parameterNode.SetParameter(
-            name,
-            ds_serialized,
-        )
-
-    def read(self, parameterNode: slicer.vtkMRMLScriptedModuleNode, name: str) -> SlicerOpenLIFUXADataset:
-        """
-        Reads and returns the value with the given name from the parameterNode.
-        """
-        import xarray
-
-        ds_serialized = parameterNode.GetParameter(name)
-        ds_deserialized = xarray.open_dataset(base64.b64decode(ds_serialized.encode('utf-8')))
-        return SlicerOpenLIFUXADataset(ds_deserialized)
+        return SlicerOpenLIFUPhotoscanWrapper(openlifu.nav.photoscan.Photoscan.from_json(serialized))
 
 @parameterNodeSerializer
 class NumpyArraySerializer(Serializer):
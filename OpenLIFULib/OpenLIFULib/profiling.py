@@ -0,0 +1,182 @@
+"""Timing of long running operations and their stages, for finding out where the time goes in slow workflows"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import qt
+
+PROFILING_HISTORY_SIZE = 50
+"""Number of recently finished operations that are kept in memory"""
+
+PROFILING_EXPORT_PATH_SETTING = "OpenLIFU/profilingExportPath"
+"""Application setting holding the JSON lines file to which finished operations are appended, if any"""
+
+class ProfileSpan:
+    """A timed operation, or a timed stage of one. Stages are nested spans, listed in `children`.
+
+    A span without a parent is an operation; when it finishes it is recorded in the history of recent operations
+    (see `get_recent_operations`) and logged with its per-stage breakdown.
+    """
+
+    def __init__(self, name:str, parent:"Optional[ProfileSpan]" = None):
+        self.name = name
+        self.parent = parent
+        self.children : List[ProfileSpan] = []
+        self.thread_name = threading.current_thread().name
+        self.start_time = datetime.now()
+        self.duration : Optional[float] = None
+        """Duration in seconds, or None if the span has not finished yet"""
+        self.error : Optional[str] = None
+        """The error that ended the span, if it did not finish normally"""
+        self._start_counter = time.perf_counter()
+        if parent is not None:
+            with _lock:
+                parent.children.append(self)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.duration is not None
+
+    def finish(self, error:Optional[str] = None) -> None:
+        """End the span. This is done automatically by `profile_span`; spans from `start_span` must be finished by the
+        caller. Finishing a span more than once has no further effect."""
+        if self.is_finished:
+            return
+        self.duration = time.perf_counter() - self._start_counter
+        self.error = error
+        if self.parent is None:
+            _record_operation(self)
+
+    def to_dict(self) -> Dict[str,Any]:
+        """Convert the span and its stages to a JSON-serializable dict"""
+        return {
+            "name" : self.name,
+            "start_time" : self.start_time.isoformat(),
+            "duration" : self.duration,
+            "thread" : self.thread_name,
+            "error" : self.error,
+            "children" : [child.to_dict() for child in self.children],
+        }
+
+    def format_breakdown(self, indent:int = 0) -> str:
+        """Describe the span and its stages, one line per span, with stages indented under their parent"""
+        duration_text = f"{self.duration:.3f} s" if self.is_finished else "unfinished"
+        error_text = f" (failed: {self.error})" if self.error else ""
+        lines = [f"{'  '*indent}{self.name}: {duration_text}{error_text}"]
+        lines.extend(child.format_breakdown(indent+1) for child in self.children)
+        return "\n".join(lines)
+
+_lock = threading.Lock()
+_thread_local = threading.local()
+_recent_operations : "deque[ProfileSpan]" = deque(maxlen=PROFILING_HISTORY_SIZE)
+_num_recorded_operations = 0
+
+_CURRENT_SPAN = object()
+"""Marker for the `parent` argument, meaning that the innermost open span of the calling thread is the parent"""
+
+def _span_stack() -> List[ProfileSpan]:
+    if not hasattr(_thread_local, "span_stack"):
+        _thread_local.span_stack = []
+    return _thread_local.span_stack
+
+def current_span() -> Optional[ProfileSpan]:
+    """Get the innermost `profile_span` that is open in the calling thread, or None. Pass it as the `parent` of spans
+    opened in worker threads to time those as stages of the calling thread's operation."""
+    stack = _span_stack()
+    return stack[-1] if stack else None
+
+def start_span(name:str, parent:Any = _CURRENT_SPAN) -> ProfileSpan:
+    """Start timing an operation or stage that does not fit in a `with` block, such as one that finishes in a callback.
+    The caller must call `finish` on the returned span. The span is not made the current span.
+
+    Args:
+        name: The name of the operation or stage
+        parent: The span of which this is a stage. By default the current span of the calling thread is used, so that
+            this is a stage of it if there is one. Pass None to make this an operation of its own.
+    """
+    if parent is _CURRENT_SPAN:
+        parent = current_span()
+    return ProfileSpan(name, parent)
+
+@contextmanager
+def profile_span(name:str, parent:Any = _CURRENT_SPAN) -> Iterator[ProfileSpan]:
+    """Context manager that times its body as an operation, or as a stage of the current operation if there is one.
+    Spans opened inside the body are its stages. This can be used from any thread.
+
+    Args:
+        name: The name of the operation or stage
+        parent: See `start_span`.
+    """
+    span = start_span(name, parent)
+    stack = _span_stack()
+    stack.append(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(error = f"{type(e).__name__}: {e}")
+        raise
+    else:
+        span.finish()
+    finally:
+        stack.remove(span)
+
+def profiled(name:Optional[str] = None) -> Callable[[Callable], Callable]:
+    """Decorator that times each call of a function with `profile_span`.
+
+    Args:
+        name: The name of the span. Defaults to the qualified name of the function.
+    """
+    def decorator(f:Callable) -> Callable:
+        span_name = name if name is not None else f.__qualname__
+        @wraps(f)
+        def f_profiled(*args, **kwargs):
+            with profile_span(span_name):
+                return f(*args, **kwargs)
+        return f_profiled
+    return decorator
+
+def _record_operation(span:ProfileSpan) -> None:
+    global _num_recorded_operations
+    with _lock:
+        _recent_operations.append(span)
+        _num_recorded_operations += 1
+    logging.info(f"Timing of {span.format_breakdown()}")
+    export_path = get_profiling_export_path()
+    if export_path:
+        try:
+            with _lock, open(export_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(span.to_dict()) + "\n")
+        except OSError as e:
+            logging.warning(f"Could not export operation timing to {export_path}: {e}")
+
+def get_recent_operations() -> List[ProfileSpan]:
+    """Get the most recently finished operations, oldest first. At most `PROFILING_HISTORY_SIZE` are kept."""
+    with _lock:
+        return list(_recent_operations)
+
+def get_num_recorded_operations() -> int:
+    """Get the number of operations that finished so far. This changes whenever `get_recent_operations` does, so it can
+    be polled to find out whether there is anything new."""
+    return _num_recorded_operations
+
+def clear_recent_operations() -> None:
+    """Forget the recently finished operations"""
+    global _num_recorded_operations
+    with _lock:
+        _recent_operations.clear()
+        _num_recorded_operations += 1
+
+def get_profiling_export_path() -> str:
+    """Get the JSON lines file to which each finished operation is appended, or the empty string if exporting is off"""
+    return qt.QSettings().value(PROFILING_EXPORT_PATH_SETTING, "") or ""
+
+def set_profiling_export_path(path:Optional[str]) -> None:
+    """Set the JSON lines file to which each finished operation is appended. Exporting is off by default; pass None or
+    the empty string to turn it off again. The setting is remembered across application restarts."""
+    qt.QSettings().setValue(PROFILING_EXPORT_PATH_SETTING, path or "")
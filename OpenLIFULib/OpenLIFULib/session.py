@@ -1,4 +1,4 @@
-from typing import List, TYPE_CHECKING, Optional, Tuple, Dict
+from typing import Iterable, List, TYPE_CHECKING, Optional, Tuple, Dict
 import numpy as np
 import slicer
 from slicer import (
@@ -7,8 +7,13 @@ from slicer import (
     vtkMRMLMarkupsFiducialNode,
 )
 from slicer.parameterNodeWrapper import parameterPack
-from OpenLIFULib.util import get_openlifu_data_parameter_node, BusyCursor
-from OpenLIFULib.volume_thresholding import load_volume_and_threshold_background
+from OpenLIFULib.util import get_openlifu_data_parameter_node, get_cur_db, BusyCursor
+from OpenLIFULib.foreground_mask_store import get_session_foreground_mask_store_dir
+from OpenLIFULib.volume_thresholding import (
+    ReadVolume,
+    add_read_volume_to_scene_and_threshold_background,
+    load_volume_and_threshold_background,
+)
 from OpenLIFULib.parameter_node_utils import SlicerOpenLIFUSessionWrapper, SlicerOpenLIFUPhotoscanWrapper
 from OpenLIFULib.targets import (
     openlifu_point_to_fiducial,
@@ -18,6 +23,7 @@ from OpenLIFULib.transform_conversion import transducer_transform_node_to_openli
 from OpenLIFULib.virtual_fit_results import get_virtual_fit_results_in_openlifu_session_format
 from OpenLIFULib.skinseg import get_skin_segmentation, generate_skin_segmentation
 from OpenLIFULib.transducer_tracking_results import get_transducer_tracking_results_in_openlifu_session_format
+from OpenLIFULib.session_saving import SessionComponent
 
 if TYPE_CHECKING:
     import openlifu
@@ -138,6 +144,7 @@ class SlicerOpenLIFUSession:
     def initialize_from_openlifu_session(
         session : "openlifu.db.Session",
         volume_info : dict,
+        read_volume : Optional[ReadVolume] = None,
     ) -> "SlicerOpenLIFUSession":
         """Create a SlicerOpenLIFUSession from an openlifu Session, loading affiliated data into the scene.
 
@@ -145,10 +152,18 @@ class SlicerOpenLIFUSession:
             session: OpenLIFU Session
             volume_info: Dictionary containing the metadata (name, id and filepath) of the volume
             being loaded as part of the session
+            read_volume: The session volume, if it was already read from file ahead of time with
+                `read_volume_and_compute_foreground_mask`. If None then the volume is loaded here.
         """
 
         # Load volume
-        volume_node, foreground_mask = load_volume_and_threshold_background(volume_info['data_abspath'])
+        if read_volume is not None:
+            volume_node, _ = add_read_volume_to_scene_and_threshold_background(read_volume)
+        else:
+            volume_node, _ = load_volume_and_threshold_background(
+                volume_info['data_abspath'],
+                foreground_mask_store_dir = get_session_foreground_mask_store_dir(get_cur_db().path, session.subject_id, session.id),
+            )
         assign_openlifu_metadata_to_volume_node(volume_node, volume_info)
 
         if (
@@ -159,7 +174,7 @@ class SlicerOpenLIFUSession:
             and get_skin_segmentation(volume_node) is None
         ):
             with BusyCursor():
-                generate_skin_segmentation(volume_node, foreground_mask) # provide foreground mask so that we don't waste time recomputing it
+                generate_skin_segmentation(volume_node) # the foreground mask computed while loading the volume is attached to it, so it is not recomputed
             slicer.modules.OpenLIFUPrePlanningWidget.showSkin(volume_node)
 
         # Load targets
@@ -187,14 +202,22 @@ class SlicerOpenLIFUSession:
             raise RuntimeError("The specified photoscan is not affiliated with this session") 
         self.affiliated_photoscans[photoscan.id] = SlicerOpenLIFUPhotoscanWrapper(photoscan)
 
-    def update_underlying_openlifu_session(self, targets : List[vtkMRMLMarkupsFiducialNode]) -> "openlifu.db.Session":
+    def update_underlying_openlifu_session(
+        self,
+        targets : List[vtkMRMLMarkupsFiducialNode],
+        components : Optional[Iterable[SessionComponent]] = None,
+    ) -> "openlifu.db.Session":
         """Update the underlying openlifu session and the list of target nodes that are considered to be affiliated with this session.
 
         Args:
             targets: new list of targets
+            components: the parts of the underlying session to update from the scene. By default all of them are
+                updated. Parts that are known not to have changed since they were last updated can be left out to save
+                time; see SessionChangeTracker.
 
         Returns: the now updated underlying openlifu Session
         """
+        components = set(SessionComponent) if components is None else set(components)
 
         # Update target fiducial nodes in this object
         self.target_nodes = targets
@@ -203,25 +226,30 @@ class SlicerOpenLIFUSession:
             raise RuntimeError("No underlying openlifu session")
 
         # Update target Points in the underlying Session
-        self.session.session.targets = list(map(fiducial_to_openlifu_point,targets))
+        if SessionComponent.TARGETS in components:
+            self.session.session.targets = list(map(fiducial_to_openlifu_point,targets))
 
-        # Update transducer transform in the underlying Session
         transducer = get_openlifu_data_parameter_node().loaded_transducers[self.get_transducer_id()]
         transducer_openlifu = transducer.transducer.transducer
-        transducer_transform_node : vtkMRMLTransformNode = transducer.transform_node
-        self.session.session.array_transform = transducer_transform_node_to_openlifu(transducer_transform_node, transducer_openlifu.units)
+
+        # Update transducer transform in the underlying Session
+        if SessionComponent.TRANSDUCER_TRANSFORM in components:
+            transducer_transform_node : vtkMRMLTransformNode = transducer.transform_node
+            self.session.session.array_transform = transducer_transform_node_to_openlifu(transducer_transform_node, transducer_openlifu.units)
 
         # Update virtual fit results
-        self.session.session.virtual_fit_results = get_virtual_fit_results_in_openlifu_session_format(
-            session_id=self.get_session_id(),
-            units = transducer_openlifu.units,
-        )
+        if SessionComponent.VIRTUAL_FIT_RESULTS in components:
+            self.session.session.virtual_fit_results = get_virtual_fit_results_in_openlifu_session_format(
+                session_id=self.get_session_id(),
+                units = transducer_openlifu.units,
+            )
 
         #Update transducer localization results
-        self.session.session.transducer_tracking_results = get_transducer_tracking_results_in_openlifu_session_format(
-            session_id=self.get_session_id(),
-            transducer_units = transducer_openlifu.units,
-        )
+        if SessionComponent.TRANSDUCER_TRACKING_RESULTS in components:
+            self.session.session.transducer_tracking_results = get_transducer_tracking_results_in_openlifu_session_format(
+                session_id=self.get_session_id(),
+                transducer_units = transducer_openlifu.units,
+            )
 
         return self.session.session
 
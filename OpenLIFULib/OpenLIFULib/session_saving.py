@@ -0,0 +1,305 @@
+"""Tracking of changes to the loaded session, and writing only the changed parts of it to the database"""
+
+import os
+import tempfile
+from enum import Enum, auto
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Set, TYPE_CHECKING
+import qt
+import vtk
+import slicer
+from slicer import vtkMRMLNode, vtkMRMLTransformNode
+from slicer.util import VTKObservationMixin
+from OpenLIFULib.events import SlicerOpenLIFUEvents
+from OpenLIFULib.transducer_tracking_results import is_transducer_tracking_result_node
+from OpenLIFULib.virtual_fit_results import is_virtual_fit_result_node
+
+if TYPE_CHECKING:
+    import openlifu.db
+    import openlifu.nav.photoscan
+
+AUTOSAVE_SETTINGS_KEY = "OpenLIFU/autosaveSession"
+"""QSettings key holding whether changes to the loaded session are saved automatically"""
+
+AUTOSAVE_QUIET_PERIOD_MS = 2000
+"""How long the loaded session has to go without changes before they are saved automatically, in milliseconds. Every
+change restarts the wait, so that a burst of changes (e.g. dragging the transducer) is saved with a single write."""
+
+def get_autosave_enabled() -> bool:
+    """Get whether changes to the loaded session are saved automatically. This is on by default."""
+    return slicer.util.settingsValue(AUTOSAVE_SETTINGS_KEY, True, converter=slicer.util.toBool)
+
+def set_autosave_enabled(enabled:bool) -> None:
+    """Set whether changes to the loaded session are saved automatically. The setting is remembered across application
+    restarts."""
+    qt.QSettings().setValue(AUTOSAVE_SETTINGS_KEY, bool(enabled))
+
+class SessionComponent(Enum):
+    """The parts of an openlifu Session that are kept in the scene while the session is loaded, and that are written
+    back into the Session when it is saved"""
+    TARGETS = auto()
+    TRANSDUCER_TRANSFORM = auto()
+    VIRTUAL_FIT_RESULTS = auto()
+    TRANSDUCER_TRACKING_RESULTS = auto()
+
+class SessionChangeTracker(VTKObservationMixin):
+    """Keeps track of which parts of the loaded session changed since it was loaded or last saved.
+
+    The scene is observed for added and removed nodes, target fiducial nodes for point changes and renames, the
+    transducer transform node for transform changes, and virtual fit and transducer tracking result nodes for any
+    modification (which is how approval attribute changes are announced). Each change marks the `SessionComponent` that
+    the node belongs to as modified. Photoscan approvals are not kept in the scene, so changes to the affiliated
+    photoscans must be reported with `mark_photoscan_modified`.
+
+    Telling apart relevant from irrelevant changes is done conservatively: a change that might affect the session marks
+    it as modified, which at worst costs an unneeded write.
+
+    Args:
+        scene: The scene that the session is loaded into
+        session_id: The ID of the session, used to recognize its virtual fit and transducer tracking results
+        transducer_transform_node: The transform node of the session transducer
+        on_modified: A function to call, without arguments, whenever a change is noticed
+    """
+
+    def __init__(
+        self,
+        scene:slicer.vtkMRMLScene,
+        session_id:str,
+        transducer_transform_node:vtkMRMLTransformNode,
+        on_modified:Optional[Callable[[],None]] = None,
+    ) -> None:
+        VTKObservationMixin.__init__(self)
+        self.scene = scene
+        self.session_id = session_id
+        self.transducer_transform_node = transducer_transform_node
+        self.on_modified = on_modified
+
+        self.modified_components : Set[SessionComponent] = set()
+        """The parts of the session that changed and have not been saved yet"""
+
+        self.modified_photoscan_ids : Set[str] = set()
+        """The IDs of the affiliated photoscans that changed and have not been saved yet"""
+
+        self._node_components : Dict[str,SessionComponent] = {}
+        """Mapping from mrml node ID to the session component that the node was last seen to belong to. This is
+        remembered so that a node that stops belonging to the session (e.g. a target that gets a second point, or a
+        result whose attributes are removed) still marks its former component as modified."""
+
+        self.active = True
+        """Whether changes are being tracked. Tracking stops when the scene is closed, since what was tracked is gone."""
+
+        self.addObserver(self.scene, slicer.vtkMRMLScene.StartCloseEvent, self.onSceneStartClose)
+        self.addObserver(self.scene, slicer.vtkMRMLScene.NodeAddedEvent, self.onNodeAdded)
+        self.addObserver(self.scene, slicer.vtkMRMLScene.NodeAboutToBeRemovedEvent, self.onNodeAboutToBeRemoved)
+        for node in slicer.util.getNodesByClass('vtkMRMLTransformNode', self.scene):
+            self._watch_node(node)
+        for node in slicer.util.getNodesByClass('vtkMRMLMarkupsFiducialNode', self.scene):
+            self._watch_node(node)
+
+    def stop(self) -> None:
+        """Stop observing the scene. Call this when the session is unloaded."""
+        self.removeObservers()
+        self.active = False
+
+    # ---- Change bookkeeping ----
+
+    def is_modified(self) -> bool:
+        """Whether anything changed since the session was loaded or last saved"""
+        return bool(self.modified_components) or bool(self.modified_photoscan_ids)
+
+    def mark_modified(self, component:SessionComponent) -> None:
+        self.modified_components.add(component)
+        if self.on_modified is not None:
+            self.on_modified()
+
+    def mark_photoscan_modified(self, photoscan_id:str) -> None:
+        self.modified_photoscan_ids.add(photoscan_id)
+        if self.on_modified is not None:
+            self.on_modified()
+
+    def mark_all_modified(self, photoscan_ids:Iterable[str]) -> None:
+        """Mark every component of the session, and the given affiliated photoscans, as modified. Use this when it is
+        not known what is in the database, so that the next save writes everything."""
+        self.modified_components.update(SessionComponent)
+        self.modified_photoscan_ids.update(photoscan_ids)
+
+    def mark_saved(self, components:Iterable[SessionComponent], photoscan_ids:Iterable[str]) -> None:
+        """Mark the given components and photoscans as no longer modified, after they were written to the database"""
+        self.modified_components.difference_update(components)
+        self.modified_photoscan_ids.difference_update(photoscan_ids)
+
+    def mark_not_saved(self, components:Iterable[SessionComponent], photoscan_ids:Iterable[str]) -> None:
+        """Undo `mark_saved`, for when writing the given components and photoscans failed after all. Unlike the other
+        `mark_` methods this does not call `on_modified`; the caller decides whether and when to try saving again.
+        Like the other `mark_` methods this must be called on the main thread."""
+        self.modified_components.update(components)
+        self.modified_photoscan_ids.update(photoscan_ids)
+
+    # ---- Scene observation ----
+
+    def _get_component(self, node:vtkMRMLNode) -> Optional[SessionComponent]:
+        """The session component that a node belongs to, or None if changes to it do not affect the session"""
+        if node.IsA('vtkMRMLMarkupsFiducialNode'):
+            # See get_target_candidates
+            return SessionComponent.TARGETS if node.GetNumberOfControlPoints() == 1 else None
+        if node is self.transducer_transform_node:
+            return SessionComponent.TRANSDUCER_TRANSFORM
+        if is_virtual_fit_result_node(node) and node.GetAttribute("VF:sessionID") == self.session_id:
+            return SessionComponent.VIRTUAL_FIT_RESULTS
+        if is_transducer_tracking_result_node(node) and node.GetAttribute("TT:sessionID") == self.session_id:
+            return SessionComponent.TRANSDUCER_TRACKING_RESULTS
+        return None
+
+    def _on_node_changed(self, node:vtkMRMLNode) -> None:
+        node_id = node.GetID()
+        component = self._get_component(node)
+        previous_component = self._node_components.get(node_id)
+        if component is not None:
+            self._node_components[node_id] = component
+            self.mark_modified(component)
+        else:
+            self._node_components.pop(node_id, None)
+        if previous_component is not None:
+            self.mark_modified(previous_component)
+
+    @staticmethod
+    def _events_to_watch(node:vtkMRMLNode) -> List[int]:
+        if node.IsA('vtkMRMLTransformNode'):
+            return [vtk.vtkCommand.ModifiedEvent, slicer.vtkMRMLTransformNode.TransformModifiedEvent]
+        if node.IsA('vtkMRMLMarkupsFiducialNode'):
+            return [
+                vtk.vtkCommand.ModifiedEvent,
+                slicer.vtkMRMLMarkupsNode.PointAddedEvent,
+                slicer.vtkMRMLMarkupsNode.PointRemovedEvent,
+                slicer.vtkMRMLMarkupsNode.PointModifiedEvent,
+                SlicerOpenLIFUEvents.TARGET_NAME_MODIFIED_EVENT,
+            ]
+        return []
+
+    def _watch_node(self, node:vtkMRMLNode) -> None:
+        for event in self._events_to_watch(node):
+            if not self.hasObserver(node, event, self.onWatchedNodeModified):
+                self.addObserver(node, event, self.onWatchedNodeModified)
+        component = self._get_component(node)
+        if component is not None:
+            self._node_components[node.GetID()] = component
+
+    def _unwatch_node(self, node:vtkMRMLNode) -> None:
+        for event in self._events_to_watch(node):
+            self.removeObserver(node, event, self.onWatchedNodeModified)
+
+    def onSceneStartClose(self, caller, event) -> None:
+        self.stop()
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAdded(self, caller, event, node:vtkMRMLNode) -> None:
+        self._watch_node(node)
+        if node.GetID() in self._node_components:
+            self.mark_modified(self._node_components[node.GetID()])
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAboutToBeRemoved(self, caller, event, node:vtkMRMLNode) -> None:
+        component = self._node_components.pop(node.GetID(), None)
+        if component is None:
+            component = self._get_component(node)
+        if component is not None:
+            self.mark_modified(component)
+        self._unwatch_node(node)
+
+    def onWatchedNodeModified(self, node:vtkMRMLNode, event) -> None:
+        # Attributes of the transducer transform node, such as the matching transform, are not part of the session;
+        # only its transform is.
+        if node is self.transducer_transform_node and event == vtk.vtkCommand.ModifiedEvent:
+            return
+        self._on_node_changed(node)
+
+# ---- Atomic writes of session and photoscan files ----
+
+class PendingFileWrite(NamedTuple):
+    """A database file and the text to replace it with. The text is prepared on the main thread, where the objects that
+    it comes from are safe to read, and then `write_pending_file` can be run in a worker thread."""
+    path : Path
+    text : str
+
+def write_pending_file(pending_write:PendingFileWrite) -> None:
+    """Write a file by writing a temporary file and moving it into place, so that a partially written file is never
+    left behind, e.g. if the application crashes mid-write. This is safe to call from a worker thread."""
+    path = pending_write.path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(prefix=f".{path.name}-", dir=path.parent)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(pending_write.text)
+        os.replace(temp_path, path)
+    except Exception:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
+def prepare_session_file_write(
+    db:"openlifu.db.Database",
+    subject:"openlifu.db.Subject",
+    session:"openlifu.db.Session",
+) -> Optional[PendingFileWrite]:
+    """Prepare replacing the file of a session in the database.
+
+    This validates the session the way `Database.write_session` does and updates its modification time, but leaves
+    the writing to `write_pending_file`. The openlifu Database has no way to write a file atomically or from prepared
+    text, so its validation and file layout are mirrored here; `OpenLIFUDataTest` checks that the written file is
+    byte-identical to what `Database.write_session` writes. Only the session file itself needs to be written, since for a session that is
+    already in the database the accompanying lists of IDs are already in place. A session that is not in the database
+    yet is written right away with `Database.write_session`, and None is returned.
+    """
+    import openlifu.db.database
+
+    if session.id not in db.get_session_ids(subject.id):
+        db.write_session(subject, session, on_conflict=openlifu.db.database.OnConflictOpts.OVERWRITE)
+        return None
+
+    if session.subject_id != subject.id:
+        raise ValueError("IDs do not match between the given subject and the subject referenced in the session.")
+    target_ids = [target.id for target in session.targets]
+    for target_id, transforms in session.virtual_fit_results.items():
+        if target_id not in target_ids:
+            raise ValueError(
+                f"The virtual_fit_results of session {session.id} references a target {target_id} that is not"
+                " in the session's list of targets."
+            )
+        if len(transforms) < 1:
+            raise ValueError(f"The virtual_fit_results of session {session.id} provides no transforms for target {target_id}.")
+    if session.transducer_tracking_results:
+        photoscan_ids = db.get_photoscan_ids(subject.id, session.id)
+        for result in session.transducer_tracking_results:
+            if result.photoscan_id not in photoscan_ids:
+                raise ValueError(
+                    f"Photoscan id {result.photoscan_id} provided in the transducer_tracking_results has not "
+                    "been associated with this session."
+                )
+
+    session.update_modified_time()
+    return PendingFileWrite(Path(db.get_session_filename(subject.id, session.id)), session.to_json(compact=False))
+
+def prepare_photoscan_metadata_file_write(
+    db:"openlifu.db.Database",
+    subject_id:str,
+    session_id:str,
+    photoscan:"openlifu.nav.photoscan.Photoscan",
+) -> Optional[PendingFileWrite]:
+    """Prepare replacing the metadata file of a photoscan that is already in the database, leaving the writing to
+    `write_pending_file`, mirroring what `Database.write_photoscan` writes (see `prepare_session_file_write`). The model
+    and texture files are left alone. A photoscan that is not in the database yet, or
+    whose data files are missing, is written right away with `Database.write_photoscan` (which reports the problem),
+    and None is returned.
+    """
+    import openlifu.db.database
+
+    metadata_filepath = Path(db.get_photoscan_metadata_filepath(subject_id, session_id, photoscan.id))
+    data_filenames = [photoscan.model_filename, photoscan.texture_filename, photoscan.mtl_filename]
+    if (
+        photoscan.id not in db.get_photoscan_ids(subject_id, session_id)
+        or not photoscan.model_filename
+        or not all((metadata_filepath.parent / filename).exists() for filename in data_filenames if filename)
+    ):
+        db.write_photoscan(subject_id, session_id, photoscan, on_conflict=openlifu.db.database.OnConflictOpts.OVERWRITE)
+        return None
+
+    return PendingFileWrite(metadata_filepath, photoscan.to_json(compact=False))
@@ -1,4 +1,8 @@
-from typing import TYPE_CHECKING
+import itertools
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, TYPE_CHECKING
 from scipy.ndimage import affine_transform
 import numpy as np
 import vtk
@@ -14,22 +18,34 @@ if TYPE_CHECKING:
     import xarray
     from OpenLIFULib import SlicerOpenLIFUTransducer
 
-def make_volume_from_xarray_in_transducer_coords(data_array: "xarray.DataArray", transducer: "SlicerOpenLIFUTransducer") -> vtkMRMLScalarVolumeNode:
+def make_volume_from_xarray_in_transducer_coords(
+    data_array: "xarray.DataArray",
+    transducer: "SlicerOpenLIFUTransducer",
+    downcast_to_float32: bool = False,
+) -> vtkMRMLScalarVolumeNode:
     """Convert a DataArray in the coordinates of a given transducer into a volume node. It is assumed that the DataArray coords form a regular grid.
     See also `make_xarray_in_transducer_coords_from_volume`.
+
+    The voxels are copied exactly once, straight from the DataArray into a VTK-owned array, with any reordering and type
+    conversion done in that same copy. The volume node therefore does not depend on the DataArray staying alive.
+
+    Args:
+        data_array: The DataArray, with dimensions in the order x, y, z of transducer coordinates.
+        transducer: The transducer in whose coordinates the DataArray is given.
+        downcast_to_float32: Whether to store the voxels as float32 instead of float64, halving the memory used by the volume.
     """
-    array = data_array.data
     coords = data_array.coords
 
     nodeName = data_array.name
-    imageSize = list(array.shape)
-    voxelType=vtk.VTK_DOUBLE
+    imageSize = list(data_array.shape)
+
+    vtk_array = vtk.vtkFloatArray() if downcast_to_float32 else vtk.vtkDoubleArray()
+    vtk_array.SetNumberOfTuples(int(np.prod(imageSize)))
+    # VTK image data has x varying fastest, which is the Fortran order of an array indexed by (x,y,z)
+    numpy_support.vtk_to_numpy(vtk_array).reshape(imageSize, order='F')[...] = data_array.data
 
     imageData = vtk.vtkImageData()
     imageData.SetDimensions(imageSize)
-    imageData.AllocateScalars(voxelType, 1)
-
-    vtk_array = numpy_support.numpy_to_vtk(array.transpose((2,1,0)).ravel(), deep=True, array_type=voxelType)
     imageData.GetPointData().SetScalars(vtk_array)
 
     # Create volume node
@@ -43,9 +59,90 @@ def make_volume_from_xarray_in_transducer_coords(data_array: "xarray.DataArray",
 
     return volumeNode
 
-def make_xarray_in_transducer_coords_from_volume(volume_node:vtkMRMLScalarVolumeNode, transducer:"SlicerOpenLIFUTransducer", protocol:"openlifu.plan.Protocol") -> "xarray.DataArray":
+RESAMPLED_VOLUME_CACHE_SIZE = 4
+"""The number of resampled volumes that `make_xarray_in_transducer_coords_from_volume` keeps around for reuse"""
+
+_resampled_volume_cache : "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+
+def clear_resampled_volume_cache() -> None:
+    """Drop the volumes cached by `make_xarray_in_transducer_coords_from_volume`."""
+    _resampled_volume_cache.clear()
+
+def _crop_to_sampled_region(input_array:np.ndarray, matrix:np.ndarray, offset:np.ndarray, output_shape:Tuple[int,...]) -> Tuple[np.ndarray, np.ndarray]:
+    """Crop `input_array` to the region that an affine resampling onto a grid of shape `output_shape` can touch, returning
+    the cropped array (a view) and the offset adjusted for it.
+
+    Since the map from output indices to input indices is affine, the output grid lands in the bounding box of the images of its
+    corners. One voxel of margin is kept for the upper interpolation neighbor. Along axes where the bounding box leaves the input
+    array, the crop stops at the input boundary, so sampling beyond the boundary by nearest-value extension is unaffected.
+    """
+    corners = np.array(list(itertools.product(*[(0, n-1) for n in output_shape])), dtype=float)
+    mapped_corners = corners @ matrix.T + offset
+    input_shape = np.array(input_array.shape)
+    lower = np.clip(np.floor(mapped_corners.min(axis=0)).astype(int) - 1, 0, input_shape - 1)
+    upper = np.clip(np.ceil(mapped_corners.max(axis=0)).astype(int) + 1, lower, input_shape - 1)
+    cropped_array = input_array[tuple(slice(l, u+1) for l, u in zip(lower, upper))]
+    return cropped_array, offset - lower
+
+def affine_resample_trilinear(
+    input_array:np.ndarray,
+    ijk2IJK:np.ndarray,
+    output_shape:Tuple[int,...],
+    max_workers:Optional[int] = None,
+) -> np.ndarray:
+    """Resample a 3D array by trilinear interpolation onto a grid related to it by an affine map, extending the input array
+    by its nearest boundary values. The result is the same as that of
+    `scipy.ndimage.affine_transform(input_array, ijk2IJK, order=1, mode='nearest', output_shape=output_shape)`.
+
+    To make this fast on high resolution volumes, the input array is first cropped to the region that the output grid samples,
+    and the output is then computed in slabs along its first axis on a thread pool.
+
+    Args:
+        input_array: The array to resample
+        ijk2IJK: Homogeneous 4x4 matrix mapping output array indices to input array indices
+        output_shape: The shape of the output array
+        max_workers: The number of threads to use. Defaults to the number of CPUs.
+    """
+    matrix = ijk2IJK[:3,:3]
+    offset = ijk2IJK[:3,3]
+    input_array, offset = _crop_to_sampled_region(input_array, matrix, offset, output_shape)
+
+    output = np.empty(output_shape, dtype=input_array.dtype)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    slab_bounds = np.linspace(0, output_shape[0], min(max_workers, output_shape[0]) + 1).astype(int)
+
+    def resample_slab(start:int, stop:int) -> None:
+        affine_transform(
+            input_array,
+            matrix,
+            offset = offset + matrix[:,0] * start, # shift so that the slab's first index maps where output index `start` would
+            output = output[start:stop],
+            order = 1, # equivalent to trilinear interpolation, I think
+            mode = 'nearest', # method of sampling beyond input array boundary
+        )
+
+    if len(slab_bounds) <= 2:
+        resample_slab(0, output_shape[0])
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            slab_futures = [executor.submit(resample_slab, start, stop) for start, stop in zip(slab_bounds[:-1], slab_bounds[1:])]
+            for slab_future in slab_futures:
+                slab_future.result()
+    return output
+
+def make_xarray_in_transducer_coords_from_volume(
+    volume_node:vtkMRMLScalarVolumeNode,
+    transducer:"SlicerOpenLIFUTransducer",
+    protocol:"openlifu.plan.Protocol",
+    transducer_matrix:Optional[np.ndarray] = None,
+) -> "xarray.DataArray":
     """Convert a volume node into a DataArray in the coordinates of a given transducer.
     See also `make_volume_from_xarray_in_transducer_coords`.
+
+    If `transducer_matrix` is provided, it is used as the transducer transform in place of the current matrix of the
+    transducer's transform node. This allows sampling the volume for a transducer pose other than the current one,
+    for example the pose of a virtual fit result.
     """
     import xarray
 
@@ -61,16 +158,33 @@ def make_xarray_in_transducer_coords_from_volume(volume_node:vtkMRMLScalarVolume
     # ras : The slicer world RAS coordinate system
     # IJK : the volume node's underlying data array indices
     ijk2xyz = np.concatenate([np.concatenate([np.diag(spacing),origin.reshape(3,1)], axis=1), np.array([0,0,0,1],dtype=origin.dtype).reshape(1,4)])
-    xyz2ras = slicer.util.arrayFromTransformMatrix(transducer.transform_node)
+    xyz2ras = transducer_matrix if transducer_matrix is not None else slicer.util.arrayFromTransformMatrix(transducer.transform_node)
     ras2IJK = np.linalg.inv(get_IJK2RAS(volume_node))
     ijk2IJK = ras2IJK @ xyz2ras @ ijk2xyz
-    volume_resampled_array = affine_transform(
-        slicer.util.arrayFromVolume(volume_node).transpose((2,1,0)), # the array indices come in KJI rather than IJK so we permute them
-        ijk2IJK,
-        order = 1, # equivalent to trilinear interpolation, I think
-        mode = 'nearest', # method of sampling beyond input array boundary
-        output_shape = coords_shape,
+
+    # The same volume is resampled for the same transducer pose and simulation grid over and over while planning,
+    # so the resampled arrays are cached. The modification times invalidate entries when the voxels or geometry change.
+    cache_key = (
+        volume_node.GetID(),
+        volume_node.GetMTime(),
+        volume_node.GetImageData().GetMTime(),
+        ijk2IJK.tobytes(),
+        coords_shape,
     )
+    volume_resampled_array = _resampled_volume_cache.get(cache_key)
+    if volume_resampled_array is None:
+        volume_resampled_array = affine_resample_trilinear(
+            slicer.util.arrayFromVolume(volume_node).transpose((2,1,0)), # the array indices come in KJI rather than IJK so we permute them
+            ijk2IJK,
+            output_shape = coords_shape,
+        )
+        volume_resampled_array.flags.writeable = False # it is shared by all DataArrays made from this cache entry
+        _resampled_volume_cache[cache_key] = volume_resampled_array
+        while len(_resampled_volume_cache) > RESAMPLED_VOLUME_CACHE_SIZE:
+            _resampled_volume_cache.popitem(last=False)
+    else:
+        _resampled_volume_cache.move_to_end(cache_key)
+
     volume_resampled_dataarray = xarray.DataArray(
         volume_resampled_array,
         coords=coords,
@@ -1,35 +1,303 @@
 """Skin segmentation tools"""
 
+import hashlib
+import logging
+from enum import Enum, auto
+from pathlib import Path
 from slicer import vtkMRMLScalarVolumeNode, vtkMRMLModelNode
+import vtk
 from OpenLIFULib.coordinate_system_utils import get_IJK2RAS
 from OpenLIFULib.transducer import TRANSDUCER_MODEL_COLORS
+from OpenLIFULib.util import get_cur_db
+from OpenLIFULib.volume_thresholding import get_volume_foreground_mask
 import slicer
-from typing import Union, Optional
+from typing import Dict, Union, Optional
 import numpy as np
 
-def generate_skin_segmentation(volume_node:vtkMRMLScalarVolumeNode, foreground_mask_array:Optional[np.ndarray]=None) -> vtkMRMLModelNode:
+SKIN_SEGMENTATION_CACHE_DIRNAME = "skinseg_cache"
+"""Name of the folder, placed next to a volume file in the openlifu database, that holds its cached skin segmentation products."""
+
+class SkinMeshLOD(Enum):
+    """Levels of detail of a skin mesh. The lower levels are decimated from the full resolution mesh, keeping the
+    Hausdorff distance to it within the bound given in `SKIN_MESH_LOD_MAX_ERROR_MM`. See `get_skin_mesh`."""
+    FULL = auto()
+    """The mesh as it comes out of the skin segmentation, which is the mesh that skin segmentation model nodes hold. It is
+    what gets rendered, what landmarks are placed on, and what final distance metrics are measured against."""
+    FINE = auto()
+    """For virtual fit"""
+    COARSE = auto()
+    """For ICP registration"""
+
+SKIN_MESH_LOD_MAX_ERROR_MM : Dict[SkinMeshLOD, float] = {
+    SkinMeshLOD.FULL : 0.0,
+    SkinMeshLOD.FINE : 0.2,
+    SkinMeshLOD.COARSE : 0.5,
+}
+"""Largest Hausdorff distance, in mm, that each level of detail of a skin mesh may have from the full resolution mesh"""
+
+SKIN_MESH_DECIMATION_TARGET_REDUCTIONS = (0.95, 0.9, 0.8, 0.6, 0.4)
+"""Fractions of triangles that decimation tries to remove, most aggressive first, when making a level of detail"""
+
+def compute_volume_content_hash(volume_node:vtkMRMLScalarVolumeNode) -> str:
+    """Hash the voxel data of a volume together with its IJK to RAS transform.
+
+    Two volume nodes with the same hash would produce the same skin segmentation, so this is used to
+    key the on-disk skin segmentation cache.
+    """
+    volume_array = slicer.util.arrayFromVolume(volume_node)
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(str((volume_array.dtype.str, volume_array.shape)).encode('utf-8'))
+    hasher.update(np.ascontiguousarray(volume_array).data)
+    hasher.update(np.ascontiguousarray(get_IJK2RAS(volume_node), dtype=np.float64).data)
+    return hasher.hexdigest()
+
+def get_skin_segmentation_cache_dir(volume_node:vtkMRMLScalarVolumeNode) -> Optional[Path]:
+    """Get the folder in which the skin segmentation products of the given volume are cached, or None
+    if the volume was not loaded from a file inside the currently loaded openlifu database.
+
+    Only volumes living in the database get a cache, so that we never write into arbitrary folders that
+    volumes happened to be loaded from.
+    """
+    db = get_cur_db()
+    storage_node = volume_node.GetStorageNode()
+    if db is None or storage_node is None or not storage_node.GetFileName():
+        return None
+    volume_filepath = Path(storage_node.GetFileName()).resolve()
+    if not volume_filepath.is_relative_to(Path(db.path).resolve()):
+        return None
+    return volume_filepath.parent / SKIN_SEGMENTATION_CACHE_DIRNAME
+
+def _get_skin_mesh_cache_filepath(cache_dir:Path, content_hash:str) -> Path:
+    """Get the skin mesh cache filepath for a given volume content hash"""
+    return cache_dir / f"{content_hash}-skin.vtp"
+
+def _read_polydata(filepath:Path) -> Optional[vtk.vtkPolyData]:
+    """Read a .vtp file, returning None if it could not be read or has no points"""
+    reader = vtk.vtkXMLPolyDataReader()
+    reader.SetFileName(str(filepath))
+    reader.Update()
+    polydata = reader.GetOutput()
+    if polydata is None or polydata.GetNumberOfPoints() == 0:
+        return None
+    return polydata
+
+def _write_polydata(filepath:Path, polydata:vtk.vtkPolyData) -> None:
+    """Write a .vtp file, compressed"""
+    writer = vtk.vtkXMLPolyDataWriter()
+    writer.SetFileName(str(filepath))
+    writer.SetInputData(polydata)
+    writer.SetDataModeToBinary()
+    writer.SetCompressorTypeToZLib()
+    if not writer.Write():
+        raise RuntimeError(f"Failed to write mesh to {filepath}")
+
+def load_cached_skin_segmentation(volume_node:vtkMRMLScalarVolumeNode, content_hash:Optional[str] = None) -> Optional[vtk.vtkPolyData]:
+    """Load the cached skin mesh for a volume, if there is a cache entry for its current content. The foreground mask is
+    not part of the cache, since it has a store of its own; see `OpenLIFULib.foreground_mask_store`.
+
+    Args:
+        volume_node: The volume whose skin mesh to look up
+        content_hash: The value of `compute_volume_content_hash` for the volume, if it was already computed.
+
+    Returns the skin mesh, or None if there is no cache entry.
+    """
+    cache_dir = get_skin_segmentation_cache_dir(volume_node)
+    if cache_dir is None:
+        return None
+    if content_hash is None:
+        content_hash = compute_volume_content_hash(volume_node)
+    skin_mesh_filepath = _get_skin_mesh_cache_filepath(cache_dir, content_hash)
+    if not skin_mesh_filepath.exists():
+        return None
+
+    skin_mesh = _read_polydata(skin_mesh_filepath)
+    if skin_mesh is None:
+        logging.warning(f"Ignoring unreadable cached skin mesh {skin_mesh_filepath}")
+    return skin_mesh
+
+def save_skin_segmentation_to_cache(
+    volume_node:vtkMRMLScalarVolumeNode,
+    skin_mesh:vtk.vtkPolyData,
+    content_hash:Optional[str] = None,
+) -> None:
+    """Write the skin mesh for a volume into its skin segmentation cache, replacing any cache entries for previous content
+    of the volume. Does nothing if the volume does not have a cache folder; see `get_skin_segmentation_cache_dir`.
+
+    Args:
+        volume_node: The volume from which the skin mesh was computed
+        skin_mesh: The skin mesh
+        content_hash: The value of `compute_volume_content_hash` for the volume, if it was already computed.
+    """
+    cache_dir = get_skin_segmentation_cache_dir(volume_node)
+    if cache_dir is None:
+        return
+    if content_hash is None:
+        content_hash = compute_volume_content_hash(volume_node)
+    cache_dir.mkdir(exist_ok=True)
+    for stale_filepath in cache_dir.iterdir():
+        # Foreground masks were cached here as .npz files before they got a store of their own
+        if not stale_filepath.name.startswith(content_hash) or stale_filepath.suffix == ".npz":
+            stale_filepath.unlink()
+
+    _write_polydata(_get_skin_mesh_cache_filepath(cache_dir, content_hash), skin_mesh)
+
+def decimate_mesh(mesh:vtk.vtkPolyData, target_reduction:float) -> vtk.vtkPolyData:
+    """Decimate a mesh with quadric error decimation, aiming to remove the given fraction of its triangles.
+    Point normals are recomputed if the input mesh had them."""
+    triangle_filter = vtk.vtkTriangleFilter()
+    triangle_filter.SetInputData(mesh)
+    decimation = vtk.vtkQuadricDecimation()
+    decimation.SetInputConnection(triangle_filter.GetOutputPort())
+    decimation.SetTargetReduction(target_reduction)
+    decimation.VolumePreservationOn()
+    last_filter = decimation
+    if mesh.GetPointData().GetNormals() is not None:
+        normals = vtk.vtkPolyDataNormals()
+        normals.SetInputConnection(decimation.GetOutputPort())
+        normals.SplittingOff()
+        last_filter = normals
+    last_filter.Update()
+    return last_filter.GetOutput()
+
+def hausdorff_distance(mesh_a:vtk.vtkPolyData, mesh_b:vtk.vtkPolyData) -> float:
+    """The Hausdorff distance between two meshes, measured from the vertices of each mesh to the surface of the other"""
+    hausdorff_filter = vtk.vtkHausdorffDistancePointSetFilter()
+    hausdorff_filter.SetInputData(0, mesh_a)
+    hausdorff_filter.SetInputData(1, mesh_b)
+    hausdorff_filter.SetTargetDistanceMethodToPointToCell()
+    hausdorff_filter.Update()
+    return hausdorff_filter.GetHausdorffDistance()
+
+def decimate_mesh_with_bounded_error(mesh:vtk.vtkPolyData, max_error:float) -> vtk.vtkPolyData:
+    """Decimate a mesh as far as `SKIN_MESH_DECIMATION_TARGET_REDUCTIONS` allows while keeping the Hausdorff distance to
+    the original mesh within `max_error`. Returns the original mesh if no decimation stays within the bound."""
+    if max_error <= 0:
+        return mesh
+    for target_reduction in SKIN_MESH_DECIMATION_TARGET_REDUCTIONS:
+        decimated_mesh = decimate_mesh(mesh, target_reduction)
+        if decimated_mesh.GetNumberOfPoints() > 0 and hausdorff_distance(mesh, decimated_mesh) <= max_error:
+            return decimated_mesh
+    return mesh
+
+class SkinMeshLevelsOfDetail:
+    """The levels of detail of one skin mesh. The lower levels are decimated from the full resolution mesh when they are
+    first asked for. If a skin segmentation cache folder and volume content hash are given then the lower levels are also
+    read from and written to the skin segmentation cache, next to the full resolution mesh.
+
+    Args:
+        full_mesh: The full resolution skin mesh
+        cache_dir: The skin segmentation cache folder of the volume, see `get_skin_segmentation_cache_dir`
+        content_hash: The value of `compute_volume_content_hash` for the volume
+    """
+
+    def __init__(self, full_mesh:vtk.vtkPolyData, cache_dir:Optional[Path] = None, content_hash:Optional[str] = None):
+        self.meshes : Dict[SkinMeshLOD, vtk.vtkPolyData] = {SkinMeshLOD.FULL : full_mesh}
+        self.cache_dir = cache_dir
+        self.content_hash = content_hash
+
+    @property
+    def full_mesh(self) -> vtk.vtkPolyData:
+        return self.meshes[SkinMeshLOD.FULL]
+
+    def _cache_filepath(self, lod:SkinMeshLOD) -> Optional[Path]:
+        if self.cache_dir is None or self.content_hash is None:
+            return None
+        return self.cache_dir / f"{self.content_hash}-skin-{lod.name.lower()}.vtp"
+
+    def get(self, lod:SkinMeshLOD) -> vtk.vtkPolyData:
+        """Get the mesh at the given level of detail"""
+        if lod not in self.meshes:
+            cache_filepath = self._cache_filepath(lod)
+            mesh = _read_polydata(cache_filepath) if cache_filepath is not None and cache_filepath.exists() else None
+            if mesh is None:
+                mesh = decimate_mesh_with_bounded_error(self.meshes[SkinMeshLOD.FULL], SKIN_MESH_LOD_MAX_ERROR_MM[lod])
+                if cache_filepath is not None:
+                    try:
+                        cache_filepath.parent.mkdir(exist_ok=True)
+                        _write_polydata(cache_filepath, mesh)
+                    except (OSError, RuntimeError) as e:
+                        logging.warning(f"Could not write skin mesh level of detail to {cache_filepath}: {e}")
+            self.meshes[lod] = mesh
+        return self.meshes[lod]
+
+_skin_mesh_levels_of_detail : Dict[str, SkinMeshLevelsOfDetail] = {}
+"""Levels of detail of the skin meshes in the scene, keyed by skin segmentation model node ID"""
+
+def _set_skin_mesh_levels_of_detail(skin_mesh_node:vtkMRMLModelNode, levels_of_detail:SkinMeshLevelsOfDetail) -> None:
+    """Remember the levels of detail of a skin mesh node, and forget those of nodes that are no longer in the scene"""
+    for node_id in list(_skin_mesh_levels_of_detail.keys()):
+        if slicer.mrmlScene.GetNodeByID(node_id) is None:
+            del _skin_mesh_levels_of_detail[node_id]
+    _skin_mesh_levels_of_detail[skin_mesh_node.GetID()] = levels_of_detail
+
+def discard_skin_mesh_levels_of_detail(skin_mesh_node:vtkMRMLModelNode) -> None:
+    """Forget the levels of detail of a skin mesh node. Call this when the node is removed from the scene."""
+    _skin_mesh_levels_of_detail.pop(skin_mesh_node.GetID(), None)
+
+def get_skin_mesh(skin_mesh_node:vtkMRMLModelNode, lod:SkinMeshLOD = SkinMeshLOD.FULL) -> vtk.vtkPolyData:
+    """Get the skin mesh of a skin segmentation model node at the given level of detail.
+
+    The model node itself holds the full resolution mesh, so consumers that can make do with less should ask for their
+    level here; see `SkinMeshLOD` for which level suits what. A lower level is decimated the first time it is asked for,
+    or read from the skin segmentation cache if it was decimated in an earlier session. If the model node was not made
+    by `generate_skin_segmentation`, or its mesh was replaced since, then its current mesh is taken as the full
+    resolution mesh.
+    """
+    levels_of_detail = _skin_mesh_levels_of_detail.get(skin_mesh_node.GetID())
+    if levels_of_detail is None or levels_of_detail.full_mesh is not skin_mesh_node.GetPolyData():
+        levels_of_detail = SkinMeshLevelsOfDetail(skin_mesh_node.GetPolyData())
+        _set_skin_mesh_levels_of_detail(skin_mesh_node, levels_of_detail)
+    return levels_of_detail.get(lod)
+
+def generate_skin_segmentation(volume_node:vtkMRMLScalarVolumeNode, foreground_mask_array:Optional[np.ndarray]=None, use_cache:bool=True) -> vtkMRMLModelNode:
     """Computes the skin segmentation for the given volume. The ID of the volume node used to create the 
     skin segmentation is added as a model node attribute. Note, this is different from the openlifu volume id.
 
     An already computed foreground_mask_array may optionally be provided if it's available, to save the time of recomputing it.
     If the foreground_mask_array is provided, then it is assumed to be in correspondence with (so in the same index order as)
-    the array you would get by applying `slicer.util.arrayFromVolume` to `volume_node`.
+    the array you would get by applying `slicer.util.arrayFromVolume` to `volume_node`. If it is not provided then the mask is
+    taken from the mask store of the volume, which computes it only if it is neither attached to the volume nor persisted;
+    see `OpenLIFULib.volume_thresholding.get_volume_foreground_mask`.
+
+    If `use_cache` is enabled and the volume lives in the openlifu database, then the skin mesh is loaded from the on-disk
+    skin segmentation cache when there is an entry for the current volume content, and otherwise the freshly computed
+    skin mesh is written to the cache. See `get_skin_segmentation_cache_dir`.
+
+    The model node holds the full resolution skin mesh; use `get_skin_mesh` to get lower levels of detail. No
+    decimation happens here, the lower levels are only made when they are first asked for.
     """
-    import openlifu.seg.skinseg
+    skin_mesh = None
+    content_hash = None
+    if use_cache and get_skin_segmentation_cache_dir(volume_node) is not None:
+        content_hash = compute_volume_content_hash(volume_node)
+        skin_mesh = load_cached_skin_segmentation(volume_node, content_hash)
 
-    volume_array = slicer.util.arrayFromVolume(volume_node).transpose((2,1,0)) # the array indices come in KJI rather than IJK so we permute them
-    volume_affine_RAS = get_IJK2RAS(volume_node)
+    if skin_mesh is None:
+        import openlifu.seg.skinseg
 
-    if foreground_mask_array is None:
-        foreground_mask_array = openlifu.seg.skinseg.compute_foreground_mask(volume_array)
-    else:
-        # if foreground_mask_array was provided, we assume the same index permutation as above is needed:
-        foreground_mask_array = foreground_mask_array.transpose((2,1,0))
-    foreground_mask_vtk_image = openlifu.seg.skinseg.vtk_img_from_array_and_affine(foreground_mask_array, volume_affine_RAS)
-    skin_mesh = openlifu.seg.skinseg.create_closed_surface_from_labelmap(foreground_mask_vtk_image)
+        volume_affine_RAS = get_IJK2RAS(volume_node)
+
+        if foreground_mask_array is None:
+            foreground_mask_array = get_volume_foreground_mask(volume_node)
+        foreground_mask_array = foreground_mask_array.transpose((2,1,0)) # the array indices come in KJI rather than IJK so we permute them
+        foreground_mask_vtk_image = openlifu.seg.skinseg.vtk_img_from_array_and_affine(foreground_mask_array, volume_affine_RAS)
+        skin_mesh = openlifu.seg.skinseg.create_closed_surface_from_labelmap(foreground_mask_vtk_image)
+
+        if content_hash is not None:
+            try:
+                save_skin_segmentation_to_cache(volume_node, skin_mesh, content_hash)
+            except OSError as e:
+                logging.warning(f"Could not write skin segmentation cache for {volume_node.GetName()}: {e}")
+
+    levels_of_detail = SkinMeshLevelsOfDetail(
+        skin_mesh,
+        cache_dir = get_skin_segmentation_cache_dir(volume_node) if content_hash is not None else None,
+        content_hash = content_hash,
+    )
 
     skin_mesh_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
     skin_mesh_node.SetAndObservePolyData(skin_mesh)
+    _set_skin_mesh_levels_of_detail(skin_mesh_node, levels_of_detail)
     
     skin_mesh_node.SetName(f'{volume_node.GetName()}-skinsegmentation')
     # Set the ID of corresponding volume as a node attribute 
@@ -1,4 +1,4 @@
-from typing import List, NamedTuple, TYPE_CHECKING
+from typing import List, NamedTuple, Optional, TYPE_CHECKING
 import numpy as np
 import slicer
 from slicer import vtkMRMLScalarVolumeNode
@@ -17,6 +17,15 @@ if TYPE_CHECKING:
     import openlifu.plan
     import xarray
 
+FLOAT32_SOLUTION_VOLUMES_SETTINGS_KEY = "OpenLIFU/float32SolutionVolumes"
+"""QSettings key holding whether the pnp and intensity volume nodes of solutions are stored as float32 rather than float64,
+halving their memory. The volume nodes are only for display; the openlifu Solution keeps the simulation outputs at full
+precision."""
+
+def get_float32_solution_volumes_enabled() -> bool:
+    """Get whether solution volume nodes are stored as float32. This is off by default."""
+    return slicer.util.settingsValue(FLOAT32_SOLUTION_VOLUMES_SETTINGS_KEY, False, converter=slicer.util.toBool)
+
 @parameterPack
 class SlicerOpenLIFUSolution:
     """Information that is generated by running the SlicerOpenLIFU planning module"""
@@ -36,6 +45,7 @@ class SlicerOpenLIFUSolution:
         pnp_datarray : "xarray.DataArray",
         intensity_dataarray : "xarray.DataArray",
         transducer : SlicerOpenLIFUTransducer,
+        downcast_to_float32 : Optional[bool] = None,
     ) -> "SlicerOpenLIFUSolution":
         """Create a SlicerOpenLIFUSolution from an openlifu Solution and aggregated data arrays to visualize,
         loading those data arrays into the scene as volume nodes.
@@ -45,10 +55,15 @@ class SlicerOpenLIFUSolution:
             pnp_datarray: Peak negative pressure volumetric data array to visualize
             intensity_dataarray: Intensity volumetric data array to visualize
             transducer: SlicerOpenLIFUTransducer, needed to put simulation outputs in the right coordinate system
+            downcast_to_float32: Whether to store the volume nodes as float32 rather than float64, halving their memory.
+                By default this follows the `FLOAT32_SOLUTION_VOLUMES_SETTINGS_KEY` setting.
+                See `make_volume_from_xarray_in_transducer_coords`.
         """
+        if downcast_to_float32 is None:
+            downcast_to_float32 = get_float32_solution_volumes_enabled()
 
-        pnp_volume_node = make_volume_from_xarray_in_transducer_coords(pnp_datarray, transducer)
-        intensity_volume_node = make_volume_from_xarray_in_transducer_coords(intensity_dataarray, transducer)
+        pnp_volume_node = make_volume_from_xarray_in_transducer_coords(pnp_datarray, transducer, downcast_to_float32=downcast_to_float32)
+        intensity_volume_node = make_volume_from_xarray_in_transducer_coords(intensity_dataarray, transducer, downcast_to_float32=downcast_to_float32)
 
         pnp_volume_node.GetDisplayNode().SetAndObserveColorNodeID("vtkMRMLColorTableNodeFilePlasma.txt")
         intensity_volume_node.GetDisplayNode().SetAndObserveColorNodeID("vtkMRMLColorTableNodeFilePlasma.txt")
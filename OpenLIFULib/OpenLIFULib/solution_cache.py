@@ -0,0 +1,186 @@
+"""On-disk cache of sonication solution computation outputs, keyed by the content of the computation inputs"""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple, TYPE_CHECKING
+import numpy as np
+import qt
+import slicer
+from slicer import vtkMRMLMarkupsFiducialNode, vtkMRMLScalarVolumeNode
+from OpenLIFULib.skinseg import compute_volume_content_hash
+from OpenLIFULib.solution_compute import SolutionComputationResult, read_solution_outputs, write_solution_outputs
+
+if TYPE_CHECKING:
+    import openlifu
+    import openlifu.plan
+    from OpenLIFULib.transducer import SlicerOpenLIFUTransducer
+
+SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY = "OpenLIFU/solutionCacheMaxSizeMB"
+"""QSettings key holding the size bound of the solution cache, in megabytes. A value of 0 disables the cache."""
+
+DEFAULT_SOLUTION_CACHE_MAX_SIZE_MB = 2048
+
+SOLUTION_CACHE_FORMAT_VERSION = 1
+"""Version of the cache keys and entries. It goes into every cache key, so bumping it retires all existing entries."""
+
+_SOLUTION_CACHE_TIMESTAMP_FORMAT = "%Y%m%d_%H%M%S"
+
+def get_solution_cache_dir() -> Path:
+    """Get the folder holding the solution cache, inside the Slicer cache folder."""
+    return Path(slicer.app.cachePath) / "OpenLIFU" / "solution_cache"
+
+def get_solution_cache_max_size_bytes() -> int:
+    """Get the size bound of the solution cache, from the application settings."""
+    max_size_mb = qt.QSettings().value(SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY, DEFAULT_SOLUTION_CACHE_MAX_SIZE_MB)
+    try:
+        return max(int(max_size_mb), 0) * 1024 * 1024
+    except (TypeError, ValueError):
+        return DEFAULT_SOLUTION_CACHE_MAX_SIZE_MB * 1024 * 1024
+
+def compute_transducer_content_hash(transducer: "SlicerOpenLIFUTransducer") -> str:
+    """Hash the definition of a transducer, so that editing a transducer without changing its ID is noticed."""
+    return hashlib.blake2b(transducer.transducer.transducer.to_json(compact=True).encode('utf-8'), digest_size=16).hexdigest()
+
+def compute_solution_cache_key(
+    protocol: "openlifu.plan.Protocol",
+    transducer: "SlicerOpenLIFUTransducer",
+    target_node: vtkMRMLMarkupsFiducialNode,
+    volume_node: vtkMRMLScalarVolumeNode,
+    session_id: Optional[str] = None,
+    transducer_matrix: Optional[np.ndarray] = None,
+    volume_content_hash: Optional[str] = None,
+    transducer_content_hash: Optional[str] = None,
+) -> str:
+    """Hash everything that determines the outcome of a solution computation into a cache key.
+
+    The key covers the protocol JSON, the transducer ID, definition (see `compute_transducer_content_hash`) and transform
+    matrix, the target position, and the volume content (see `compute_volume_content_hash`). The session ID is included as
+    well since it goes into the solution ID. The openlifu version and `SOLUTION_CACHE_FORMAT_VERSION` are included so that
+    an upgrade never picks up solutions computed by other code.
+
+    Args:
+        transducer_matrix: The transducer transform that the solution is computed for, if it is not the current matrix of the
+            transducer's transform node.
+        volume_content_hash: The value of `compute_volume_content_hash` for the volume, if it was already computed.
+        transducer_content_hash: The value of `compute_transducer_content_hash` for the transducer, if it was already
+            computed.
+    """
+    import openlifu
+
+    target_position = [0.0, 0.0, 0.0]
+    target_node.GetNthControlPointPositionWorld(0, target_position)
+    if transducer_matrix is None:
+        transducer_matrix = slicer.util.arrayFromTransformMatrix(transducer.transform_node)
+    if volume_content_hash is None:
+        volume_content_hash = compute_volume_content_hash(volume_node)
+    if transducer_content_hash is None:
+        transducer_content_hash = compute_transducer_content_hash(transducer)
+
+    hasher = hashlib.blake2b(digest_size=16)
+    hasher.update(f"{SOLUTION_CACHE_FORMAT_VERSION}|{getattr(openlifu, '__version__', 'unknown')}|".encode('utf-8'))
+    hasher.update(protocol.to_json(compact=True).encode('utf-8'))
+    hasher.update(str(transducer.transducer.transducer.id).encode('utf-8'))
+    hasher.update(transducer_content_hash.encode('utf-8'))
+    hasher.update(np.ascontiguousarray(transducer_matrix, dtype=np.float64).data)
+    hasher.update(np.array(target_position, dtype=np.float64).data)
+    hasher.update(volume_content_hash.encode('utf-8'))
+    hasher.update(str(session_id).encode('utf-8'))
+    return hasher.hexdigest()
+
+def refresh_solution_identity(solution: "openlifu.plan.Solution") -> None:
+    """Give a solution that comes out of the cache a new creation time and ID, so that writing it into a session does not
+    collide with the solution it was originally computed as. The timestamp embedded in the ID is replaced if there is one."""
+    now = datetime.now()
+    new_timestamp = now.strftime(_SOLUTION_CACHE_TIMESTAMP_FORMAT)
+    old_created = getattr(solution, "date_created", None)
+    old_timestamp = old_created.strftime(_SOLUTION_CACHE_TIMESTAMP_FORMAT) if isinstance(old_created, datetime) else None
+    if old_timestamp is not None and old_timestamp in solution.id:
+        solution.id = solution.id.replace(old_timestamp, new_timestamp)
+        if solution.name:
+            solution.name = solution.name.replace(old_timestamp, new_timestamp)
+    else:
+        solution.id = f"{solution.id}_{new_timestamp}"
+    if old_created is not None:
+        solution.date_created = now
+    solution.approved = False
+
+def load_cached_solution(cache_key: str) -> Optional[SolutionComputationResult]:
+    """Load the solution computation outputs stored under the given cache key, or return None if there is no such
+    cache entry. A hit marks the entry as most recently used."""
+    entry_dir = get_solution_cache_dir() / cache_key
+    if not entry_dir.is_dir():
+        return None
+    try:
+        result = read_solution_outputs(entry_dir)
+    except Exception as e:
+        logging.warning(f"Discarding unreadable solution cache entry {entry_dir}: {e}")
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        return None
+    os.utime(entry_dir)
+    refresh_solution_identity(result.solution)
+    return result
+
+def save_solution_to_cache(cache_key: str, result: SolutionComputationResult) -> None:
+    """Store solution computation outputs under the given cache key, then evict least recently used entries
+    until the cache fits in its size bound. Does nothing if the cache is disabled by a size bound of 0."""
+    max_size_bytes = get_solution_cache_max_size_bytes()
+    if max_size_bytes <= 0:
+        return
+    cache_dir = get_solution_cache_dir()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    entry_dir = cache_dir / cache_key
+    if entry_dir.is_dir():
+        os.utime(entry_dir)
+        return
+
+    # Write into a temporary folder and move it into place, so that a partially written entry is never read
+    staging_dir = Path(tempfile.mkdtemp(prefix=f".{cache_key}-", dir=cache_dir))
+    try:
+        write_solution_outputs(staging_dir, result)
+        staging_dir.rename(entry_dir)
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    evict_solution_cache(max_size_bytes, keep=cache_key)
+
+def _get_solution_cache_entries() -> List[Tuple[Path, float, int]]:
+    """List (folder, last used time, size in bytes) for each solution cache entry."""
+    cache_dir = get_solution_cache_dir()
+    if not cache_dir.is_dir():
+        return []
+    entries = []
+    for entry_dir in cache_dir.iterdir():
+        if not entry_dir.is_dir() or entry_dir.name.startswith("."):
+            continue
+        size = sum(f.stat().st_size for f in entry_dir.iterdir() if f.is_file())
+        entries.append((entry_dir, entry_dir.stat().st_mtime, size))
+    return entries
+
+def evict_solution_cache(max_size_bytes: Optional[int] = None, keep: Optional[str] = None) -> None:
+    """Remove least recently used solution cache entries until the cache fits in `max_size_bytes`.
+
+    Args:
+        max_size_bytes: The size bound. If not provided then the bound from the application settings is used.
+        keep: A cache key whose entry should not be evicted, typically the one that was just written.
+    """
+    if max_size_bytes is None:
+        max_size_bytes = get_solution_cache_max_size_bytes()
+    entries = sorted(_get_solution_cache_entries(), key = lambda entry : entry[1])
+    total_size = sum(size for _, _, size in entries)
+    for entry_dir, _, size in entries:
+        if total_size <= max_size_bytes:
+            break
+        if entry_dir.name == keep:
+            continue
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        total_size -= size
+
+def clear_solution_cache() -> None:
+    """Remove all solution cache entries."""
+    shutil.rmtree(get_solution_cache_dir(), ignore_errors=True)
@@ -0,0 +1,141 @@
+# Standard library imports
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional, TYPE_CHECKING
+
+# OpenLIFULib imports
+from OpenLIFULib import solution_compute_cli
+from OpenLIFULib.worker_process import WorkerPool, WorkerProcess
+
+if TYPE_CHECKING:
+    import openlifu
+    import openlifu.db
+    import openlifu.geo
+    import openlifu.plan
+    import openlifu.xdc
+    import xarray
+
+
+class SolutionComputationResult(NamedTuple):
+    """The outputs of a solution computation, as returned by `compute_solution_openlifu`."""
+    solution : "openlifu.plan.Solution"
+    pnp_aggregated : "xarray.DataArray"
+    intensity_aggregated : "xarray.DataArray"
+    analysis : "openlifu.plan.SolutionAnalysis"
+
+
+def solution_compute_cli_path() -> Path:
+    return Path(solution_compute_cli.__file__).resolve()
+
+
+def read_solution_outputs(directory: Path) -> SolutionComputationResult:
+    """Read solution computation outputs from a directory written by `write_solution_outputs`."""
+    import openlifu.plan
+    import xarray
+
+    solution = openlifu.plan.Solution.from_json(
+        (directory / solution_compute_cli.SOLUTION_FILENAME).read_text(encoding="utf-8")
+    )
+    analysis = openlifu.plan.SolutionAnalysis.from_json(
+        (directory / solution_compute_cli.ANALYSIS_FILENAME).read_text(encoding="utf-8")
+    )
+    # Load fully into memory so that the file handle is released and the directory can be removed
+    with xarray.open_dataset(directory / solution_compute_cli.SIMULATION_RESULT_AGGREGATED_FILENAME) as ds:
+        simulation_result_aggregated = ds.load()
+    return SolutionComputationResult(
+        solution=solution,
+        pnp_aggregated=simulation_result_aggregated["p_min"],
+        intensity_aggregated=simulation_result_aggregated["intensity"],
+        analysis=analysis,
+    )
+
+
+def write_solution_outputs(directory: Path, result: SolutionComputationResult) -> None:
+    """Write solution computation outputs into a directory, in the same layout that the solution computation worker uses."""
+    import xarray
+
+    simulation_result_aggregated = xarray.Dataset({
+        "p_min" : result.pnp_aggregated,
+        "intensity" : result.intensity_aggregated,
+    })
+    solution_compute_cli.write_solution_outputs(directory, result.solution, simulation_result_aggregated, result.analysis)
+
+
+class SolutionComputationProcess(WorkerProcess):
+    """Runs `Protocol.calc_solution` in a PythonSlicer worker process so that the Slicer GUI stays responsive.
+
+    The inputs are written to a temporary work directory, the worker (see solution_compute_cli.py) streams progress
+    lines on its stdout, and when it exits the outputs are read back from the work directory and handed to
+    `finished_callback` as a `SolutionComputationResult`. Callbacks are invoked on the main thread from the Qt event loop.
+
+    Args:
+        progress_callback: Called with (message, value, maximum) as the worker reports progress. A maximum of 0 means
+            the progress is indeterminate.
+        finished_callback: Called exactly once per started computation with (result, error_message, canceled).
+            The result is None if the computation failed or was canceled.
+    """
+
+    description = "solution computation"
+    progress_line_prefix = solution_compute_cli.PROGRESS_LINE_PREFIX
+    work_dir_prefix = "openlifu-solution-"
+
+    def start(
+        self,
+        protocol: "openlifu.plan.Protocol",
+        transducer: "openlifu.xdc.Transducer",
+        target: "openlifu.geo.Point",
+        volume: "xarray.DataArray",
+        session: "Optional[openlifu.db.Session]" = None,
+    ) -> None:
+        """Write the simulation inputs and launch the worker process. Raises RuntimeError if the worker cannot be started."""
+
+        def write_inputs(work_dir: Path) -> None:
+            (work_dir / solution_compute_cli.PROTOCOL_FILENAME).write_text(protocol.to_json(compact=True), encoding="utf-8")
+            (work_dir / solution_compute_cli.TRANSDUCER_FILENAME).write_text(transducer.to_json(compact=True), encoding="utf-8")
+            (work_dir / solution_compute_cli.TARGET_FILENAME).write_text(target.to_json(compact=True), encoding="utf-8")
+            if session is not None:
+                (work_dir / solution_compute_cli.SESSION_FILENAME).write_text(session.to_json(compact=True), encoding="utf-8")
+            volume.to_netcdf(work_dir / solution_compute_cli.VOLUME_FILENAME)
+
+        self._start_worker(solution_compute_cli_path(), write_inputs)
+
+    def _read_outputs(self, work_dir: Path) -> SolutionComputationResult:
+        return read_solution_outputs(work_dir)
+
+
+class SolutionComputationJob(NamedTuple):
+    """The inputs of one solution computation in a `SolutionComputationPool`, with a key to tell the jobs apart.
+
+    The volume is only made, by calling `make_volume`, when the job is started, and it is let go of once it is written
+    for the worker. This way a batch of queued jobs does not hold a resampled volume for every job at once."""
+    key : str
+    protocol : "openlifu.plan.Protocol"
+    transducer : "openlifu.xdc.Transducer"
+    target : "openlifu.geo.Point"
+    make_volume : "Callable[[], xarray.DataArray]"
+    session : "Optional[openlifu.db.Session]" = None
+
+
+class SolutionComputationPool(WorkerPool):
+    """Runs several solution computations, each in its own worker process, with at most `max_workers` of them running at once.
+
+    Args:
+        max_workers: The maximum number of worker processes to run at the same time.
+        progress_callback: Called with (job key, message, value, maximum) as a worker reports progress.
+        job_finished_callback: Called with (job key, result, error_message, canceled) as each job ends.
+            See `SolutionComputationProcess` for the meaning of the last three arguments.
+        finished_callback: Called with no arguments once every job has ended.
+    """
+
+    description = "solution computation"
+
+    def _create_process(self, progress_callback, finished_callback) -> SolutionComputationProcess:
+        return SolutionComputationProcess(progress_callback=progress_callback, finished_callback=finished_callback)
+
+    def _start_process(self, process: SolutionComputationProcess, job: SolutionComputationJob) -> None:
+        process.start(
+            protocol=job.protocol,
+            transducer=job.transducer,
+            target=job.target,
+            volume=job.make_volume(),
+            session=job.session,
+        )
@@ -0,0 +1,152 @@
+# Standard library imports
+import argparse
+import json
+import logging
+import os
+import sys
+import traceback
+from pathlib import Path
+
+# This script is run by PythonSlicer in a worker process, so it must not import slicer or anything that does.
+# The file names and progress line format below are shared with the parent side in solution_compute.py.
+
+PROGRESS_LINE_PREFIX = "OPENLIFU_SOLUTION_PROGRESS "
+
+PROTOCOL_FILENAME = "protocol.json"
+TRANSDUCER_FILENAME = "transducer.json"
+TARGET_FILENAME = "target.json"
+SESSION_FILENAME = "session.json"
+VOLUME_FILENAME = "volume.nc"
+SOLUTION_FILENAME = "solution.json"
+SIMULATION_RESULT_AGGREGATED_FILENAME = "simulation_result_aggregated.nc"
+ANALYSIS_FILENAME = "analysis.json"
+
+NUM_PROGRESS_STEPS = 3
+
+
+def _emit_progress_event(event: dict) -> None:
+    print(PROGRESS_LINE_PREFIX + json.dumps(event), flush=True)
+
+
+def _progress_callback(message: str, value: int, maximum: int = NUM_PROGRESS_STEPS) -> None:
+    _emit_progress_event(
+        {
+            "message": message,
+            "value": value,
+            "maximum": maximum,
+        }
+    )
+
+
+class _OpenLIFULogProgressHandler(logging.Handler):
+    """Forwards openlifu log messages to the parent process as progress messages, so that the parent
+    can show which focus point or simulation stage the worker is on."""
+
+    def __init__(self, value: int) -> None:
+        super().__init__(level=logging.INFO)
+        self.value = value
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            _progress_callback(record.getMessage(), self.value)
+        except Exception:
+            self.handleError(record)
+
+
+def compute_solution(work_dir: Path) -> None:
+    """Read the simulation inputs that the parent process wrote into `work_dir`, run `Protocol.calc_solution`,
+    and write the solution, the aggregated simulation outputs, and the solution analysis back into `work_dir`."""
+    import openlifu.db
+    import openlifu.geo
+    import openlifu.plan
+    import openlifu.xdc
+    import xarray
+
+    _progress_callback("Loading simulation inputs", 0)
+    protocol = openlifu.plan.Protocol.from_json((work_dir / PROTOCOL_FILENAME).read_text(encoding="utf-8"))
+    transducer = openlifu.xdc.Transducer.from_json((work_dir / TRANSDUCER_FILENAME).read_text(encoding="utf-8"))
+    target = openlifu.geo.Point.from_json((work_dir / TARGET_FILENAME).read_text(encoding="utf-8"))
+    session_path = work_dir / SESSION_FILENAME
+    session = (
+        openlifu.db.Session.from_json(session_path.read_text(encoding="utf-8"))
+        if session_path.exists() else None
+    )
+    with xarray.open_dataarray(work_dir / VOLUME_FILENAME) as volume:
+        volume = volume.load()
+
+    _progress_callback("Running beamforming and simulation", 1)
+    openlifu_logger = logging.getLogger("openlifu")
+    previous_level = openlifu_logger.level
+    if previous_level == logging.NOTSET or previous_level > logging.INFO:
+        openlifu_logger.setLevel(logging.INFO)
+    log_progress_handler = _OpenLIFULogProgressHandler(1)
+    openlifu_logger.addHandler(log_progress_handler)
+    try:
+        solution, simulation_result_aggregated, scaled_solution_analysis = protocol.calc_solution(
+            transducer=transducer,
+            volume=volume,
+            target=target,
+            session=session,
+        )
+    finally:
+        openlifu_logger.removeHandler(log_progress_handler)
+        openlifu_logger.setLevel(previous_level)
+
+    _progress_callback("Writing simulation outputs", 2)
+    write_solution_outputs(work_dir, solution, simulation_result_aggregated, scaled_solution_analysis)
+
+
+def write_solution_outputs(directory: Path, solution, simulation_result_aggregated, analysis) -> None:
+    """Write an openlifu Solution, the aggregated simulation result Dataset (only its p_min and intensity variables are kept),
+    and a SolutionAnalysis into a directory, in the layout that solution_compute.read_solution_outputs reads."""
+    (directory / SOLUTION_FILENAME).write_text(
+        solution.to_json(include_simulation_data=True, compact=True),
+        encoding="utf-8",
+    )
+    simulation_result_aggregated[["p_min", "intensity"]].to_netcdf(directory / SIMULATION_RESULT_AGGREGATED_FILENAME)
+    (directory / ANALYSIS_FILENAME).write_text(analysis.to_json(compact=True), encoding="utf-8")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compute an OpenLIFU sonication solution.")
+    parser.add_argument(
+        "--work-dir",
+        required=True,
+        help="Directory owned by the parent process, containing the simulation inputs. Outputs are written here too.",
+    )
+    args = parser.parse_args(argv)
+
+    # Put the worker in its own process group, so that the parent can cancel it together with any
+    # simulation executables that it launches.
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+    try:
+        compute_solution(Path(args.work_dir))
+    except Exception as exc:
+        _emit_progress_event(
+            {
+                "message": str(exc),
+                "value": 0,
+                "maximum": 0,
+                "success": False,
+                "error": str(exc),
+            }
+        )
+        traceback.print_exc(file=sys.stderr)
+        sys.stderr.flush()
+        return 1
+
+    _emit_progress_event(
+        {
+            "message": "Solution computed.",
+            "value": NUM_PROGRESS_STEPS,
+            "maximum": NUM_PROGRESS_STEPS,
+            "success": True,
+        }
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -60,15 +60,24 @@ def fiducial_to_openlifu_point_id(fiducial_node:vtkMRMLMarkupsFiducialNode) -> s
     """Get the openlifu point ID that we would use if we were to convert the given fiducial node to an openlifu Point"""
     return fiducial_node.GetName()
 
-def fiducial_to_openlifu_point_in_transducer_coords(fiducial_node:vtkMRMLMarkupsFiducialNode, transducer:"SlicerOpenLIFUTransducer", name:Optional[str] = None) -> "openlifu.geo.Point":
+def fiducial_to_openlifu_point_in_transducer_coords(
+    fiducial_node:vtkMRMLMarkupsFiducialNode,
+    transducer:"SlicerOpenLIFUTransducer",
+    name:Optional[str] = None,
+    transducer_matrix:Optional[np.ndarray] = None,
+) -> "openlifu.geo.Point":
     """Given a fiducial node with at least one point, return an openlifu Point in the local coordinates of the given transducer.
     If name is provided then it will be used as the name of the openlifu Point. Otherwise we use the label on the control point.
+    If transducer_matrix is provided then it is used as the transducer transform in place of the current matrix of the
+    transducer's transform node.
     """
     import openlifu.geo
 
     if fiducial_node.GetNumberOfControlPoints() < 1:
         raise ValueError(f"Fiducial node {fiducial_node.GetID()} does not have any points.")
-    position = (np.linalg.inv(slicer.util.arrayFromTransformMatrix(transducer.transform_node)) @ np.array([*fiducial_node.GetNthControlPointPosition(0),1]))[:3] # TODO handle 4th coord here actually, would need to unprojectivize
+    if transducer_matrix is None:
+        transducer_matrix = slicer.util.arrayFromTransformMatrix(transducer.transform_node)
+    position = (np.linalg.inv(transducer_matrix) @ np.array([*fiducial_node.GetNthControlPointPosition(0),1]))[:3] # TODO handle 4th coord here actually, would need to unprojectivize
     return openlifu.geo.Point(
         position=position,
         name = name if name is not None else fiducial_node.GetNthControlPointLabel(0),
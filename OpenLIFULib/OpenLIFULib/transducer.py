@@ -1,10 +1,11 @@
-from typing import Optional, TYPE_CHECKING, Callable, Any
+from typing import Optional, TYPE_CHECKING, Callable, Any, NamedTuple, Tuple
 import numpy as np
 from pathlib import Path
 import vtk
 import slicer
 from slicer import (
     vtkMRMLModelNode,
+    vtkMRMLModelStorageNode,
     vtkMRMLTransformNode,
     vtkMRMLNode,
 )
@@ -21,6 +22,60 @@ if TYPE_CHECKING:
     import openlifu.xdc
 
 
+class TransducerModelData(NamedTuple):
+    """Transducer geometry that was read ahead of creating the transducer's scene nodes.
+    See `read_transducer_model_data`."""
+    transducer_polydata : vtk.vtkPolyData
+    body_model : Optional[Tuple[vtkMRMLModelNode, vtkMRMLModelStorageNode]]
+    """The transducer body model node, not added to the scene, along with the storage node it was read with"""
+    registration_surface_model : Optional[Tuple[vtkMRMLModelNode, vtkMRMLModelStorageNode]]
+    """The registration surface model node, not added to the scene, along with the storage node it was read with"""
+
+def _read_model_node(model_filepath) -> Tuple[vtkMRMLModelNode, vtkMRMLModelStorageNode]:
+    """Read a model from file into a new model node without adding anything to the scene."""
+    model_node = vtkMRMLModelNode()
+    storage_node = vtkMRMLModelStorageNode()
+    storage_node.SetFileName(str(model_filepath))
+    if not storage_node.ReadData(model_node):
+        raise RuntimeError(f"Failed to read model from {model_filepath}")
+    return model_node, storage_node
+
+def _add_read_model_node_to_scene(model_node:vtkMRMLModelNode, storage_node:vtkMRMLModelStorageNode) -> vtkMRMLModelNode:
+    """Add a model node that was read by `_read_model_node` to the scene, like slicer.util.loadModel would."""
+    slicer.mrmlScene.AddNode(storage_node)
+    slicer.mrmlScene.AddNode(model_node)
+    model_node.SetAndObserveStorageNodeID(storage_node.GetID())
+    model_node.CreateDefaultDisplayNodes()
+    return model_node
+
+def read_transducer_model_data(
+        transducer : "openlifu.xdc.Transducer",
+        transducer_abspaths_info: dict = {},
+    ) -> TransducerModelData:
+    """Build the transducer polydata and read the transducer body and registration surface models from file, without
+    adding anything to the scene. This can be run in a worker thread, leaving only the creation of scene nodes to
+    `SlicerOpenLIFUTransducer.initialize_from_openlifu_transducer`.
+
+    Args:
+        transducer: The openlifu Transducer object
+        transducer_abspaths_info: See `SlicerOpenLIFUTransducer.initialize_from_openlifu_transducer`.
+    """
+    if transducer_abspaths_info['transducer_body_abspath'] is not None:
+        if transducer.transducer_body_filename != Path(transducer_abspaths_info['transducer_body_abspath']).name:
+            raise ValueError("The filename provided in 'transducer_body_abspath' does not match the file specified in the Transducer object")
+        body_model = _read_model_node(transducer_abspaths_info['transducer_body_abspath'])
+    else:
+        body_model = None
+
+    if transducer_abspaths_info['registration_surface_abspath'] is not None:
+        if transducer.registration_surface_filename != Path(transducer_abspaths_info['registration_surface_abspath']).name:
+            raise ValueError("The filename provided in 'registration_surface_abspath' does not match the file specified in the Transducer object")
+        registration_surface_model = _read_model_node(transducer_abspaths_info['registration_surface_abspath'])
+    else:
+        registration_surface_model = None
+
+    return TransducerModelData(transducer.get_polydata(), body_model, registration_surface_model)
+
 # Define transducer color dictionary
 TRANSDUCER_MODEL_COLORS = {
     "default": [230, 230, 77], # YELLOW
@@ -45,6 +100,7 @@ class SlicerOpenLIFUTransducer:
             transducer_abspaths_info: dict = {},
             transducer_matrix: Optional[np.ndarray]=None,
             transducer_matrix_units: Optional[str]=None,
+            model_data: Optional[TransducerModelData]=None,
     ) -> "SlicerOpenLIFUTransducer":
         """Initialize object with needed scene nodes from just the openlifu object.
 
@@ -58,9 +114,14 @@ class SlicerOpenLIFUTransducer:
             transducer_matrix_units: The units in which to interpret the transform matrix.
                 The transform matrix operates on a version of the coordinate space of the transducer that has been scaled to
                 these units. If left as None then the transducer's native units (Transducer.units) will be assumed.
+            model_data: The transducer geometry, if it was already read ahead of time with `read_transducer_model_data`.
+                If None then it is read here, from the files in `transducer_abspaths_info`.
         Returns: the newly constructed SlicerOpenLIFUTransducer object
         """
 
+        if model_data is None:
+            model_data = read_transducer_model_data(transducer, transducer_abspaths_info)
+
         shNode = slicer.vtkMRMLSubjectHierarchyNode.GetSubjectHierarchyNode(slicer.mrmlScene)
         slicer_transducer_name = slicer.mrmlScene.GenerateUniqueName(transducer.id)
         parentFolderItem = shNode.CreateFolderItem(shNode.GetSceneItemID(), slicer_transducer_name)
@@ -84,25 +145,21 @@ class SlicerOpenLIFUTransducer:
         #Model nodes
         model_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
         model_node.SetName(f"{slicer_transducer_name}-transducer")
-        model_node.SetAndObservePolyData(transducer.get_polydata())
+        model_node.SetAndObservePolyData(model_data.transducer_polydata)
         model_node.SetAndObserveTransformNodeID(transform_node.GetID())
         shNode.SetItemParent(shNode.GetItemByDataNode(model_node), parentFolderItem)
         model_node.CreateDefaultDisplayNodes() # toggles the "eyeball" on
 
-        if transducer_abspaths_info['transducer_body_abspath'] is not None:
-            if transducer.transducer_body_filename != Path(transducer_abspaths_info['transducer_body_abspath']).name:
-                raise ValueError("The filename provided in 'transducer_body_abspath' does not match the file specified in the Transducer object")
-            body_model_node = slicer.util.loadModel(transducer_abspaths_info['transducer_body_abspath'])
+        if model_data.body_model is not None:
+            body_model_node = _add_read_model_node_to_scene(*model_data.body_model)
             body_model_node.SetName(f"{slicer_transducer_name}-body")
             body_model_node.SetAndObserveTransformNodeID(transform_node.GetID())
             shNode.SetItemParent(shNode.GetItemByDataNode(body_model_node), parentFolderItem)
         else:
             body_model_node = None
 
-        if transducer_abspaths_info['registration_surface_abspath'] is not None:
-            if transducer.registration_surface_filename != Path(transducer_abspaths_info['registration_surface_abspath']).name:
-                raise ValueError("The filename provided in 'registration_surface_abspath' does not match the file specified in the Transducer object")
-            surface_model_node = slicer.util.loadModel(transducer_abspaths_info['registration_surface_abspath'])
+        if model_data.registration_surface_model is not None:
+            surface_model_node = _add_read_model_node_to_scene(*model_data.registration_surface_model)
             shNode.SetItemParent(shNode.GetItemByDataNode(surface_model_node), parentFolderItem)
             surface_model_node.SetAndObserveTransformNodeID(transform_node.GetID())
             surface_model_node.SetName(f"{slicer_transducer_name}-surface")
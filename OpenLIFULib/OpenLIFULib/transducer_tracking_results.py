@@ -1,6 +1,6 @@
 import slicer
 from slicer import vtkMRMLTransformNode
-from typing import Iterable, Optional, Tuple, Union, List, TYPE_CHECKING
+from typing import Iterable, Optional, Tuple, Union, List, NamedTuple, TYPE_CHECKING
 from enum import Enum, auto
 
 from OpenLIFULib.transform_conversion import (
@@ -11,6 +11,7 @@ from OpenLIFULib.transform_conversion import (
 import numpy as np
 from OpenLIFULib.coordinate_system_utils import numpy_to_vtk_4x4
 from OpenLIFULib.util import get_cloned_node
+from OpenLIFULib.transform_node_index import TransformNodeAttributeIndex
 
 if TYPE_CHECKING:
     from openlifu.db.session import TransducerTrackingResult
@@ -20,6 +21,90 @@ class TransducerTrackingTransformType(Enum):
     TRANSDUCER_TO_VOLUME = auto()
     PHOTOSCAN_TO_VOLUME = auto()
 
+class TransducerTrackingResultIndexEntry(NamedTuple):
+    """The attributes of a transducer localization result node that the index keys on, parsed once when the node changes."""
+    session_id : Optional[str]
+    photoscan_id : str
+    transform_type : TransducerTrackingTransformType
+    approved : bool
+
+class TransducerTrackingResultIndex(TransformNodeAttributeIndex):
+    """An index of the transducer localization result nodes in the scene, keyed by session ID, photoscan ID, and transform type.
+
+    The transducer localization widget resolves results for each photoscan several times per UI refresh, so this
+    keeps those lookups from having to scan the whole scene. Use `get_transducer_tracking_result_index` to get the
+    shared instance rather than constructing this directly.
+    """
+
+    @staticmethod
+    def _read_entry(node:vtkMRMLTransformNode) -> Optional[TransducerTrackingResultIndexEntry]:
+        """Parse the index entry for a node, or return None if the node is not a (fully set up) transducer localization result.
+        While `add_transducer_tracking_result` is still setting attributes one at a time, a node can be briefly incomplete;
+        it gets indexed once its photoscan ID is in place."""
+        if not is_transducer_tracking_result_node(node):
+            return None
+        photoscan_id = node.GetAttribute("TT:photoscanID")
+        if photoscan_id is None:
+            return None
+        return TransducerTrackingResultIndexEntry(
+            session_id = node.GetAttribute("TT:sessionID"),
+            photoscan_id = photoscan_id,
+            transform_type = get_transform_type_from_transducer_tracking_result_node(node),
+            approved = node.GetAttribute("TT:approvalStatus") == "1",
+        )
+
+    @staticmethod
+    def _bucket_keys(entry:TransducerTrackingResultIndexEntry) -> List[Tuple]:
+        return [
+            ("session", entry.session_id),
+            ("photoscan", entry.photoscan_id),
+            ("session_photoscan", entry.session_id, entry.photoscan_id),
+            ("session_type", entry.session_id, entry.transform_type),
+            ("session_photoscan_type", entry.session_id, entry.photoscan_id, entry.transform_type),
+        ]
+
+    def query(
+        self,
+        photoscan_id : Optional[str] = None,
+        session_id : Optional[str] = None,
+        transform_type : Optional[TransducerTrackingTransformType] = None,
+        sessionless_only : bool = False,
+    ) -> List[Tuple[vtkMRMLTransformNode, TransducerTrackingResultIndexEntry]]:
+        """Return (node, entry) pairs for the indexed transducer localization results matching the given filters.
+
+        Args:
+            photoscan_id: filter for only this photoscan ID, or None to not filter on photoscan
+            session_id: filter for only this session ID, or None to not filter on session
+            transform_type: filter for only this transform type, or None to not filter on transform type
+            sessionless_only: if session_id is None, this filters for only results that have *no* session ID.
+        """
+        if sessionless_only and session_id is not None:
+            raise ValueError("Cannot filter for a session ID and for sessionless results at the same time.")
+        filter_session = session_id is not None or sessionless_only
+        if filter_session:
+            if photoscan_id is not None and transform_type is not None:
+                return self._lookup(("session_photoscan_type", session_id, photoscan_id, transform_type))
+            elif photoscan_id is not None:
+                return self._lookup(("session_photoscan", session_id, photoscan_id))
+            elif transform_type is not None:
+                return self._lookup(("session_type", session_id, transform_type))
+            return self._lookup(("session", session_id))
+        results = self._lookup(None if photoscan_id is None else ("photoscan", photoscan_id))
+        if transform_type is not None:
+            results = [(node, entry) for node, entry in results if entry.transform_type == transform_type]
+        return results
+
+_transducer_tracking_result_index : Optional[TransducerTrackingResultIndex] = None
+
+def get_transducer_tracking_result_index() -> TransducerTrackingResultIndex:
+    """Get the transducer localization result index for the main scene, creating it on first use."""
+    global _transducer_tracking_result_index
+    if _transducer_tracking_result_index is None or _transducer_tracking_result_index.scene is not slicer.mrmlScene:
+        if _transducer_tracking_result_index is not None:
+            _transducer_tracking_result_index.removeObservers()
+        _transducer_tracking_result_index = TransducerTrackingResultIndex(slicer.mrmlScene)
+    return _transducer_tracking_result_index
+
 def add_transducer_tracking_result(
         transform_node: vtkMRMLTransformNode,
         transform_type: TransducerTrackingTransformType,
@@ -58,18 +143,14 @@ def add_transducer_tracking_result(
     """
     
     # Should only be one per photoscan/per session/per transform_type
-    existing_tt_result_nodes = get_transducer_tracking_result_nodes_in_scene(
+    existing_tt_results = get_transducer_tracking_result_index().query(
         photoscan_id=photoscan_id,
         session_id=session_id,
-        transform_type=transform_type) 
-    
-    if session_id is None:
-        existing_tt_result_nodes = filter(
-            lambda t : t.GetAttribute("TT:sessionID") is None,
-            existing_tt_result_nodes,
-        ) # if a sessionless TT result is being added, conflict should only occur among other sessionless results, hence this filtering
+        transform_type=transform_type,
+        sessionless_only=session_id is None, # if a sessionless TT result is being added, conflict should only occur among other sessionless results
+    )
 
-    for existing_tt_result_node in existing_tt_result_nodes:
+    for existing_tt_result_node, _ in existing_tt_results:
         if replace:
             slicer.mrmlScene.RemoveNode(existing_tt_result_node)  
         else:
@@ -227,20 +308,12 @@ def get_transducer_tracking_result_nodes_in_scene(
     Returns the list of matching transducer localization transform nodes that are currently in the scene.
     """
 
-    tt_result_nodes = [
-        t for t in slicer.util.getNodesByClass('vtkMRMLTransformNode') if is_transducer_tracking_result_node(t)
-        ]
-
-    if session_id is not None:
-        tt_result_nodes = filter(lambda t : t.GetAttribute("TT:sessionID") == session_id, tt_result_nodes)
-
-    if photoscan_id is not None:
-        tt_result_nodes = filter(lambda t : t.GetAttribute("TT:photoscanID") == photoscan_id, tt_result_nodes)
-
-    if transform_type is not None:
-        tt_result_nodes = filter(lambda t : t.GetAttribute(f"isTT-{transform_type.name}") == "1", tt_result_nodes)
-
-    return tt_result_nodes
+    tt_results = get_transducer_tracking_result_index().query(
+        photoscan_id=photoscan_id,
+        session_id=session_id,
+        transform_type=transform_type,
+    )
+    return [node for node, _ in tt_results]
 
 def get_transducer_tracking_result(
     photoscan_id : str,
@@ -258,19 +331,13 @@ def get_transducer_tracking_result(
 
     Returns: The retrieved transducer localization result vtkMRMLTransformNode.
     """
-    tt_result_nodes = list(get_transducer_tracking_result_nodes_in_scene(
+    # If session_id is None, then we specifically look for nodes that have *no* session id
+    tt_result_nodes = [node for node, _ in get_transducer_tracking_result_index().query(
         photoscan_id= photoscan_id,
         transform_type= transform_type,
-        session_id=session_id
-    ))
-
-    # If session_id None, then at this point tt_result_nodes is not filtered for session ID
-    # So here we specifically filter for nodes that are have *no* session id:
-    if session_id is None:
-        tt_result_nodes = list(filter(
-            lambda t : t.GetAttribute("TT:sessionID") is None,
-            tt_result_nodes,
-        ))
+        session_id=session_id,
+        sessionless_only=session_id is None,
+    )]
 
     if len(tt_result_nodes) < 1:
         return None
@@ -300,28 +367,37 @@ def get_complete_transducer_tracking_results(session_id: Optional[str], photosca
     tuple of transducer localization nodes: (transducer_to_volume_transform, photoscan_to_volume_transform) 
     """
 
-    tp_nodes = get_transducer_tracking_result_nodes_in_scene(session_id=session_id, photoscan_id=photoscan_id, transform_type=TransducerTrackingTransformType.TRANSDUCER_TO_VOLUME)
-    pv_nodes = get_transducer_tracking_result_nodes_in_scene(session_id = session_id, photoscan_id= photoscan_id, transform_type=TransducerTrackingTransformType.PHOTOSCAN_TO_VOLUME)
+    return [(tp_node, pv_node) for tp_node, pv_node, _ in _query_complete_transducer_tracking_results(session_id, photoscan_id)]
 
-    # If session_id None, then at this point `nodes`` is not filtered for session ID
-    # So here we specifically filter for nodes that are have *no* session id:
-    if session_id is None:
-        tp_nodes = filter(lambda t : t.GetAttribute("TT:sessionID") is None, tp_nodes)
-        pv_nodes = filter(lambda t : t.GetAttribute("TT:sessionID") is None, pv_nodes)
-
-    tp_nodes = list(tp_nodes)
-    pv_nodes = list(pv_nodes)
+def _query_complete_transducer_tracking_results(
+    session_id: Optional[str],
+    photoscan_id: Optional[str],
+) -> List[Tuple[vtkMRMLTransformNode, vtkMRMLTransformNode, bool]]:
+    """Like `get_complete_transducer_tracking_results`, but with a third element in each tuple indicating whether
+    both transform nodes of the result are approved, as read from the transducer localization result index."""
+    index = get_transducer_tracking_result_index()
+
+    # If session_id is None, then we specifically look at only nodes that have *no* session id
+    tp_results = index.query(
+        session_id=session_id,
+        photoscan_id=photoscan_id,
+        transform_type=TransducerTrackingTransformType.TRANSDUCER_TO_VOLUME,
+        sessionless_only=session_id is None,
+    )
+    pv_results = index.query(
+        session_id=session_id,
+        photoscan_id=photoscan_id,
+        transform_type=TransducerTrackingTransformType.PHOTOSCAN_TO_VOLUME,
+        sessionless_only=session_id is None,
+    )
 
-    pv_nodes_by_id = {}
-    for pv_node in pv_nodes:
-        photoscan_id = pv_node.GetAttribute("TT:photoscanID")
-        pv_nodes_by_id[photoscan_id] = pv_node
+    pv_results_by_id = {pv_entry.photoscan_id : (pv_node, pv_entry) for pv_node, pv_entry in pv_results}
 
     tt_results = []
-    for tp_node in tp_nodes:
-        photoscan_id = tp_node.GetAttribute("TT:photoscanID")
-        if photoscan_id in pv_nodes_by_id:
-            tt_results.append((tp_node, pv_nodes_by_id[photoscan_id]))
+    for tp_node, tp_entry in tp_results:
+        if tp_entry.photoscan_id in pv_results_by_id:
+            pv_node, pv_entry = pv_results_by_id[tp_entry.photoscan_id]
+            tt_results.append((tp_node, pv_node, tp_entry.approved and pv_entry.approved))
 
     return tt_results
 
@@ -332,13 +408,13 @@ def get_photoscan_ids_with_results(session_id: str, approved_only = False) -> Li
         session_id: optional session ID. If None then **only transducer results with no session ID are included**.
         approved_only: optional flag. If True, then only approved results are returned.
     """
-    tt_results = get_complete_transducer_tracking_results(session_id = session_id, photoscan_id=None)
+    tt_results = _query_complete_transducer_tracking_results(session_id = session_id, photoscan_id=None)
 
     if approved_only:
         # Both transform nodes need to be approved for the photoscan to be approved
-        return [t.GetAttribute("TT:photoscanID") for (t,p) in tt_results if (t.GetAttribute("TT:approvalStatus") == "1") and (p.GetAttribute("TT:approvalStatus") == "1")]
+        return [t.GetAttribute("TT:photoscanID") for (t,_,approved) in tt_results if approved]
     else:
-        return [t.GetAttribute("TT:photoscanID") for (t,_) in tt_results]
+        return [t.GetAttribute("TT:photoscanID") for (t,_,_) in tt_results]
 
 def set_transducer_tracking_approval_for_node(approval_state: bool, transform_node: vtkMRMLTransformNode) -> None:
     """Set approval state on the given transducer localization transform node.
@@ -407,17 +483,10 @@ def clear_transducer_tracking_results(
         session_id: session ID. If None then **only transducer localization results with no session ID are removed**!
     """
 
-    nodes_to_remove = get_transducer_tracking_result_nodes_in_scene(session_id=session_id)
-
-    # If session_id None, then at this point nodes_to_remove is not filtered for session ID
-    # So here we specifically filter for nodes that are have *no* session id:
-    if session_id is None:
-        nodes_to_remove = filter(
-            lambda t : t.GetAttribute("TT:sessionID") is None,
-            nodes_to_remove,
-        )
+    # If session_id is None, then we specifically remove only nodes that have *no* session id
+    tt_results_to_remove = get_transducer_tracking_result_index().query(session_id=session_id, sessionless_only=session_id is None)
 
-    for node in nodes_to_remove:
+    for node, _ in tt_results_to_remove:
         slicer.mrmlScene.RemoveNode(node)
     
 def is_transducer_tracking_result_node(transform_node) -> bool:
@@ -0,0 +1,109 @@
+"""Scene-observer-maintained indices over transform nodes, keyed by their attributes"""
+
+import abc
+from collections import defaultdict
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import vtk
+import slicer
+from slicer import vtkMRMLTransformNode
+from slicer.util import VTKObservationMixin
+
+class TransformNodeAttributeIndex(VTKObservationMixin, abc.ABC):
+    """Base class for an index of the transform nodes in a scene, keyed by values parsed from their attributes.
+
+    SlicerOpenLIFU identifies result transform nodes (virtual fit results, transducer tracking results) by attributes
+    set on them, and looking those up by walking every transform node in the scene and comparing attribute strings
+    gets slow once a session accumulates many results. An index is kept current by observing the scene for added
+    and removed nodes, and by observing each transform node for modifications (which is how attribute changes are
+    announced), so that lookups only cost as much as the number of results they return.
+
+    Subclasses implement `_read_entry`, to parse the attributes of a node into a hashable entry (or None for nodes
+    that are not to be indexed), and `_bucket_keys`, to list the keys under which an entry can be looked up.
+    """
+
+    def __init__(self, scene:slicer.vtkMRMLScene) -> None:
+        VTKObservationMixin.__init__(self)
+        self.scene = scene
+
+        self._nodes : Dict[str,vtkMRMLTransformNode] = {}
+        """Mapping from mrml node ID to the indexed node"""
+
+        self._entries : Dict[str,Any] = {}
+        """Mapping from mrml node ID to the parsed attributes of the indexed node"""
+
+        self._node_ids_by_key : Dict[Hashable,Set[str]] = defaultdict(set)
+        """Mapping from bucket key to the mrml node IDs of the indexed nodes filed under that key"""
+
+        self.addObserver(self.scene, slicer.vtkMRMLScene.NodeAddedEvent, self.onNodeAdded)
+        self.addObserver(self.scene, slicer.vtkMRMLScene.NodeRemovedEvent, self.onNodeRemoved)
+        self.addObserver(self.scene, slicer.vtkMRMLScene.EndCloseEvent, self.onSceneEndClose)
+        self.rebuild()
+
+    @staticmethod
+    @abc.abstractmethod
+    def _read_entry(node:vtkMRMLTransformNode) -> Optional[Hashable]:
+        """Parse the index entry for a node, or return None if the node should not be indexed."""
+
+    @staticmethod
+    @abc.abstractmethod
+    def _bucket_keys(entry:Hashable) -> Iterable[Hashable]:
+        """The keys under which a node with the given entry can be looked up."""
+
+    def rebuild(self) -> None:
+        """Discard the index and rebuild it by scanning the whole scene."""
+        for node_id in list(self._nodes.keys()):
+            self._unindex_node_id(node_id)
+        self.removeObservers(self.onTransformNodeModified)
+        for node in slicer.util.getNodesByClass('vtkMRMLTransformNode', self.scene):
+            self._watch_transform_node(node)
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeAdded(self, caller, event, node : slicer.vtkMRMLNode) -> None:
+        if node.IsA('vtkMRMLTransformNode'):
+            self._watch_transform_node(node)
+
+    @vtk.calldata_type(vtk.VTK_OBJECT)
+    def onNodeRemoved(self, caller, event, node : slicer.vtkMRMLNode) -> None:
+        if node.IsA('vtkMRMLTransformNode'):
+            self.removeObserver(node, vtk.vtkCommand.ModifiedEvent, self.onTransformNodeModified)
+            self._unindex_node_id(node.GetID())
+
+    def onSceneEndClose(self, caller, event) -> None:
+        self.rebuild()
+
+    def onTransformNodeModified(self, node:vtkMRMLTransformNode, event) -> None:
+        self._reindex_node(node)
+
+    def _watch_transform_node(self, node:vtkMRMLTransformNode) -> None:
+        if not self.hasObserver(node, vtk.vtkCommand.ModifiedEvent, self.onTransformNodeModified):
+            self.addObserver(node, vtk.vtkCommand.ModifiedEvent, self.onTransformNodeModified)
+        self._reindex_node(node)
+
+    def _reindex_node(self, node:vtkMRMLTransformNode) -> None:
+        node_id = node.GetID()
+        entry = self._read_entry(node)
+        if self._entries.get(node_id) == entry:
+            return
+        self._unindex_node_id(node_id)
+        if entry is None:
+            return
+        self._nodes[node_id] = node
+        self._entries[node_id] = entry
+        for key in self._bucket_keys(entry):
+            self._node_ids_by_key[key].add(node_id)
+
+    def _unindex_node_id(self, node_id:str) -> None:
+        entry = self._entries.pop(node_id, None)
+        self._nodes.pop(node_id, None)
+        if entry is None:
+            return
+        for key in self._bucket_keys(entry):
+            self._node_ids_by_key[key].discard(node_id)
+            if not self._node_ids_by_key[key]:
+                del self._node_ids_by_key[key]
+
+    def _lookup(self, key:Optional[Hashable]) -> List[Tuple[vtkMRMLTransformNode, Any]]:
+        """Return (node, entry) pairs for the indexed nodes filed under the given bucket key,
+        or for all indexed nodes if the key is None."""
+        node_ids = self._entries.keys() if key is None else self._node_ids_by_key.get(key, ())
+        return [(self._nodes[node_id], self._entries[node_id]) for node_id in node_ids]
@@ -0,0 +1,216 @@
+# Standard library imports
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Sequence, TYPE_CHECKING, Union
+
+# Third-party imports
+import numpy as np
+import qt
+import vtk
+
+# OpenLIFULib imports
+from OpenLIFULib import virtual_fit_compute_cli
+from OpenLIFULib.worker_process import WorkerPool, WorkerProcess
+
+if TYPE_CHECKING:
+    import openlifu.seg.virtual_fit
+
+VIRTUAL_FIT_BLAS_THREADS_SETTINGS_KEY = "OpenLIFU/virtualFitBlasThreads"
+"""QSettings key holding the maximum number of BLAS and OpenMP threads of the virtual fit worker process. A value of 0
+leaves the number of threads unlimited."""
+
+DEFAULT_VIRTUAL_FIT_BLAS_THREADS = 1
+
+DEFAULT_VIRTUAL_FIT_MAX_WORKERS = os.cpu_count() or 1
+"""Default bound on the number of virtual fit worker processes of a `VirtualFitPool`. Since each worker is limited to a
+single BLAS thread by default, this keeps every core busy."""
+
+
+def get_virtual_fit_blas_threads() -> int:
+    """Get the maximum number of BLAS and OpenMP threads of the virtual fit worker process, from the application settings."""
+    blas_threads = qt.QSettings().value(VIRTUAL_FIT_BLAS_THREADS_SETTINGS_KEY, DEFAULT_VIRTUAL_FIT_BLAS_THREADS)
+    try:
+        return max(int(blas_threads), 0)
+    except (TypeError, ValueError):
+        return DEFAULT_VIRTUAL_FIT_BLAS_THREADS
+
+
+def virtual_fit_compute_cli_path() -> Path:
+    return Path(virtual_fit_compute_cli.__file__).resolve()
+
+
+class VirtualFitComputationResult(NamedTuple):
+    """The outputs of a virtual fit, as returned by `openlifu.seg.run_virtual_fit`."""
+    transforms : List[np.ndarray]
+    """The candidate transducer transforms, best first"""
+    debug_info : "Optional[openlifu.seg.virtual_fit.VirtualFitDebugInfo]"
+    """The debugging info, if it was asked for"""
+
+
+def read_virtual_fit_outputs(directory: Path) -> VirtualFitComputationResult:
+    """Read virtual fit outputs from a directory written by the virtual fit worker."""
+    transforms = [
+        np.array(transform, dtype=float)
+        for transform in json.loads((directory / virtual_fit_compute_cli.TRANSFORMS_FILENAME).read_text(encoding="utf-8"))
+    ]
+
+    debug_info = None
+    debug_arrays_path = directory / virtual_fit_compute_cli.DEBUG_ARRAYS_FILENAME
+    if debug_arrays_path.exists():
+        from openlifu.seg.virtual_fit import VirtualFitDebugInfo
+        # Load fully into memory so that the file handle is released and the directory can be removed
+        with np.load(debug_arrays_path) as debug_arrays:
+            debug_arrays = {name : debug_arrays[name] for name in debug_arrays.files}
+        debug_info = VirtualFitDebugInfo(
+            skin_mesh = virtual_fit_compute_cli.read_polydata(directory / virtual_fit_compute_cli.DEBUG_SKIN_MESH_FILENAME),
+            spherically_interpolated_mesh = virtual_fit_compute_cli.read_polydata(
+                directory / virtual_fit_compute_cli.DEBUG_SPHERICALLY_INTERPOLATED_MESH_FILENAME
+            ),
+            **debug_arrays,
+        )
+
+    return VirtualFitComputationResult(transforms=transforms, debug_info=debug_info)
+
+
+class VirtualFitProcess(WorkerProcess):
+    """Runs `openlifu.seg.run_virtual_fit` in a PythonSlicer worker process so that the Slicer GUI stays responsive, and
+    so that the number of BLAS threads of the virtual fit can be tuned without affecting Slicer's own VTK/ITK threads.
+
+    The inputs are written to a temporary work directory, the worker (see virtual_fit_compute_cli.py) streams progress
+    lines on its stdout, and when it exits the outputs are read back from the work directory and handed to
+    `finished_callback` as a `VirtualFitComputationResult`. Callbacks are invoked on the main thread from the Qt event loop.
+
+    Args:
+        progress_callback: Called with (message, value, maximum) as the worker reports progress. The maximum is 100.
+        finished_callback: Called exactly once per started virtual fit with (result, error_message, canceled).
+            The result is None if the virtual fit failed or was canceled.
+        blas_threads: The maximum number of BLAS and OpenMP threads of the worker, or 0 for no limit. By default this
+            comes from the application settings; see `get_virtual_fit_blas_threads`.
+    """
+
+    description = "virtual fit"
+    progress_line_prefix = virtual_fit_compute_cli.PROGRESS_LINE_PREFIX
+    work_dir_prefix = "openlifu-virtual-fit-"
+
+    def __init__(
+        self,
+        progress_callback: Callable[[str, int, int], None],
+        finished_callback: Callable[[Optional[VirtualFitComputationResult], str, bool], None],
+        blas_threads: Optional[int] = None,
+    ) -> None:
+        super().__init__(progress_callback, finished_callback)
+        self.blas_threads = blas_threads if blas_threads is not None else get_virtual_fit_blas_threads()
+
+    def start(
+        self,
+        units: str,
+        target_RAS: Sequence[float],
+        standoff_transform: np.ndarray,
+        options: "openlifu.seg.virtual_fit.VirtualFitOptions",
+        skin_mesh: Union[vtk.vtkPolyData, Path],
+        include_debug_info: bool = False,
+    ) -> None:
+        """Write the virtual fit inputs and launch the worker process. The arguments are those of
+        `openlifu.seg.run_virtual_fit`, except that the skin mesh can also be given as the path of a .vtp file, which
+        saves writing it again for each of several virtual fits on the same skin. Raises RuntimeError if the worker cannot
+        be started."""
+
+        def write_inputs(work_dir: Path) -> None:
+            inputs = {
+                "units" : units,
+                "target_RAS" : [float(x) for x in target_RAS],
+                "standoff_transform" : np.asarray(standoff_transform, dtype=float).tolist(),
+                "options" : options.to_dict(),
+                "include_debug_info" : include_debug_info,
+            }
+            (work_dir / virtual_fit_compute_cli.INPUTS_FILENAME).write_text(json.dumps(inputs), encoding="utf-8")
+            if not isinstance(skin_mesh, Path):
+                virtual_fit_compute_cli.write_polydata(work_dir / virtual_fit_compute_cli.SKIN_MESH_FILENAME, skin_mesh)
+
+        extra_args = ["--blas-threads", str(self.blas_threads)]
+        if isinstance(skin_mesh, Path):
+            extra_args += ["--skin-mesh", str(skin_mesh)]
+        self._start_worker(virtual_fit_compute_cli_path(), write_inputs, extra_args)
+
+    def _read_outputs(self, work_dir: Path) -> VirtualFitComputationResult:
+        return read_virtual_fit_outputs(work_dir)
+
+
+class VirtualFitJob(NamedTuple):
+    """The target of one virtual fit in a `VirtualFitPool`, with a key to tell the jobs apart."""
+    key : str
+    target_RAS : Sequence[float]
+    include_debug_info : bool = False
+
+
+class VirtualFitPool(WorkerPool):
+    """Runs virtual fits of several targets on the same skin, each in its own worker process, with at most `max_workers`
+    of them running at once. The inputs that the targets share, most notably the skin mesh, are written only once.
+
+    Args:
+        max_workers: The maximum number of worker processes to run at the same time.
+        progress_callback: Called with (job key, message, value, maximum) as a worker reports progress.
+        job_finished_callback: Called with (job key, result, error_message, canceled) as each job ends.
+            See `VirtualFitProcess` for the meaning of the last three arguments.
+        finished_callback: Called with no arguments once every job has ended.
+    """
+
+    description = "virtual fit"
+
+    def __init__(
+        self,
+        max_workers: int,
+        progress_callback: Callable[[str, str, int, int], None],
+        job_finished_callback: Callable[[str, Optional[VirtualFitComputationResult], str, bool], None],
+        finished_callback: Callable[[], None],
+    ) -> None:
+        super().__init__(max_workers, progress_callback, job_finished_callback, finished_callback)
+        self._shared_dir : Optional[Path] = None
+        self._shared_inputs = {}
+
+    def start(
+        self,
+        jobs: List[VirtualFitJob],
+        units: str,
+        standoff_transform: np.ndarray,
+        options: "openlifu.seg.virtual_fit.VirtualFitOptions",
+        skin_mesh: vtk.vtkPolyData,
+    ) -> None:
+        """Write the skin mesh for all jobs, then queue the jobs and start as many of them as the worker bound allows.
+        The remaining arguments are those of `openlifu.seg.run_virtual_fit` that are shared by all targets."""
+        if self.is_active():
+            raise RuntimeError(f"The {self.description} pool is already running.")
+        self._shared_dir = Path(tempfile.mkdtemp(prefix="openlifu-virtual-fit-shared-"))
+        try:
+            skin_mesh_path = self._shared_dir / virtual_fit_compute_cli.SKIN_MESH_FILENAME
+            virtual_fit_compute_cli.write_polydata(skin_mesh_path, skin_mesh)
+        except Exception:
+            self._remove_shared_dir()
+            raise
+        self._shared_inputs = {
+            "units" : units,
+            "standoff_transform" : standoff_transform,
+            "options" : options,
+            "skin_mesh" : skin_mesh_path,
+        }
+        super().start(jobs)
+
+    def _create_process(self, progress_callback, finished_callback) -> VirtualFitProcess:
+        return VirtualFitProcess(progress_callback=progress_callback, finished_callback=finished_callback)
+
+    def _start_process(self, process: VirtualFitProcess, job: VirtualFitJob) -> None:
+        process.start(target_RAS=job.target_RAS, include_debug_info=job.include_debug_info, **self._shared_inputs)
+
+    def _on_all_jobs_finished(self) -> None:
+        self._remove_shared_dir()
+        super()._on_all_jobs_finished()
+
+    def _remove_shared_dir(self) -> None:
+        # Canceled workers may still be exiting; the removal is best effort
+        if self._shared_dir is not None:
+            shutil.rmtree(self._shared_dir, ignore_errors=True)
+            self._shared_dir = None
+        self._shared_inputs = {}
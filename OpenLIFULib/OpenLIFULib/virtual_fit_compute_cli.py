@@ -0,0 +1,161 @@
+# Standard library imports
+import argparse
+import json
+import os
+import sys
+import traceback
+from pathlib import Path
+from typing import Optional
+
+# This script is run by PythonSlicer in a worker process, so it must not import slicer or anything that does.
+# The file names and progress line format below are shared with the parent side in virtual_fit_compute.py.
+
+PROGRESS_LINE_PREFIX = "OPENLIFU_VIRTUAL_FIT_PROGRESS "
+
+INPUTS_FILENAME = "virtual_fit_inputs.json"
+SKIN_MESH_FILENAME = "skin_mesh.vtp"
+TRANSFORMS_FILENAME = "virtual_fit_transforms.json"
+DEBUG_SKIN_MESH_FILENAME = "debug_skin_mesh.vtp"
+DEBUG_SPHERICALLY_INTERPOLATED_MESH_FILENAME = "debug_spherically_interpolated_mesh.vtp"
+DEBUG_ARRAYS_FILENAME = "debug_arrays.npz"
+
+PROGRESS_MAXIMUM = 100
+"""Progress is reported in percent, which is how `run_virtual_fit` reports it"""
+
+
+def _emit_progress_event(event: dict) -> None:
+    print(PROGRESS_LINE_PREFIX + json.dumps(event), flush=True)
+
+
+def _progress_callback(value: int, message: str) -> None:
+    """Progress callback with the signature that `run_virtual_fit` expects"""
+    _emit_progress_event(
+        {
+            "message": message,
+            "value": int(value),
+            "maximum": PROGRESS_MAXIMUM,
+        }
+    )
+
+
+def read_polydata(path: Path):
+    import vtk
+    reader = vtk.vtkXMLPolyDataReader()
+    reader.SetFileName(str(path))
+    reader.Update()
+    return reader.GetOutput()
+
+
+def write_polydata(path: Path, polydata) -> None:
+    import vtk
+    writer = vtk.vtkXMLPolyDataWriter()
+    writer.SetFileName(str(path))
+    writer.SetInputData(polydata)
+    if not writer.Write():
+        raise RuntimeError(f"Could not write {path}")
+
+
+def run_virtual_fit(work_dir: Path, blas_threads: int, skin_mesh_path: Optional[Path] = None) -> None:
+    """Read the virtual fit inputs that the parent process wrote into `work_dir`, run `openlifu.seg.run_virtual_fit`,
+    and write the candidate transducer transforms, and the debugging info if it was asked for, back into `work_dir`.
+    The skin mesh is read from `skin_mesh_path` if it is given, so that several workers can share one skin mesh file."""
+    import numpy as np
+    import openlifu.seg
+    import threadpoolctl
+    from openlifu.seg.virtual_fit import VirtualFitOptions
+
+    _progress_callback(0, "Loading virtual fit inputs")
+    inputs = json.loads((work_dir / INPUTS_FILENAME).read_text(encoding="utf-8"))
+    skin_mesh = read_polydata(skin_mesh_path if skin_mesh_path is not None else work_dir / SKIN_MESH_FILENAME)
+    include_debug_info = bool(inputs["include_debug_info"])
+
+    # The virtual fit makes many tiny svd calls, for which multithreaded BLAS has more overhead than it is worth.
+    # Since this runs in its own process, the limit does not affect Slicer's own VTK/ITK threads either way.
+    limits = blas_threads if blas_threads > 0 else None
+    with threadpoolctl.threadpool_limits(limits=limits): # caps BLAS and OpenMP threads
+        vf_output = openlifu.seg.run_virtual_fit(
+            units = inputs["units"],
+            target_RAS = inputs["target_RAS"],
+            standoff_transform = np.array(inputs["standoff_transform"], dtype=float),
+            options = VirtualFitOptions.from_dict(inputs["options"]),
+            skin_mesh = skin_mesh,
+            progress_callback = _progress_callback,
+            include_debug_info = include_debug_info,
+        )
+
+    if include_debug_info:
+        vf_transforms, debug_info = vf_output
+        write_polydata(work_dir / DEBUG_SKIN_MESH_FILENAME, debug_info.skin_mesh)
+        write_polydata(work_dir / DEBUG_SPHERICALLY_INTERPOLATED_MESH_FILENAME, debug_info.spherically_interpolated_mesh)
+        np.savez(
+            work_dir / DEBUG_ARRAYS_FILENAME,
+            search_points = debug_info.search_points,
+            plane_normals = debug_info.plane_normals,
+            steering_dists = debug_info.steering_dists,
+            in_bounds = debug_info.in_bounds,
+        )
+    else:
+        vf_transforms = vf_output
+
+    (work_dir / TRANSFORMS_FILENAME).write_text(
+        json.dumps([np.asarray(transform, dtype=float).tolist() for transform in vf_transforms]),
+        encoding="utf-8",
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Run the OpenLIFU virtual fit algorithm.")
+    parser.add_argument(
+        "--work-dir",
+        required=True,
+        help="Directory owned by the parent process, containing the virtual fit inputs. Outputs are written here too.",
+    )
+    parser.add_argument(
+        "--blas-threads",
+        type=int,
+        default=1,
+        help="Maximum number of BLAS and OpenMP threads to use. Pass 0 to leave the number of threads unlimited.",
+    )
+    parser.add_argument(
+        "--skin-mesh",
+        help=f"Skin mesh file to use instead of the {SKIN_MESH_FILENAME} in the work directory.",
+    )
+    args = parser.parse_args(argv)
+
+    # Put the worker in its own process group, so that the parent can cancel it together with anything it launches.
+    if hasattr(os, "setpgrp"):
+        os.setpgrp()
+
+    try:
+        run_virtual_fit(
+            Path(args.work_dir),
+            args.blas_threads,
+            Path(args.skin_mesh) if args.skin_mesh is not None else None,
+        )
+    except Exception as exc:
+        _emit_progress_event(
+            {
+                "message": str(exc),
+                "value": 0,
+                "maximum": 0,
+                "success": False,
+                "error": str(exc),
+            }
+        )
+        traceback.print_exc(file=sys.stderr)
+        sys.stderr.flush()
+        return 1
+
+    _emit_progress_event(
+        {
+            "message": "Virtual fit complete.",
+            "value": PROGRESS_MAXIMUM,
+            "maximum": PROGRESS_MAXIMUM,
+            "success": True,
+        }
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
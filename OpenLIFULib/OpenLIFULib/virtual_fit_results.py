@@ -1,6 +1,7 @@
+from typing import Optional, Iterable, List, Tuple, Dict, NamedTuple, TYPE_CHECKING, Union
 import slicer
 from slicer import vtkMRMLTransformNode
-from typing import Optional, Iterable, List, Tuple, Dict, TYPE_CHECKING, Union
+from OpenLIFULib.transform_node_index import TransformNodeAttributeIndex
 from OpenLIFULib.transform_conversion import transducer_transform_node_to_openlifu, transducer_transform_node_from_openlifu
 from OpenLIFULib.util import get_cloned_node
 
@@ -8,6 +9,82 @@ if TYPE_CHECKING:
     from openlifu.geo import ArrayTransform
     from openlifu import Transducer
 
+class VirtualFitResultIndexEntry(NamedTuple):
+    """The attributes of a virtual fit result node that the index keys on, parsed once when the node changes."""
+    session_id : Optional[str]
+    target_id : str
+    rank : int
+    approved : bool
+
+class VirtualFitResultIndex(TransformNodeAttributeIndex):
+    """An index of the virtual fit result nodes in the scene, keyed by session ID, target ID, rank, and approval.
+
+    The pre-planning widget looks up virtual fit results on every point-modified and selection event, so this keeps
+    those lookups from having to scan the whole scene. Use `get_virtual_fit_result_index` to get the shared instance
+    rather than constructing this directly.
+    """
+
+    @staticmethod
+    def _read_entry(node:vtkMRMLTransformNode) -> Optional[VirtualFitResultIndexEntry]:
+        """Parse the index entry for a node, or return None if the node is not a (fully set up) virtual fit result.
+        While `add_virtual_fit_result` is still setting attributes one at a time, a node can be briefly incomplete;
+        it gets indexed once its target ID and rank are in place."""
+        if not is_virtual_fit_result_node(node):
+            return None
+        target_id = node.GetAttribute("VF:targetID")
+        rank = node.GetAttribute("VF:rank")
+        if target_id is None or rank is None:
+            return None
+        return VirtualFitResultIndexEntry(
+            session_id = node.GetAttribute("VF:sessionID"),
+            target_id = target_id,
+            rank = int(rank),
+            approved = node.GetAttribute("VF:approvalStatus") == "1",
+        )
+
+    @staticmethod
+    def _bucket_keys(entry:VirtualFitResultIndexEntry) -> List[Tuple]:
+        return [
+            ("session", entry.session_id),
+            ("target", entry.target_id),
+            ("session_target", entry.session_id, entry.target_id),
+        ]
+
+    def query(
+        self,
+        target_id : Optional[str] = None,
+        session_id : Optional[str] = None,
+        sessionless_only : bool = False,
+    ) -> List[Tuple[vtkMRMLTransformNode, VirtualFitResultIndexEntry]]:
+        """Return (node, entry) pairs for the indexed virtual fit results matching the given IDs.
+
+        Args:
+            target_id: filter for only this target ID, or None to not filter on target
+            session_id: filter for only this session ID, or None to not filter on session
+            sessionless_only: if session_id is None, this filters for only results that have *no* session ID.
+        """
+        if sessionless_only and session_id is not None:
+            raise ValueError("Cannot filter for a session ID and for sessionless results at the same time.")
+        filter_session = session_id is not None or sessionless_only
+        if target_id is not None and filter_session:
+            return self._lookup(("session_target", session_id, target_id))
+        elif target_id is not None:
+            return self._lookup(("target", target_id))
+        elif filter_session:
+            return self._lookup(("session", session_id))
+        return self._lookup(None)
+
+_virtual_fit_result_index : Optional[VirtualFitResultIndex] = None
+
+def get_virtual_fit_result_index() -> VirtualFitResultIndex:
+    """Get the virtual fit result index for the main scene, creating it on first use."""
+    global _virtual_fit_result_index
+    if _virtual_fit_result_index is None or _virtual_fit_result_index.scene is not slicer.mrmlScene:
+        if _virtual_fit_result_index is not None:
+            _virtual_fit_result_index.removeObservers()
+        _virtual_fit_result_index = VirtualFitResultIndex(slicer.mrmlScene)
+    return _virtual_fit_result_index
+
 def add_virtual_fit_result(
     transform_node: vtkMRMLTransformNode,
     target_id: str,
@@ -51,15 +128,13 @@ def add_virtual_fit_result(
     Returns: The newly created virtual fit result transform node
     """
 
-    existing_vf_result_nodes = get_virtual_fit_result_nodes(target_id=target_id, session_id=session_id)
-    if session_id is None:
-        existing_vf_result_nodes = filter(
-            lambda t : t.GetAttribute("VF:sessionID") is None,
-            existing_vf_result_nodes,
-        ) # if a sessionless VF result is being added, conflict should only occur among other sessionless results, hence this filtering
-    for existing_vf_result_node in existing_vf_result_nodes:
-        existing_vf_result_node_rank = int(existing_vf_result_node.GetAttribute("VF:rank"))
-        if existing_vf_result_node_rank == rank:
+    existing_vf_results = get_virtual_fit_result_index().query(
+        target_id=target_id,
+        session_id=session_id,
+        sessionless_only=session_id is None, # if a sessionless VF result is being added, conflict should only occur among other sessionless results
+    )
+    for existing_vf_result_node, existing_entry in existing_vf_results:
+        if existing_entry.rank == rank:
             if replace:
                 slicer.mrmlScene.RemoveNode(existing_vf_result_node)
             else:
@@ -106,26 +181,36 @@ def get_virtual_fit_result_nodes(
     if num_exclusive > 1:
         raise ValueError("You can specify only one of 'rank' or 'sort'")
 
-    vf_result_nodes : Iterable[vtkMRMLTransformNode] = [
-        t for t in slicer.util.getNodesByClass('vtkMRMLTransformNode') if is_virtual_fit_result_node(t)
-    ]
-
-    if session_id is not None:
-        vf_result_nodes = filter(lambda t : t.GetAttribute("VF:sessionID") == session_id, vf_result_nodes)
+    return [node for node, _ in _query_virtual_fit_results(
+        target_id=target_id,
+        session_id=session_id,
+        rank=rank,
+        sort=sort,
+        approved_only=approved_only,
+    )]
 
-    if target_id is not None:
-        vf_result_nodes = filter(lambda t : t.GetAttribute("VF:targetID") == target_id, vf_result_nodes)
+def _query_virtual_fit_results(
+    target_id : Optional[str] = None,
+    session_id : Optional[str] = None,
+    rank : Optional[int] = None,
+    sort : bool = False,
+    approved_only : bool = False,
+    sessionless_only : bool = False,
+) -> List[Tuple[vtkMRMLTransformNode, VirtualFitResultIndexEntry]]:
+    """Like `get_virtual_fit_result_nodes`, but returning the (node, index entry) pairs from the virtual fit result index,
+    and optionally restricting to virtual fit results that have no session ID when session_id is None."""
+    results = get_virtual_fit_result_index().query(target_id=target_id, session_id=session_id, sessionless_only=sessionless_only)
 
-    if rank:
-        vf_result_nodes = filter(lambda t : t.GetAttribute("VF:rank") == rank, vf_result_nodes)
+    if rank is not None:
+        results = [(node, entry) for node, entry in results if entry.rank == rank]
 
     if approved_only:
-        vf_result_nodes = filter(lambda t : int(t.GetAttribute("VF:approvalStatus")) == 1, vf_result_nodes)
+        results = [(node, entry) for node, entry in results if entry.approved]
 
     if sort:
-        vf_result_nodes = sorted(vf_result_nodes, key = lambda t : int(t.GetAttribute("VF:rank")))
+        results = sorted(results, key = lambda node_and_entry : node_and_entry[1].rank)
 
-    return vf_result_nodes
+    return results
 
 def get_virtual_fit_results_in_openlifu_session_format(session_id:str, units:str) -> "Dict[str,Tuple[bool,List[ArrayTransform]]]":
     """Parse through virtual fit transform nodes in the scene and return the information in Session representation.
@@ -141,20 +226,20 @@ def get_virtual_fit_results_in_openlifu_session_format(session_id:str, units:str
 
     See also the reverse function `add_virtual_fit_results_from_openlifu_session_format`.
     """
-    vf_nodes_for_session = get_virtual_fit_result_nodes(session_id=session_id)
-    target_ids = [t.GetAttribute("VF:targetID") for t in vf_nodes_for_session]
+    vf_results_for_session = _query_virtual_fit_results(session_id=session_id)
+    target_ids = {entry.target_id for _, entry in vf_results_for_session}
     virtual_fit_results_openlifu = {}
     for target_id in target_ids:
-        vf_nodes_for_target = get_virtual_fit_result_nodes(
+        vf_results_for_target = _query_virtual_fit_results(
             session_id=session_id,
             target_id=target_id,
             sort=True, # Sorted!
         )
         virtual_fit_results_openlifu[target_id] = [
             (
-                t.GetAttribute("VF:approvalStatus") == "1",
+                entry.approved,
                 transducer_transform_node_to_openlifu(transform_node=t, transducer_units=units)
-            ) for t in vf_nodes_for_target
+            ) for t, entry in vf_results_for_target
             ]
     return virtual_fit_results_openlifu
 
@@ -219,36 +304,19 @@ def get_best_virtual_fit_result_node(
     Returns: The retrieved virtual fit result vtkMRMLTransformNode.
     """
     
-    approved_vf_result_nodes = list(get_virtual_fit_result_nodes(target_id=target_id, session_id=session_id, approved_only = True, sort = True))
-
-    # If session_id None, then at this point approved_vf_result_nodes is not filtered for session ID
-    # So here we specifically filter for nodes that are have *no* session id:
-    if session_id is None:
-        approved_vf_result_nodes = list(filter(
-            lambda t : t.GetAttribute("VF:sessionID") is None,
-            approved_vf_result_nodes,
-        ))
-
-    if len(approved_vf_result_nodes) > 0:
-        # Return the result with the highest rank
-        return approved_vf_result_nodes[0]
-    
-    # If no results are approved, then returns the highest rank node ( may not be rank 1)
-    else:
-        vf_result_nodes = list(get_virtual_fit_result_nodes(target_id=target_id, session_id=session_id, sort = True))
+    # If session_id is None, then we specifically look for nodes that have *no* session id
+    vf_results = _query_virtual_fit_results(target_id=target_id, session_id=session_id, sort = True, sessionless_only = session_id is None)
 
-        # If session_id None, then at this point vf_result_nodes is not filtered for session ID
-        # So here we specifically filter for nodes that are have *no* session id:
-        if session_id is None:
-            vf_result_nodes = list(filter(
-                lambda t : t.GetAttribute("VF:sessionID") is None,
-                vf_result_nodes,
-            ))
+    if len(vf_results) < 1:
+        return None
 
-        if len(vf_result_nodes) < 1:
-            return None
-        
-        return vf_result_nodes[0]
+    approved_vf_results = [(node, entry) for node, entry in vf_results if entry.approved]
+    if len(approved_vf_results) > 0:
+        # Return the approved result with the highest rank
+        return approved_vf_results[0][0]
+
+    # If no results are approved, then returns the highest rank node ( may not be rank 1)
+    return vf_results[0][0]
 
 def clear_virtual_fit_results(
     target_id: Optional[str],
@@ -262,17 +330,10 @@ def clear_virtual_fit_results(
         session_id: session ID. If None then **only virtual fit results with no session ID are removed**!
     """
 
-    nodes_to_remove = get_virtual_fit_result_nodes(target_id=target_id, session_id=session_id)
+    # If session_id is None, then we specifically remove only nodes that have *no* session id
+    vf_results_to_remove = _query_virtual_fit_results(target_id=target_id, session_id=session_id, sessionless_only = session_id is None)
 
-    # If session_id None, then at this point nodes_to_remove is not filtered for session ID
-    # So here we specifically filter for nodes that are have *no* session id:
-    if session_id is None:
-        nodes_to_remove = filter(
-            lambda t : t.GetAttribute("VF:sessionID") is None,
-            nodes_to_remove,
-        )
-
-    for node in nodes_to_remove:
+    for node, _ in vf_results_to_remove:
         slicer.mrmlScene.RemoveNode(node)
 
 def get_approved_target_ids(session_id: str) -> List[str]:
@@ -282,16 +343,11 @@ def get_approved_target_ids(session_id: str) -> List[str]:
         session_id: optional session ID. If None then **only virtual fit results with no session ID are included**.
     """
 
-    nodes = get_virtual_fit_result_nodes(session_id=session_id, approved_only = True)
-
-    # If session_id None, then at this point `nodes`` is not filtered for session ID
-    # So here we specifically filter for nodes that are have *no* session id:
-    if session_id is None:
-        nodes = filter(lambda t : t.GetAttribute("VF:sessionID") is None, nodes)
+    # If session_id is None, then we specifically look at only nodes that have *no* session id
+    approved_vf_results = _query_virtual_fit_results(session_id=session_id, approved_only = True, sessionless_only = session_id is None)
 
-    targets_with_duplicates = [t.GetAttribute("VF:targetID") for t in nodes if int(t.GetAttribute("VF:approvalStatus")) == 1]
     # Use sets since a target can have multiple approved nodes
-    return list(set(targets_with_duplicates))
+    return list({entry.target_id for _, entry in approved_vf_results})
 
 def set_approval_for_virtual_fit_result_node(
     approval_state: bool,
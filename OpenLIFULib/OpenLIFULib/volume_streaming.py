@@ -0,0 +1,341 @@
+"""Streaming computations on volume arrays, and memory-mapped reading of volume files.
+
+The computations here go through a volume a slab of slices at a time, so that they can run on a memory-mapped volume
+file without pulling the whole volume into memory, and so that they make no whole-volume temporaries of the voxel type.
+Nothing here touches slicer, so it is all safe to run in a worker thread.
+"""
+
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+import numpy as np
+
+DEFAULT_CHUNK_VOXELS = 2**24
+"""The number of voxels that the streaming computations handle at a time"""
+
+MAX_INTEGER_HISTOGRAM_BINS = 2**24
+"""Integer volumes whose range of values fits in this many bins get a histogram with one bin per value. Quantiles of
+other volumes are found by narrowing down histograms of `SELECTION_HISTOGRAM_BINS` bins."""
+
+SELECTION_HISTOGRAM_BINS = 2**16
+"""The number of histogram bins with which the range of values holding a quantile of a float volume is narrowed down"""
+
+MAX_GATHERED_VALUES = 2**20
+"""Once the range of values holding a quantile of a float volume holds at most this many voxels, their values are
+gathered and sorted"""
+
+OTSU_HISTOGRAM_BINS = 256
+"""The number of histogram bins over which the Otsu threshold of a float volume is computed, as in skimage"""
+
+def iter_slabs(shape:Sequence[int], chunk_voxels:int = DEFAULT_CHUNK_VOXELS) -> Iterator[slice]:
+    """Slices along the first axis of an array of the given shape, each covering about `chunk_voxels` voxels. For an
+    array that is in correspondence with slicer.util.arrayFromVolume, these are slabs of whole slices."""
+    slice_voxels = max(int(np.prod(shape[1:], dtype=np.int64)), 1)
+    slices_per_slab = max(chunk_voxels // slice_voxels, 1)
+    for start in range(0, shape[0], slices_per_slab):
+        yield slice(start, min(start + slices_per_slab, shape[0]))
+
+def streaming_min_max(vol_array:np.ndarray, chunk_voxels:int = DEFAULT_CHUNK_VOXELS) -> Tuple[Union[int,float],Union[int,float]]:
+    """Compute the minimum and maximum of an array, one slab at a time. They are returned as python numbers, so that
+    arithmetic on them cannot overflow the voxel type."""
+    slab_extrema = [(vol_array[slab].min(), vol_array[slab].max()) for slab in iter_slabs(vol_array.shape, chunk_voxels)]
+    return min(e[0] for e in slab_extrema).item(), max(e[1] for e in slab_extrema).item()
+
+def _quantiles_from_order_statistics(
+    n:int,
+    quantiles:Sequence[float],
+    dtype:np.dtype,
+    order_statistics:Callable[[List[int]], Dict[int,Any]],
+) -> List[Any]:
+    """Compute quantiles of data the way np.quantile does by default (linear interpolation between the two closest data
+    points), given a function that finds the values at the given indices of the sorted data."""
+    positions = [q * (n - 1) for q in quantiles]
+    lower_indices = [int(np.floor(position)) for position in positions]
+    values = order_statistics(sorted({i for lower_index in lower_indices for i in (lower_index, min(lower_index + 1, n - 1))}))
+    result = []
+    for position, lower_index in zip(positions, lower_indices):
+        # The interpolation is left to np.quantile, so that it is done in the same types and with the same rounding
+        closest_values = np.array([values[lower_index], values[min(lower_index + 1, n - 1)]], dtype=dtype)
+        result.append(np.quantile(closest_values, [position - lower_index])[0])
+    return result
+
+def _streaming_order_statistics(
+    vol_array:np.ndarray,
+    indices:List[int],
+    value_range:Tuple[Any,Any],
+    chunk_voxels:int,
+) -> Dict[int,Any]:
+    """Find the values at the given indices of the sorted values of an array that lie in the given (inclusive) range,
+    one slab at a time. A histogram of the range locates the bin that holds each index; bins that hold few enough values
+    are gathered and sorted, and the others are narrowed down to the range of their values and searched again."""
+    range_min, range_max = value_range
+    if range_min == range_max:
+        return {i : range_min for i in indices}
+
+    # Binning is monotonic in the value, so the values of a bin are exactly the values in the range that the bin's values span
+    bin_scale = SELECTION_HISTOGRAM_BINS / (float(range_max) - float(range_min))
+    def bin_indices(values:np.ndarray) -> np.ndarray:
+        scaled = (values.astype(np.float64) - float(range_min)) * bin_scale
+        return np.minimum(scaled.astype(np.int64), SELECTION_HISTOGRAM_BINS - 1)
+    def slab_values_in_range(slab:slice) -> np.ndarray:
+        chunk = vol_array[slab]
+        return chunk[(chunk >= range_min) & (chunk <= range_max)]
+
+    counts = np.zeros(SELECTION_HISTOGRAM_BINS, dtype=np.int64)
+    for slab in iter_slabs(vol_array.shape, chunk_voxels):
+        counts += np.bincount(bin_indices(slab_values_in_range(slab)), minlength=SELECTION_HISTOGRAM_BINS)
+    cumulative_counts = np.cumsum(counts)
+
+    # The data point of sorted index i is in the first bin whose cumulative count exceeds i
+    indices_by_bin : Dict[int,List[int]] = {}
+    for i in indices:
+        indices_by_bin.setdefault(int(np.searchsorted(cumulative_counts, i, side='right')), []).append(i)
+
+    gathered = {b : [] for b in indices_by_bin if counts[b] <= MAX_GATHERED_VALUES}
+    bin_extrema = {b : [] for b in indices_by_bin if b not in gathered}
+    for slab in iter_slabs(vol_array.shape, chunk_voxels):
+        values = slab_values_in_range(slab)
+        values_bin_indices = bin_indices(values)
+        for b in gathered:
+            gathered[b].append(values[values_bin_indices == b])
+        for b in bin_extrema:
+            bin_values = values[values_bin_indices == b]
+            if bin_values.size > 0:
+                bin_extrema[b].append((bin_values.min(), bin_values.max()))
+
+    order_statistics = {}
+    for b, bin_indices_list in indices_by_bin.items():
+        count_before_bin = int(cumulative_counts[b] - counts[b])
+        if b in gathered:
+            bin_values = np.sort(np.concatenate(gathered[b]))
+            order_statistics.update({i : bin_values[i - count_before_bin] for i in bin_indices_list})
+        else:
+            # Every value in the range of values of this bin is in this bin, so the search continues within that range
+            bin_range = (min(e[0] for e in bin_extrema[b]), max(e[1] for e in bin_extrema[b]))
+            order_statistics.update({
+                count_before_bin + i : value
+                for i, value in _streaming_order_statistics(
+                    vol_array, [i - count_before_bin for i in bin_indices_list], bin_range, chunk_voxels,
+                ).items()
+            })
+    return order_statistics
+
+def _otsu_foreground_threshold(
+    vol_array:np.ndarray,
+    lower_quantile:float,
+    upper_quantile:float,
+    chunk_voxels:int,
+) -> Union[int,float]:
+    """Step 1 of `openlifu.seg.skinseg.compute_foreground_mask` computed from histograms that are accumulated one slab
+    at a time: the Otsu threshold of the values between the given quantiles. The result is the same as openlifu's."""
+    import skimage.filters
+
+    n = int(np.prod(vol_array.shape, dtype=np.int64))
+    slab_extrema = [(vol_array[slab].min(), vol_array[slab].max()) for slab in iter_slabs(vol_array.shape, chunk_voxels)]
+    vmin, vmax = min(e[0] for e in slab_extrema), max(e[1] for e in slab_extrema)
+    if vmin == vmax:
+        return vmin
+
+    if np.issubdtype(vol_array.dtype, np.integer) and vmax.item() - vmin.item() < MAX_INTEGER_HISTOGRAM_BINS:
+        vmin, vmax = vmin.item(), vmax.item()
+        counts = np.zeros(vmax - vmin + 1, dtype=np.int64)
+        for slab in iter_slabs(vol_array.shape, chunk_voxels):
+            counts += np.bincount((vol_array[slab].astype(np.int64) - vmin).ravel(), minlength=len(counts))
+        values = np.arange(vmin, vmax + 1)
+        cumulative_counts = np.cumsum(counts)
+        threshold_lower, threshold_upper = _quantiles_from_order_statistics(
+            n, [lower_quantile, upper_quantile], vol_array.dtype,
+            lambda indices : {i : values[np.searchsorted(cumulative_counts, i, side='right')] for i in indices},
+        )
+
+        # Like skimage does for integer images, the Otsu histogram gets a bin for every integer from the smallest to the
+        # largest value kept
+        kept = (values >= threshold_lower) & (values <= threshold_upper) & (counts > 0)
+        kept_indices = np.flatnonzero(kept)
+        first, last = kept_indices[0], kept_indices[-1] + 1
+        otsu_counts = np.where(kept, counts, 0)[first:last]
+        otsu_bin_centers = values[first:last]
+    else:
+        threshold_lower, threshold_upper = _quantiles_from_order_statistics(
+            n, [lower_quantile, upper_quantile], vol_array.dtype,
+            lambda indices : _streaming_order_statistics(vol_array, indices, (vmin, vmax), chunk_voxels),
+        )
+
+        # skimage spreads the Otsu bins over the range of the values kept, which takes one more pass to find. The bins
+        # are then made the way skimage makes them, by np.histogram over that range, so the bin of each value matches.
+        kept_extrema = []
+        for slab in iter_slabs(vol_array.shape, chunk_voxels):
+            chunk = vol_array[slab]
+            kept_values = chunk[(chunk >= threshold_lower) & (chunk <= threshold_upper)]
+            if kept_values.size > 0:
+                kept_extrema.append((kept_values.min(), kept_values.max()))
+        if not kept_extrema:
+            return threshold_lower
+        kept_min, kept_max = min(e[0] for e in kept_extrema), max(e[1] for e in kept_extrema)
+        if kept_min == kept_max:
+            return kept_min
+        otsu_counts = np.zeros(OTSU_HISTOGRAM_BINS, dtype=np.int64)
+        for slab in iter_slabs(vol_array.shape, chunk_voxels):
+            chunk = vol_array[slab]
+            slab_counts, otsu_bin_edges = np.histogram(
+                chunk[(chunk >= threshold_lower) & (chunk <= threshold_upper)],
+                bins = OTSU_HISTOGRAM_BINS,
+                range = (kept_min, kept_max),
+            )
+            otsu_counts += slab_counts
+        otsu_bin_centers = (otsu_bin_edges[:-1] + otsu_bin_edges[1:]) / 2.0
+
+    if len(otsu_counts) == 1:
+        return otsu_bin_centers[0]
+    return skimage.filters.threshold_otsu(hist=(otsu_counts, otsu_bin_centers))
+
+def compute_foreground_mask_streaming(
+    vol_array:np.ndarray,
+    closing_radius:float = 9.,
+    lower_quantile_for_otsu_threshold:float = 0.02,
+    upper_quantile_for_otsu_threshold:float = 0.99,
+    chunk_voxels:int = DEFAULT_CHUNK_VOXELS,
+) -> np.ndarray:
+    """Compute the same foreground mask as `openlifu.seg.skinseg.compute_foreground_mask` (see there for the algorithm and
+    the arguments), but read the volume array only one slab at a time, so that it can be a memory-mapped file.
+
+    The thresholding step is done on histograms that are accumulated slab by slab, and gives the same threshold as
+    openlifu for integer and float volumes alike: the quantiles of float volumes are found exactly by narrowing down
+    histograms until few enough values are left to sort (see `_streaming_order_statistics`). The remaining steps work on
+    the boolean mask, which takes a byte per voxel, rather than on the volume itself.
+    """
+    from openlifu.seg.skinseg import take_largest_connected_component
+    from scipy.ndimage import distance_transform_edt
+
+    # step 1: otsu-threshold the image to create an initial foreground mask.
+    threshold_foreground = _otsu_foreground_threshold(
+        vol_array,
+        lower_quantile_for_otsu_threshold,
+        upper_quantile_for_otsu_threshold,
+        chunk_voxels,
+    )
+    foreground_mask = np.empty(vol_array.shape, dtype=bool)
+    for slab in iter_slabs(vol_array.shape, chunk_voxels):
+        np.greater_equal(vol_array[slab], threshold_foreground, out=foreground_mask[slab])
+
+    # steps 2 to 4 are as in openlifu: keep the largest connected component, do a morphological closing, and fill holes
+    # by taking the complement of the largest connected component of the background.
+    foreground_mask = take_largest_connected_component(foreground_mask)
+    pad_width = int(closing_radius+2)
+    foreground_mask_padded = np.pad(foreground_mask, pad_width, mode='constant')
+    foreground_dilated = distance_transform_edt(~foreground_mask_padded) <= closing_radius
+    foreground_closed = distance_transform_edt(foreground_dilated) >= closing_radius
+    h,w,d = foreground_mask.shape
+    p = pad_width
+    foreground_mask = foreground_closed[p:p+h,p:p+w,p:p+d]
+    return ~take_largest_connected_component(~foreground_mask)
+
+_NRRD_TYPES = {
+    **dict.fromkeys(["signed char", "int8", "int8_t"], np.dtype(np.int8)),
+    **dict.fromkeys(["uchar", "unsigned char", "uint8", "uint8_t"], np.dtype(np.uint8)),
+    **dict.fromkeys(["short", "short int", "signed short", "signed short int", "int16", "int16_t"], np.dtype(np.int16)),
+    **dict.fromkeys(["ushort", "unsigned short", "unsigned short int", "uint16", "uint16_t"], np.dtype(np.uint16)),
+    **dict.fromkeys(["int", "signed int", "int32", "int32_t"], np.dtype(np.int32)),
+    **dict.fromkeys(["uint", "unsigned int", "uint32", "uint32_t"], np.dtype(np.uint32)),
+    **dict.fromkeys(
+        ["longlong", "long long", "long long int", "signed long long", "signed long long int", "int64", "int64_t"],
+        np.dtype(np.int64),
+    ),
+    **dict.fromkeys(
+        ["ulonglong", "unsigned long long", "unsigned long long int", "uint64", "uint64_t"],
+        np.dtype(np.uint64),
+    ),
+    "float" : np.dtype(np.float32),
+    "double" : np.dtype(np.float64),
+}
+"""Mapping from the NRRD "type" field to numpy dtype"""
+
+def _read_nrrd_header(nrrd_filepath:Path) -> Tuple[dict, int]:
+    """Read the fields of a NRRD header. Returns the fields, keyed by lower case field name, and the size in bytes of
+    the header (which is where attached data starts)."""
+    fields = {}
+    with open(nrrd_filepath, 'rb') as f:
+        if not f.readline().startswith(b"NRRD"):
+            raise ValueError(f"{nrrd_filepath} is not a NRRD file")
+        while True:
+            line = f.readline()
+            if not line.strip(): # a blank line ends the header, or the end of file does for a detached header
+                break
+            line = line.decode('latin-1').rstrip('\r\n')
+            if line.startswith('#') or ':=' in line: # comments and key/value pairs
+                continue
+            key, separator, value = line.partition(': ')
+            if separator:
+                fields[key.strip().lower()] = value.strip()
+        return fields, f.tell()
+
+def _memory_map_nrrd(nrrd_filepath:Path) -> Optional[np.ndarray]:
+    fields, header_size = _read_nrrd_header(nrrd_filepath)
+    dtype = _NRRD_TYPES.get(fields.get('type', ''))
+    if (
+        fields.get('encoding') != 'raw'
+        or int(fields.get('dimension', 0)) != 3
+        or int(fields.get('line skip', fields.get('lineskip', 0))) != 0
+        or dtype is None
+    ):
+        return None
+    if dtype.itemsize > 1:
+        dtype = dtype.newbyteorder('>' if fields.get('endian') == 'big' else '<')
+    sizes = [int(size) for size in fields['sizes'].split()]
+
+    data_file = fields.get('data file', fields.get('datafile'))
+    if data_file is None:
+        data_filepath, offset = nrrd_filepath, header_size
+    elif ' ' in data_file: # a LIST or a format string of several data files
+        return None
+    else:
+        data_filepath, offset = nrrd_filepath.parent / data_file, 0
+
+    byte_skip = int(fields.get('byte skip', fields.get('byteskip', 0)))
+    if byte_skip == -1: # the data is at the end of the file
+        offset = data_filepath.stat().st_size - int(np.prod(sizes)) * dtype.itemsize
+    else:
+        offset += byte_skip
+
+    # The first axis in "sizes" is the fastest varying, so reversing it gives the KJI indexing of arrayFromVolume
+    return np.memmap(data_filepath, dtype=dtype, mode='r', offset=offset, shape=tuple(reversed(sizes)))
+
+def _memory_map_nifti(nifti_filepath:Path) -> Optional[np.ndarray]:
+    import nibabel
+    image = nibabel.load(nifti_filepath, mmap='r')
+    if len(image.shape) != 3:
+        return None
+    if image.dataobj.slope != 1 or image.dataobj.inter != 0: # the reader rescales these, so the file values are not the voxels
+        return None
+    vol_array = image.dataobj.get_unscaled()
+    if not isinstance(vol_array, np.memmap):
+        return None
+    # nibabel indexes IJK, so transposing gives the KJI indexing of arrayFromVolume
+    return vol_array.transpose(2, 1, 0)
+
+def memory_map_volume_file(volume_filepath) -> Optional[np.ndarray]:
+    """Memory-map the voxels of an uncompressed NIfTI file or a raw-encoded NRRD file as a read-only array that is in
+    correspondence with what slicer.util.arrayFromVolume gives once the volume is loaded.
+
+    Returns None for files that cannot be memory-mapped: compressed files, files of other formats, files whose voxel
+    values get rescaled on reading, and anything that is not a single component 3D volume.
+    """
+    volume_filepath = Path(volume_filepath)
+    name = volume_filepath.name.lower()
+    try:
+        if name.endswith(".nii"):
+            return _memory_map_nifti(volume_filepath)
+        if name.endswith((".nrrd", ".nhdr")):
+            return _memory_map_nrrd(volume_filepath)
+    except Exception as e:
+        logging.warning(f"Could not memory-map {volume_filepath}, so it will be read into memory instead: {e}")
+    return None
+
+def compute_foreground_mask_of_volume_file(volume_filepath, chunk_voxels:int = DEFAULT_CHUNK_VOXELS) -> Optional[np.ndarray]:
+    """Compute the foreground mask of a volume file by streaming through its memory-mapped voxels
+    (see `memory_map_volume_file` and `compute_foreground_mask_streaming`).
+    Returns None if the file cannot be memory-mapped."""
+    vol_array = memory_map_volume_file(volume_filepath)
+    if vol_array is None:
+        return None
+    return compute_foreground_mask_streaming(vol_array, chunk_voxels=chunk_voxels)
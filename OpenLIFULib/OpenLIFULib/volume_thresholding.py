@@ -2,17 +2,58 @@
 
 import logging
 import numpy as np
-from typing import Tuple
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple, Union
 import vtk
+import vtk.util.numpy_support
 import slicer
-from slicer import vtkMRMLScalarVolumeNode
+from slicer import vtkMRMLScalarVolumeNode, vtkMRMLVolumeArchetypeStorageNode
+from OpenLIFULib.foreground_mask_store import (
+    attach_foreground_mask,
+    get_attached_foreground_mask,
+    get_foreground_mask_store_dir,
+    load_stored_foreground_mask,
+    save_foreground_mask_to_store,
+    set_foreground_mask_store_dir,
+)
 from OpenLIFULib.util import BusyCursor
+from OpenLIFULib.volume_streaming import (
+    compute_foreground_mask_of_volume_file,
+    compute_foreground_mask_streaming,
+    iter_slabs,
+    streaming_min_max,
+)
 
-def cast_volume_to_float(volume_node:vtkMRMLScalarVolumeNode) -> None:
-    """Converts a volume node to float, replacing the underlying vtkImageData."""
+STREAMING_VOLUME_LOADING_SETTINGS_KEY = "OpenLIFU/streamingVolumeLoading"
+"""QSettings key holding whether volumes are loaded in streaming mode. In streaming mode the foreground mask is computed
+from a memory-mapped volume file when possible, a slab at a time, so that large volumes do not need several
+whole-volume temporaries on top of the loaded volume. See `OpenLIFULib.volume_streaming`."""
+
+MASKED_BACKGROUND_THRESHOLDING_SETTINGS_KEY = "OpenLIFU/maskedBackgroundThresholding"
+"""QSettings key holding whether the background of loaded volumes is hidden through a foreground mask labelmap rather than
+by rewriting the background voxels. See `mask_volume_background`."""
+
+FOREGROUND_MASK_COLOR_NODE_SINGLETON_TAG = "OpenLIFUForegroundMask"
+"""Singleton tag of the color table with which foreground mask labelmaps are displayed"""
+
+def get_streaming_volume_loading_enabled() -> bool:
+    """Get whether volumes are loaded in streaming mode. This is on by default."""
+    return slicer.util.settingsValue(STREAMING_VOLUME_LOADING_SETTINGS_KEY, True, converter=slicer.util.toBool)
+
+def get_masked_background_thresholding_enabled() -> bool:
+    """Get whether volume backgrounds are hidden through a foreground mask labelmap, leaving the voxels untouched. This is on by default."""
+    return slicer.util.settingsValue(MASKED_BACKGROUND_THRESHOLDING_SETTINGS_KEY, True, converter=slicer.util.toBool)
+
+def narrowest_dtype_holding_value(dtype:np.dtype, value:Union[int,float]) -> np.dtype:
+    """The narrowest numpy dtype that can hold both all values of `dtype` and the given value,
+    e.g. int16 for uint8 and -1, or float32 for float32 and anything in range."""
+    return np.result_type(dtype, np.min_scalar_type(value))
+
+def cast_volume_to_scalar_type(volume_node:vtkMRMLScalarVolumeNode, dtype:np.dtype) -> None:
+    """Converts a volume node to the VTK scalar type corresponding to a numpy dtype, replacing the underlying vtkImageData."""
     image_cast = vtk.vtkImageCast()
     image_cast.SetInputData(volume_node.GetImageData())
-    image_cast.SetOutputScalarTypeToDouble()
+    image_cast.SetOutputScalarType(vtk.util.numpy_support.get_vtk_array_type(np.dtype(dtype)))
     image_cast.Update()
     volume_node.SetAndObserveImageData(image_cast.GetOutput())
 
@@ -20,38 +61,252 @@ def cast_volume_to_float(volume_node:vtkMRMLScalarVolumeNode) -> None:
     # so I hope poking `CreateDefaultDisplayNodes` here makes it do the right thing. If it's not needed then it's harmless anyway:
     volume_node.CreateDefaultDisplayNodes()
 
-def threshold_volume_by_foreground_mask(volume_node:vtkMRMLScalarVolumeNode) -> np.ndarray:
-    """Compute the foreground mask for a loaded volume and threshold the volume to strip out the background.
-    This modifies the values of the background region in the volume and sets them to 1 less than the minimum value in the volume.
-    This way we can simply enable volume thresholding to remove
-    It can take a moment to actually compute the foreground mask.
+def cast_volume_to_float(volume_node:vtkMRMLScalarVolumeNode) -> None:
+    """Converts a volume node to float, replacing the underlying vtkImageData."""
+    cast_volume_to_scalar_type(volume_node, np.float64)
+
+def compute_volume_foreground_mask(volume_node:vtkMRMLScalarVolumeNode, streaming:bool = False) -> np.ndarray:
+    """Compute the foreground mask of a volume. This does not touch the scene, so it can be run in a worker thread on a
+    volume node that is not in the scene yet (see `read_volume_node`).
+
+    If `streaming` is set then the mask is computed with `OpenLIFULib.volume_streaming.compute_foreground_mask_streaming`,
+    which avoids whole-volume temporaries of the voxel type.
 
     Returns foreground mask. The array is in correspondence with what you'd get from slicer.util.arrayFromVolume on the volume node.
     """
+    if streaming:
+        return compute_foreground_mask_streaming(slicer.util.arrayFromVolume(volume_node))
     import openlifu.seg.skinseg
+    return openlifu.seg.skinseg.compute_foreground_mask(slicer.util.arrayFromVolume(volume_node))
 
-    volume_array = slicer.util.arrayFromVolume(volume_node)
-    volume_array_min = volume_array.min()
+def threshold_volume_by_precomputed_foreground_mask(volume_node:vtkMRMLScalarVolumeNode, foreground_mask:np.ndarray) -> None:
+    """Threshold a loaded volume to strip out the background, given its foreground mask.
+    This modifies the values of the background region in the volume and sets them to 1 less than the minimum value in the volume.
+    This way we can simply enable volume thresholding to remove the background.
+    """
+    volume_array_min, volume_array_max = streaming_min_max(slicer.util.arrayFromVolume(volume_node))
 
     background_value = volume_array_min - 1
     if background_value < volume_node.GetImageData().GetScalarTypeMin(): # e.g. if volume_array_min is 0 and it's an unsigned int type
-        logging.info("Casting volume to float for the sake of `threshold_volume_by_foreground_mask`.")
-        cast_volume_to_float(volume_node)
+        promoted_dtype = narrowest_dtype_holding_value(slicer.util.arrayFromVolume(volume_node).dtype, background_value)
+        logging.info(f"Casting volume to {promoted_dtype} for the sake of `threshold_volume_by_foreground_mask`.")
+        cast_volume_to_scalar_type(volume_node, promoted_dtype)
 
-    foreground_mask = openlifu.seg.skinseg.compute_foreground_mask(volume_array)
-    slicer.util.arrayFromVolume(volume_node)[~foreground_mask] = background_value
-    volume_node.GetDisplayNode().SetThreshold(volume_array_min,volume_array.max())
+    volume_array = slicer.util.arrayFromVolume(volume_node)
+    for slab in iter_slabs(volume_array.shape):
+        volume_array[slab][~foreground_mask[slab]] = background_value
+    volume_node.GetDisplayNode().SetThreshold(volume_array_min,volume_array_max)
     volume_node.GetDisplayNode().SetApplyThreshold(1)
     volume_node.GetDisplayNode().SetAutoThreshold(0)
     volume_node.Modified()
+
+def get_foreground_mask_color_node() -> slicer.vtkMRMLColorTableNode:
+    """Get the color table with which foreground mask labelmaps are displayed, creating it if needed. Background voxels
+    are opaque black and foreground voxels are fully transparent, so that showing a foreground mask in the label layer
+    of the slice views looks the same as thresholding out the background of the volume beneath it."""
+    color_node = slicer.mrmlScene.GetSingletonNode(FOREGROUND_MASK_COLOR_NODE_SINGLETON_TAG, "vtkMRMLColorTableNode")
+    if color_node is None:
+        color_node = slicer.vtkMRMLColorTableNode()
+        color_node.SetSingletonTag(FOREGROUND_MASK_COLOR_NODE_SINGLETON_TAG)
+        color_node.SetName("OpenLIFU foreground mask")
+        color_node.SetTypeToUser()
+        color_node.SetNumberOfColors(2)
+        color_node.SetColor(0, "background", 0., 0., 0., 1.)
+        color_node.SetColor(1, "foreground", 0., 0., 0., 0.)
+        color_node.SetHideFromEditors(True)
+        color_node = slicer.mrmlScene.AddNode(color_node)
+    return color_node
+
+def get_volume_foreground_mask(volume_node:vtkMRMLScalarVolumeNode) -> np.ndarray:
+    """Get the foreground mask of a volume through its mask store (see `OpenLIFULib.foreground_mask_store`), so that
+    background thresholding, skin segmentation and virtual fit all share one mask per volume.
+
+    The mask attached to the volume is used if there is one. Otherwise the mask persisted for the volume file is loaded
+    if the volume has a mask store folder, and failing that the mask is computed and persisted. Either way it is then
+    attached to the volume.
+
+    Returns the foreground mask as a boolean view of the attached labelmap voxels. The array is in correspondence with
+    what you'd get from slicer.util.arrayFromVolume on the volume node.
+    """
+    foreground_mask = get_attached_foreground_mask(volume_node)
+    if foreground_mask is not None:
+        return foreground_mask
+
+    store_dir = get_foreground_mask_store_dir(volume_node)
+    storage_node = volume_node.GetStorageNode()
+    volume_filepath = storage_node.GetFileName() if storage_node is not None else None
+    if store_dir is not None and volume_filepath:
+        foreground_mask = load_stored_foreground_mask(store_dir, volume_filepath)
+    if foreground_mask is None or foreground_mask.shape != slicer.util.arrayFromVolume(volume_node).shape:
+        foreground_mask = compute_volume_foreground_mask(volume_node, streaming=get_streaming_volume_loading_enabled())
+        if store_dir is not None and volume_filepath:
+            save_foreground_mask_to_store(store_dir, volume_filepath, foreground_mask)
+
+    attach_foreground_mask(volume_node, foreground_mask)
+    return get_attached_foreground_mask(volume_node)
+
+def mask_volume_background(volume_node:vtkMRMLScalarVolumeNode, foreground_mask:np.ndarray) -> np.ndarray:
+    """Hide the background of a loaded volume, given its foreground mask, without modifying the volume.
+    The mask is attached to the volume as a uint8 labelmap (see `OpenLIFULib.foreground_mask_store.attach_foreground_mask`),
+    and that labelmap is shown in the label layer of the slice views with a color table that blacks out the background;
+    see `get_foreground_mask_color_node`.
+    Unlike `threshold_volume_by_precomputed_foreground_mask`, the original intensities are kept and the volume never needs
+    to be cast to a wider type.
+
+    Returns the foreground mask as a boolean view of the labelmap voxels, so that the mask is held in memory only once.
+    The array is in correspondence with what you'd get from slicer.util.arrayFromVolume on the volume node.
+    """
+    mask_node = attach_foreground_mask(volume_node, foreground_mask)
+    mask_node.CreateDefaultDisplayNodes()
+    mask_node.GetDisplayNode().SetAndObserveColorNodeID(get_foreground_mask_color_node().GetID())
+
+    if volume_node.GetDisplayNode() is not None:
+        volume_node.GetDisplayNode().SetApplyThreshold(0)
+
+    for composite_node in slicer.util.getNodesByClass('vtkMRMLSliceCompositeNode'):
+        if composite_node.GetBackgroundVolumeID() == volume_node.GetID():
+            composite_node.SetLabelVolumeID(mask_node.GetID())
+            composite_node.SetLabelOpacity(1.0)
+
+    return slicer.util.arrayFromVolume(mask_node).view(bool)
+
+def threshold_volume_by_foreground_mask(volume_node:vtkMRMLScalarVolumeNode, streaming:bool = False) -> np.ndarray:
+    """Compute the foreground mask for a loaded volume and threshold the volume to strip out the background.
+    This modifies the values of the background region in the volume and sets them to 1 less than the minimum value in the volume.
+    This way we can simply enable volume thresholding to remove
+    It can take a moment to actually compute the foreground mask. See `compute_volume_foreground_mask` about `streaming`.
+
+    Returns foreground mask. The array is in correspondence with what you'd get from slicer.util.arrayFromVolume on the volume node.
+    """
+    foreground_mask = compute_volume_foreground_mask(volume_node, streaming=streaming)
+    threshold_volume_by_precomputed_foreground_mask(volume_node, foreground_mask)
     return foreground_mask
 
-def load_volume_and_threshold_background(volume_filepath) -> Tuple[vtkMRMLScalarVolumeNode, np.ndarray]:
+def read_volume_node(volume_filepath) -> Tuple[vtkMRMLScalarVolumeNode, vtkMRMLVolumeArchetypeStorageNode]:
+    """Read a volume from file into a new volume node without adding anything to the scene, so that this can be run in
+    a worker thread. Use `add_read_volume_node_to_scene` on the main thread to then add the volume to the scene.
+
+    Returns the volume node and the storage node that it was read with.
+    """
+    volume_node = vtkMRMLScalarVolumeNode()
+    storage_node = vtkMRMLVolumeArchetypeStorageNode()
+    storage_node.SetFileName(str(volume_filepath))
+    if not storage_node.ReadData(volume_node):
+        raise RuntimeError(f"Failed to read volume from {volume_filepath}")
+    return volume_node, storage_node
+
+def add_read_volume_node_to_scene(volume_node:vtkMRMLScalarVolumeNode, storage_node:vtkMRMLVolumeArchetypeStorageNode) -> None:
+    """Add a volume node that was read by `read_volume_node` to the scene and show it in the slice views, like
+    slicer.util.loadVolume would. This must be run on the main thread."""
+    volume_node.SetName(slicer.mrmlScene.GenerateUniqueName(storage_node.GetFileNameWithoutExtension()))
+    slicer.mrmlScene.AddNode(storage_node)
+    slicer.mrmlScene.AddNode(volume_node)
+    volume_node.SetAndObserveStorageNodeID(storage_node.GetID())
+    volume_node.CreateDefaultDisplayNodes()
+    app_logic = slicer.app.applicationLogic()
+    app_logic.GetSelectionNode().SetActiveVolumeID(volume_node.GetID())
+    app_logic.PropagateVolumeSelection()
+
+class ReadVolume(NamedTuple):
+    """A volume that was read from file, along with its foreground mask, and that is not in the scene yet.
+    See `read_volume_and_compute_foreground_mask`."""
+    volume_node : vtkMRMLScalarVolumeNode
+    storage_node : vtkMRMLVolumeArchetypeStorageNode
+    foreground_mask : np.ndarray
+    foreground_mask_store_dir : Optional[Path] = None
+
+def _read_or_compute_foreground_mask_of_file(
+    volume_filepath,
+    streaming:bool,
+    foreground_mask_store_dir:Optional[Path],
+) -> Tuple[Optional[np.ndarray], bool]:
+    """Get the foreground mask of a volume file without reading the volume, from its persisted mask if there is one and
+    otherwise by streaming over the memory-mapped file if `streaming` is set.
+    Returns the mask, or None if neither worked, and whether the mask came from the mask store."""
+    if foreground_mask_store_dir is not None:
+        foreground_mask = load_stored_foreground_mask(foreground_mask_store_dir, volume_filepath)
+        if foreground_mask is not None:
+            return foreground_mask, True
+    foreground_mask = compute_foreground_mask_of_volume_file(volume_filepath) if streaming else None
+    return foreground_mask, False
+
+def read_volume_and_compute_foreground_mask(
+    volume_filepath,
+    streaming:Optional[bool] = None,
+    foreground_mask_store_dir:Optional[Path] = None,
+) -> ReadVolume:
+    """Read a volume from file and compute its foreground mask, without adding anything to the scene.
+    This is the part of `load_volume_and_threshold_background` that can be run in a worker thread; finish loading the
+    volume on the main thread with `add_read_volume_to_scene_and_threshold_background`.
+
+    In streaming mode the foreground mask is computed from the memory-mapped file before the volume is read, so that the
+    mask computation and the loaded volume never take up memory at the same time. Files that cannot be memory-mapped
+    get the streaming mask computation on the loaded volume instead. If `streaming` is None then the mode comes from the
+    application settings, see `get_streaming_volume_loading_enabled`; pass it explicitly when calling this from a worker
+    thread.
+
+    If a `foreground_mask_store_dir` is given (see `OpenLIFULib.foreground_mask_store.get_session_foreground_mask_store_dir`)
+    then the mask persisted there for the volume file is used instead of computing one, and a computed mask is persisted there.
+    """
+    if streaming is None:
+        streaming = get_streaming_volume_loading_enabled()
+    foreground_mask, from_store = _read_or_compute_foreground_mask_of_file(volume_filepath, streaming, foreground_mask_store_dir)
+    volume_node, storage_node = read_volume_node(volume_filepath)
+    if foreground_mask is None or foreground_mask.shape != slicer.util.arrayFromVolume(volume_node).shape:
+        foreground_mask, from_store = compute_volume_foreground_mask(volume_node, streaming=streaming), False
+    if foreground_mask_store_dir is not None and not from_store:
+        save_foreground_mask_to_store(foreground_mask_store_dir, volume_filepath, foreground_mask)
+    return ReadVolume(volume_node, storage_node, foreground_mask, foreground_mask_store_dir)
+
+def hide_volume_background(volume_node:vtkMRMLScalarVolumeNode, foreground_mask:np.ndarray, masked:Optional[bool] = None) -> np.ndarray:
+    """Hide the background of a loaded volume given its foreground mask, either with `mask_volume_background` if `masked`
+    is set or else with `threshold_volume_by_precomputed_foreground_mask`. If `masked` is None then the mode comes from
+    the application settings, see `get_masked_background_thresholding_enabled`. In both modes the mask is attached to the
+    volume, so that later consumers find it with `get_volume_foreground_mask`.
+
+    Returns the foreground mask that downstream consumers should use, in correspondence with what you'd get from
+    slicer.util.arrayFromVolume on the volume node.
+    """
+    if masked is None:
+        masked = get_masked_background_thresholding_enabled()
+    if masked:
+        return mask_volume_background(volume_node, foreground_mask)
+    threshold_volume_by_precomputed_foreground_mask(volume_node, foreground_mask)
+    attach_foreground_mask(volume_node, foreground_mask)
+    return get_attached_foreground_mask(volume_node)
+
+def add_read_volume_to_scene_and_threshold_background(read_volume:ReadVolume, masked:Optional[bool] = None) -> Tuple[vtkMRMLScalarVolumeNode, np.ndarray]:
+    """Add a volume read by `read_volume_and_compute_foreground_mask` to the scene and threshold out its background.
+    Returns the same as `load_volume_and_threshold_background`. See `hide_volume_background` about `masked`."""
+    add_read_volume_node_to_scene(read_volume.volume_node, read_volume.storage_node)
+    if read_volume.foreground_mask_store_dir is not None:
+        set_foreground_mask_store_dir(read_volume.volume_node, read_volume.foreground_mask_store_dir)
+    foreground_mask = hide_volume_background(read_volume.volume_node, read_volume.foreground_mask, masked=masked)
+    return read_volume.volume_node, foreground_mask
+
+def load_volume_and_threshold_background(
+    volume_filepath,
+    streaming:Optional[bool] = None,
+    masked:Optional[bool] = None,
+    foreground_mask_store_dir:Optional[Path] = None,
+) -> Tuple[vtkMRMLScalarVolumeNode, np.ndarray]:
     """Load a volume node from file, and also set the background values to a certain value that can be threshoded out, and threshold it out.
     Returns the loaded volume node, as well as the foreground mask array. 
     The foreground mask array is in correspondence with what you'd get from slicer.util.arrayFromVolume on the volume node.
+    See `read_volume_and_compute_foreground_mask` about `streaming` and `foreground_mask_store_dir`, and
+    `hide_volume_background` about `masked`; in masked mode the background voxels are left as they are.
     """
+    if streaming is None:
+        streaming = get_streaming_volume_loading_enabled()
+    with BusyCursor():
+        foreground_mask, from_store = _read_or_compute_foreground_mask_of_file(volume_filepath, streaming, foreground_mask_store_dir)
     volume_node = slicer.util.loadVolume(volume_filepath)
     with BusyCursor():
-        foreground_mask = threshold_volume_by_foreground_mask(volume_node)
+        if foreground_mask is None or foreground_mask.shape != slicer.util.arrayFromVolume(volume_node).shape:
+            foreground_mask, from_store = compute_volume_foreground_mask(volume_node, streaming=streaming), False
+        if foreground_mask_store_dir is not None:
+            set_foreground_mask_store_dir(volume_node, foreground_mask_store_dir)
+            if not from_store:
+                save_foreground_mask_to_store(foreground_mask_store_dir, volume_filepath, foreground_mask)
+        foreground_mask = hide_volume_background(volume_node, foreground_mask, masked=masked)
     return volume_node, foreground_mask
@@ -0,0 +1,401 @@
+# Standard library imports
+import abc
+import json
+import logging
+import os
+import shutil
+import signal
+import tempfile
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+# Third-party imports
+import qt
+
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerProcess(abc.ABC):
+    """Runs a worker script with PythonSlicer in a separate process so that the Slicer GUI stays responsive, and reports
+    its progress and outcome through callbacks. Callbacks are invoked on the main thread from the Qt event loop.
+
+    Subclasses write the inputs of the worker into a temporary work directory and call `_start_worker`, and implement
+    `_read_outputs` to read the outputs back from the work directory once the worker exits. The work directory is
+    removed afterwards.
+
+    The worker script streams progress lines on its stdout, each consisting of `progress_line_prefix` followed by a JSON
+    object with "message", "value" and "maximum" keys. Its last progress line has a "success" key, along with an "error"
+    key if it failed. Any other output of the worker is logged and kept for error messages. On Unix the worker should
+    put itself in its own process group, so that `cancel` also stops any executables that it launched.
+
+    Args:
+        progress_callback: Called with (message, value, maximum) as the worker reports progress. A maximum of 0 means
+            the progress is indeterminate.
+        finished_callback: Called exactly once per started worker with (result, error_message, canceled).
+            The result is what `_read_outputs` returned, or None if the worker failed or was canceled.
+    """
+
+    description = "worker"
+    """What the worker does, for log and error messages, e.g. "solution computation"."""
+
+    progress_line_prefix = ""
+    """The prefix of the stdout lines on which the worker reports progress"""
+
+    work_dir_prefix = "openlifu-worker-"
+    """The prefix of the name of the temporary work directory"""
+
+    def __init__(
+        self,
+        progress_callback: Callable[[str, int, int], None],
+        finished_callback: Callable[[Any, str, bool], None],
+    ) -> None:
+        self.progress_callback = progress_callback
+        self.finished_callback = finished_callback
+
+        self._process = None
+        self._work_dir : Optional[Path] = None
+        self._background_canceled_processes = []
+        self._stdout_buffer = ""
+        self._stderr_buffer = ""
+        self._diagnostics: List[str] = []
+        self._child_succeeded = False
+        self._child_error = ""
+        self._process_error = ""
+
+    def is_active(self) -> bool:
+        return self._process is not None
+
+    @abc.abstractmethod
+    def _read_outputs(self, work_dir: Path) -> Any:
+        """Read the outputs that the worker wrote into its work directory. Called once the worker has exited successfully."""
+
+    def _start_worker(
+        self,
+        script_path: Path,
+        write_inputs: Callable[[Path], None],
+        extra_args: Sequence[str] = (),
+    ) -> None:
+        """Create the work directory, write the worker inputs into it, and launch the worker script with
+        `--work-dir <work directory>` followed by `extra_args`. Raises RuntimeError if the worker cannot be started.
+
+        Args:
+            script_path: The worker script, which must not import slicer
+            write_inputs: Called with the work directory to write the worker inputs into it
+            extra_args: Further command line arguments of the worker script
+        """
+        if self.is_active():
+            raise RuntimeError(f"A {self.description} is already in progress.")
+
+        python_slicer = shutil.which("PythonSlicer")
+        if python_slicer is None:
+            raise RuntimeError(f"Cannot run the {self.description} in the background: PythonSlicer was not found on PATH.")
+
+        self._reset_output_state()
+        self._work_dir = Path(tempfile.mkdtemp(prefix=self.work_dir_prefix))
+        try:
+            write_inputs(self._work_dir)
+        except Exception:
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+            raise
+
+        process = qt.QProcess()
+        process.readyReadStandardOutput.connect(self._on_stdout_ready)
+        process.readyReadStandardError.connect(self._on_stderr_ready)
+        process.finished.connect(self._on_finished)
+        process.errorOccurred.connect(self._on_process_error)
+        self._process = process
+
+        process.start(python_slicer, [str(script_path), "--work-dir", str(self._work_dir), *extra_args])
+        if not process.waitForStarted(3000):
+            error_message = process.errorString() or f"The {self.description} process failed to start."
+            self._process = None
+            self._disconnect_process_signals(process)
+            process.deleteLater()
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._work_dir = None
+            raise RuntimeError(error_message)
+
+    def cancel(self) -> None:
+        """Stop the worker process, along with any executables it launched, and report it as canceled.
+        The work directory is cleaned up once the worker has actually exited."""
+        process = self._process
+        if process is None:
+            return
+        work_dir = self._work_dir
+        self._process = None
+        self._work_dir = None
+
+        self._disconnect_process_signals(process)
+        if process.state() == qt.QProcess.NotRunning:
+            process.deleteLater()
+            if work_dir is not None:
+                shutil.rmtree(work_dir, ignore_errors=True)
+        else:
+            self._background_canceled_processes.append(process)
+
+            def cleanup_detached_process(*args, detached_process=process, detached_work_dir=work_dir):
+                self._cleanup_detached_process(detached_process, detached_work_dir)
+
+            process.finished.connect(cleanup_detached_process)
+            self._kill_process_group(process)
+
+        self.finished_callback(None, "", True)
+
+    def _kill_process_group(self, process) -> None:
+        pid = process.processId()
+        if hasattr(os, "killpg") and pid > 0:
+            try:
+                os.killpg(pid, signal.SIGKILL)
+                return
+            except (ProcessLookupError, PermissionError):
+                pass
+        # On Windows the worker is not in its own process group, so only the worker itself can be killed here.
+        process.kill()
+
+    def _cleanup_detached_process(self, process, work_dir: Optional[Path]) -> None:
+        try:
+            process.finished.disconnect()
+        except Exception:
+            pass
+        if process in self._background_canceled_processes:
+            self._background_canceled_processes.remove(process)
+        process.deleteLater()
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    def _disconnect_process_signals(self, process) -> None:
+        for signal_name in ("readyReadStandardOutput", "readyReadStandardError", "finished", "errorOccurred"):
+            try:
+                getattr(process, signal_name).disconnect()
+            except Exception:
+                pass
+
+    def _reset_output_state(self) -> None:
+        self._stdout_buffer = ""
+        self._stderr_buffer = ""
+        self._diagnostics = []
+        self._child_succeeded = False
+        self._child_error = ""
+        self._process_error = ""
+
+    def _on_stdout_ready(self) -> None:
+        process = self._process
+        if process is None:
+            return
+
+        self._stdout_buffer += process.readAllStandardOutput().data().decode("utf-8", errors="replace")
+        self._consume_stdout_lines()
+
+    def _on_stderr_ready(self) -> None:
+        process = self._process
+        if process is None:
+            return
+
+        self._stderr_buffer += process.readAllStandardError().data().decode("utf-8", errors="replace")
+        self._consume_stderr_lines()
+
+    def _consume_stdout_lines(self, flush: bool = False) -> None:
+        while "\n" in self._stdout_buffer:
+            line, self._stdout_buffer = self._stdout_buffer.split("\n", 1)
+            self._handle_stdout_line(line.rstrip("\r"))
+
+        if flush and self._stdout_buffer:
+            line = self._stdout_buffer
+            self._stdout_buffer = ""
+            self._handle_stdout_line(line.rstrip("\r"))
+
+    def _consume_stderr_lines(self, flush: bool = False) -> None:
+        while "\n" in self._stderr_buffer:
+            line, self._stderr_buffer = self._stderr_buffer.split("\n", 1)
+            self._append_diagnostic(line.rstrip("\r"))
+
+        if flush and self._stderr_buffer:
+            line = self._stderr_buffer
+            self._stderr_buffer = ""
+            self._append_diagnostic(line.rstrip("\r"))
+
+    def _append_diagnostic(self, line: str) -> None:
+        line = line.strip()
+        if not line:
+            return
+
+        logger.info("OpenLIFU %s: %s", self.description, line)
+        self._diagnostics.append(line)
+        self._diagnostics = self._diagnostics[-40:]
+
+    def _handle_stdout_line(self, line: str) -> None:
+        line = line.strip()
+        if not line:
+            return
+
+        if not line.startswith(self.progress_line_prefix):
+            self._append_diagnostic(line)
+            return
+
+        try:
+            progress_event = json.loads(line[len(self.progress_line_prefix):])
+        except json.JSONDecodeError as exc:
+            self._append_diagnostic(f"Could not parse progress line: {exc}: {line}")
+            return
+
+        if "success" in progress_event:
+            if progress_event["success"]:
+                self._child_succeeded = True
+            else:
+                self._child_error = str(
+                    progress_event.get("error") or progress_event.get("message") or f"{self.description.capitalize()} failed."
+                )
+            return
+
+        message = str(progress_event.get("message") or "")
+        value = int(progress_event.get("value") or 0)
+        maximum = int(progress_event.get("maximum") or 0)
+        self.progress_callback(message, value, maximum)
+
+    def _on_process_error(self, process_error) -> None:
+        process = self._process
+        if process is not None:
+            self._process_error = process.errorString()
+
+    def _on_finished(self, *args) -> None:
+        process = self._process
+        if process is None:
+            return
+
+        self._on_stdout_ready()
+        self._on_stderr_ready()
+        self._consume_stdout_lines(flush=True)
+        self._consume_stderr_lines(flush=True)
+
+        exit_code = args[0] if args else process.exitCode()
+        work_dir = self._work_dir
+        self._process = None
+        self._work_dir = None
+        process.deleteLater()
+
+        result = None
+        error_message = ""
+        try:
+            if self._child_succeeded and not self._child_error and exit_code == 0:
+                try:
+                    result = self._read_outputs(work_dir)
+                except Exception as exc:
+                    error_message = f"Could not read the outputs of the {self.description}: {exc}"
+            else:
+                error_message = self._failure_message(exit_code)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        self.finished_callback(result, error_message, False)
+
+    def _failure_message(self, exit_code: int) -> str:
+        if self._child_error:
+            message = self._child_error
+        elif self._process_error:
+            message = self._process_error
+        elif exit_code != 0:
+            message = f"{self.description.capitalize()} subprocess failed with exit code {exit_code}."
+        else:
+            message = f"{self.description.capitalize()} subprocess finished without reporting success."
+
+        if self._diagnostics:
+            message += "\n\nChild process output:\n" + "\n".join(self._diagnostics[-10:])
+        return message
+
+
+class WorkerPool(abc.ABC):
+    """Runs several jobs, each in its own `WorkerProcess`, with at most `max_workers` of them running at once.
+
+    Subclasses implement `_create_process` and `_start_process`. Each job must have a `key` attribute that tells it apart
+    from the other jobs.
+
+    Args:
+        max_workers: The maximum number of worker processes to run at the same time.
+        progress_callback: Called with (job key, message, value, maximum) as a worker reports progress.
+        job_finished_callback: Called with (job key, result, error_message, canceled) as each job ends.
+            See `WorkerProcess` for the meaning of the last three arguments.
+        finished_callback: Called with no arguments once every job has ended.
+    """
+
+    description = "worker"
+    """What the workers do, for error messages, e.g. "solution computation"."""
+
+    def __init__(
+        self,
+        max_workers: int,
+        progress_callback: Callable[[str, str, int, int], None],
+        job_finished_callback: Callable[[str, Any, str, bool], None],
+        finished_callback: Callable[[], None],
+    ) -> None:
+        if max_workers < 1:
+            raise ValueError(f"A {self.description} pool needs at least one worker.")
+        self.max_workers = max_workers
+        self.progress_callback = progress_callback
+        self.job_finished_callback = job_finished_callback
+        self.finished_callback = finished_callback
+
+        self._queued_jobs : List[Any] = []
+        self._running : Dict[str, WorkerProcess] = {}
+
+    def is_active(self) -> bool:
+        return bool(self._queued_jobs or self._running)
+
+    @abc.abstractmethod
+    def _create_process(
+        self,
+        progress_callback: Callable[[str, int, int], None],
+        finished_callback: Callable[[Any, str, bool], None],
+    ) -> WorkerProcess:
+        """Create the worker process that will run a job"""
+
+    @abc.abstractmethod
+    def _start_process(self, process: WorkerProcess, job: Any) -> None:
+        """Start the worker process of a job. Raises an exception if the worker cannot be started."""
+
+    def start(self, jobs: Sequence[Any]) -> None:
+        """Queue the given jobs and start as many of them as the worker bound allows."""
+        if self.is_active():
+            raise RuntimeError(f"The {self.description} pool is already running.")
+        if len({job.key for job in jobs}) != len(jobs):
+            raise ValueError(f"{self.description.capitalize()} job keys must be unique.")
+        self._queued_jobs = list(jobs)
+        if not self._queued_jobs:
+            self._on_all_jobs_finished()
+            return
+        self._start_queued_jobs()
+
+    def cancel(self) -> None:
+        """Cancel the running jobs and drop the queued ones. Each of them is reported as canceled."""
+        queued_jobs = self._queued_jobs
+        self._queued_jobs = []
+        for job in queued_jobs:
+            self.job_finished_callback(job.key, None, "", True)
+        for process in list(self._running.values()):
+            process.cancel() # this reports the job as canceled and ends up calling finished_callback once nothing is left
+
+    def _start_queued_jobs(self) -> None:
+        while self._queued_jobs and len(self._running) < self.max_workers:
+            job = self._queued_jobs.pop(0)
+            process = self._create_process(
+                progress_callback = lambda message, value, maximum, key=job.key : self.progress_callback(key, message, value, maximum),
+                finished_callback = lambda result, error_message, canceled, key=job.key : self._on_job_finished(key, result, error_message, canceled),
+            )
+            self._running[job.key] = process
+            try:
+                self._start_process(process, job)
+            except Exception as e:
+                del self._running[job.key]
+                self.job_finished_callback(job.key, None, str(e), False)
+
+        if not self.is_active():
+            self._on_all_jobs_finished()
+
+    def _on_job_finished(self, key: str, result: Any, error_message: str, canceled: bool) -> None:
+        self._running.pop(key, None)
+        self.job_finished_callback(key, result, error_message, canceled)
+        self._start_queued_jobs()
+
+    def _on_all_jobs_finished(self) -> None:
+        self.finished_callback()
@@ -1,7 +1,7 @@
 # Standard library imports
 from collections import defaultdict
 from functools import partial
-from typing import Callable, Optional, TYPE_CHECKING, Dict, List, Union
+from typing import Any, Callable, NamedTuple, Optional, TYPE_CHECKING, Dict, List, Tuple, Union
 
 # Third-party imports
 import qt
@@ -30,16 +30,25 @@ from OpenLIFULib import (
     get_openlifu_data_parameter_node,
     get_target_candidates,
 )
-from OpenLIFULib.coordinate_system_utils import get_IJK2RAS
+from OpenLIFULib.coordinate_system_utils import get_IJK2RAS, numpy_to_vtk_polydata
 from OpenLIFULib.events import SlicerOpenLIFUEvents
 from OpenLIFULib.guided_mode_util import GuidedWorkflowMixin
-from OpenLIFULib.skinseg import get_skin_segmentation, generate_skin_segmentation
+from OpenLIFULib.profiling import profile_span, profiled, start_span
+from OpenLIFULib.skinseg import SkinMeshLOD, get_skin_mesh, get_skin_segmentation, generate_skin_segmentation
 from OpenLIFULib.targets import fiducial_to_openlifu_point_id
 from OpenLIFULib.transform_conversion import transducer_transform_node_from_openlifu
 from OpenLIFULib.user_account_mode_util import UserAccountBanner
+from OpenLIFULib.virtual_fit_compute import (
+    DEFAULT_VIRTUAL_FIT_MAX_WORKERS,
+    VirtualFitComputationResult,
+    VirtualFitJob,
+    VirtualFitPool,
+    VirtualFitProcess,
+)
 from OpenLIFULib.util import (
     BusyCursor,
     add_slicer_log_handler,
+    display_errors,
     replace_widget,
 )
 from OpenLIFULib.notifications import notify
@@ -126,6 +135,10 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
 
         self._vf_interaction_in_progress = False
 
+        self._virtual_fit_progress : Dict[str, Tuple[int,str]] = {}
+        """Mapping from target node ID to the latest (progress_percent, step_description) of the background virtual fit
+        of that target, for the virtual fits that are running"""
+
     def setup(self) -> None:
         """Called when the user opens the module the first time and the widget is initialized."""
         ScriptedLoadableModuleWidget.setup(self)
@@ -239,6 +252,8 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
 
     def cleanup(self) -> None:
         """Called when the application closes and the module widget is destroyed."""
+        self.logic.cancelVirtualFit()
+        self.logic.cancelVirtualFitMany()
         self.removeObservers()
 
     def enter(self) -> None:
@@ -257,6 +272,9 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
 
     def onSceneStartClose(self, caller, event) -> None:
         """Called just before the scene is closed."""
+        # The targets that are being fitted are going away
+        self.logic.cancelVirtualFit()
+        self.logic.cancelVirtualFitMany()
         # Parameter node will be reset, do not use it anymore
         self.setParameterNode(None)
 
@@ -307,6 +325,7 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
             return
         if node.IsA('vtkMRMLMarkupsFiducialNode'):
             self.unwatch_fiducial_node(node)
+            self.logic.cancelVirtualFit(target = node)
 
             data_logic : "OpenLIFUDataLogic" = slicer.util.getModuleLogic('OpenLIFUData')
             if not data_logic.session_loading_unloading_in_progress:
@@ -366,7 +385,10 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         target_id = fiducial_to_openlifu_point_id(target)
         session = get_openlifu_data_parameter_node().loaded_session
         session_id = None if session is None else session.get_session_id()
-        
+
+        # A virtual fit that is running for the target would no longer describe it
+        self.logic.cancelVirtualFit(target = target)
+
         if list(get_virtual_fit_result_nodes(target_id, session_id)):
             self.logic.clear_virtual_fit_results(target = target)
             self.updateWorkflowControls()
@@ -583,8 +605,14 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
             
             else:
                 self.ui.virtualfitButton.enabled = True
-                self.ui.virtualfitButton.setToolTip("Run virtual fit algorithm to automatically suggest a transducer positioning." \
-                    "Any existing virtual fit results for the selected target will be removed.")
+                # While the selected target is being fitted in the background, the virtual fit button serves to cancel it
+                if self.logic.is_virtual_fitting(self.algorithm_input_widget.get_current_data()["Target"]):
+                    self.ui.virtualfitButton.text = "Cancel auto-fitting algorithm"
+                    self.ui.virtualfitButton.setToolTip("Stop the virtual fit of the selected target that is running in the background")
+                else:
+                    self.ui.virtualfitButton.text = "Run auto-fitting algorithm"
+                    self.ui.virtualfitButton.setToolTip("Run virtual fit algorithm to automatically suggest a transducer positioning." \
+                        "Any existing virtual fit results for the selected target will be removed.")
                 self.ui.addTransformPushButton.enabled=True
                 self.ui.addTransformPushButton.setToolTip("Add a new transducer transform to the table, to be manually positioned.")
                 
@@ -682,6 +710,15 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         self.ui.virtualFitProgressBar.show()
         self.ui.virtualFitProgressStatusLabel.show()
 
+    def updateVirtualFitProgressDisplay(self):
+        """Show the progress of the background virtual fit of the selected target, if there is one running."""
+        target = self.algorithm_input_widget.get_current_data()["Target"]
+        if target is None or target.GetID() not in self._virtual_fit_progress:
+            self.resetVirtualFitProgressDisplay()
+            return
+        value, status_text = self._virtual_fit_progress[target.GetID()]
+        self.setVirtualFitProgressDisplay(value = value, status_text = status_text)
+
     def updateVirtualFitResultsTable(self):
         """ Updates the list of virtual list results shown. This is dependent on the 
         currently selected target in the algorithm inputs."""
@@ -690,6 +727,8 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         if self._input_update_in_progress:
             return
 
+        self.updateVirtualFitProgressDisplay()
+
         most_recent_selection = self.ui.virtualFitResultTable.currentRow
         self.ui.virtualFitResultTable.clearContents()
         self.ui.virtualFitResultTable.setRowCount(0) # Remove all rows
@@ -755,6 +794,10 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         self.ui.virtualFitResultTable.selectRow(selected_item[0].row())
         
     def onRunAutoFitClicked(self):  
+        target = self.algorithm_input_widget.get_current_data()["Target"]
+        if self.logic.is_virtual_fitting(target):
+            self.logic.cancelVirtualFit(target = target)
+            return
         self.create_virtual_fit_result(auto_fit = True)
     
     def onAddVirtualFitResultClicked(self):
@@ -769,30 +812,37 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         target = activeData["Target"]
 
         if auto_fit:
-            virtual_fit_result = self.run_virtual_fit_algorithm(
+            # The fitting algorithm runs in the background, and its results are shown by onVirtualFitFinished
+            self.run_virtual_fit_algorithm(
                 protocol = protocol,
                 transducer = transducer,
                 volume = volume,
                 target = target
             )
-            if virtual_fit_result is None:
-                slicer.util.errorDisplay("Fitting algorithm failed. No viable transducer positions found.")
-                return
-        else:
-            virtual_fit_result = self.logic.create_manual_virtual_fit_result(
-                transducer = transducer,
-                volume = volume,
-                target = target)
-        
-        # If running the fitting algorithm, defaults to the rank 1 virtual fit result
+            return
+
+        virtual_fit_result = self.logic.create_manual_virtual_fit_result(
+            transducer = transducer,
+            volume = volume,
+            target = target)
+        self.showVirtualFitResult(virtual_fit_result, transducer, volume)
+
+    def showVirtualFitResult(
+        self,
+        virtual_fit_result: vtkMRMLTransformNode,
+        transducer: SlicerOpenLIFUTransducer,
+        volume: vtkMRMLScalarVolumeNode,
+    ) -> None:
+        """Move the transducer to a new virtual fit result of the selected target, select it in the results table, and
+        display the skin segmentation and transducer."""
         transducer.set_current_transform_to_match_transform_node(virtual_fit_result)
         self.watchVirtualFit(virtual_fit_result)
         self.updateVirtualFitResultsTable()
         self.setCurrentVirtualFitSelection(virtual_fit_result)
 
         # Display the skin segmentation and transducer
-        self.showSkin(activeData["Volume"])
-        activeData["Transducer"].set_visibility(True)
+        self.showSkin(volume)
+        transducer.set_visibility(True)
 
         self.updateApprovalStatusLabel()
         self.updateWorkflowControls()
@@ -815,29 +865,71 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
         transducer: SlicerOpenLIFUTransducer,
         volume: vtkMRMLScalarVolumeNode,
         target: vtkMRMLMarkupsFiducialNode
-        ):
-
-        def progress_callback(progress_percent:int, step_description:str) -> None:
-            self.setVirtualFitProgressDisplay(value = progress_percent, status_text = step_description)
-            slicer.app.processEvents()
+        ) -> None:
+        """Start the virtual fit of the target in a worker process. Targets can keep being placed and edited while it
+        runs, and its results are shown by `onVirtualFitFinished`."""
 
         target_id = fiducial_to_openlifu_point_id(target)
-        notify(f"Removing any existing virtual fit results for {target_id}.")
+        target_node_id = target.GetID()
+        notify(f"Any existing virtual fit results for {target_id} will be replaced when the virtual fit finishes.")
 
-        with BusyCursor():
-            try:
-                virtual_fit_result : Optional[vtkMRMLTransformNode] = self.logic.virtual_fit(
+        self._virtual_fit_progress[target_node_id] = (0, "Starting")
+        try:
+            with BusyCursor(): # Getting the skin mesh happens here, and it may need to be generated first
+                self.logic.virtual_fit_async(
                     protocol = protocol,
                     transducer = transducer,
                     volume = volume,
                     target = target,
-                    progress_callback = progress_callback,
                     include_debug_info = self.ui.virtualfitDebugCheckbox.checked,
+                    progress_callback = partial(self.onVirtualFitProgress, target_node_id),
+                    finished_callback = partial(self.onVirtualFitFinished, target, transducer, volume),
                 )
-            finally:
-                self.resetVirtualFitProgressDisplay()
-        
-        return virtual_fit_result
+        except Exception:
+            self._virtual_fit_progress.pop(target_node_id, None)
+            raise
+        finally:
+            self.updateVirtualFitProgressDisplay()
+            self.updateVirtualfitButtons()
+
+    def onVirtualFitProgress(self, target_node_id: str, progress_percent: int, step_description: str) -> None:
+        self._virtual_fit_progress[target_node_id] = (progress_percent, step_description)
+        self.updateVirtualFitProgressDisplay()
+
+    @display_errors
+    def onVirtualFitFinished(
+        self,
+        target: vtkMRMLMarkupsFiducialNode,
+        transducer: SlicerOpenLIFUTransducer,
+        volume: vtkMRMLScalarVolumeNode,
+        virtual_fit_result: Optional[vtkMRMLTransformNode],
+        error_message: str,
+        canceled: bool,
+    ) -> None:
+        self._virtual_fit_progress.pop(target.GetID(), None)
+        self.updateVirtualFitProgressDisplay()
+        self.updateVirtualfitButtons()
+
+        target_id = fiducial_to_openlifu_point_id(target)
+        if canceled:
+            notify(f"Virtual fit of {target_id} canceled.")
+            return
+        if error_message:
+            raise RuntimeError(f"The virtual fit of {target_id} could not be completed:\n{error_message}")
+        if virtual_fit_result is None:
+            slicer.util.errorDisplay("Fitting algorithm failed. No viable transducer positions found.")
+            return
+
+        if self.algorithm_input_widget.get_current_data()["Target"] is target:
+            # Defaults to the rank 1 virtual fit result
+            self.showVirtualFitResult(virtual_fit_result, transducer, volume)
+        else:
+            # Another target was selected in the meantime, so leave the transducer where the user has it now
+            self.watchVirtualFit(virtual_fit_result)
+            self.updateVirtualFitResultsTable()
+            self.updateApprovalStatusLabel()
+            self.updateWorkflowControls()
+            notify(f"Virtual fit of {target_id} finished.")
 
     def onVirtualFitResultSelected(self):
         """Updates the transducer transform to match the currently selected virtual fit result"""
@@ -953,6 +1045,19 @@ class OpenLIFUPrePlanningWidget(ScriptedLoadableModuleWidget, VTKObservationMixi
 #
 
 
+class BatchVirtualFitTargetResult(NamedTuple):
+    """The outcome of the virtual fit of one target in a batch. See `OpenLIFUPrePlanningLogic.virtual_fit_many`."""
+    target_id : str
+    target_node : vtkMRMLMarkupsFiducialNode
+    target_position : List[float]
+    """The world position of the target at the time the virtual fit started"""
+    virtual_fit_result : Optional[vtkMRMLTransformNode] = None
+    """The best virtual fit result node, or None while the virtual fit is running, or if it failed, was canceled, found no
+    viable transducer positions, or the target changed in the meantime"""
+    error_message : str = ""
+    canceled : bool = False
+
+
 class OpenLIFUPrePlanningLogic(ScriptedLoadableModuleLogic):
     """This class should implement all the actual
     computation done by your module.  The interface
@@ -973,6 +1078,15 @@ class OpenLIFUPrePlanningLogic(ScriptedLoadableModuleLogic):
         self._on_chosen_virtual_fit_changed_callbacks : List[Callable[[Optional[vtkMRMLTransformNode]],None]] = []
         """List of functions to call when `chosen_virtual_fit` property is changed."""
 
+        self._virtual_fit_processes : Dict[str, VirtualFitProcess] = {}
+        """Mapping from target node ID to the background virtual fit of that target, if one is running. See `virtual_fit_async`."""
+
+        self._batch_virtual_fit_pool : Optional[VirtualFitPool] = None
+        """The batch of background virtual fits that is currently running, if any. See `virtual_fit_many`."""
+
+        self.batch_virtual_fit_results : Dict[str, BatchVirtualFitTargetResult] = {}
+        """Mapping from target ID to the outcome of its virtual fit, from the most recent `virtual_fit_many`"""
+
     def getParameterNode(self):
         return OpenLIFUPrePlanningParameterNode(super().getParameterNode())
 
@@ -1090,6 +1204,7 @@ class OpenLIFUPrePlanningLogic(ScriptedLoadableModuleLogic):
 
         return vf_result_node
 
+    @profiled("virtual fit")
     def virtual_fit(
         self,
         protocol: SlicerOpenLIFUProtocol,
@@ -1100,33 +1215,24 @@ class OpenLIFUPrePlanningLogic(ScriptedLoadableModuleLogic):
         include_debug_info : bool,
     ) -> Optional[vtkMRMLTransformNode]:
 
-        add_slicer_log_handler("VirtualFit", "Virtual fitting")
+        if self.is_virtual_fitting(target) or self._is_virtual_fitting_in_batch(target):
+            raise RuntimeError(f"A virtual fit is already in progress for {target.GetName()}.")
 
-        transducer_openlifu : "openlifu.xdc.Transducer" = transducer.transducer.transducer
-        protocol_openlifu : "openlifu.plan.Protocol" = protocol.protocol
-
-        units = "mm" # These are the units of the output space of the transform returned by get_IJK2RAS
+        add_slicer_log_handler("VirtualFit", "Virtual fitting")
 
-        # Get the skin mesh associated with the volume
-        skin_mesh_node = get_skin_segmentation(volume)
-        if skin_mesh_node is None:
-            skin_mesh_node = generate_skin_segmentation(volume)
+        virtual_fit_inputs = self._get_virtual_fit_inputs(protocol, transducer, volume, target)
 
         import openlifu.seg
         import threadpoolctl
 
-        with threadpoolctl.threadpool_limits(limits=1): # caps BLAS and OpenMP threads
+        with profile_span("run_virtual_fit"), threadpoolctl.threadpool_limits(limits=1): # caps BLAS and OpenMP threads
             # Capping BLAS threads appears to have a performance improvement when running this algorithm in Slicer.
             # This may be because Slicer already occupies BLAS threads with its VTK/ITK stuff and so the virtual fit's many
             # tiny svd calls end up having more overhead than is worth it.
             # For some unknown reason, the improvement is only noticable when we do not use the embree
             # option in virtual fitting, which makes things very fast.
             vf_transforms = openlifu.seg.run_virtual_fit(
-                units = units,
-                target_RAS = target.GetNthControlPointPosition(0),
-                standoff_transform = transducer_openlifu.get_standoff_transform_in_units(units),
-                options = protocol_openlifu.virtual_fit_options,
-                skin_mesh = skin_mesh_node.GetPolyData(),
+                **virtual_fit_inputs,
                 progress_callback = progress_callback,
                 include_debug_info = include_debug_info,
             )
@@ -1134,6 +1240,279 @@ class OpenLIFUPrePlanningLogic(ScriptedLoadableModuleLogic):
             vf_transforms, debug_info = vf_transforms # In this case two things were actually returned, the first of which is the list of transforms
             self.load_vf_debugging_info(debug_info)
 
+        return self._add_virtual_fit_results(vf_transforms, transducer, target)
+
+    def virtual_fit_async(
+        self,
+        protocol: SlicerOpenLIFUProtocol,
+        transducer : SlicerOpenLIFUTransducer,
+        volume: vtkMRMLScalarVolumeNode,
+        target: vtkMRMLMarkupsFiducialNode,
+        include_debug_info : bool = False,
+        progress_callback : Optional[Callable[[int,str],None]] = None,
+        finished_callback : Optional[Callable[[Optional[vtkMRMLTransformNode], str, bool],None]] = None,
+    ) -> None:
+        """Like `virtual_fit`, but run the virtual fit algorithm in a worker process and return immediately.
+
+        Only getting the skin mesh happens here, which may require generating the skin segmentation. The virtual fit
+        result nodes are added when the worker finishes, so the scene can keep being edited in the meantime. Virtual fits
+        of different targets can run at the same time, but a target that is being fitted, here or by `virtual_fit_many`,
+        cannot be fitted again until that virtual fit ends.
+
+        Args:
+            progress_callback: Called with (progress_percent, step_description) as the virtual fit progresses.
+            finished_callback: Called with (virtual_fit_result, error_message, canceled) once the virtual fit ends, where
+                virtual_fit_result is the best virtual fit result node, like the return value of `virtual_fit`. It is None
+                if the virtual fit failed, was canceled, or found no viable transducer positions, or if the target was moved
+                or removed or the session changed while it ran, since the result would then no longer describe the scene.
+        """
+        if self.is_virtual_fitting(target) or self._is_virtual_fitting_in_batch(target):
+            raise RuntimeError(f"A virtual fit is already in progress for {target.GetName()}.")
+
+        add_slicer_log_handler("VirtualFit", "Virtual fitting")
+
+        # The virtual fit ends in a callback, so the timing span is started and finished by hand
+        virtual_fit_span = start_span("virtual fit")
+        with profile_span("prepare virtual fit inputs", parent=virtual_fit_span):
+            virtual_fit_inputs = self._get_virtual_fit_inputs(protocol, transducer, volume, target)
+
+        target_node_id = target.GetID()
+        target_position_at_start = [0.0, 0.0, 0.0]
+        target.GetNthControlPointPositionWorld(0, target_position_at_start)
+        session = get_openlifu_data_parameter_node().loaded_session
+        session_id_at_start = session.get_session_id() if session is not None else None
+
+        def inputs_unchanged() -> bool:
+            if not (slicer.mrmlScene.IsNodePresent(transducer.transform_node) and slicer.mrmlScene.IsNodePresent(target)):
+                return False
+            if target.GetNumberOfControlPoints() != 1:
+                return False
+            target_position = [0.0, 0.0, 0.0]
+            target.GetNthControlPointPositionWorld(0, target_position)
+            session = get_openlifu_data_parameter_node().loaded_session
+            session_id = session.get_session_id() if session is not None else None
+            return target_position == target_position_at_start and session_id == session_id_at_start
+
+        def on_progress(message:str, value:int, maximum:int) -> None:
+            if progress_callback is not None:
+                progress_callback(value, message)
+
+        def on_finished(result:Optional[VirtualFitComputationResult], error_message:str, canceled:bool) -> None:
+            self._virtual_fit_processes.pop(target_node_id, None)
+            worker_span.finish(error = "canceled" if canceled else (error_message or None))
+            virtual_fit_result = None
+            if result is not None:
+                if inputs_unchanged():
+                    with profile_span("add virtual fit results", parent=virtual_fit_span):
+                        if result.debug_info is not None:
+                            self.load_vf_debugging_info(result.debug_info)
+                        virtual_fit_result = self._add_virtual_fit_results(result.transforms, transducer, target)
+                else:
+                    error_message = "The target or session changed while the virtual fit was running, so the result was discarded."
+            virtual_fit_span.finish(error = "canceled" if canceled else (error_message or None))
+            if finished_callback is not None:
+                finished_callback(virtual_fit_result, error_message, canceled)
+
+        virtual_fit_process = VirtualFitProcess(progress_callback = on_progress, finished_callback = on_finished)
+        worker_span = start_span("run_virtual_fit (worker process)", parent=virtual_fit_span)
+        try:
+            virtual_fit_process.start(**virtual_fit_inputs, include_debug_info = include_debug_info)
+        except Exception as e:
+            worker_span.finish(error = str(e))
+            virtual_fit_span.finish(error = str(e))
+            raise
+        self._virtual_fit_processes[target_node_id] = virtual_fit_process
+
+    def virtual_fit_many(
+        self,
+        protocol: SlicerOpenLIFUProtocol,
+        transducer : SlicerOpenLIFUTransducer,
+        volume: vtkMRMLScalarVolumeNode,
+        targets: List[vtkMRMLMarkupsFiducialNode],
+        max_workers : int = DEFAULT_VIRTUAL_FIT_MAX_WORKERS,
+        progress_callback : Optional[Callable[[str,int,str],None]] = None,
+        target_finished_callback : Optional[Callable[[BatchVirtualFitTargetResult],None]] = None,
+        finished_callback : Optional[Callable[[Dict[str,BatchVirtualFitTargetResult]],None]] = None,
+    ) -> List[str]:
+        """Run the virtual fit of several targets in the background, each in its own worker process, with at most
+        `max_workers` of them running at once.
+
+        The skin mesh is looked up (or generated) once and written once for all of the targets, as are the rest of the
+        inputs that do not depend on the target. When all of the virtual fits have ended, the results of every target that
+        is unchanged are added in one pass, replacing its previous virtual fit results, ranked as by `virtual_fit`. The
+        outcomes are collected into `batch_virtual_fit_results`. None of the targets may be in a virtual fit started by
+        `virtual_fit_async`, and none of them can be fitted by `virtual_fit_async` until the batch ends.
+
+        Args:
+            progress_callback: Called with (target ID, progress_percent, step_description) as the virtual fit of a
+                target progresses.
+            target_finished_callback: Called with the `BatchVirtualFitTargetResult` of each target once its results were
+                added, or once it failed or was canceled.
+            finished_callback: Called with `batch_virtual_fit_results` once the virtual fits of all targets have ended.
+
+        Returns the IDs of the targets that are being fitted.
+        """
+        if self.is_virtual_fitting_many():
+            raise RuntimeError("A batch virtual fit is already in progress.")
+        if len(targets) == 0:
+            raise RuntimeError("There are no targets to fit.")
+        targets_being_fitted = [target.GetName() for target in targets if self.is_virtual_fitting(target)]
+        if targets_being_fitted:
+            raise RuntimeError(f"A virtual fit is already in progress for {', '.join(targets_being_fitted)}.")
+
+        add_slicer_log_handler("VirtualFit", "Virtual fitting")
+
+        # The virtual fits end in a callback, so the timing span is started and finished by hand
+        batch_span = start_span("virtual fit many")
+        with profile_span("prepare virtual fit inputs", parent=batch_span):
+            shared_inputs = self._get_virtual_fit_inputs(protocol, transducer, volume, targets[0])
+        del shared_inputs["target_RAS"]
+
+        session = get_openlifu_data_parameter_node().loaded_session
+        session_id_at_start = session.get_session_id() if session is not None else None
+
+        self.batch_virtual_fit_results = {}
+        jobs : List[VirtualFitJob] = []
+        for target in targets:
+            target_id = fiducial_to_openlifu_point_id(target)
+            target_position = [0.0, 0.0, 0.0]
+            target.GetNthControlPointPositionWorld(0, target_position)
+            self.batch_virtual_fit_results[target_id] = BatchVirtualFitTargetResult(
+                target_id = target_id,
+                target_node = target,
+                target_position = target_position,
+            )
+            jobs.append(VirtualFitJob(key = target_id, target_RAS = target.GetNthControlPointPosition(0)))
+
+        def target_unchanged(target_result:BatchVirtualFitTargetResult) -> bool:
+            target = target_result.target_node
+            if not (slicer.mrmlScene.IsNodePresent(transducer.transform_node) and slicer.mrmlScene.IsNodePresent(target)):
+                return False
+            if target.GetNumberOfControlPoints() != 1 or fiducial_to_openlifu_point_id(target) != target_result.target_id:
+                return False
+            target_position = [0.0, 0.0, 0.0]
+            target.GetNthControlPointPositionWorld(0, target_position)
+            session = get_openlifu_data_parameter_node().loaded_session
+            session_id = session.get_session_id() if session is not None else None
+            return target_position == target_result.target_position and session_id == session_id_at_start
+
+        computed_transforms : Dict[str, List[np.ndarray]] = {}
+
+        def on_job_finished(target_id:str, result:Optional[VirtualFitComputationResult], error_message:str, canceled:bool) -> None:
+            if result is not None:
+                computed_transforms[target_id] = result.transforms
+                return # reported once the results are added
+            target_result = self.batch_virtual_fit_results[target_id]._replace(error_message = error_message, canceled = canceled)
+            self.batch_virtual_fit_results[target_id] = target_result
+            if target_finished_callback is not None:
+                target_finished_callback(target_result)
+
+        def on_finished() -> None:
+            self._batch_virtual_fit_pool = None
+            with profile_span("add virtual fit results", parent=batch_span):
+                for target_id, vf_transforms in computed_transforms.items():
+                    target_result = self.batch_virtual_fit_results[target_id]
+                    if target_unchanged(target_result):
+                        target_result = target_result._replace(
+                            virtual_fit_result = self._add_virtual_fit_results(vf_transforms, transducer, target_result.target_node),
+                        )
+                    else:
+                        target_result = target_result._replace(
+                            error_message = "The target or session changed while the virtual fit was running, so the result was discarded.",
+                        )
+                    self.batch_virtual_fit_results[target_id] = target_result
+                    if target_finished_callback is not None:
+                        target_finished_callback(target_result)
+            batch_span.finish()
+            if finished_callback is not None:
+                finished_callback(self.batch_virtual_fit_results)
+
+        self._batch_virtual_fit_pool = VirtualFitPool(
+            max_workers = max_workers,
+            progress_callback = lambda target_id, message, value, maximum : (
+                progress_callback(target_id, value, message) if progress_callback is not None else None
+            ),
+            job_finished_callback = on_job_finished,
+            finished_callback = on_finished,
+        )
+        try:
+            self._batch_virtual_fit_pool.start(jobs, **shared_inputs)
+        except Exception as e:
+            self._batch_virtual_fit_pool = None
+            batch_span.finish(error = str(e))
+            raise
+
+        return [job.key for job in jobs]
+
+    def is_virtual_fitting_many(self) -> bool:
+        """Whether the batch virtual fit started by `virtual_fit_many` is still running."""
+        return self._batch_virtual_fit_pool is not None and self._batch_virtual_fit_pool.is_active()
+
+    def _is_virtual_fitting_in_batch(self, target: vtkMRMLMarkupsFiducialNode) -> bool:
+        """Whether the given target is one of the targets of the batch virtual fit started by `virtual_fit_many`, and the
+        batch is still running."""
+        return self.is_virtual_fitting_many() and any(
+            target_result.target_node.GetID() == target.GetID() for target_result in self.batch_virtual_fit_results.values()
+        )
+
+    def cancelVirtualFitMany(self) -> None:
+        """Cancel the batch virtual fit started by `virtual_fit_many`, if there is one running."""
+        if self._batch_virtual_fit_pool is not None:
+            self._batch_virtual_fit_pool.cancel()
+
+    def is_virtual_fitting(self, target: Optional[vtkMRMLMarkupsFiducialNode] = None) -> bool:
+        """Whether a virtual fit started by `virtual_fit_async` is still running for the given target, or for any target
+        if no target is given."""
+        if target is None:
+            return any(process.is_active() for process in self._virtual_fit_processes.values())
+        process = self._virtual_fit_processes.get(target.GetID())
+        return process is not None and process.is_active()
+
+    def cancelVirtualFit(self, target: Optional[vtkMRMLMarkupsFiducialNode] = None) -> None:
+        """Cancel the virtual fit started by `virtual_fit_async` for the given target, or all of them if no target is given."""
+        if target is None:
+            processes = list(self._virtual_fit_processes.values())
+        else:
+            processes = [self._virtual_fit_processes[target.GetID()]] if target.GetID() in self._virtual_fit_processes else []
+        for process in processes:
+            process.cancel()
+
+    def _get_virtual_fit_inputs(
+        self,
+        protocol: SlicerOpenLIFUProtocol,
+        transducer : SlicerOpenLIFUTransducer,
+        volume: vtkMRMLScalarVolumeNode,
+        target: vtkMRMLMarkupsFiducialNode,
+    ) -> Dict[str,Any]:
+        """Get the arguments of `openlifu.seg.run_virtual_fit` that describe the virtual fit problem, generating the skin
+        segmentation of the volume if it does not exist yet."""
+        transducer_openlifu : "openlifu.xdc.Transducer" = transducer.transducer.transducer
+        protocol_openlifu : "openlifu.plan.Protocol" = protocol.protocol
+
+        units = "mm" # These are the units of the output space of the transform returned by get_IJK2RAS
+
+        # Get the skin mesh associated with the volume
+        skin_mesh_node = get_skin_segmentation(volume)
+        if skin_mesh_node is None:
+            with profile_span("generate skin segmentation"):
+                skin_mesh_node = generate_skin_segmentation(volume)
+
+        return {
+            "units" : units,
+            "target_RAS" : target.GetNthControlPointPosition(0),
+            "standoff_transform" : transducer_openlifu.get_standoff_transform_in_units(units),
+            "options" : protocol_openlifu.virtual_fit_options,
+            "skin_mesh" : get_skin_mesh(skin_mesh_node, SkinMeshLOD.FINE),
+        }
+
+    def _add_virtual_fit_results(
+        self,
+        vf_transforms : List[np.ndarray],
+        transducer : SlicerOpenLIFUTransducer,
+        target: vtkMRMLMarkupsFiducialNode,
+    ) -> Optional[vtkMRMLTransformNode]:
+        """Replace the virtual fit results of the target by the given transducer transforms, best first, and return the
+        best virtual fit result node. Returns None if there are no transforms."""
         session = get_openlifu_data_parameter_node().loaded_session
         session_id : Optional[str] = session.get_session_id() if session is not None else None
 
@@ -1179,31 +1558,15 @@ class OpenLIFUPrePlanningLogic(ScriptedLoadableModuleLogic):
             (debug_info.search_points[debug_info.in_bounds], debug_info.steering_dists[debug_info.in_bounds], None, 'VF-debug-search-points-in-bounds', False),
             (debug_info.search_points, debug_info.steering_dists, -debug_info.plane_normals, 'VF-debug-fitted_plane-normals', False),
         ]:
-            points_vtk = vtk.vtkPoints()
-            for pt in points:
-                points_vtk.InsertNextPoint(pt)
-
-            points_polydata = vtk.vtkPolyData()
-            points_polydata.SetPoints(points_vtk)
-
-            scalar_array = vtk.vtkDoubleArray()
-            scalar_array.SetName('steeringDist')
-            scalar_array.SetNumberOfTuples(points.shape[0])
-            for i, v in enumerate(scalars):
-                scalar_array.SetValue(i, float(v))
-            points_polydata.GetPointData().AddArray(scalar_array)
-            points_polydata.GetPointData().SetActiveScalars('steeringDist')
+            points_polydata = numpy_to_vtk_polydata(
+                points,
+                scalars = scalars,
+                scalars_name = 'steeringDist',
+                vectors = vectors,
+                vectors_name = 'planeNormal',
+            )
 
             if vectors is not None:
-                vector_array = vtk.vtkDoubleArray()
-                vector_array.SetName('planeNormal')
-                vector_array.SetNumberOfComponents(3)
-                vector_array.SetNumberOfTuples(vectors.shape[0])
-                for i, vec in enumerate(vectors):
-                    vector_array.SetTuple(i, vec)
-                points_polydata.GetPointData().AddArray(vector_array)
-                points_polydata.GetPointData().SetActiveVectors('planeNormal')
-
                 arrow = vtk.vtkArrowSource()
                 glyph = vtk.vtkGlyph3D()
                 glyph.SetSourceConnection(arrow.GetOutputPort())
@@ -1267,6 +1630,11 @@ class OpenLIFUPrePlanningTest(ScriptedLoadableModuleTest):
         assert session_id is not None
         preplanning_widget.create_virtual_fit_result(auto_fit = True)
 
+        # The virtual fit runs in a worker process; wait for it to finish
+        while preplanning_logic.is_virtual_fitting(example_target):
+            slicer.app.processEvents()
+            qt.QThread.msleep(10)
+
         # Confirm that virtual fit result exists
         vf_nodes = list(get_virtual_fit_result_nodes(target_id, session_id))
         num_vf_results = session.get_protocol().protocol.virtual_fit_options.top_n_candidates
@@ -1288,3 +1656,65 @@ class OpenLIFUPrePlanningTest(ScriptedLoadableModuleTest):
         preplanning_widget.create_virtual_fit_result(auto_fit = False)
         vf_nodes = list(get_virtual_fit_result_nodes(target_id, session_id))
         assert len(vf_nodes) == 1
+
+    def _workflow_virtual_fit_many(self):
+        """Test running a batch virtual fit of two targets, and that it cannot overlap a single target virtual fit."""
+
+        slicer.util.selectModule("OpenLIFUPrePlanning")
+        preplanning_logic = slicer.modules.OpenLIFUPrePlanningWidget.logic
+
+        session = get_openlifu_data_parameter_node().loaded_session
+        session_id = None if session is None else session.get_session_id()
+        assert session_id is not None
+        protocol = session.get_protocol()
+        transducer = session.get_transducer()
+        volume = session.volume_node
+        num_vf_results = protocol.protocol.virtual_fit_options.top_n_candidates
+
+        def wait_for_virtual_fits():
+            while preplanning_logic.is_virtual_fitting() or preplanning_logic.is_virtual_fitting_many():
+                slicer.app.processEvents()
+                qt.QThread.msleep(10)
+
+        # Use a second target next to the first one if the session has only one
+        targets = get_target_candidates()[:2]
+        added_target = None
+        if len(targets) < 2:
+            target_position = targets[0].GetNthControlPointPositionWorld(0)
+            added_target = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLMarkupsFiducialNode", "batch_test_target")
+            added_target.AddControlPointWorld(target_position[0], target_position[1], target_position[2] + 5.0)
+            targets.append(added_target)
+
+        try:
+            finished = []
+            target_ids = preplanning_logic.virtual_fit_many(
+                protocol, transducer, volume, targets, finished_callback = finished.append,
+            )
+            assert target_ids == [fiducial_to_openlifu_point_id(target) for target in targets]
+
+            # A target in the batch cannot be fitted on its own until the batch ends
+            with self.assertRaises(RuntimeError):
+                preplanning_logic.virtual_fit_async(protocol, transducer, volume, targets[0])
+
+            wait_for_virtual_fits()
+            assert len(finished) == 1
+
+            for target_id in target_ids:
+                target_result = preplanning_logic.batch_virtual_fit_results[target_id]
+                assert target_result.error_message == ""
+                assert not target_result.canceled
+                vf_nodes = get_virtual_fit_result_nodes(target_id, session_id, sort = True)
+                assert len(vf_nodes) == num_vf_results
+                assert [int(node.GetAttribute("VF:rank")) for node in vf_nodes] == list(range(1, num_vf_results + 1))
+                assert target_result.virtual_fit_result.GetID() == vf_nodes[0].GetID()
+
+            # A batch cannot include a target that is being fitted on its own
+            preplanning_logic.virtual_fit_async(protocol, transducer, volume, targets[0])
+            with self.assertRaises(RuntimeError):
+                preplanning_logic.virtual_fit_many(protocol, transducer, volume, targets)
+            preplanning_logic.cancelVirtualFit(targets[0])
+            wait_for_virtual_fits()
+        finally:
+            if added_target is not None:
+                clear_virtual_fit_results(target_id = fiducial_to_openlifu_point_id(added_target), session_id = session_id)
+                slicer.mrmlScene.RemoveNode(added_target)
@@ -33,6 +33,7 @@ from OpenLIFULib.class_definition_widgets import (
     OpenLIFUAbstractDataclassDefinitionFormWidget,
     OpenLIFUAbstractMultipleABCDefinitionFormWidget,
 )
+from OpenLIFULib.database_metadata_cache import get_database_metadata_cache
 from OpenLIFULib.user_account_mode_util import get_current_user, get_user_account_mode_state, UserAccountBanner
 from OpenLIFULib.util import (
     display_errors,
@@ -691,7 +692,7 @@ class OpenLIFUProtocolConfigWidget(ScriptedLoadableModuleWidget, VTKObservationM
             raise RuntimeError("Cannot load protocol from database because there is no database connection")
 
         # Open the protocol selection dialog
-        protocols: List["openlifu.plan.Protocol"] = get_cur_db().load_all_protocols()
+        protocols: List["openlifu.plan.Protocol"] = get_database_metadata_cache(get_cur_db()).get_all_protocols()
 
         dialog = ProtocolSelectionFromDatabaseDialog(protocols)
         if dialog.exec_() == qt.QDialog.Accepted:
@@ -1005,6 +1006,7 @@ class OpenLIFUProtocolConfigLogic(ScriptedLoadableModuleLogic):
         import openlifu.db.database
 
         get_cur_db().write_protocol(protocol, openlifu.db.database.OnConflictOpts.OVERWRITE)
+        get_database_metadata_cache(get_cur_db()).invalidate_protocol(protocol.id)
 
     def delete_protocol_from_database(self, protocol_id: str) -> None:
         if get_cur_db() is None:
@@ -1012,6 +1014,7 @@ class OpenLIFUProtocolConfigLogic(ScriptedLoadableModuleLogic):
         import openlifu.db.database
 
         get_cur_db().delete_protocol(protocol_id, openlifu.db.database.OnConflictOpts.ERROR)
+        get_database_metadata_cache(get_cur_db()).invalidate_protocol(protocol_id)
 
     def cache_protocol(self, protocol_id: str, protocol: "openlifu.plan.Protocol") -> None:
         self.cached_protocols[protocol_id] = protocol
@@ -1,8 +1,12 @@
 # Standard library imports
+import copy
+import functools
+import logging
 import warnings
 from dataclasses import fields
 import math
-from typing import Optional, Union, Tuple, TYPE_CHECKING, get_origin, get_args
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Union, Tuple, TYPE_CHECKING, get_origin, get_args
 
 # Third-party imports
 import qt
@@ -10,7 +14,7 @@ import vtk
 
 # Slicer imports
 import slicer
-from slicer import vtkMRMLMarkupsFiducialNode, vtkMRMLScalarVolumeNode
+from slicer import vtkMRMLMarkupsFiducialNode, vtkMRMLScalarVolumeNode, vtkMRMLTransformNode
 from slicer.ScriptedLoadableModule import *
 from slicer.i18n import tr as _
 from slicer.i18n import translate
@@ -29,6 +33,7 @@ from OpenLIFULib import (
     SlicerOpenLIFUTransducer,
     fiducial_to_openlifu_point_in_transducer_coords,
     get_openlifu_data_parameter_node,
+    get_target_candidates,
     make_xarray_in_transducer_coords_from_volume,
 )
 from OpenLIFULib.events import SlicerOpenLIFUEvents
@@ -40,11 +45,31 @@ from OpenLIFULib.util import (
     replace_widget,
 )
 from OpenLIFULib.notifications import notify
+from OpenLIFULib.profiling import profile_span, profiled, start_span
+from OpenLIFULib.skinseg import compute_volume_content_hash
+from OpenLIFULib.solution_cache import (
+    SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY,
+    compute_solution_cache_key,
+    compute_transducer_content_hash,
+    get_solution_cache_max_size_bytes,
+    load_cached_solution,
+    refresh_solution_identity,
+    save_solution_to_cache,
+)
+from OpenLIFULib.solution_compute import (
+    SolutionComputationJob,
+    SolutionComputationPool,
+    SolutionComputationProcess,
+    SolutionComputationResult,
+)
+from OpenLIFULib.targets import fiducial_to_openlifu_point_id
+from OpenLIFULib.virtual_fit_results import get_approved_target_ids, get_best_virtual_fit_result_node
 
 if TYPE_CHECKING:
     import openlifu
     import openlifu.plan
     import openlifu.xdc
+    import numpy as np
     import xarray
     from OpenLIFUData.OpenLIFUData import OpenLIFUDataLogic
 
@@ -88,6 +113,22 @@ class OpenLIFUSonicationPlanner(ScriptedLoadableModule):
 class OpenLIFUSonicationPlannerParameterNode:
     solution_analysis : Optional[SlicerOpenLIFUSolutionAnalysis] = None
 
+#
+# Solution analysis table formatting
+#
+
+def format_analysis_value(val) -> str:
+    """
+    Format numeric values:
+    - Floats >= 0.01 → rounded to 2 decimal places
+    - Floats < 0.01  → 3 significant digits
+    - Non-floats     → converted to string as-is
+    """
+    if isinstance(val, float):
+        return f"{val:.2f}" if abs(val) >= 0.01 else f"{val:.3g}"
+    return str(val)
+
+
 #
 # OpenLIFUSonicationPlannerWidget
 #
@@ -110,6 +151,8 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
         """Flag to help prevent recursive event when onParameterNodeModified causes the parameter node to be modified"""
         self._updating_gui_from_sliders = False
         """Flag to prevent recursive updates when setting slider values programmatically."""
+        self._solution_progress : Optional[Tuple[int,int]] = None
+        """The (value, maximum) most recently reported by the running background solution computation, if any."""
 
     def setup(self) -> None:
         """Called when the user opens the module the first time and the widget is initialized."""
@@ -134,6 +177,12 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
         self.globalAnalysisTableModel = qt.QStandardItemModel() # analysis metrics that are for the whole solution, i.e. over all focus points
         self.ui.globalAnalysisTableView.setModel(self.globalAnalysisTableModel)
 
+        # Create and set batch planning table models
+        self.batchProgressTableModel = qt.QStandardItemModel() # one row per target, showing the progress of its computation
+        self.ui.batchProgressTableView.setModel(self.batchProgressTableModel)
+        self.batchAnalysisTableModel = qt.QStandardItemModel() # one column per target, comparing the solution analyses
+        self.ui.batchAnalysisTableView.setModel(self.batchAnalysisTableModel)
+
         # User account banner widget replacement
         self.user_account_banner = UserAccountBanner(parent=self.ui.userAccountBannerPlaceholder.parentWidget())
         replace_widget(self.ui.userAccountBannerPlaceholder, self.user_account_banner, self.ui)
@@ -173,6 +222,9 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
         self.ui.solutionPushButton.clicked.connect(self.onComputeSolutionClicked)
         self.ui.renderPNPCheckBox.toggled.connect(self.onrenderPNPCheckBoxToggled)
         self.ui.approveButton.clicked.connect(self.onApproveClicked)
+        self.ui.batchSolutionPushButton.clicked.connect(self.onComputeBatchSolutionsClicked)
+        self.ui.batchUseSolutionPushButton.clicked.connect(self.onUseBatchSolutionClicked)
+        self.ui.batchProgressTableView.selectionModel().selectionChanged.connect(self.updateBatchPlanningButtons)
 
         # Connect PNP sliders
         self.ui.pnpColorSlider.valuesChanged.connect(self.onPnpColorSliderChanged)
@@ -180,6 +232,7 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
 
         self.checkCanComputeSolution()
         self.updateApproveButton()
+        self.updateBatchPlanningButtons()
 
         # Make sure parameter node is initialized (needed for module reload)
         self.initializeParameterNode()
@@ -188,6 +241,8 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
 
     def cleanup(self) -> None:
         """Called when the application closes and the module widget is destroyed."""
+        self.logic.cancelSolutionComputation()
+        self.logic.cancelBatchSolutionComputation()
         self.removeObservers()
 
     def enter(self) -> None:
@@ -240,6 +295,19 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
 
     def checkCanComputeSolution(self, caller = None, event = None) -> None:
 
+        # While a solution is being computed in the background, the compute solution button serves to cancel it
+        if self.logic.is_computing_solution():
+            self.ui.solutionPushButton.enabled = True
+            self.ui.solutionPushButton.text = "Cancel solution computation"
+            self.ui.solutionPushButton.setToolTip("Stop the sonication solution computation that is running in the background")
+            return
+        self.ui.solutionPushButton.text = "Compute sonication solution"
+
+        if self.logic.is_computing_batch_solutions():
+            self.ui.solutionPushButton.enabled = False
+            self.ui.solutionPushButton.setToolTip("Batch planning is in progress")
+            return
+
         # If all the needed objects/nodes are loaded within the Slicer scene, all of the combo boxes will have valid data selected
         # This means that the compute solution button can be enabled
         if self.algorithm_input_widget.has_valid_selections():
@@ -271,10 +339,18 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
 
         # Determine whether solution can be computed based on the status of combo boxes
         self.checkCanComputeSolution()
+        self.updateBatchPlanningButtons()
 
     def updateSolutionProgressBar(self):
-        """Update the solution progress bar. 0% if there is no existing solution, 100% if there is an existing solution."""
-        self.ui.solutionProgressBar.maximum = 1 # (during computation we set maxmimum=0 to put it into an infinite loading animation)
+        """Update the solution progress bar. 0% if there is no existing solution, 100% if there is an existing solution.
+        While a solution is being computed in the background, show the progress reported by the computation instead."""
+        if self.logic.is_computing_solution():
+            value, maximum = self._solution_progress if self._solution_progress is not None else (0, 0)
+            self.ui.solutionProgressBar.maximum = maximum # maximum=0 puts it into an infinite loading animation
+            self.ui.solutionProgressBar.value = value
+            return
+
+        self.ui.solutionProgressBar.maximum = 1
 
         if get_openlifu_data_parameter_node().loaded_solution is None:
             self.ui.solutionProgressBar.value = 0
@@ -400,6 +476,10 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
 
     @display_errors
     def onComputeSolutionClicked(self, checked:bool):
+        if self.logic.is_computing_solution():
+            self.logic.cancelSolutionComputation()
+            return
+
         activeData = self.algorithm_input_widget.get_current_data()
 
         if not check_and_install_kwave_binaries():
@@ -409,16 +489,46 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
         self.ui.renderPNPCheckBox.checked = False
         self.logic.hide_pnp()
 
+        # The simulation runs in a worker process, so that targets and virtual fits can still be reviewed while it runs.
+        # Only preparing the simulation inputs from the scene happens here.
+        self._solution_progress = None
         with BusyCursor():
-            try:
-                self.ui.solutionProgressBar.maximum = 0
-                slicer.app.processEvents()
-                self.logic.computeSolution(activeData["Volume"], activeData["Target"],
-                                           activeData["Transducer"], activeData["Protocol"])
-            finally:
-                self.updateSolutionProgressBar()
+            self.logic.computeSolutionAsync(
+                activeData["Volume"], activeData["Target"],
+                activeData["Transducer"], activeData["Protocol"],
+                progress_callback = self.onSolutionComputationProgress,
+                finished_callback = self.onSolutionComputationFinished,
+            )
+        self.checkCanComputeSolution()
+        self.updateBatchPlanningButtons()
+        self.updateSolutionProgressBar()
 
-        self.ui.renderPNPCheckBox.checked = True
+    def onSolutionComputationProgress(self, message:str, value:int, maximum:int) -> None:
+        self._solution_progress = (value, maximum)
+        self.updateSolutionProgressBar()
+        if message:
+            slicer.util.showStatusMessage(f"Computing sonication solution: {message}")
+
+    @display_errors
+    def onSolutionComputationFinished(
+        self,
+        solution:Optional[SlicerOpenLIFUSolution],
+        analysis:Optional[SlicerOpenLIFUSolutionAnalysis],
+        error_message:str,
+        canceled:bool,
+    ) -> None:
+        self._solution_progress = None
+        self.checkCanComputeSolution()
+        self.updateBatchPlanningButtons()
+        self.updateSolutionProgressBar()
+        slicer.util.showStatusMessage("")
+
+        if canceled:
+            notify("Sonication solution computation canceled.")
+        elif solution is None:
+            raise RuntimeError(f"The sonication solution could not be computed:\n{error_message}")
+        else:
+            self.ui.renderPNPCheckBox.checked = True
 
         self.updateWorkflowControls()
 
@@ -634,17 +744,6 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
         if analysis is None:
             raise RuntimeError("Cannot populate solution analysis tables because there is no solution analysis.")
 
-        def format_value(val):
-            """
-            Format numeric values:
-            - Floats >= 0.01 → rounded to 2 decimal places
-            - Floats < 0.01  → 3 significant digits
-            - Non-floats     → converted to string as-is
-            """
-            if isinstance(val, float):
-                return f"{val:.2f}" if abs(val) >= 0.01 else f"{val:.3g}"
-            return str(val)
-
         analysis_openlifu = analysis.analysis
         self.clear_solution_analysis_tables()
 
@@ -668,12 +767,199 @@ class OpenLIFUSonicationPlannerWidget(ScriptedLoadableModuleWidget, VTKObservati
 
         for _, row in df.iterrows():
             row["Status"] = row["Status"] if row["Status"] else openlifu.plan.param_constraint.PARAM_STATUS_SYMBOLS["ok"]
-            items = [create_noneditable_QStandardItem(format_value(cell)) for cell in row]
-            self.globalAnalysisTableModel.appendRow(items)#
+            items = [create_noneditable_QStandardItem(format_analysis_value(cell)) for cell in row]
+            self.globalAnalysisTableModel.appendRow(items)
+
+    def updateBatchPlanningButtons(self, *args) -> None:
+        """Update the batch planning buttons. While batch planning is running, the compute button serves to cancel it."""
+        if self.logic.is_computing_batch_solutions():
+            self.ui.batchSolutionPushButton.enabled = True
+            self.ui.batchSolutionPushButton.text = "Cancel batch planning"
+            self.ui.batchSolutionPushButton.setToolTip("Stop the solution computations for the approved targets")
+        else:
+            self.ui.batchSolutionPushButton.text = "Compute solutions for approved targets"
+            if self.logic.is_computing_solution():
+                self.ui.batchSolutionPushButton.enabled = False
+                self.ui.batchSolutionPushButton.setToolTip("A solution computation is in progress")
+            elif not self.algorithm_input_widget.has_valid_selections():
+                self.ui.batchSolutionPushButton.enabled = False
+                self.ui.batchSolutionPushButton.setToolTip("Please specify the required inputs. The selected target is not used; every target with an approved virtual fit is planned.")
+            else:
+                self.ui.batchSolutionPushButton.enabled = True
+                self.ui.batchSolutionPushButton.setToolTip("Compute a sonication solution for every target that has an approved virtual fit, with the transducer placed at that virtual fit")
+
+        target_id = self.get_selected_batch_target_id()
+        target_result = self.logic.batch_solution_results.get(target_id) if target_id is not None else None
+        if target_result is None or target_result.result is None:
+            self.ui.batchUseSolutionPushButton.enabled = False
+            self.ui.batchUseSolutionPushButton.setToolTip("Select a target whose batch planning solution was computed")
+        else:
+            self.ui.batchUseSolutionPushButton.enabled = True
+            self.ui.batchUseSolutionPushButton.setToolTip("Move the transducer to the virtual fit of the selected target and make its solution the active solution")
+
+    def get_selected_batch_target_id(self) -> Optional[str]:
+        """Get the target ID of the row selected in the batch planning progress table, if any."""
+        selected_rows = self.ui.batchProgressTableView.selectionModel().selectedRows()
+        if not selected_rows:
+            return None
+        return self.batchProgressTableModel.item(selected_rows[0].row(), 0).text()
+
+    def _find_batch_progress_row(self, target_id:str) -> Optional[int]:
+        for row in range(self.batchProgressTableModel.rowCount()):
+            if self.batchProgressTableModel.item(row, 0).text() == target_id:
+                return row
+        return None
+
+    def _set_batch_status(self, target_id:str, status:str) -> None:
+        row = self._find_batch_progress_row(target_id)
+        if row is not None:
+            self.batchProgressTableModel.setItem(row, 2, create_noneditable_QStandardItem(status))
+
+    @display_errors
+    def onComputeBatchSolutionsClicked(self, checked:bool):
+        if self.logic.is_computing_batch_solutions():
+            self.logic.cancelBatchSolutionComputation()
+            return
+
+        activeData = self.algorithm_input_widget.get_current_data()
+
+        if not check_and_install_kwave_binaries():
+            raise RuntimeError("Cannot find kwave binaries required to compute sonication solutions.")
+
+        self.batchProgressTableModel.removeRows(0, self.batchProgressTableModel.rowCount())
+        self.batchProgressTableModel.setHorizontalHeaderLabels(["Target", "Virtual fit", "Status"])
+        self.clear_batch_analysis_table()
+
+        for target_id, _, virtual_fit_node in self.logic.get_batch_planning_targets():
+            self.batchProgressTableModel.appendRow([
+                create_noneditable_QStandardItem(target_id),
+                create_noneditable_QStandardItem(virtual_fit_node.GetAttribute("DisplayName") or virtual_fit_node.GetName()),
+                create_noneditable_QStandardItem("Queued"),
+            ])
+
+        with BusyCursor():
+            self.logic.computeSolutionsForApprovedTargets(
+                activeData["Volume"], activeData["Transducer"], activeData["Protocol"],
+                max_workers = self.ui.batchMaxWorkersSpinBox.value,
+                progress_callback = self.onBatchSolutionProgress,
+                target_finished_callback = self.onBatchTargetSolutionFinished,
+                finished_callback = self.onBatchSolutionsFinished,
+            )
+        self.checkCanComputeSolution()
+        self.updateBatchPlanningButtons()
+
+    def onBatchSolutionProgress(self, target_id:str, message:str, value:int, maximum:int) -> None:
+        if maximum > 0:
+            self._set_batch_status(target_id, f"{int(100 * value / maximum)}% {message}")
+        else:
+            self._set_batch_status(target_id, message)
+
+    def onBatchTargetSolutionFinished(self, target_result:BatchSolutionTargetResult) -> None:
+        if target_result.canceled:
+            self._set_batch_status(target_result.target_id, "Canceled")
+        elif target_result.result is None:
+            self._set_batch_status(target_result.target_id, f"Failed: {target_result.error_message}")
+        else:
+            self._set_batch_status(target_result.target_id, "Done")
+        self.populate_batch_analysis_table()
+        self.updateBatchPlanningButtons()
+
+    def onBatchSolutionsFinished(self, batch_solution_results:Dict[str, BatchSolutionTargetResult]) -> None:
+        self.checkCanComputeSolution()
+        self.updateBatchPlanningButtons()
+        num_computed = sum(target_result.result is not None for target_result in batch_solution_results.values())
+        notify(f"Batch planning finished: {num_computed} of {len(batch_solution_results)} target solutions computed.")
+
+    @display_errors
+    def onUseBatchSolutionClicked(self, checked:bool):
+        target_id = self.get_selected_batch_target_id()
+        if target_id is None:
+            raise RuntimeError("No target is selected in the batch planning table.")
+        activeData = self.algorithm_input_widget.get_current_data()
+
+        self.ui.renderPNPCheckBox.checked = False
+        self.logic.hide_pnp()
+        with BusyCursor():
+            self.logic.useBatchSolution(target_id, activeData["Transducer"])
+        self.ui.renderPNPCheckBox.checked = True
+
+        self.updateWorkflowControls()
+
+    def clear_batch_analysis_table(self) -> None:
+        """Clear out the batch planning analysis comparison table, removing all rows and column headers"""
+        self.batchAnalysisTableModel.removeRows(0, self.batchAnalysisTableModel.rowCount())
+        self.batchAnalysisTableModel.setColumnCount(0)
+
+    def populate_batch_analysis_table(self) -> None:
+        """Fill the batch planning analysis comparison table with one column per target that has a batch planning solution,
+        so that the solution analyses of the targets can be reviewed side by side."""
+        import openlifu.plan.param_constraint
+
+        self.clear_batch_analysis_table()
+        computed_results = [
+            target_result for target_result in self.logic.batch_solution_results.values()
+            if target_result.result is not None
+        ]
+        if not computed_results:
+            return
+
+        analysis_tables = [target_result.result.analysis.to_table() for target_result in computed_results]
+        self.batchAnalysisTableModel.setHorizontalHeaderLabels(
+            ["Param", "Units"] + [target_result.target_id for target_result in computed_results]
+        )
 
+        ok_symbol = openlifu.plan.param_constraint.PARAM_STATUS_SYMBOLS["ok"]
+        for row_index, row in analysis_tables[0].iterrows():
+            items = [
+                create_noneditable_QStandardItem(str(row["Param"])),
+                create_noneditable_QStandardItem(str(row["Units"])),
+            ]
+            for analysis_table in analysis_tables:
+                matching_rows = analysis_table[analysis_table["Param"] == row["Param"]]
+                if len(matching_rows) == 0:
+                    items.append(create_noneditable_QStandardItem(""))
+                    continue
+                matching_row = matching_rows.iloc[0]
+                status = matching_row["Status"] if matching_row["Status"] else ok_symbol
+                items.append(create_noneditable_QStandardItem(f"{format_analysis_value(matching_row['Value'])} {status}"))
+            self.batchAnalysisTableModel.appendRow(items)
+
+#
 # Solution computation function using openlifu
 #
 
+def make_solution_inputs_openlifu(
+        protocol: "openlifu.plan.Protocol",
+        transducer:SlicerOpenLIFUTransducer,
+        target_node:vtkMRMLMarkupsFiducialNode,
+        volume_node:vtkMRMLScalarVolumeNode,
+        transducer_matrix:"Optional[np.ndarray]" = None,
+        volume_in_transducer_coords:"Optional[xarray.DataArray]" = None,
+        include_volume:bool = True,
+    ) -> dict:
+    """Gather the keyword arguments of `protocol.calc_solution` from the Slicer scene and the active session.
+    This is the part of the solution computation that needs the scene, so it runs on the main thread even when
+    the simulation itself is run in a worker process.
+
+    Args:
+        transducer_matrix: The transducer transform to compute the solution for, if not the current one of the transducer.
+        volume_in_transducer_coords: The volume already sampled in the coordinates of the transducer at the pose that the
+            solution is computed for, if it is available, to save the time of resampling it.
+        include_volume: Whether to include the volume. If False then the "volume" argument is left out, for the caller to
+            resample the volume when it is needed, with `make_xarray_in_transducer_coords_from_volume`.
+    """
+    session = get_openlifu_data_parameter_node().loaded_session
+    solution_inputs = dict(
+        transducer=transducer.transducer.transducer,
+        target=fiducial_to_openlifu_point_in_transducer_coords(target_node, transducer, name = 'sonication target', transducer_matrix=transducer_matrix),
+        session=session.session.session if session is not None else None,
+    )
+    if include_volume:
+        if volume_in_transducer_coords is None:
+            volume_in_transducer_coords = make_xarray_in_transducer_coords_from_volume(volume_node, transducer, protocol, transducer_matrix=transducer_matrix)
+        solution_inputs["volume"] = volume_in_transducer_coords
+    return solution_inputs
+
 def compute_solution_openlifu(
         protocol: "openlifu.plan.Protocol",
         transducer:SlicerOpenLIFUTransducer,
@@ -688,16 +974,29 @@ def compute_solution_openlifu(
         intensity_aggregated: Time-averaged intensity, a simulation output. This is mean-aggregated over all focus points.
             Note: It should be weighted by the number of times each focus point is focused on, but this functionality is not yet represented by openlifu.
     """
-    session = get_openlifu_data_parameter_node().loaded_session
     solution, simulation_result_aggregated, scaled_solution_analysis = protocol.calc_solution(
-        transducer=transducer.transducer.transducer,
-        volume=make_xarray_in_transducer_coords_from_volume(volume_node, transducer, protocol),
-        target=fiducial_to_openlifu_point_in_transducer_coords(target_node, transducer, name = 'sonication target'),
-        session=session.session.session if session is not None else None,
+        **make_solution_inputs_openlifu(protocol, transducer, target_node, volume_node)
     )
     return solution, simulation_result_aggregated["p_min"], simulation_result_aggregated["intensity"], scaled_solution_analysis
 
 
+class BatchSolutionTargetResult(NamedTuple):
+    """The outcome of batch planning for one target. See `OpenLIFUSonicationPlannerLogic.computeSolutionsForApprovedTargets`."""
+    target_id : str
+    target_node : vtkMRMLMarkupsFiducialNode
+    virtual_fit_node : vtkMRMLTransformNode
+    """The virtual fit result at whose pose the transducer was placed for this target"""
+    transducer_matrix : "np.ndarray"
+    """The matrix of the virtual fit result at the time the computation started"""
+    target_position : List[float]
+    """The world position of the target at the time the computation started"""
+    result : Optional[SolutionComputationResult] = None
+    """The solution computation outputs, or None while the computation is running or if it failed or was canceled"""
+    error_message : str = ""
+    canceled : bool = False
+
+DEFAULT_BATCH_SOLUTION_MAX_WORKERS = 2
+
 #
 # OpenLIFUSonicationPlannerLogic
 #
@@ -717,9 +1016,19 @@ class OpenLIFUSonicationPlannerLogic(ScriptedLoadableModuleLogic):
         """Called when the logic class is instantiated. Can be used for initializing member variables."""
         ScriptedLoadableModuleLogic.__init__(self)
 
+        self._solution_computation : Optional[SolutionComputationProcess] = None
+        """The background solution computation that is currently running, if any. See `computeSolutionAsync`."""
+
+        self._batch_solution_pool : Optional[SolutionComputationPool] = None
+        """The batch of background solution computations that is currently running, if any. See `computeSolutionsForApprovedTargets`."""
+
+        self.batch_solution_results : Dict[str, BatchSolutionTargetResult] = {}
+        """Mapping from target ID to the outcome of batch planning for that target, from the most recent batch"""
+
     def getParameterNode(self):
         return OpenLIFUSonicationPlannerParameterNode(super().getParameterNode())
 
+    @profiled("compute solution")
     def computeSolution(
             self,
             inputVolume: vtkMRMLScalarVolumeNode,
@@ -728,20 +1037,330 @@ class OpenLIFUSonicationPlannerLogic(ScriptedLoadableModuleLogic):
             inputProtocol: SlicerOpenLIFUProtocol) -> Tuple[SlicerOpenLIFUSolution, SlicerOpenLIFUSolutionAnalysis]:
         """Compute solution for the given volume, target, transducer, and protocol, setting the solution as the active solution.
         Note that setting the solution will trigger a write of the solution to the databse if there is an active session.
+        If the same inputs were computed before, the outputs are taken from the solution cache instead; see `OpenLIFULib.solution_cache`.
+        """
+        cache_key = self._get_solution_cache_key(inputVolume, inputTarget, inputTransducer, inputProtocol)
+        result = load_cached_solution(cache_key) if cache_key is not None else None
+        if result is None:
+            with profile_span("beamforming and simulation"):
+                result = SolutionComputationResult(*compute_solution_openlifu(
+                    inputProtocol.protocol,
+                    inputTransducer,
+                    inputTarget,
+                    inputVolume,
+                ))
+            self._save_solution_to_cache(cache_key, result)
+        with profile_span("set solution"):
+            return self._set_solution_from_openlifu_outputs(result, inputTransducer)
+
+    def computeSolutionAsync(
+            self,
+            inputVolume: vtkMRMLScalarVolumeNode,
+            inputTarget: vtkMRMLMarkupsFiducialNode,
+            inputTransducer : SlicerOpenLIFUTransducer,
+            inputProtocol: SlicerOpenLIFUProtocol,
+            progress_callback: Optional[Callable[[str, int, int], None]] = None,
+            finished_callback: "Optional[Callable[[Optional[SlicerOpenLIFUSolution], Optional[SlicerOpenLIFUSolutionAnalysis], str, bool], None]]" = None,
+        ) -> None:
+        """Like `computeSolution`, but run the beamforming and simulation in a worker process and return immediately.
+
+        If the same inputs were computed before, the outputs are taken from the solution cache and `finished_callback` is
+        called before this returns.
+
+        Args:
+            progress_callback: Called with (message, value, maximum) as the computation progresses. A maximum of 0 means
+                the progress is indeterminate.
+            finished_callback: Called with (solution, analysis, error_message, canceled) once the computation ends.
+                On success the solution has already been set as the active solution. The solution and analysis are None if the
+                computation failed or was canceled, or if the transducer or target were moved or removed while it ran, since
+                the result would then no longer describe the scene.
+        """
+        if self.is_computing_solution() or self.is_computing_batch_solutions():
+            raise RuntimeError("A solution computation is already in progress.")
+
+        # The computation ends in a callback, so the timing span is started and finished by hand
+        compute_span = start_span("compute solution")
+
+        try:
+            cache_key = self._get_solution_cache_key(inputVolume, inputTarget, inputTransducer, inputProtocol)
+            cached_result = load_cached_solution(cache_key) if cache_key is not None else None
+            if cached_result is not None:
+                with profile_span("set solution", parent=compute_span):
+                    solution, analysis = self._set_solution_from_openlifu_outputs(cached_result, inputTransducer)
+            else:
+                with profile_span("prepare solution inputs", parent=compute_span):
+                    solution_inputs = make_solution_inputs_openlifu(inputProtocol.protocol, inputTransducer, inputTarget, inputVolume)
+        except Exception as e:
+            compute_span.finish(error = str(e))
+            raise
+
+        if cached_result is not None:
+            compute_span.finish()
+            if finished_callback is not None:
+                finished_callback(solution, analysis, "", False)
+            return
+
+        transducer_matrix_at_start = slicer.util.arrayFromTransformMatrix(inputTransducer.transform_node)
+        target_position_at_start = [0.0, 0.0, 0.0]
+        inputTarget.GetNthControlPointPositionWorld(0, target_position_at_start)
+
+        def inputs_unchanged() -> bool:
+            if not (slicer.mrmlScene.IsNodePresent(inputTransducer.transform_node) and slicer.mrmlScene.IsNodePresent(inputTarget)):
+                return False
+            if inputTarget.GetNumberOfControlPoints() < 1:
+                return False
+            target_position = [0.0, 0.0, 0.0]
+            inputTarget.GetNthControlPointPositionWorld(0, target_position)
+            return (
+                target_position == target_position_at_start
+                and (slicer.util.arrayFromTransformMatrix(inputTransducer.transform_node) == transducer_matrix_at_start).all()
+            )
+
+        def on_finished(result:Optional[SolutionComputationResult], error_message:str, canceled:bool) -> None:
+            self._solution_computation = None
+            worker_span.finish(error = "canceled" if canceled else (error_message or None))
+            solution, analysis = None, None
+            if result is not None:
+                self._save_solution_to_cache(cache_key, result)
+                if inputs_unchanged():
+                    with profile_span("set solution", parent=compute_span):
+                        solution, analysis = self._set_solution_from_openlifu_outputs(result, inputTransducer)
+                else:
+                    error_message = "The transducer or target changed while the solution was being computed, so the result was discarded."
+            compute_span.finish(error = "canceled" if canceled else (error_message or None))
+            if finished_callback is not None:
+                finished_callback(solution, analysis, error_message, canceled)
+
+        solution_computation = SolutionComputationProcess(
+            progress_callback = progress_callback if progress_callback is not None else (lambda message, value, maximum : None),
+            finished_callback = on_finished,
+        )
+        worker_span = start_span("beamforming and simulation (worker process)", parent=compute_span)
+        try:
+            solution_computation.start(protocol=inputProtocol.protocol, **solution_inputs)
+        except Exception as e:
+            worker_span.finish(error = str(e))
+            compute_span.finish(error = str(e))
+            raise
+        self._solution_computation = solution_computation
+
+    def get_batch_planning_targets(self) -> List[Tuple[str, vtkMRMLMarkupsFiducialNode, vtkMRMLTransformNode]]:
+        """List (target ID, target node, virtual fit result node) for each target in the scene that has an approved virtual fit
+        in the active session (or, if there is no active session, among the virtual fit results that have no session).
+        The virtual fit result node is the best approved one for the target."""
+        session = get_openlifu_data_parameter_node().loaded_session
+        session_id = session.get_session_id() if session is not None else None
+        target_nodes_by_id = {fiducial_to_openlifu_point_id(node) : node for node in get_target_candidates()}
+        batch_planning_targets = []
+        for target_id in sorted(get_approved_target_ids(session_id=session_id)):
+            if target_id not in target_nodes_by_id:
+                continue
+            virtual_fit_node = get_best_virtual_fit_result_node(target_id=target_id, session_id=session_id)
+            batch_planning_targets.append((target_id, target_nodes_by_id[target_id], virtual_fit_node))
+        return batch_planning_targets
+
+    def computeSolutionsForApprovedTargets(
+            self,
+            inputVolume: vtkMRMLScalarVolumeNode,
+            inputTransducer : SlicerOpenLIFUTransducer,
+            inputProtocol: SlicerOpenLIFUProtocol,
+            max_workers: int = DEFAULT_BATCH_SOLUTION_MAX_WORKERS,
+            progress_callback: Optional[Callable[[str, str, int, int], None]] = None,
+            target_finished_callback: Optional[Callable[[BatchSolutionTargetResult], None]] = None,
+            finished_callback: Optional[Callable[[Dict[str, BatchSolutionTargetResult]], None]] = None,
+        ) -> List[str]:
+        """Compute solutions in the background for every target that has an approved virtual fit, with the transducer placed
+        at the pose of that virtual fit, running at most `max_workers` simulations at once. See `get_batch_planning_targets`.
+
+        The transducer itself is not moved and none of the solutions is made the active solution; the outcomes are collected into
+        `batch_solution_results` for review, and `useBatchSolution` makes one of them active. The volume is resampled for each
+        computation only when a worker is free to start it, and is let go of once it is handed to the worker, so the batch never
+        holds more resampled volumes than there are workers; targets whose virtual fits came out at the same pose reuse the
+        resampled volume through the cache of `make_xarray_in_transducer_coords_from_volume`. Targets whose inputs were
+        computed before are taken from the solution cache.
+
+        Args:
+            progress_callback: Called with (target ID, message, value, maximum) as the computation for a target progresses.
+            target_finished_callback: Called with the `BatchSolutionTargetResult` of each target as its computation ends.
+            finished_callback: Called with `batch_solution_results` once the computations for all targets have ended.
+
+        Returns the IDs of the targets that are being planned.
         """
-        solution_openlifu, pnp_aggregated, intensity_aggregated, analysis_openlifu = compute_solution_openlifu(
+        if self.is_computing_solution() or self.is_computing_batch_solutions():
+            raise RuntimeError("A solution computation is already in progress.")
+
+        batch_planning_targets = self.get_batch_planning_targets()
+        if len(batch_planning_targets) == 0:
+            raise RuntimeError("There are no targets with an approved virtual fit to plan.")
+
+        protocol = inputProtocol.protocol
+        session = get_openlifu_data_parameter_node().loaded_session
+        session_id = session.get_session_id() if session is not None else None
+        use_cache = get_solution_cache_max_size_bytes() > 0
+        volume_content_hash = compute_volume_content_hash(inputVolume) if use_cache else None
+        transducer_content_hash = compute_transducer_content_hash(inputTransducer) if use_cache else None
+
+        self.batch_solution_results = {}
+        cache_keys : Dict[str, Optional[str]] = {}
+        cached_results : Dict[str, SolutionComputationResult] = {}
+        jobs : List[SolutionComputationJob] = []
+        for target_id, target_node, virtual_fit_node in batch_planning_targets:
+            transducer_matrix = slicer.util.arrayFromTransformMatrix(virtual_fit_node)
+            target_position = [0.0, 0.0, 0.0]
+            target_node.GetNthControlPointPositionWorld(0, target_position)
+            self.batch_solution_results[target_id] = BatchSolutionTargetResult(
+                target_id = target_id,
+                target_node = target_node,
+                virtual_fit_node = virtual_fit_node,
+                transducer_matrix = transducer_matrix,
+                target_position = target_position,
+            )
+
+            cache_keys[target_id] = compute_solution_cache_key(
+                protocol, inputTransducer, target_node, inputVolume,
+                session_id = session_id,
+                transducer_matrix = transducer_matrix,
+                volume_content_hash = volume_content_hash,
+                transducer_content_hash = transducer_content_hash,
+            ) if use_cache else None
+            cached_result = load_cached_solution(cache_keys[target_id]) if use_cache else None
+            if cached_result is not None:
+                cached_results[target_id] = cached_result
+                continue
+
+            # The target and session are captured now, so that the computation matches the cache key and target position
+            # recorded above; only the volume resampling waits until the job starts
+            solution_inputs = make_solution_inputs_openlifu(
+                protocol, inputTransducer, target_node, inputVolume,
+                transducer_matrix = transducer_matrix,
+                include_volume = False,
+            )
+            make_volume = functools.partial(
+                make_xarray_in_transducer_coords_from_volume,
+                inputVolume, inputTransducer, protocol, transducer_matrix=transducer_matrix,
+            )
+            jobs.append(SolutionComputationJob(key=target_id, protocol=protocol, make_volume=make_volume, **solution_inputs))
+
+        def on_job_finished(target_id:str, result:Optional[SolutionComputationResult], error_message:str, canceled:bool) -> None:
+            if result is not None:
+                self._save_solution_to_cache(cache_keys[target_id], result)
+            target_result = self.batch_solution_results[target_id]._replace(
+                result = result,
+                error_message = error_message,
+                canceled = canceled,
+            )
+            self.batch_solution_results[target_id] = target_result
+            if target_finished_callback is not None:
+                target_finished_callback(target_result)
+
+        def on_finished() -> None:
+            self._batch_solution_pool = None
+            if finished_callback is not None:
+                finished_callback(self.batch_solution_results)
+
+        for target_id, cached_result in cached_results.items():
+            on_job_finished(target_id, cached_result, "", False)
+
+        self._batch_solution_pool = SolutionComputationPool(
+            max_workers = max_workers,
+            progress_callback = progress_callback if progress_callback is not None else (lambda target_id, message, value, maximum : None),
+            job_finished_callback = on_job_finished,
+            finished_callback = on_finished,
+        )
+        self._batch_solution_pool.start(jobs)
+
+        return [target_id for target_id, _, _ in batch_planning_targets]
+
+    def is_computing_batch_solutions(self) -> bool:
+        """Whether the batch solution computation started by `computeSolutionsForApprovedTargets` is still running."""
+        return self._batch_solution_pool is not None and self._batch_solution_pool.is_active()
+
+    def cancelBatchSolutionComputation(self) -> None:
+        """Cancel the batch solution computation started by `computeSolutionsForApprovedTargets`, if there is one running."""
+        if self._batch_solution_pool is not None:
+            self._batch_solution_pool.cancel()
+
+    def useBatchSolution(
+            self,
+            target_id:str,
+            inputTransducer:SlicerOpenLIFUTransducer,
+        ) -> Tuple[SlicerOpenLIFUSolution, SlicerOpenLIFUSolutionAnalysis]:
+        """Make the batch planning solution for the given target the active solution, moving the transducer to the virtual
+        fit result pose that the solution was computed for. See `computeSolutionsForApprovedTargets`."""
+        target_result = self.batch_solution_results.get(target_id)
+        if target_result is None or target_result.result is None:
+            raise RuntimeError(f"There is no batch planning solution for target {target_id}.")
+        if not (slicer.mrmlScene.IsNodePresent(target_result.virtual_fit_node) and slicer.mrmlScene.IsNodePresent(target_result.target_node)):
+            raise RuntimeError(f"The virtual fit result or the target node of target {target_id} is no longer in the scene.")
+        target_position = [0.0, 0.0, 0.0]
+        target_result.target_node.GetNthControlPointPositionWorld(0, target_position)
+        if (
+            target_position != target_result.target_position
+            or not (slicer.util.arrayFromTransformMatrix(target_result.virtual_fit_node) == target_result.transducer_matrix).all()
+        ):
+            raise RuntimeError(f"The target {target_id} or its virtual fit result changed since the batch planning solution was computed.")
+
+        # Moving the transducer clears any active solution, so this goes first
+        inputTransducer.set_current_transform_to_match_transform_node(target_result.virtual_fit_node)
+
+        # The same batch result can be made active more than once, and each time it is written into the session as a new solution
+        solution_openlifu = copy.deepcopy(target_result.result.solution)
+        refresh_solution_identity(solution_openlifu)
+        return self._set_solution_from_openlifu_outputs(
+            target_result.result._replace(solution = solution_openlifu),
+            inputTransducer,
+        )
+
+    def is_computing_solution(self) -> bool:
+        """Whether a solution computation started by `computeSolutionAsync` is still running."""
+        return self._solution_computation is not None and self._solution_computation.is_active()
+
+    def cancelSolutionComputation(self) -> None:
+        """Cancel the solution computation started by `computeSolutionAsync`, if there is one running."""
+        if self._solution_computation is not None:
+            self._solution_computation.cancel()
+
+    def _get_solution_cache_key(
+            self,
+            inputVolume: vtkMRMLScalarVolumeNode,
+            inputTarget: vtkMRMLMarkupsFiducialNode,
+            inputTransducer : SlicerOpenLIFUTransducer,
+            inputProtocol: SlicerOpenLIFUProtocol,
+        ) -> Optional[str]:
+        """Get the solution cache key for the given inputs, or None if the solution cache is disabled."""
+        if get_solution_cache_max_size_bytes() <= 0:
+            return None
+        session = get_openlifu_data_parameter_node().loaded_session
+        return compute_solution_cache_key(
             inputProtocol.protocol,
             inputTransducer,
             inputTarget,
             inputVolume,
+            session_id = session.get_session_id() if session is not None else None,
         )
+
+    def _save_solution_to_cache(self, cache_key:Optional[str], result:SolutionComputationResult) -> None:
+        """Store solution computation outputs in the solution cache. Failing to do so is not an error, since the cache only saves time."""
+        if cache_key is None:
+            return
+        try:
+            save_solution_to_cache(cache_key, result)
+        except Exception as e:
+            logging.warning(f"Could not store the solution in the solution cache: {e}")
+
+    def _set_solution_from_openlifu_outputs(
+            self,
+            result:SolutionComputationResult,
+            transducer:SlicerOpenLIFUTransducer,
+        ) -> Tuple[SlicerOpenLIFUSolution, SlicerOpenLIFUSolutionAnalysis]:
+        """Load solution computation outputs into the scene and set them as the active solution and solution analysis."""
         solution = SlicerOpenLIFUSolution.initialize_from_openlifu_data(
-            solution = solution_openlifu,
-            pnp_datarray=pnp_aggregated,
-            intensity_dataarray=intensity_aggregated,
-            transducer=inputTransducer,
+            solution = result.solution,
+            pnp_datarray=result.pnp_aggregated,
+            intensity_dataarray=result.intensity_aggregated,
+            transducer=transducer,
         )
-        analysis = SlicerOpenLIFUSolutionAnalysis(analysis_openlifu)
+        analysis = SlicerOpenLIFUSolutionAnalysis(result.analysis)
         slicer.util.getModuleLogic('OpenLIFUData').set_solution(solution)
         self.getParameterNode().solution_analysis = analysis
         return solution, analysis
@@ -907,6 +1526,75 @@ class OpenLIFUSonicationPlannerTest(ScriptedLoadableModuleTest):
     https://github.com/Slicer/Slicer/blob/main/Base/Python/slicer/ScriptedLoadableModule.py
     """
 
+    def test_compute_solution_async_finishes_spans_on_error(self):
+        """Test that the timing spans of a solution computation are finished with the error when it fails to start."""
+        from unittest import mock
+        import numpy as np
+        from OpenLIFULib.profiling import get_recent_operations
+
+        logic = OpenLIFUSonicationPlannerLogic()
+        inputs = dict(inputVolume = mock.MagicMock(), inputTarget = mock.MagicMock(), inputTransducer = mock.MagicMock(), inputProtocol = mock.MagicMock())
+
+        def assert_last_operation_failed(error:str, failed_stage:Optional[str]):
+            compute_span = get_recent_operations()[-1]
+            self.assertEqual(compute_span.name, "compute solution")
+            self.assertEqual(compute_span.error, error)
+            if failed_stage is not None:
+                stage_span = next(child for child in compute_span.children if child.name == failed_stage)
+                self.assertTrue(stage_span.is_finished)
+                self.assertIn(error, stage_span.error)
+
+        with mock.patch.object(logic, "_get_solution_cache_key", side_effect=RuntimeError("no cache key")):
+            with self.assertRaisesRegex(RuntimeError, "no cache key"):
+                logic.computeSolutionAsync(**inputs)
+        assert_last_operation_failed("no cache key", None)
+
+        with mock.patch.object(logic, "_get_solution_cache_key", return_value=None), \
+            mock.patch(f"{__name__}.make_solution_inputs_openlifu", side_effect=RuntimeError("no inputs")):
+            with self.assertRaisesRegex(RuntimeError, "no inputs"):
+                logic.computeSolutionAsync(**inputs)
+        assert_last_operation_failed("no inputs", "prepare solution inputs")
+
+        with mock.patch.object(logic, "_get_solution_cache_key", return_value=None), \
+            mock.patch(f"{__name__}.make_solution_inputs_openlifu", return_value={}), \
+            mock.patch("slicer.util.arrayFromTransformMatrix", return_value=np.eye(4)), \
+            mock.patch.object(SolutionComputationProcess, "start", side_effect=RuntimeError("no worker")):
+            with self.assertRaisesRegex(RuntimeError, "no worker"):
+                logic.computeSolutionAsync(**inputs)
+        assert_last_operation_failed("no worker", "beamforming and simulation (worker process)")
+        self.assertFalse(logic.is_computing_solution())
+
+    def _workflow_cancel_solution_computation(self):
+        """Test that clicking the compute button while a solution is being computed cancels the computation."""
+
+        slicer.util.selectModule("OpenLIFUSonicationPlanner")
+        sp_widget = slicer.modules.OpenLIFUSonicationPlannerWidget
+        sp_logic = sp_widget.logic
+
+        # A cached solution would be set right away without starting a worker process
+        settings = qt.QSettings()
+        solution_cache_max_size = settings.value(SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY)
+        settings.setValue(SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY, 0)
+        try:
+            sp_widget.onComputeSolutionClicked(True)
+            assert sp_logic.is_computing_solution()
+            worker_qprocess = sp_logic._solution_computation._process
+
+            sp_widget.onComputeSolutionClicked(True) # the button now reads "Cancel solution computation"
+            assert not sp_logic.is_computing_solution()
+
+            deadline = time.monotonic() + 10
+            while worker_qprocess.state() != qt.QProcess.NotRunning and time.monotonic() < deadline:
+                slicer.app.processEvents()
+                qt.QThread.msleep(10)
+            assert worker_qprocess.state() == qt.QProcess.NotRunning, "The solution computation worker was not killed"
+            assert get_openlifu_data_parameter_node().loaded_solution is None
+        finally:
+            if solution_cache_max_size is None:
+                settings.remove(SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY)
+            else:
+                settings.setValue(SOLUTION_CACHE_MAX_SIZE_SETTINGS_KEY, solution_cache_max_size)
+
     def _workflow_planning(self):
 
         import numpy as np
@@ -921,6 +1609,10 @@ class OpenLIFUSonicationPlannerTest(ScriptedLoadableModuleTest):
         selected_transducer = activeData["Transducer"]
 
         sp_widget.onComputeSolutionClicked(True)
+        while sp_logic.is_computing_solution():
+            slicer.app.processEvents()
+            qt.QThread.msleep(10)
+        slicer.app.processEvents()
         assert get_openlifu_data_parameter_node().loaded_solution is not None
     
         # Test that moving the target clears the solution
@@ -47,7 +47,8 @@ from OpenLIFULib import (
 from OpenLIFULib.coordinate_system_utils import numpy_to_vtk_4x4
 from OpenLIFULib.events import SlicerOpenLIFUEvents
 from OpenLIFULib.guided_mode_util import get_guided_mode_state, GuidedWorkflowMixin
-from OpenLIFULib.skinseg import get_skin_segmentation, generate_skin_segmentation
+from OpenLIFULib.profiling import profiled
+from OpenLIFULib.skinseg import SkinMeshLOD, discard_skin_mesh_levels_of_detail, get_skin_mesh, get_skin_segmentation, generate_skin_segmentation
 from OpenLIFULib.targets import fiducial_to_openlifu_point_id
 from OpenLIFULib.transform_conversion import transducer_transform_node_from_openlifu
 from OpenLIFULib.transducer import TRANSDUCER_MODEL_COLORS
@@ -74,6 +75,7 @@ from OpenLIFULib.user_account_mode_util import UserAccountBanner
 from OpenLIFULib.util import add_slicer_log_handler, BusyCursor, get_cloned_node, replace_widget, display_errors
 from OpenLIFULib.notifications import notify
 from OpenLIFULib.virtual_fit_results import get_virtual_fit_approval_for_target, get_approval_from_virtual_fit_result_node
+from OpenLIFULib.foreground_mask_store import remove_foreground_mask_nodes
 from OpenLIFULib.install_asset_dialog import InstallAssetDialog
 
 # These imports are for IDE and static analysis purposes only
@@ -734,12 +736,14 @@ class PhotoscanVolumeTrackingPage(qt.QWizardPage):
                     numIterations = self.ui.maxNumOfIterationsSpinBox.value,
                     maxMeanDistance = self.ui.maxMeanDistanceDoubleSpinBox.value,
                     mean_distance_mode = self.ui.SetDistanceModeRadioButton.isChecked(),
+                    fixed_mesh = get_skin_mesh(self.wizard().skin_mesh_node, SkinMeshLOD.COARSE),
                     )
                 
                 # Harden the photoscan_roi_submesh after ICP
                 self.photoscan_roi_submesh.SetAndObserveTransformNodeID(self.photoscan_to_volume_icp_transform_node.GetID())
                 self.photoscan_roi_submesh.HardenTransform()
                
+                # ICP ran against a coarse level of detail of the skin mesh; the reported distances use the full resolution mesh of the node
                 distance_map = self.wizard()._logic.compute_surface_distance(
                     input_fixed_model = self.wizard().skin_mesh_node,
                     input_moving_model = self.photoscan_roi_submesh) 
@@ -2205,6 +2209,10 @@ class OpenLIFUTransducerLocalizationWidget(ScriptedLoadableModuleWidget, VTKObse
         if node.IsA('vtkMRMLScalarVolumeNode'):
             self.logic.clear_any_openlifu_volume_affiliated_nodes(node)
 
+        # If a skin surface is removed, drop the levels of detail kept for it
+        if node.IsA('vtkMRMLModelNode') and node.GetAttribute('OpenLIFUData.volume_id') is not None:
+            discard_skin_mesh_levels_of_detail(node)
+
     @vtk.calldata_type(vtk.VTK_OBJECT)
     def onNodeAdded(self, caller, event, node : slicer.vtkMRMLNode) -> None:
         """ Update volume and photoscan combo boxes when nodes are added to the scene"""
@@ -3255,6 +3263,7 @@ class OpenLIFUTransducerLocalizationLogic(ScriptedLoadableModuleLogic):
         # Fallback v1: legacy filesystem at /sdcard/DCIM/Camera/
         return self._pull_from_fallback_location_v1(scan_id, temp_path)
 
+    @profiled("generate photoscan")
     def generate_photoscan(self,
         subject_id:str,
         session_id:str,
@@ -3367,6 +3376,7 @@ class OpenLIFUTransducerLocalizationLogic(ScriptedLoadableModuleLogic):
                 if photoscan_openlifu.id == photoscan_id:
                     photoscan_openlifu.photoscan_approved = approval_state
                     session.update_affiliated_photoscan(photoscan_openlifu)
+                    slicer.util.getModuleLogic('OpenLIFUData').mark_affiliated_photoscan_modified(photoscan_id)
                     break
 
     def revoke_transducer_tracking_approval(self, photoscan_id: str) -> bool:
@@ -3622,6 +3632,7 @@ class OpenLIFUTransducerLocalizationLogic(ScriptedLoadableModuleLogic):
         except Exception as e:
             raise RuntimeError(f"Error extracting facial ROI submesh: {e}")
 
+    @profiled("ICP registration")
     def run_icp_model_registration(
         self,
         input_fixed_model: vtkMRMLModelNode,
@@ -3631,6 +3642,7 @@ class OpenLIFUTransducerLocalizationLogic(ScriptedLoadableModuleLogic):
         numIterations: int = 100,
         maxMeanDistance: float = 0.01,
         mean_distance_mode: bool = False,
+        fixed_mesh: Optional[vtk.vtkPolyData] = None,
     ) -> Tuple[vtkMRMLTransformNode, float, int]:
         """Registers a moving model to a fixed model using the Iterative Closest Point (ICP) algorithm.
         Note: This function operates directly on the point sets of the
@@ -3649,6 +3661,8 @@ class OpenLIFUTransducerLocalizationLogic(ScriptedLoadableModuleLogic):
             numIterations: Maximum iterations allowed if mean_distance_mode is False. Defaults to 100.
             maxMeanDistance: Convergence threshold if mean_distance_mode is True; algorithm stops if mean distance falls below this value. Defaults to 0.01.
             mean_distance_mode: If True, prioritizes convergence to maxMeanDistance over numIterations.
+            fixed_mesh: A mesh to use in place of the mesh of input_fixed_model, e.g. a lower level of detail of the skin
+                mesh from OpenLIFULib.skinseg.get_skin_mesh when input_fixed_model is a skin segmentation.
 
         Returns:
             A tuple (vtkMRMLTransformNode, float, int) or None
@@ -3663,7 +3677,7 @@ class OpenLIFUTransducerLocalizationLogic(ScriptedLoadableModuleLogic):
 
         icpTransform = vtk.vtkIterativeClosestPointTransform()
         icpTransform.SetSource( input_moving_model.GetPolyData() )
-        icpTransform.SetTarget( input_fixed_model.GetPolyData() )
+        icpTransform.SetTarget( fixed_mesh if fixed_mesh is not None else input_fixed_model.GetPolyData() )
         icpTransform.GetLandmarkTransform().SetModeToRigidBody()
         if transformType == 1:
             icpTransform.GetLandmarkTransform().SetModeToSimilarity()
@@ -3792,6 +3806,7 @@ class OpenLIFUTransducerLocalizationLogic(ScriptedLoadableModuleLogic):
             if node.GetAttribute('OpenLIFUData.volume_id') == volume_node.GetID()
             ]
         for node in skin_mesh_node:
+            discard_skin_mesh_levels_of_detail(node)
             slicer.mrmlScene.RemoveNode(node)
         
         # Check for and remove any affiliated facial landmark fiducial nodes
@@ -3801,6 +3816,9 @@ class OpenLIFUTransducerLocalizationLogic(ScriptedLoadableModuleLogic):
             ]
         for node in facial_landmark_node:
             slicer.mrmlScene.RemoveNode(node)
+
+        # Remove any affiliated foreground mask labelmaps
+        remove_foreground_mask_nodes(volume_node)
     
     def calculate_transform_origin_distance(self, transform_node1: vtkMRMLTransformNode, transform_node2: vtkMRMLTransformNode) -> float:
         """
@@ -3864,6 +3882,45 @@ class OpenLIFUTransducerLocalizationTest(ScriptedLoadableModuleTest):
         node.SetMatrixTransformToParent(numpy_to_vtk_4x4(affine))
         return node
 
+    def test_skin_mesh_levels_of_detail_stay_within_hausdorff_bound(self):
+        from OpenLIFULib.skinseg import SKIN_MESH_LOD_MAX_ERROR_MM, _skin_mesh_levels_of_detail, hausdorff_distance
+
+        sphere_source = vtk.vtkSphereSource()
+        sphere_source.SetRadius(80.0)
+        sphere_source.SetThetaResolution(200)
+        sphere_source.SetPhiResolution(200)
+        sphere_source.Update()
+        full_mesh = sphere_source.GetOutput()
+
+        skin_mesh_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLModelNode")
+        skin_mesh_node.SetAndObservePolyData(full_mesh)
+        skin_mesh_node.SetAttribute('OpenLIFUData.volume_id', "test_volume")
+        try:
+            self.assertIs(get_skin_mesh(skin_mesh_node, SkinMeshLOD.FULL), full_mesh)
+            levels_of_detail = _skin_mesh_levels_of_detail[skin_mesh_node.GetID()]
+            self.assertEqual(set(levels_of_detail.meshes.keys()), {SkinMeshLOD.FULL}) # lower levels are only made on request
+
+            num_points = full_mesh.GetNumberOfPoints()
+            for lod in (SkinMeshLOD.FINE, SkinMeshLOD.COARSE):
+                lod_mesh = get_skin_mesh(skin_mesh_node, lod)
+                self.assertGreater(lod_mesh.GetNumberOfPoints(), 0)
+                self.assertLessEqual(lod_mesh.GetNumberOfPoints(), num_points)
+                self.assertLessEqual(hausdorff_distance(full_mesh, lod_mesh), SKIN_MESH_LOD_MAX_ERROR_MM[lod])
+                num_points = lod_mesh.GetNumberOfPoints()
+            self.assertLess(num_points, full_mesh.GetNumberOfPoints()) # a fine sphere tessellation decimates well within 0.5 mm
+
+            # Replacing the mesh of the node starts over from the new mesh
+            sphere_source.SetThetaResolution(100)
+            sphere_source.Update()
+            replacement_mesh = vtk.vtkPolyData()
+            replacement_mesh.DeepCopy(sphere_source.GetOutput())
+            skin_mesh_node.SetAndObservePolyData(replacement_mesh)
+            self.assertIs(get_skin_mesh(skin_mesh_node, SkinMeshLOD.FULL), replacement_mesh)
+        finally:
+            discard_skin_mesh_levels_of_detail(skin_mesh_node)
+            slicer.mrmlScene.RemoveNode(skin_mesh_node)
+        self.assertNotIn(skin_mesh_node.GetID(), _skin_mesh_levels_of_detail)
+
     def _workflow_localization(self):
         """Test running virtual fit and approving results."""
 